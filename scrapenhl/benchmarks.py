@@ -0,0 +1,715 @@
+"""
+Benchmarks comparing the parsing and storage methods in this package against the implementations they replaced.
+
+These read the raw files already saved in SAVE_FOLDER, so scrape a season before running them (except
+check_import_time, which checks that importing the package stays fast).
+"""
+
+import scrapenhl_globals
+import scrape_game
+
+def _read_shifts_from_json_loop(data, homename = None, roadname = None):
+    """
+    The original per-second merge loop behind scrape_game.read_shifts_from_json, kept as a reference.
+
+    Parameters
+    -----------
+    data : list of dict
+        A json list that is the result of shift_page['data']
+    homename : str or None
+        The home team abbreviation
+    roadname : str or None
+        The road team abbreviation
+
+    Returns
+    --------
+    pandas df
+        Same format as scrape_game.read_shifts_from_json
+    """
+    if len(data) == 0:
+        return
+    ids = ['' for i in range(len(data))]
+    periods = [0 for i in range(len(data))]
+    starts = ['0:00' for i in range(len(data))]
+    ends = ['0:00' for i in range(len(data))]
+    teams = ['' for i in range(len(data))]
+    durations = [0 for i in range(len(data))]
+
+    for i, dct in enumerate(data):
+        ids[i] = dct['playerId']
+        periods[i] = dct['period']
+        starts[i] = dct['startTime']
+        ends[i] = dct['endTime']
+        durations[i] = dct['duration']
+        teams[i] = dct['teamAbbrev']
+
+    ### Seems like home players come first
+    if homename is None:
+        homename = teams[0]
+        for i in range(len(teams) - 1, 0, -1):
+            if not teams[i] == homename:
+                roadname = teams[i]
+                break
+
+    startmin = [x[:x.index(':')] for x in starts]
+    startsec = [x[x.index(':') + 1:] for x in starts]
+    starttimes = [1200 * (p-1) + 60 * int(m) + int(s) for p, m, s in zip(periods, startmin, startsec)]
+    endmin = [x[:x.index(':')] for x in ends]
+    endsec = [x[x.index(':') + 1:] for x in ends]
+    ### There is an extra -1 in endtimes to avoid overlapping start/end
+    endtimes = [1200 * (p - 1) + 60 * int(m) + int(s) - 1 for p, m, s in zip(periods, endmin, endsec)]
+
+    durationtime = [e - s for s, e in zip(starttimes, endtimes)]
+
+    import pandas as pd
+    df = pd.DataFrame({'PlayerID': ids, 'Period': periods, 'Start': starttimes, 'End': endtimes,
+                       'Team': teams, 'Duration': durationtime})
+    df.loc[df.End < df.Start, 'End'] = df.End + 1200
+    tempdf = df[['PlayerID', 'Start', 'End', 'Team', 'Duration']]
+    tempdf = tempdf.assign(Time = tempdf.Start)
+
+    toi = pd.DataFrame({'Time': [i for i in range(0, max(df.End) + 1)]})
+
+    toidfs = []
+    while len(tempdf.index) > 0:
+        temptoi = toi.merge(tempdf, how = 'inner', on = 'Time')
+        toidfs.append(temptoi)
+
+        tempdf = tempdf.assign(Time = tempdf.Time + 1)
+        tempdf = tempdf.query('Time <= End')
+
+    tempdf = pd.concat(toidfs)
+    tempdf = tempdf.sort_values(by = 'Time')
+
+    ### Append team name to start of columns by team
+    hdf = tempdf.query('Team == "' + homename + '"')
+    hdf2 = hdf.groupby('Time').rank()
+    hdf2 = hdf2.rename(columns = {'PlayerID': 'rank'})
+    hdf2.loc[:, 'rank'] = hdf2['rank'].apply(lambda x: int(x))
+    hdf.loc[:, 'rank'] = homename + hdf2['rank'].astype('str')
+
+    rdf = tempdf.query('Team == "' + roadname + '"')
+    rdf2 = rdf.groupby('Time').rank()
+    rdf2 = rdf2.rename(columns={'PlayerID': 'rank'})
+    rdf2.loc[:, 'rank'] = rdf2['rank'].apply(lambda x: int(x))
+    rdf.loc[:, 'rank'] = roadname + rdf2['rank'].astype('str')
+
+    ### Occasionally bad entries make duplicates on time and rank. Take one with longer duration
+
+    tokeep = hdf.sort_values(by = 'Duration', ascending = False)
+    tokeep = tokeep.groupby(['Time', 'PlayerID']).first()
+    tokeep.reset_index(inplace = True)
+    hdf = hdf.merge(tokeep, how = 'inner', on = ['Time', 'PlayerID', 'Start', 'End', 'Team', 'rank'])
+
+    tokeep = rdf.sort_values(by='Duration', ascending=False)
+    tokeep = tokeep.groupby(['Time', 'PlayerID']).first()
+    tokeep.reset_index(inplace=True)
+    rdf = rdf.merge(tokeep, how='inner', on=['Time', 'PlayerID', 'Start', 'End', 'Team', 'rank'])
+
+    ### Remove values above 6--looking like there won't be many
+    hdf = hdf.pivot(index = 'Time', columns = 'rank', values = 'PlayerID').iloc[:, 0:6]
+    hdf.reset_index(inplace = True) #get time back as a column
+    rdf = rdf.pivot(index='Time', columns='rank', values='PlayerID').iloc[:, 0:6]
+    rdf.reset_index(inplace = True)
+
+    toi = toi.merge(hdf, how = 'left', on = 'Time').merge(rdf, how = 'left', on = 'Time')
+
+    return(toi)
+
+def _read_shifts_with_loop(data, homename = None, roadname = None):
+    """
+    Runs _read_shifts_from_json_loop, with its rank labels (e.g. WSH1.0 under current pandas) normalised to the integer
+    labels scrape_game.read_shifts_from_json writes (WSH1), so the two can be compared.
+    """
+    toi = _read_shifts_from_json_loop(data, homename, roadname)
+    if toi is None:
+        return None
+    return toi.rename(columns = {col: col[:-2] for col in toi.columns if col[-2:] == '.0'})
+
+def _read_saved_shifts(season, game):
+    """
+    Reads a saved shift json from disk, along with the home and road names from the game log if available.
+
+    Returns
+    --------
+    tuple
+        The shift data list, home name, and road name. The data list is None if the file is missing or unreadable.
+    """
+    import os.path
+    import json
+
+    if not scrape_game.raw_page_exists(season, game, 'shift'):
+        return None, None, None
+    try:
+        data = scrape_game.decode_json(scrape_game.read_game_page(season, game, 'shift'))['data']
+    except (json.JSONDecodeError, KeyError):
+        return None, None, None
+
+    basic_gamelog = scrapenhl_globals.get_quick_gamelog_file()
+    try:
+        thisgamedata = basic_gamelog.query('Season == {0:d} & Game == {1:d}'.format(season, game))
+        rname = thisgamedata['Away'].iloc[0]
+        hname = thisgamedata['Home'].iloc[0]
+    except Exception as e:
+        hname = None
+        rname = None
+    return data, hname, rname
+
+def benchmark_read_shifts(season, games):
+    """
+    Times the per-second merge loop against the interval sweep in scrape_game.read_shifts_from_json on saved shift
+    files, and checks that the two produce identical dataframes.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : iterable of ints (e.g. list)
+        The game ids to read
+
+    Returns
+    --------
+    pandas df
+        One row per game with the time taken by each method, in seconds, and whether the outputs matched
+    """
+    import time
+    import pandas as pd
+
+    results = []
+    for game in sorted(games):
+        data, hname, rname = _read_saved_shifts(season, game)
+        if data is None or len(data) == 0:
+            continue
+
+        starttime = time.perf_counter()
+        old = _read_shifts_with_loop(data, hname, rname)
+        looptime = time.perf_counter() - starttime
+
+        starttime = time.perf_counter()
+        new = scrape_game.read_shifts_from_json(data, hname, rname)
+        sweeptime = time.perf_counter() - starttime
+
+        try:
+            pd.testing.assert_frame_equal(old, new, check_exact = True)
+            same = True
+        except AssertionError:
+            same = False
+        results.append({'Game': game, 'Loop': looptime, 'Sweep': sweeptime, 'Identical': same})
+
+    results = pd.DataFrame(results, columns = ['Game', 'Loop', 'Sweep', 'Identical'])
+    if len(results) > 0:
+        print('Loop total {0:.2f}s, sweep total {1:.2f}s, {2:d} of {3:d} games identical'.format(
+            results.Loop.sum(), results.Sweep.sum(), int(results.Identical.sum()), len(results)))
+    return results
+
+def _read_events_from_json_lists(pbp):
+    """
+    The original list-based extractor behind scrape_game.read_events_from_json, kept as a reference.
+
+    Parameters
+    -----------
+    pbp : list of dict
+        A json list that is the result of api_page['liveData']['plays']['allPlays']
+
+    Returns
+    --------
+    pandas df
+        Dataframe of the game's play by play data, with coordinates in a tuple column XY
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    index = [i for i in range(len(pbp))]
+    period = [-1 for i in range(len(pbp))]
+    time = ['0:00' for i in range(len(pbp))]
+    event = ['NA' for i in range(len(pbp))]
+
+    team = [-1 for i in range(len(pbp))]
+    p1 = [-1 for i in range(len(pbp))]
+    p1role = ['' for i in range(len(pbp))]
+    p2 = [-1 for i in range(len(pbp))]
+    p2role = ['' for i in range(len(pbp))]
+    xy = [(np.nan, np.nan) for i in range(len(pbp))]
+    note = ['' for i in range(len(pbp))]
+
+    for i in range(len(pbp)):
+        period[i] = int(pbp[i]['about']['period'])
+        time[i] = pbp[i]['about']['periodTime']
+        event[i] = pbp[i]['result']['event']
+
+        try:
+            xy[i] = (float(pbp[i]['coordinates']['x']), float(pbp[i]['coordinates']['y']))
+        except KeyError:
+            pass
+        try:
+            team[i] = pbp[i]['team']['id']
+        except KeyError:
+            pass
+        try:
+            p1[i] = pbp[i]['players'][0]['player']['id']
+            p1role[i] = pbp[i]['players'][0]['playerType']
+        except KeyError:
+            pass
+        try:
+            p2[i] = pbp[i]['players'][1]['player']['id']
+            p2role[i] = pbp[i]['players'][1]['playerType']
+        except KeyError:
+            pass
+        except IndexError: #e.g. on a give or take
+            pass
+
+        try:
+            note[i] = pbp[i]['result']['description']
+        except KeyError:
+            pass
+
+    pbpdf = pd.DataFrame({'Index': index, 'Period': period, 'Time': time, 'Event': event,
+                          'Team': team, 'Actor': p1, 'ActorRole': p1role, 'Recipient': p2, 'RecipientRole': p2role,
+                          'XY': xy, 'Note': note})
+    return pbpdf
+
+def _read_saved_plays(season, game):
+    """
+    Reads a saved game json from disk and returns its list of plays, or None if the file is missing or unreadable.
+    """
+    import os.path
+    import json
+
+    if not scrape_game.raw_page_exists(season, game, 'pbp'):
+        return None
+    try:
+        page = scrape_game.read_game_page(season, game, 'pbp')
+        return scrape_game.decode_json(page, scrape_game.GAME_SUBTREES[2:])['liveData']['plays']['allPlays']
+    except (json.JSONDecodeError, KeyError):
+        return None
+
+def benchmark_read_events(season, games):
+    """
+    Times the list-based extractor against the columnar scrape_game.read_events_from_json on saved game files, and
+    measures each one's peak memory while parsing and the size of the resulting dataframe.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : iterable of ints (e.g. list)
+        The game ids to read
+
+    Returns
+    --------
+    pandas df
+        One row per game with parse time in seconds, peak traced memory in bytes, and dataframe size in bytes for
+        each method
+    """
+    import time
+    import tracemalloc
+    import pandas as pd
+
+    results = []
+    for game in sorted(games):
+        plays = _read_saved_plays(season, game)
+        if plays is None:
+            continue
+        row = {'Game': game, 'Events': len(plays)}
+        for label, method in (('Lists', _read_events_from_json_lists),
+                              ('Columnar', scrape_game.read_events_from_json)):
+            tracemalloc.start()
+            starttime = time.perf_counter()
+            df = method(plays)
+            row[label + 'Time'] = time.perf_counter() - starttime
+            row[label + 'Peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            row[label + 'Size'] = df.memory_usage(deep = True).sum()
+        results.append(row)
+
+    results = pd.DataFrame(results)
+    if len(results) > 0:
+        print('Per game: lists {0:.1f} ms / {1:.0f} KB peak, columnar {2:.1f} ms / {3:.0f} KB peak'.format(
+            1000 * results.ListsTime.mean(), results.ListsPeak.mean() / 1024,
+            1000 * results.ColumnarTime.mean(), results.ColumnarPeak.mean() / 1024))
+    return results
+
+def benchmark_json_decode(season, games = None):
+    """
+    Times decompressing and decoding a season's saved game files with each available JSON backend, both for the full
+    document and for just the subtrees the parser uses (scrape_game.GAME_SUBTREES).
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : iterable of ints, or None
+        The game ids to read. If None, reads every saved game file in the season folder.
+
+    Returns
+    --------
+    pandas df
+        One row per backend and mode, with total seconds and MB/s of decompressed json
+    """
+    import time
+    import pandas as pd
+
+    if games is None:
+        games = scrape_game.list_raw_games(season)
+    games = [game for game in sorted(games) if scrape_game.raw_page_exists(season, game, 'pbp')]
+
+    starttime = time.perf_counter()
+    pages = [scrape_game.read_game_page(season, game, 'pbp') for game in games]
+    decompresstime = time.perf_counter() - starttime
+    totalmb = sum(len(p) for p in pages) / 1e6
+
+    backends = ['json']
+    for name in ('orjson', 'simdjson'):
+        try:
+            __import__(name)
+            backends.append(name)
+        except ImportError:
+            pass
+
+    results = [{'Backend': 'zlib', 'Mode': 'decompress', 'Seconds': decompresstime}]
+    original = scrape_game.JSON_BACKEND
+    try:
+        for backend in backends:
+            scrape_game.JSON_BACKEND = backend
+            for mode, subtrees in (('full', None), ('subtrees', scrape_game.GAME_SUBTREES)):
+                starttime = time.perf_counter()
+                for page in pages:
+                    try:
+                        scrape_game.decode_json(page, subtrees)
+                    except ValueError:
+                        pass
+                results.append({'Backend': backend, 'Mode': mode, 'Seconds': time.perf_counter() - starttime})
+    finally:
+        scrape_game.JSON_BACKEND = original
+
+    results = pd.DataFrame(results, columns = ['Backend', 'Mode', 'Seconds'])
+    results = results.assign(MBps = totalmb / results.Seconds)
+    print('Decoded', len(pages), 'files,', round(totalmb, 1), 'MB of json')
+    print(results)
+    return results
+
+def _attach_on_ice_merge(events, season, games):
+    """
+    The naive way to find players on ice: expand each game's shifts to one row per second with
+    scrape_game.read_shifts_from_json and merge the events onto it. Used as the reference in benchmark_on_ice.
+    """
+    import pandas as pd
+
+    pieces = []
+    for game in games:
+        data, hname, rname = _read_saved_shifts(season, game)
+        if data is None or hname is None:
+            continue
+        toi = scrape_game.read_shifts_from_json(data, hname, rname)
+        pieces.append(toi.assign(Game = game))
+    toi = pd.concat(pieces, ignore_index = True)
+    return events.merge(toi, how = 'left', left_on = ['Game', 'Seconds'], right_on = ['Game', 'Time'])
+
+def benchmark_on_ice(season, games):
+    """
+    Times attaching the players on ice to a season's events with the interval index in onice, against expanding
+    shifts to seconds and merging.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : iterable of ints
+        The game ids to use. Their raw pbp and shift files must be saved.
+
+    Returns
+    --------
+    pandas df
+        One row per method, with total seconds
+    """
+    import time
+    import pandas as pd
+    import onice
+
+    games = sorted(games)
+    events = []
+    for game in games:
+        plays = _read_saved_plays(season, game)
+        if plays is not None:
+            events.append(scrape_game.read_events_from_json(plays).assign(Game = game))
+    events = pd.concat(events, ignore_index = True)
+
+    results = []
+    starttime = time.perf_counter()
+    _attach_on_ice_merge(events, season, games)
+    results.append({'Method': 'merge', 'Seconds': time.perf_counter() - starttime})
+
+    starttime = time.perf_counter()
+    index = onice.ShiftIntervalIndex.from_season(season, games)
+    buildtime = time.perf_counter() - starttime
+    onice.attach_on_ice(events, season, index)
+    results.append({'Method': 'interval index', 'Seconds': time.perf_counter() - starttime})
+    results.append({'Method': 'interval index (query only)', 'Seconds': time.perf_counter() - starttime - buildtime})
+
+    results = pd.DataFrame(results, columns = ['Method', 'Seconds'])
+    print('Attached players on ice to', len(events), 'events in', len(games), 'games')
+    print(results)
+    return results
+
+def benchmark_rolling_cf(player, windows = range(5, 81, 5), **filters):
+    """
+    Times the rolling CF% calculation behind the rollingcf dashboard: the first call for a player (which reads the
+    Corsi tables and builds the per-game series), then each window size (which only redoes the rolling sums).
+
+    Parameters
+    -----------
+    player : int
+        The player ID
+    windows : iterable of int
+        The window sizes to time
+    filters
+        Passed to chartmethods.get_rolling_cf, e.g. score_adjust = True
+
+    Returns
+    --------
+    pandas df
+        One row per call, with seconds
+    """
+    import time
+    import pandas as pd
+    import chartmethods
+
+    results = []
+    windows = list(windows)
+    starttime = time.perf_counter()
+    chartmethods.get_rolling_cf(player, windows[0], **filters)
+    results.append({'Call': 'first (window {0:d})'.format(windows[0]), 'Seconds': time.perf_counter() - starttime})
+    for window in windows:
+        starttime = time.perf_counter()
+        chartmethods.get_rolling_cf(player, window, **filters)
+        results.append({'Call': 'window {0:d}'.format(window), 'Seconds': time.perf_counter() - starttime})
+
+    results = pd.DataFrame(results, columns = ['Call', 'Seconds'])
+    print(results)
+    return results
+
+def benchmark_fuzzy_match(pnames, team_helper = None):
+    """
+    Times fuzzy matching names against the player ID file, one at a time and in bulk.
+
+    Parameters
+    -----------
+    pnames : iterable of str
+        The names to match, e.g. a roster from another source
+    team_helper : iterable of str, or str, or None
+        Passed to the matcher
+
+    Returns
+    --------
+    pandas df
+        One row per step, with total seconds and milliseconds per name
+    """
+    import time
+    import pandas as pd
+    import playernames
+
+    pnames = list(pnames)
+    results = []
+    starttime = time.perf_counter()
+    index = playernames.get_player_name_index()
+    index.fuzzy_match('')
+    results.append({'Step': 'build index', 'Seconds': time.perf_counter() - starttime})
+
+    starttime = time.perf_counter()
+    for pname in pnames:
+        index.fuzzy_match(pname, team_helper)
+    results.append({'Step': 'single queries', 'Seconds': time.perf_counter() - starttime})
+
+    starttime = time.perf_counter()
+    playernames.fuzzy_match_names(pnames, team_helper)
+    results.append({'Step': 'bulk', 'Seconds': time.perf_counter() - starttime})
+
+    results = pd.DataFrame(results, columns = ['Step', 'Seconds'])
+    results = results.assign(MsPerName = 1000 * results.Seconds / max(len(pnames), 1))
+    print(results)
+    return results
+
+def benchmark_raw_codecs(season, games = None):
+    """
+    Compares codecs for a season's raw pages: zlib level 9 (the original format), zstd without a dictionary, and zstd
+    with the active dictionaries (see rawcodec.train_dictionary), if any. Nothing is written to disk.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : iterable of ints, or None
+        The game ids to use. If None, every game with raw pages in the season folder.
+
+    Returns
+    --------
+    pandas df
+        One row per codec, with total MB on disk, compression ratio, and compress and decompress MB/s (of
+        uncompressed pages)
+    """
+    import os.path
+    import time
+    import zlib
+    import pandas as pd
+    import rawcodec
+
+    if games is None:
+        games = scrape_game.list_raw_games(season)
+    pages = []
+    for game in sorted(games):
+        for kind in ('pbp', 'shift'):
+            if scrape_game.raw_page_exists(season, game, kind):
+                pages.append((kind, scrape_game.read_game_page(season, game, kind)))
+    totalmb = sum(len(page) for kind, page in pages) / 1e6
+
+    codecs = [('zlib-9', lambda page, kind: zlib.compress(page, level = 9))]
+    try:
+        import zstandard
+        plain = zstandard.ZstdCompressor(level = rawcodec.ZSTD_LEVEL)
+        codecs.append(('zstd-{0:d}'.format(rawcodec.ZSTD_LEVEL), lambda page, kind: plain.compress(page)))
+        if len(rawcodec._get_active_dictionaries()) > 0:
+            codecs.append(('zstd-{0:d} + dictionary'.format(rawcodec.ZSTD_LEVEL),
+                           lambda page, kind: rawcodec.compress(page, kind, 'zstd')))
+    except ImportError:
+        pass
+
+    results = []
+    for name, compress in codecs:
+        starttime = time.perf_counter()
+        blobs = [compress(page, kind) for kind, page in pages]
+        compresstime = time.perf_counter() - starttime
+        starttime = time.perf_counter()
+        for blob in blobs:
+            rawcodec.decompress(blob)
+        decompresstime = time.perf_counter() - starttime
+        diskmb = sum(len(blob) for blob in blobs) / 1e6
+        results.append({'Codec': name, 'DiskMB': diskmb, 'Ratio': totalmb / diskmb,
+                        'CompressMBps': totalmb / compresstime, 'DecompressMBps': totalmb / decompresstime})
+
+    results = pd.DataFrame(results, columns = ['Codec', 'DiskMB', 'Ratio', 'CompressMBps', 'DecompressMBps'])
+    print('Compressed', len(pages), 'pages,', round(totalmb, 1), 'MB')
+    print(results)
+    return results
+
+def benchmark_team_query(season, team, player, repeats = 3):
+    """
+    Times typical team log queries with the teamquery builder against reading the whole log and filtering in pandas
+    (and, for row iteration, against iterrows, which read_team_pbp and read_team_toi used before).
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The team abbreviation
+    player : int
+        A player ID on this team
+    repeats : int
+        Each query is run this many times and the fastest time is kept
+
+    Returns
+    --------
+    pandas df
+        One row per query and method, with seconds and rows returned
+    """
+    import time
+    import pandas as pd
+    import corsi
+    import teamquery
+    import scrape_season
+
+    def pandas_shot_attempts():
+        df = scrape_season.get_team_pbplog(season, team)
+        return df[df.Event.isin(corsi.CORSI_EVENTS) & (df.Strength == '5v5') & (df.Actor == player)]
+
+    def pandas_on_ice():
+        df = scrape_season.get_team_toilog(season, team)
+        cols = [col for col in df.columns if col[:len(team)] == team and col[len(team):].isdigit()]
+        return df[(df.Strength == '5v5') & (df[cols] == player).any(axis = 1)][['Game', 'Time']]
+
+    def iterrows_5v5():
+        df = scrape_season.get_team_toilog(season, team)
+        return [row for index, row in df[df.Strength == '5v5'].iterrows()]
+
+    queries = [('5v5 shot attempts', 'read log + pandas', pandas_shot_attempts),
+               ('5v5 shot attempts', 'teamquery',
+                lambda: teamquery.team_pbp(season, team).strengths('5v5').events(list(corsi.CORSI_EVENTS))
+                .actors(player).to_df()),
+               ('5v5 seconds on ice', 'read log + pandas', pandas_on_ice),
+               ('5v5 seconds on ice', 'teamquery',
+                lambda: teamquery.team_toi(season, team).strengths('5v5').on_ice(player)
+                .columns(['Game', 'Time']).to_df()),
+               ('iterate 5v5 toi rows', 'iterrows', iterrows_5v5),
+               ('iterate 5v5 toi rows', 'teamquery rows',
+                lambda: list(teamquery.run(teamquery.team_toi(season, team).strengths('5v5'), 'rows')))]
+
+    results = []
+    for name, method, func in queries:
+        best = None
+        for i in range(repeats):
+            starttime = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - starttime
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({'Query': name, 'Method': method, 'Seconds': best, 'Rows': len(result)})
+
+    results = pd.DataFrame(results, columns = ['Query', 'Method', 'Seconds', 'Rows'])
+    print(results)
+    return results
+
+IMPORT_MODULES = ('scrapenhl_globals', 'scrape_game', 'scrape_season', 'pbpmethods', 'chartmethods', 'teamquery',
+                  'dashdata', 'playernames')
+HEAVY_MODULES = ('pandas', 'numpy', 'feather', 'pyarrow')
+
+def check_import_time(modules = IMPORT_MODULES, budget = 0.05, repeats = 5):
+    """
+    Times importing each module in a fresh interpreter, and checks that none of them is over budget or imports pandas,
+    numpy, feather, or pyarrow at module level. Unlike the other benchmarks, this needs no scraped data.
+
+    Parameters
+    -----------
+    modules : iterable of str
+        The modules to import
+    budget : float
+        The most seconds importing a module (best of repeats) may take
+    repeats : int
+        The number of fresh interpreters to time each module in
+
+    Returns
+    --------
+    list of dict
+        Module, Seconds, and the heavy modules it loaded, for each module
+
+    Raises
+    --------
+    AssertionError
+        If a module is over budget or loads a heavy module
+    """
+    import os
+    import sys
+    import json
+    import subprocess
+
+    code = 'import sys, time, json\n' \
+           'starttime = time.perf_counter()\n' \
+           'import {0:s}\n' \
+           'elapsed = time.perf_counter() - starttime\n' \
+           'print(json.dumps([elapsed, [m for m in {1:s} if m in sys.modules]]))'
+    folder = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in modules:
+        best = None
+        for i in range(repeats):
+            output = subprocess.check_output([sys.executable, '-c', code.format(module, repr(list(HEAVY_MODULES)))],
+                                             cwd = folder)
+            elapsed, heavy = json.loads(output.decode('utf-8').strip().split('\n')[-1])
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({'Module': module, 'Seconds': best, 'Heavy': heavy})
+        print('{0:20s} {1:8.4f}s {2:s}'.format(module, best, ', '.join(heavy)))
+
+    slow = [r['Module'] for r in results if r['Seconds'] > budget]
+    heavy = [r['Module'] for r in results if len(r['Heavy']) > 0]
+    assert len(slow) == 0, 'Over the {0:.3f}s import budget: {1:s}'.format(budget, ', '.join(slow))
+    assert len(heavy) == 0, 'Heavy dependencies imported at module level by: {0:s}'.format(', '.join(heavy))
+    return results
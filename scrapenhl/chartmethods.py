@@ -0,0 +1,225 @@
+"""
+Computation behind the charts in the dashboard, starting with rolling Corsi for % (see rollingcf.py).
+
+Per-game series are built from the per-player-game Corsi table (see corsi.py) and cached per player and filter set, so
+changing the window only recomputes the rolling sums.
+"""
+
+import scrapenhl_globals
+import corsi
+import functools
+
+### The number of (player, filters) series kept in memory
+SERIES_CACHE_SIZE = 64
+SCORE_ADJUSTMENTS = ('None', '@IneffectiveMath')
+
+def get_corsi_versions():
+    """
+    Returns the seasons with a per-player-game Corsi table and the tables' versions, so cached results are recomputed
+    after an update.
+
+    Returns
+    --------
+    tuple of (int, tuple)
+        (season, version) for each table, in season order. See corsi.get_player_corsi_versions.
+    """
+    return corsi.get_player_corsi_versions()
+
+@functools.lru_cache(maxsize = 32)
+def _read_season_corsi(season, version):
+    """
+    Reads one season's Corsi table. Cached by version, so the table is read once per update.
+    """
+    return corsi.get_player_corsi(season)
+
+def _get_corsi_table(versions):
+    """
+    Returns the Corsi tables for the given (season, version) pairs as one dataframe.
+    """
+    import pandas as pd
+    if len(versions) == 0:
+        return pd.DataFrame(columns = corsi.CORSI_COLUMNS)
+    return pd.concat([_read_season_corsi(season, version) for season, version in versions], ignore_index = True)
+
+@functools.lru_cache(maxsize = 16)
+def _get_score_adjustment_weights(strengths, versions):
+    """
+    See get_score_adjustment_weights. Cached per strength set and table version.
+    """
+    df = _get_corsi_table(versions)
+    if strengths is not None:
+        df = df[df.Strength.isin(strengths)]
+    totals = df.groupby('ScoreState')[['CF', 'CA']].sum()
+    weights = {}
+    for state, cf, ca in zip(totals.index, totals.CF, totals.CA):
+        if cf > 0 and ca > 0:
+            weights[int(state)] = ((cf + ca) / (2 * cf), (cf + ca) / (2 * ca))
+    return weights
+
+def get_score_adjustment_weights(strengths = ('5v5',)):
+    """
+    Returns score adjustment weights derived from the league-wide Corsi table.
+
+    Teams shoot more when trailing, so each score state gets a CF weight and a CA weight that would make league-wide CF
+    and CA equal in that state: (CF + CA) / 2CF and (CF + CA) / 2CA.
+
+    Parameters
+    -----------
+    strengths : tuple of str, or None
+        The strengths to derive weights from, e.g. ('5v5',). None uses all.
+
+    Returns
+    --------
+    dict
+        Score state (team lead, capped at +/-3) to (CF weight, CA weight)
+    """
+    return _get_score_adjustment_weights(strengths, get_corsi_versions())
+
+@functools.lru_cache(maxsize = SERIES_CACHE_SIZE)
+def _get_player_game_series(player, teams, playoffs, score_adjust, strengths, versions):
+    """
+    See get_player_game_series. Cached per player, filters, and table version.
+    """
+    import numpy as np
+    import pandas as pd
+    import reference_store
+
+    df = _get_corsi_table(versions)
+    df = df[df.Player == player]
+    if strengths is not None:
+        df = df[df.Strength.isin(strengths)]
+    if teams is not None:
+        df = df[df.Team.isin(teams)]
+    if not playoffs:
+        df = df[df.Game < 30000]
+
+    cf = df.CF.values.astype(np.float64)
+    ca = df.CA.values.astype(np.float64)
+    if score_adjust:
+        weights = _get_score_adjustment_weights(strengths, versions)
+        states = df.ScoreState.values
+        cf = cf * np.array([weights.get(int(s), (1, 1))[0] for s in states])
+        ca = ca * np.array([weights.get(int(s), (1, 1))[1] for s in states])
+    series = pd.DataFrame({'Season': df.Season.values, 'Game': df.Game.values, 'Team': df.Team.values,
+                           'CF': cf, 'CA': ca}) \
+        .groupby(['Season', 'Game', 'Team'], as_index = False).sum()
+
+    ### Games the player's team played without the player, for gaps in the chart
+    gamelog = reference_store.get_reference_store().get_quick_gamelog_df()
+    played = set(zip(series.Season, series.Game))
+    missed = []
+    for season, team in set(zip(series.Season, series.Team)):
+        teamgames = gamelog[(gamelog.Season == season) & ((gamelog.Home == team) | (gamelog.Away == team))]
+        if not playoffs:
+            teamgames = teamgames[teamgames.Game < 30000]
+        for game in teamgames.Game:
+            if (season, int(game)) not in played:
+                missed.append({'Season': season, 'Game': int(game), 'Team': team, 'CF': np.nan, 'CA': np.nan})
+    if len(missed) > 0:
+        series = pd.concat([series, pd.DataFrame(missed)], ignore_index = True)
+
+    series = series.merge(gamelog[['Season', 'Game', 'Datetime']], how = 'left', on = ['Season', 'Game'])
+    series = series.sort_values(['Season', 'Game']).reset_index(drop = True)
+    series['Played'] = series.CF.notnull()
+    return series
+
+def get_player_game_series(player, teams = None, playoffs = True, score_adjust = False, strengths = ('5v5',)):
+    """
+    Returns a player's CF and CA in each game, plus the games the player's team played without them.
+
+    The result is cached per player and filter set, and recomputed only when a Corsi table changes. It is shared
+    between callers, so do not modify it.
+
+    Parameters
+    -----------
+    player : int
+        The player ID
+    teams : iterable of str, or None
+        Only games for these teams (abbreviations). None includes all.
+    playoffs : bool
+        If False, regular season games only.
+    score_adjust : bool
+        If True, weights CF and CA by score state (see get_score_adjustment_weights)
+    strengths : iterable of str, or None
+        The strengths to include, from the player's team's perspective. None includes all.
+
+    Returns
+    --------
+    pandas df
+        One row per game in order, with Season, Game, Team, CF, CA, Datetime, and Played. CF and CA are NaN in games
+        the player missed.
+    """
+    if teams is not None:
+        teams = tuple(sorted(teams))
+    if strengths is not None:
+        strengths = (strengths,) if isinstance(strengths, str) else tuple(sorted(strengths))
+    return _get_player_game_series(int(player), teams, bool(playoffs), bool(score_adjust), strengths,
+                                   get_corsi_versions())
+
+def rolling_cf_pct(cf, ca, window):
+    """
+    Returns the rolling CF% over the given number of games, using cumulative sums.
+
+    Parameters
+    -----------
+    cf : array of float
+        CF in each game
+    ca : array of float
+        CA in each game
+    window : int
+        The number of games in each window
+
+    Returns
+    --------
+    np.array
+        CF% (0-100) over the window ending at each game; NaN for the first window - 1 games and where the window has no
+        attempts
+    """
+    import numpy as np
+    cf = np.concatenate([[0], np.cumsum(np.asarray(cf, dtype = np.float64))])
+    ca = np.concatenate([[0], np.cumsum(np.asarray(ca, dtype = np.float64))])
+    result = np.full(len(cf) - 1, np.nan)
+    if window > len(result) or window < 1:
+        return result
+    windowcf = cf[window:] - cf[:-window]
+    windowca = ca[window:] - ca[:-window]
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        result[window - 1:] = 100 * windowcf / (windowcf + windowca)
+    return result
+
+def get_rolling_cf(player, window = 25, teams = None, playoffs = True, score_adjust = False, strengths = ('5v5',),
+                   gaps = True):
+    """
+    Returns a player's rolling CF% by game.
+
+    Parameters
+    -----------
+    player : int
+        The player ID
+    window : int
+        The number of games in each window. Games the player missed are not counted.
+    teams : iterable of str, or None
+        Only games for these teams (abbreviations). None includes all.
+    playoffs : bool
+        If False, regular season games only.
+    score_adjust : bool
+        If True, weights CF and CA by score state (see get_score_adjustment_weights)
+    strengths : iterable of str, or None
+        The strengths to include, from the player's team's perspective. None includes all.
+    gaps : bool
+        If True, games the player's team played without them are included with NaN CF%.
+
+    Returns
+    --------
+    pandas df
+        Season, Game, Team, Datetime, and CF% for each game
+    """
+    import numpy as np
+    series = get_player_game_series(player, teams, playoffs, score_adjust, strengths)
+    played = series.Played.values
+    cfpct = np.full(len(series), np.nan)
+    cfpct[played] = rolling_cf_pct(series.CF.values[played], series.CA.values[played], window)
+    result = series[['Season', 'Game', 'Team', 'Datetime']].assign(**{'CF%': cfpct})
+    if not gaps:
+        result = result[played]
+    return result
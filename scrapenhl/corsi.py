@@ -0,0 +1,345 @@
+"""
+A persistent per-player, per-game table of Corsi for (CF), Corsi against (CA), and time on ice (TOI), split by strength
+and score state.
+
+Each season's table is computed from the parsed pbp and toi files and stored in the reference folder as a few feather
+parts: SAVE_FOLDER/reference/playercorsi[season]/part-00000.feather, part-00001.feather, and so on. Updates only process
+games that are not in the table yet and write their rows as a new part, so an update does not reread or rewrite the
+season. A game in more than one part (because it was recomputed) is read from the latest one. Once a season has
+MAX_PARTS parts, the next update merges them into one.
+"""
+
+import scrapenhl_globals
+import reference_store
+import os.path
+
+CORSI_EVENTS = ['Shot', 'Missed Shot', 'Blocked Shot', 'Goal']
+### Score states are the team's lead, capped at 3 either way
+MAX_SCORE_STATE = 3
+CORSI_COLUMNS = ['Season', 'Game', 'Player', 'Team', 'Strength', 'ScoreState', 'CF', 'CA', 'TOI']
+CORSI_DTYPES = {'Season': 'int64', 'Game': 'int64', 'Player': 'int64', 'ScoreState': 'int8', 'CF': 'int64',
+                'CA': 'int64', 'TOI': 'int64'}
+### The number of parts a season's table can have before an update merges them
+MAX_PARTS = 16
+
+def get_player_corsi_folder(season):
+    """
+    Returns the folder holding this season's per-player-game Corsi table.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+
+    Returns
+    --------
+    str
+        SAVE_FOLDER/reference/playercorsi[season]
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'reference', 'playercorsi{0:d}'.format(season))
+
+def get_player_corsi_filename(season):
+    """
+    Returns the single file that held this season's table before it was split into parts. It is moved into the folder
+    (see get_player_corsi_folder) the next time the season is updated.
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'reference', 'playercorsi{0:d}.feather'.format(season))
+
+def _get_parts(season):
+    """
+    Returns {part number: file} for this season's table, including a single file not yet moved into the folder as
+    part -1.
+    """
+    folder = get_player_corsi_folder(season)
+    parts = {}
+    if os.path.exists(get_player_corsi_filename(season)):
+        parts[-1] = get_player_corsi_filename(season)
+    if os.path.exists(folder):
+        for filename in os.listdir(folder):
+            if filename[:5] == 'part-' and filename[-8:] == '.feather' and filename[5:-8].isdigit():
+                parts[int(filename[5:-8])] = os.path.join(folder, filename)
+    return parts
+
+def get_player_corsi_versions():
+    """
+    Returns the seasons with a per-player-game Corsi table, each with a version that changes when the table is
+    updated, so cached results can be recomputed.
+
+    Returns
+    --------
+    tuple of (int, tuple)
+        (season, version) for each table, in season order
+    """
+    import os
+    folder = os.path.join(scrapenhl_globals.SAVE_FOLDER, 'reference')
+    if not os.path.exists(folder):
+        return ()
+    seasons = set()
+    for filename in os.listdir(folder):
+        name = filename[:-8] if filename[-8:] == '.feather' else filename
+        if name[:11] == 'playercorsi' and name[11:].isdigit():
+            seasons.add(int(name[11:]))
+    versions = []
+    for season in sorted(seasons):
+        parts = _get_parts(season)
+        if len(parts) > 0:
+            versions.append((season, tuple(sorted((part, os.stat(filename).st_mtime_ns)
+                                                  for part, filename in parts.items()))))
+    return tuple(versions)
+
+def _read_season(season):
+    """
+    Reads one season's table, keeping each game's rows from the latest part that has it.
+    """
+    import feather
+    import pandas as pd
+    parts = _get_parts(season)
+    dfs = []
+    latest = {}
+    for part in sorted(parts):
+        try:
+            df = feather.read_dataframe(parts[part])
+        except FileNotFoundError:
+            ### Merged away by an update since it was listed
+            continue
+        dfs.append((part, df))
+        for game in df.Game.unique():
+            latest[int(game)] = part
+    dfs = [df[df.Game.map(latest) == part] for part, df in dfs]
+    if len(dfs) == 0:
+        return None
+    return pd.concat(dfs, ignore_index = True)
+
+def get_player_corsi(seasons):
+    """
+    Returns the per-player-game Corsi table for these seasons.
+
+    Parameters
+    -----------
+    seasons : int or iterable of int
+        The seasons to read. 2007-08 would be 2007.
+
+    Returns
+    --------
+    pandas df
+        Columns are Season, Game, Player (ID), Team (abbreviation), Strength (team perspective, e.g. 5v4), ScoreState
+        (team lead, capped at +/-3), CF, CA, and TOI (seconds), sorted by player and game. Empty if nothing has been
+        computed.
+    """
+    import pandas as pd
+    if isinstance(seasons, int):
+        seasons = [seasons]
+    dfs = [df for df in (_read_season(season) for season in seasons) if df is not None]
+    if len(dfs) == 0:
+        return pd.DataFrame(columns = CORSI_COLUMNS)
+    df = pd.concat(dfs, ignore_index = True)
+    return df.sort_values(['Season', 'Player', 'Game'], kind = 'stable').reset_index(drop = True)
+
+def _get_score_states(goalsides, count):
+    """
+    Returns the home team's lead before each of count rows, given which side scored in each earlier row.
+
+    Parameters
+    -----------
+    goalsides : np.array of int
+        +1 where the home team scored, -1 where the road team scored, 0 otherwise, one per row
+    count : int
+        The number of rows
+
+    Returns
+    --------
+    np.array of int8
+        The home lead before each row, capped at +/- MAX_SCORE_STATE
+    """
+    import numpy as np
+    lead = np.concatenate([[0], np.cumsum(goalsides)[:count - 1]]) if count > 0 else np.zeros(0, dtype = np.int64)
+    return np.clip(lead, -MAX_SCORE_STATE, MAX_SCORE_STATE).astype(np.int8)
+
+def _get_player_matrix(toi, team):
+    """
+    Returns the team's player ID columns of a toi table as an int64 array, with 0 where there is no player.
+    """
+    import numpy as np
+    cols = [col for col in toi.columns if col[:len(team)] == team and col[len(team):].isdigit()]
+    if len(cols) == 0:
+        return np.zeros((len(toi), 0), dtype = np.int64)
+    return np.nan_to_num(toi[cols].values.astype(np.float64), nan = 0).astype(np.int64)
+
+def _melt_players(players, strengths, scorestates, values):
+    """
+    Turns an (n, k) array of player IDs into long arrays with one entry per player per row, dropping empty slots.
+    """
+    import numpy as np
+    k = players.shape[1]
+    mask = players.ravel() != 0
+    return (players.ravel()[mask], np.repeat(strengths, k)[mask], np.repeat(scorestates, k)[mask],
+            [np.repeat(v, k)[mask] for v in values])
+
+def get_game_corsi(pbp, toi, home, road, homeid):
+    """
+    Computes per-player CF, CA, and TOI by strength and score state for one game.
+
+    Parameters
+    -----------
+    pbp : pandas df
+        The game's parsed pbp, with strength columns (see strength.add_strength_to_pbp)
+    toi : pandas df
+        The game's parsed toi, with strength columns (see strength.add_strength_to_toi)
+    home : str
+        The home team abbreviation
+    road : str
+        The road team abbreviation
+    homeid : int
+        The home team ID, as used in the pbp Team column
+
+    Returns
+    --------
+    pandas df
+        Columns are Player, Team, Strength (team perspective), ScoreState (team lead), CF, CA, and TOI
+    """
+    import numpy as np
+    import pandas as pd
+    import strength
+
+    ### Score states: pbp goals count from the next event, toi goals from the next second
+    isgoal = (pbp.Event.astype(str) == 'Goal').values
+    goalsides = np.where(isgoal, np.where(pbp.Team.values == homeid, 1, -1), 0)
+    eventstates = _get_score_states(goalsides, len(pbp))
+    secondgoals = np.zeros(len(toi) + 1, dtype = np.int64)
+    goaltimes = np.clip(pbp.Seconds.values[isgoal].astype(np.int64) + 1, 0, len(toi))
+    np.add.at(secondgoals, goaltimes, goalsides[isgoal])
+    secondstates = np.clip(np.cumsum(secondgoals)[:len(toi)], -MAX_SCORE_STATE, MAX_SCORE_STATE).astype(np.int8)
+
+    homestrength = toi.Strength.values.astype(object)
+    roadstrength = strength.get_strength_codes(toi.RoadSkaters.values, toi.HomeSkaters.values)
+    homeplayers = _get_player_matrix(toi, home)
+    roadplayers = _get_player_matrix(toi, road)
+
+    ### TOI: one second per player per toi row
+    pieces = []
+    ones = np.ones(len(toi), dtype = np.int64)
+    zeros = np.zeros(len(toi), dtype = np.int64)
+    for team, players, strengths, states in ((home, homeplayers, homestrength, secondstates),
+                                             (road, roadplayers, roadstrength, -secondstates)):
+        pids, strs, scs, (cf, ca, seconds) = _melt_players(players, strengths, states, (zeros, zeros, ones))
+        pieces.append(pd.DataFrame({'Player': pids, 'Team': team, 'Strength': strs, 'ScoreState': scs,
+                                    'CF': cf, 'CA': ca, 'TOI': seconds}))
+
+    ### Corsi: blocked shots are credited to the blocking team, so the shooting team is the other one
+    corsi = pbp[pbp.Event.astype(str).isin(CORSI_EVENTS)]
+    rows = corsi.Seconds.values.astype(np.int64)
+    valid = (rows >= 0) & (rows < len(toi))
+    homeshot = (corsi.Team.values == homeid) != (corsi.Event.astype(str).values == 'Blocked Shot')
+    homeshot, rows = homeshot[valid], rows[valid]
+    states = eventstates[pbp.Event.astype(str).isin(CORSI_EVENTS).values][valid]
+    for team, players, strengths, states, forshot in (
+            (home, homeplayers, homestrength, states, homeshot),
+            (road, roadplayers, roadstrength, -states, ~homeshot)):
+        pids, strs, scs, (cf, ca, seconds) = _melt_players(players[rows], strengths[rows], states,
+                                                           (forshot.astype(np.int64), (~forshot).astype(np.int64),
+                                                            np.zeros(len(rows), dtype = np.int64)))
+        pieces.append(pd.DataFrame({'Player': pids, 'Team': team, 'Strength': strs, 'ScoreState': scs,
+                                    'CF': cf, 'CA': ca, 'TOI': seconds}))
+
+    df = pd.concat(pieces, ignore_index = True)
+    return df.groupby(['Player', 'Team', 'Strength', 'ScoreState'], as_index = False, observed = True)[
+        ['CF', 'CA', 'TOI']].sum()
+
+def _read_game_corsi(season, game, home, road, store):
+    """
+    Reads a game's parsed pbp and toi and returns its per-player Corsi rows, or None if either file is missing.
+    """
+    import pandas as pd
+    import scrape_game
+    import strength
+    import onice
+
+    if not os.path.exists(scrape_game.get_parsed_save_filename(season, game)) or \
+            not os.path.exists(scrape_game.get_parsed_shifts_save_filename(season, game)):
+        return None
+    pbp = pd.read_hdf(scrape_game.get_parsed_save_filename(season, game))
+    toi = pd.read_hdf(scrape_game.get_parsed_shifts_save_filename(season, game))
+    ### Games parsed before strength columns were added
+    if 'Strength' not in toi.columns:
+        toi = strength.add_strength_to_toi(toi, home, road, onice.get_goalie_ids(store))
+    if 'Strength' not in pbp.columns:
+        pbp = strength.add_strength_to_pbp(pbp, toi)
+
+    homeids = store.get_team_ids(home)
+    homeid = homeids[0] if len(homeids) > 0 else -2
+    return get_game_corsi(pbp, toi, home, road, homeid).assign(Season = season, Game = game)[CORSI_COLUMNS]
+
+def update_player_corsi(season, force_overwrite = False, games = None):
+    """
+    Adds parsed games that are not yet in this season's per-player-game Corsi table.
+
+    The new games' rows are written as a new part. The season's parts are merged into one instead if there are
+    already MAX_PARTS of them, if force_overwrite is set, or if a game in games can no longer be computed and has to
+    be dropped.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    force_overwrite : bool
+        If True, recomputes every game.
+    games : iterable of int, or None
+        Games to recompute even if they are already in the table, e.g. because they were reparsed
+    """
+    import os
+    import pandas as pd
+
+    store = reference_store.get_reference_store()
+    games = set() if games is None else {int(g) for g in games}
+    folder = get_player_corsi_folder(season)
+    parts = _get_parts(season)
+    if list(parts) == [-1]:
+        ### A table from before the split becomes the first part
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        os.replace(parts[-1], os.path.join(folder, 'part-00000.feather'))
+        parts = _get_parts(season)
+
+    done = set()
+    if not force_overwrite:
+        import feather
+        ### Only the Game column is needed to find new games
+        for filename in parts.values():
+            done.update(int(g) for g in feather.read_dataframe(filename, columns = ['Game']).Game.unique())
+
+    newgames = []
+    missing = set()
+    for row in store.get_season_games(season):
+        game = row['Game']
+        if game in done and game not in games:
+            continue
+        df = _read_game_corsi(season, game, row['Home'], row['Away'], store)
+        if df is not None:
+            newgames.append(df)
+        elif game in done:
+            missing.add(game)
+
+    if len(newgames) == 0 and len(missing) == 0 and not force_overwrite:
+        return
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    merge = force_overwrite or len(missing) > 0 or len(parts) >= MAX_PARTS
+    if merge and not force_overwrite and len(parts) > 0:
+        current = _read_season(season)
+        if current is not None:
+            recomputed = missing | {int(df.Game.iloc[0]) for df in newgames if len(df) > 0}
+            newgames = [current[~current.Game.isin(recomputed)]] + newgames
+    if len(newgames) > 0:
+        df = pd.concat(newgames, ignore_index = True)
+    else:
+        df = pd.DataFrame(columns = CORSI_COLUMNS)
+    df = df.sort_values(['Player', 'Game']).reset_index(drop = True).astype(CORSI_DTYPES)
+    nextpart = max(list(parts) + [-1]) + 1
+    scrapenhl_globals.write_feather(df, os.path.join(folder, 'part-{0:05d}.feather'.format(nextpart)))
+
+    if merge:
+        ### Readers that listed the old parts before this point still take each game from the newest part
+        for part, filename in _get_parts(season).items():
+            if part != nextpart:
+                os.remove(filename)
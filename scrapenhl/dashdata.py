@@ -0,0 +1,260 @@
+"""
+A precomputed snapshot of what the dashboards (see rollingcf.py and home.py) show, so the Dash apps never touch the
+player ID files, Corsi tables, or game log.
+
+build_snapshot is run at update time (see scrape_season.update) and writes two files to SAVE_FOLDER/dashboard:
+
+- options.json: the player and team dropdown options, the default selections, and when the snapshot was built.
+- series.arrow: every player's per-game 5v5 CF and CA (raw and score-adjusted), plus the games each player's team
+  played without them, sorted by player. This is an uncompressed Arrow file, so it is memory-mapped rather than read,
+  and each Dash worker process shares the same pages read-only.
+
+get_snapshot loads the snapshot the first time it is needed and reloads it when it is rebuilt.
+"""
+
+import scrapenhl_globals
+import os.path
+import threading
+
+SERIES_COLUMNS = ['Player', 'Season', 'Game', 'Team', 'Datetime', 'Played', 'CF', 'CA', 'CFAdj', 'CAAdj']
+DEFAULT_PLAYER = 8474578
+SNAPSHOT_STRENGTHS = ('5v5',)
+
+_SNAPSHOT = None
+_SNAPSHOT_MTIME = None
+_LOCK = threading.Lock()
+
+def get_snapshot_folder():
+    """
+    Returns the folder holding the dashboard snapshot, SAVE_FOLDER/dashboard.
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'dashboard')
+
+def get_options_filename():
+    """
+    Returns the file holding the snapshot's dropdown options. See the module docstring.
+    """
+    return os.path.join(get_snapshot_folder(), 'options.json')
+
+def get_series_filename():
+    """
+    Returns the file holding the snapshot's per-player game series. See the module docstring.
+    """
+    return os.path.join(get_snapshot_folder(), 'series.arrow')
+
+def _get_series_table(strengths = SNAPSHOT_STRENGTHS):
+    """
+    Builds the per-player game series for every player at once, in the layout of SERIES_COLUMNS. Matches
+    chartmethods.get_player_game_series with teams = None and playoffs = True, with both raw and score-adjusted
+    CF and CA.
+    """
+    import numpy as np
+    import pandas as pd
+    import chartmethods
+    import reference_store
+
+    versions = chartmethods.get_corsi_versions()
+    df = chartmethods._get_corsi_table(versions)
+    if strengths is not None:
+        df = df[df.Strength.isin(strengths)]
+    weights = chartmethods._get_score_adjustment_weights(strengths, versions)
+    states = df.ScoreState.values.astype(np.int64)
+    cfweights = np.ones(len(df))
+    caweights = np.ones(len(df))
+    for state, (cfweight, caweight) in weights.items():
+        cfweights[states == state] = cfweight
+        caweights[states == state] = caweight
+    cf = df.CF.values.astype(np.float64)
+    ca = df.CA.values.astype(np.float64)
+    played = pd.DataFrame({'Player': df.Player.values.astype(np.int64), 'Season': df.Season.values.astype(np.int64),
+                           'Game': df.Game.values.astype(np.int64), 'Team': df.Team.values.astype(str),
+                           'CF': cf, 'CA': ca, 'CFAdj': cf * cfweights, 'CAAdj': ca * caweights}) \
+        .groupby(['Player', 'Season', 'Game', 'Team'], as_index = False).sum()
+
+    ### Games the player's team played without the player, for gaps in the chart
+    gamelog = reference_store.get_reference_store().get_quick_gamelog_df()
+    teamgames = pd.concat([gamelog[['Season', 'Game', 'Home']].rename(columns = {'Home': 'Team'}),
+                           gamelog[['Season', 'Game', 'Away']].rename(columns = {'Away': 'Team'})],
+                          ignore_index = True).astype({'Season': np.int64, 'Game': np.int64, 'Team': str})
+    missed = played[['Player', 'Season', 'Team']].drop_duplicates() \
+        .merge(teamgames, on = ['Season', 'Team']) \
+        .merge(played[['Player', 'Season', 'Game']], on = ['Player', 'Season', 'Game'], how = 'left', indicator = True)
+    missed = missed[missed._merge == 'left_only'].drop(columns = '_merge') \
+        .assign(CF = np.nan, CA = np.nan, CFAdj = np.nan, CAAdj = np.nan)
+
+    series = pd.concat([played, missed], ignore_index = True)
+    datetimes = gamelog[['Season', 'Game', 'Datetime']].astype({'Season': np.int64, 'Game': np.int64})
+    series = series.merge(datetimes.drop_duplicates(['Season', 'Game']), how = 'left', on = ['Season', 'Game'])
+    series['Datetime'] = series.Datetime.astype(str)
+    series['Played'] = series.CF.notnull()
+    return series.sort_values(['Player', 'Season', 'Game']).reset_index(drop = True)[SERIES_COLUMNS]
+
+def build_snapshot():
+    """
+    Precomputes the dashboard options and per-player series and writes them to the snapshot folder, replacing the
+    previous snapshot. Dash workers pick up the new snapshot on their next request.
+
+    Returns
+    --------
+    dict
+        The options written to options.json
+    """
+    import os
+    import json
+    import datetime
+    import pyarrow as pa
+    import playernames
+
+    series = _get_series_table()
+    folder = get_snapshot_folder()
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    table = pa.Table.from_pandas(series, preserve_index = False)
+    with pa.OSFile(get_series_filename() + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(get_series_filename() + '.tmp', get_series_filename())
+
+    ### Most common spelling of each player's name, as in the preferred player names file
+    players = sorted((name, pid) for pid, name in playernames.get_player_name_index().id_to_name.items())
+    teams = scrapenhl_globals.get_team_id_file().sort_values(by = 'Name')
+    options = {'updated': datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+               'players': [{'label': str(pname), 'value': str(pid)} for pname, pid in players],
+               'teams': [{'label': str(tname), 'value': str(abbrev)}
+                         for tname, abbrev in zip(teams.Name, teams.Abbreviation)],
+               'default_player': str(DEFAULT_PLAYER)}
+    ### Written last: its modification time marks a complete snapshot
+    with open(get_options_filename() + '.tmp', 'w') as writer:
+        json.dump(options, writer)
+    os.replace(get_options_filename() + '.tmp', get_options_filename())
+    print('Built dashboard snapshot with', len(options['players']), 'players and', len(series), 'player-games')
+    return options
+
+class DashboardSnapshot(object):
+    """
+    A loaded dashboard snapshot. The series table is memory-mapped and never modified, so one snapshot can be shared
+    by every callback.
+
+    Parameters
+    -----------
+    options : dict
+        The contents of options.json
+    table : pyarrow table
+        The contents of series.arrow
+    """
+
+    def __init__(self, options, table):
+        self.options = options
+        self.updated = options['updated']
+        self.player_options = options['players']
+        self.team_options = options['teams']
+        self.default_player = options['default_player']
+        self.table = table
+        self._players = table.column('Player').to_numpy()
+        self._columns = {}
+
+    def _get_column(self, name):
+        """
+        Returns a column of the series table as a numpy array, converting it the first time it is asked for.
+        """
+        import numpy as np
+        if name not in self._columns:
+            column = self.table.column(name)
+            if name in ('Team', 'Datetime'):
+                self._columns[name] = np.asarray(column.to_pylist(), dtype = object)
+            else:
+                self._columns[name] = column.to_numpy()
+        return self._columns[name]
+
+    def get_player_rows(self, player):
+        """
+        Returns the slice of the series table holding this player's games.
+        """
+        import numpy as np
+        start = np.searchsorted(self._players, int(player), side = 'left')
+        stop = np.searchsorted(self._players, int(player), side = 'right')
+        return slice(int(start), int(stop))
+
+    def get_rolling_cf(self, player, window = 25, teams = None, playoffs = True, score_adjust = False, gaps = True):
+        """
+        Returns a player's rolling 5v5 CF% by game. Same as chartmethods.get_rolling_cf with strengths = ('5v5',), but
+        read from the snapshot.
+
+        Parameters
+        -----------
+        player : int
+            The player ID
+        window : int
+            The number of games in each window. Games the player missed are not counted.
+        teams : iterable of str, or None
+            Only games for these teams (abbreviations). None includes all.
+        playoffs : bool
+            If False, regular season games only.
+        score_adjust : bool
+            If True, uses score-adjusted CF and CA (see chartmethods.get_score_adjustment_weights)
+        gaps : bool
+            If True, games the player's team played without them are included with NaN CF%.
+
+        Returns
+        --------
+        dict
+            Arrays Season, Game, Team, Datetime, and CF% for each game
+        """
+        import numpy as np
+        import chartmethods
+
+        rows = self.get_player_rows(player)
+        keep = np.ones(rows.stop - rows.start, dtype = bool)
+        if teams is not None:
+            keep &= np.isin(self._get_column('Team')[rows], list(teams))
+        if not playoffs:
+            keep &= self._get_column('Game')[rows] < 30000
+        played = self._get_column('Played')[rows][keep]
+        cf = self._get_column('CFAdj' if score_adjust else 'CF')[rows][keep]
+        ca = self._get_column('CAAdj' if score_adjust else 'CA')[rows][keep]
+        cfpct = np.full(len(played), np.nan)
+        cfpct[played] = chartmethods.rolling_cf_pct(cf[played], ca[played], window)
+        if not gaps:
+            keep[keep] = played
+            cfpct = cfpct[played]
+        return {'Season': self._get_column('Season')[rows][keep], 'Game': self._get_column('Game')[rows][keep],
+                'Team': self._get_column('Team')[rows][keep], 'Datetime': self._get_column('Datetime')[rows][keep],
+                'CF%': cfpct}
+
+def _load_snapshot():
+    """
+    Reads the snapshot from disk, memory-mapping the series table.
+    """
+    import json
+    import pyarrow as pa
+    with open(get_options_filename(), 'r') as reader:
+        options = json.load(reader)
+    table = pa.ipc.open_file(pa.memory_map(get_series_filename(), 'r')).read_all()
+    return DashboardSnapshot(options, table)
+
+def get_snapshot(build_if_missing = True):
+    """
+    Returns the current dashboard snapshot, loading it on first use and reloading it after it is rebuilt.
+
+    Parameters
+    -----------
+    build_if_missing : bool
+        If True and there is no snapshot yet, builds one (which reads the Corsi tables and reference files).
+
+    Returns
+    --------
+    DashboardSnapshot or None
+        The snapshot, or None if there is none and build_if_missing is False
+    """
+    global _SNAPSHOT, _SNAPSHOT_MTIME
+    filename = get_options_filename()
+    if not os.path.exists(filename):
+        if not build_if_missing:
+            return None
+        build_snapshot()
+    mtime = os.path.getmtime(filename)
+    with _LOCK:
+        if _SNAPSHOT is None or mtime != _SNAPSHOT_MTIME:
+            _SNAPSHOT = _load_snapshot()
+            _SNAPSHOT_MTIME = mtime
+        return _SNAPSHOT
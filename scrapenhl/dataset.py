@@ -0,0 +1,473 @@
+"""
+A Hive-partitioned Parquet dataset of all parsed pbp and toi, for league-wide queries that filter by season, team,
+event type, and player without opening every game's HDF5 file.
+
+Files are laid out as SAVE_FOLDER/dataset/[pbp or toi]/season=2016/team=WSH/part-0.parquet, with one file per season
+and home team (so each game is stored once) and one row group per game. Season and team filters prune whole files;
+game, event, and player filters use Parquet row group statistics and only read the columns asked for. Every file is
+written with the schema from get_schema, so a column that happens to be all null in one game cannot change its type.
+
+Games are buffered as they are written and added to their files by flush, which rewrites each file it touches once.
+parse_games and build_dataset flush when they are done. Requires pyarrow (which feather also uses).
+"""
+
+import scrapenhl_globals
+import os.path
+
+TOI_COLUMNS = ['Time'] + ['Home{0:d}'.format(i) for i in range(1, 7)] + ['Away{0:d}'.format(i) for i in range(1, 7)]
+STRENGTH_COLUMNS = ['HomeSkaters', 'RoadSkaters', 'HomeGoalie', 'RoadGoalie', 'Strength']
+
+### Column name and pyarrow type name of each kind's files. The partition fields, season and team, come from the path.
+_COLUMN_TYPES = {'pbp': [('Index', 'int64'), ('Period', 'int32'), ('Time', 'string'), ('Seconds', 'int16'),
+                         ('Event', 'string'), ('Team', 'int64'), ('Actor', 'int64'), ('ActorRole', 'string'),
+                         ('Recipient', 'int64'), ('RecipientRole', 'string'), ('X', 'float32'), ('Y', 'float32'),
+                         ('Note', 'string')],
+                 'toi': [('Time', 'int64')] + [(col, 'float64') for col in TOI_COLUMNS[1:]]}
+_STRENGTH_TYPES = [('HomeSkaters', 'int8'), ('RoadSkaters', 'int8'), ('HomeGoalie', 'bool_'), ('RoadGoalie', 'bool_'),
+                   ('Strength', 'string')]
+_GAME_TYPES = [('Home', 'string'), ('Away', 'string'), ('game', 'int32')]
+
+### Once this many rows are buffered, write_game_pbp and write_game_toi flush
+MAX_PENDING_ROWS = 2000000
+
+### (kind, season, home team) to {game: pyarrow table}, for games not yet written. See flush.
+_PENDING = {}
+_PENDING_ROWS = 0
+_FLUSH_AT_EXIT = False
+
+def get_dataset_folder(kind):
+    """
+    Returns the root folder of the pbp or toi dataset.
+
+    Parameters
+    -----------
+    kind : str
+        'pbp' or 'toi'
+
+    Returns
+    --------
+    str
+        SAVE_FOLDER/dataset/[kind]
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'dataset', kind)
+
+def get_schema(kind, partitions = False):
+    """
+    Returns the schema of the pbp or toi dataset's files.
+
+    Parameters
+    -----------
+    kind : str
+        'pbp' or 'toi'
+    partitions : bool
+        If True, the partition fields (season and team) are included
+
+    Returns
+    --------
+    pyarrow schema
+    """
+    import pyarrow as pa
+    fields = [(name, getattr(pa, typename)()) for name, typename in _COLUMN_TYPES[kind] + _STRENGTH_TYPES + _GAME_TYPES]
+    if partitions:
+        fields += [('season', pa.int32()), ('team', pa.string())]
+    return pa.schema(fields)
+
+def get_partition_filename(kind, season, team):
+    """
+    Returns the file holding one home team's games for a season in the pbp or toi dataset.
+
+    Parameters
+    -----------
+    kind : str
+        'pbp' or 'toi'
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The home team abbreviation
+
+    Returns
+    --------
+    str
+        SAVE_FOLDER/dataset/[kind]/season=[season]/team=[team]/part-0.parquet
+    """
+    return os.path.join(get_dataset_folder(kind), 'season={0:d}'.format(season), 'team={0:s}'.format(team),
+                        'part-0.parquet')
+
+def _to_table(df, kind, game):
+    """
+    Converts one game's dataframe to a pyarrow table with the kind's schema. Missing columns are null and extra
+    columns are dropped.
+    """
+    import pyarrow as pa
+    schema = get_schema(kind)
+    df = df.assign(game = game)
+    arrays = [pa.array(df[field.name], from_pandas = True).cast(field.type) if field.name in df.columns
+              else pa.nulls(len(df), field.type) for field in schema]
+    return pa.Table.from_arrays(arrays, schema = schema)
+
+def _conform(table, schema):
+    """
+    Returns a table read from a dataset file with this schema, e.g. for files written before a column was added.
+    """
+    import pyarrow as pa
+    arrays = [table.column(field.name).cast(field.type) if field.name in table.column_names
+              else pa.nulls(table.num_rows, field.type) for field in schema]
+    return pa.Table.from_arrays(arrays, schema = schema)
+
+def _add_pending(kind, season, game, team, table):
+    """
+    Buffers one game's table until the next flush, replacing any earlier table for the game.
+    """
+    global _PENDING_ROWS, _FLUSH_AT_EXIT
+    games = _PENDING.setdefault((kind, season, team), {})
+    if game in games:
+        _PENDING_ROWS -= games[game].num_rows
+    games[game] = table
+    _PENDING_ROWS += table.num_rows
+    if not _FLUSH_AT_EXIT:
+        import atexit
+        atexit.register(flush)
+        _FLUSH_AT_EXIT = True
+
+def write_game_pbp(season, game, df, home, road):
+    """
+    Adds one game's parsed pbp to the dataset. The game is written by the next flush.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    df : pandas df
+        The result of scrape_game.read_events_from_json
+    home : str
+        The home team abbreviation
+    road : str
+        The road team abbreviation
+    """
+    _add_pending('pbp', season, game, home, _to_table(df.assign(Home = home, Away = road), 'pbp', game))
+    if _PENDING_ROWS >= MAX_PENDING_ROWS:
+        flush()
+
+def write_game_toi(season, game, df, home, road):
+    """
+    Adds one game's parsed toi to the dataset. The game is written by the next flush.
+
+    Team-named columns (e.g. WSH1) are renamed Home1-Home6 and Away1-Away6 so every game has the same schema, and
+    the team abbreviations are stored in Home and Away columns. Strength columns (see strength.py) are kept.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    df : pandas df
+        The result of scrape_game.read_shifts_from_json
+    home : str
+        The home team abbreviation
+    road : str
+        The road team abbreviation
+    """
+    homecols = [col for col in df.columns if col[:len(home)] == home and col[len(home):].isdigit()]
+    roadcols = [col for col in df.columns if col[:len(road)] == road and col[len(road):].isdigit()]
+    renamed = {col: 'Home{0:d}'.format(i + 1) for i, col in enumerate(homecols)}
+    renamed.update({col: 'Away{0:d}'.format(i + 1) for i, col in enumerate(roadcols)})
+    df = df.rename(columns = renamed).assign(Home = home, Away = road)
+    _add_pending('toi', season, game, home, _to_table(df, 'toi', game))
+    if _PENDING_ROWS >= MAX_PENDING_ROWS:
+        flush()
+
+def pop_pending():
+    """
+    Returns the buffered games and empties the buffer, e.g. to pass games parsed in a worker process back to the
+    parent, which writes them with add_pending and flush.
+
+    Returns
+    --------
+    dict
+        (kind, season, home team) to {game: pyarrow table}
+    """
+    global _PENDING, _PENDING_ROWS
+    pending = _PENDING
+    _PENDING = {}
+    _PENDING_ROWS = 0
+    return pending
+
+def add_pending(pending):
+    """
+    Buffers games from pop_pending.
+
+    Parameters
+    -----------
+    pending : dict
+        The result of pop_pending
+    """
+    for (kind, season, team), games in pending.items():
+        for game, table in games.items():
+            _add_pending(kind, season, game, team, table)
+
+def _read_partition_games(filename, schema):
+    """
+    Returns {game: pyarrow table} for the row groups in one dataset file.
+    """
+    import pyarrow.parquet as pq
+    games = {}
+    if os.path.exists(filename):
+        parquetfile = pq.ParquetFile(filename)
+        for i in range(parquetfile.num_row_groups):
+            table = _conform(parquetfile.read_row_group(i), schema)
+            if table.num_rows > 0:
+                games[table.column('game')[0].as_py()] = table
+    return games
+
+def _write_partition(kind, season, team, games):
+    """
+    Merges games into one season and home team's file, one row group per game in game order. Writes via a temporary
+    file so readers never see a partial file.
+    """
+    import os
+    import pyarrow.parquet as pq
+
+    filename = get_partition_filename(kind, season, team)
+    folder = os.path.dirname(filename)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    schema = get_schema(kind)
+    merged = _read_partition_games(filename, schema)
+    merged.update(games)
+    with pq.ParquetWriter(filename + '.tmp', schema, compression = 'zstd') as writer:
+        for game in sorted(merged):
+            writer.write_table(merged[game], row_group_size = max(1, merged[game].num_rows))
+    os.replace(filename + '.tmp', filename)
+
+def _migrate_season(kind, season, pending):
+    """
+    Moves games stored in the older one-folder-per-game layout (season=2016/game=20001/part-0.parquet) into the
+    season and home team files, along with that team's games in pending, which are removed from pending. A game in
+    pending replaces its older copy.
+    """
+    import shutil
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    seasonfolder = os.path.join(get_dataset_folder(kind), 'season={0:d}'.format(season))
+    if not os.path.exists(seasonfolder):
+        return
+    schema = get_schema(kind)
+    folders = {}
+    for name in sorted(os.listdir(seasonfolder)):
+        if name[:5] == 'game=' and name[5:].isdigit():
+            folders[int(name[5:])] = os.path.join(seasonfolder, name)
+    byteam = {}
+    for game, folder in folders.items():
+        filename = os.path.join(folder, 'part-0.parquet')
+        if os.path.exists(filename):
+            homes = pq.read_table(filename, columns = ['Home']).column('Home')
+            if len(homes) > 0:
+                byteam.setdefault(homes[0].as_py(), []).append((game, filename))
+    for team, files in sorted(byteam.items()):
+        games = {}
+        for game, filename in files:
+            table = pq.read_table(filename)
+            table = table.drop_columns([col for col in ('season', 'game') if col in table.column_names])
+            games[game] = _conform(table.append_column('game', pa.array([game] * table.num_rows, pa.int32())), schema)
+        games.update(pending.pop((kind, season, team), {}))
+        _write_partition(kind, season, team, games)
+    for folder in folders.values():
+        shutil.rmtree(folder)
+
+def flush():
+    """
+    Writes the buffered games, rewriting each season and home team file they belong to once. Games in the older
+    one-folder-per-game layout for the same seasons are moved into the new files.
+    """
+    pending = pop_pending()
+    for kind, season in sorted({(kind, season) for kind, season, team in pending}):
+        _migrate_season(kind, season, pending)
+    for (kind, season, team), games in sorted(pending.items()):
+        _write_partition(kind, season, team, games)
+
+def get_partition_games(kind, season):
+    """
+    Returns the games in the pbp or toi dataset for a season, not counting buffered games.
+
+    Parameters
+    -----------
+    kind : str
+        'pbp' or 'toi'
+    season : int
+        The season of the game. 2007-08 would be 2007.
+
+    Returns
+    --------
+    set of int
+    """
+    import glob
+    import pyarrow.parquet as pq
+    games = set()
+    pattern = os.path.join(get_dataset_folder(kind), 'season={0:d}'.format(season), 'team=*', 'part-0.parquet')
+    for filename in glob.glob(pattern):
+        games.update(pq.read_table(filename, columns = ['game']).column('game').unique().to_pylist())
+    return games
+
+def _get_filter(seasons = None, games = None, teams = None, events = None, players = None, player_columns = (),
+                strengths = None):
+    """
+    Builds a pyarrow dataset filter expression from the given criteria. Returns None if there are none.
+    """
+    import pyarrow.dataset as ds
+
+    def tolist(x):
+        if x is None:
+            return None
+        if isinstance(x, (str, int)):
+            return [x]
+        return list(x)
+
+    seasons, games, teams, events, players, strengths = [tolist(x) for x in
+                                                         (seasons, games, teams, events, players, strengths)]
+    conditions = []
+    if seasons is not None:
+        conditions.append(ds.field('season').isin(seasons))
+    if games is not None:
+        conditions.append(ds.field('game').isin(games))
+    if teams is not None:
+        conditions.append(ds.field('Home').isin(teams) | ds.field('Away').isin(teams))
+    if events is not None:
+        conditions.append(ds.field('Event').isin(events))
+    if players is not None:
+        players = [int(p) for p in players]
+        playercondition = None
+        for col in player_columns:
+            condition = ds.field(col).isin(players)
+            playercondition = condition if playercondition is None else playercondition | condition
+        conditions.append(playercondition)
+    if strengths is not None:
+        conditions.append(ds.field('Strength').isin(strengths))
+
+    result = None
+    for condition in conditions:
+        result = condition if result is None else result & condition
+    return result
+
+def _read(kind, columns, condition):
+    """
+    Reads the filtered columns of the pbp or toi dataset into a pyarrow table, after writing any buffered games.
+    Returns None if the dataset is empty.
+    """
+    import glob
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    flush()
+    folder = get_dataset_folder(kind)
+    files = sorted(glob.glob(os.path.join(folder, 'season=*', 'team=*', 'part-0.parquet')))
+    if len(files) == 0:
+        return None
+    schema = get_schema(kind, partitions = True)
+    partitioning = ds.partitioning(pa.schema([schema.field('season'), schema.field('team')]), flavor = 'hive')
+    dataset = ds.dataset(files, schema = schema, format = 'parquet', partitioning = partitioning,
+                         partition_base_dir = folder)
+    return dataset.to_table(columns = columns, filter = condition)
+
+def read_pbp(seasons = None, games = None, teams = None, events = None, players = None, columns = None,
+             return_type = 'df', strengths = None):
+    """
+    Reads pbp from the dataset, reading only matching partitions, row groups, and columns.
+
+    Parameters
+    -----------
+    seasons : int or iterable of int, or None
+        The seasons to read. 2007-08 would be 2007. None reads all seasons.
+    games : int or iterable of int, or None
+        The game ids to read. None reads all games.
+    teams : str or iterable of str, or None
+        Only read games involving these teams (abbreviations)
+    events : str or iterable of str, or None
+        Only read these event types, e.g. ['Shot', 'Missed Shot', 'Blocked Shot', 'Goal']
+    players : int or iterable of int, or None
+        Only read events where one of these player IDs is the actor or recipient
+    columns : list of str, or None
+        The columns to read. None reads all columns, plus season and team (the home team).
+    return_type : str
+        'df' for a pandas dataframe or 'arrow' for a pyarrow table
+    strengths : str or iterable of str, or None
+        Only read rows at these strengths, from the home team's perspective, e.g. ['5v4', '4v5']
+
+    Returns
+    --------
+    pandas df or pyarrow table
+        The matching events, or None if there is no pbp dataset yet
+    """
+    condition = _get_filter(seasons, games, teams, events, players, ('Actor', 'Recipient'), strengths)
+    table = _read('pbp', columns, condition)
+    if table is None or return_type == 'arrow':
+        return table
+    return table.to_pandas()
+
+def read_toi(seasons = None, games = None, teams = None, players = None, columns = None, return_type = 'df',
+             strengths = None):
+    """
+    Reads toi from the dataset, reading only matching partitions, row groups, and columns.
+
+    Parameters
+    -----------
+    seasons : int or iterable of int, or None
+        The seasons to read. 2007-08 would be 2007. None reads all seasons.
+    games : int or iterable of int, or None
+        The game ids to read. None reads all games.
+    teams : str or iterable of str, or None
+        Only read games involving these teams (abbreviations)
+    players : int or iterable of int, or None
+        Only read seconds where one of these player IDs is on the ice
+    columns : list of str, or None
+        The columns to read. None reads all columns, plus season and team (the home team).
+    return_type : str
+        'df' for a pandas dataframe or 'arrow' for a pyarrow table
+    strengths : str or iterable of str, or None
+        Only read rows at these strengths, from the home team's perspective, e.g. ['5v4', '4v5']
+
+    Returns
+    --------
+    pandas df or pyarrow table
+        The matching seconds, or None if there is no toi dataset yet
+    """
+    condition = _get_filter(seasons, games, teams, None, players, TOI_COLUMNS[1:], strengths)
+    table = _read('toi', columns, condition)
+    if table is None or return_type == 'arrow':
+        return table
+    return table.to_pandas()
+
+def build_dataset(seasons, force_overwrite = False):
+    """
+    Writes the dataset from games already parsed to HDF5, e.g. to backfill seasons parsed before the dataset existed.
+
+    Parameters
+    -----------
+    seasons : int or iterable of int
+        The seasons to write. 2007-08 would be 2007.
+    force_overwrite : bool
+        If True, rewrites games already in the dataset. If False, only writes missing games.
+    """
+    import pandas as pd
+    import scrape_game
+    import reference_store
+
+    if isinstance(seasons, int):
+        seasons = [seasons]
+    store = reference_store.get_reference_store()
+    for season in seasons:
+        for kind in ('pbp', 'toi'):
+            _migrate_season(kind, season, {})
+        written = {kind: set() if force_overwrite else get_partition_games(kind, season) for kind in ('pbp', 'toi')}
+        basic_gamelog = store.get_quick_gamelog_df()
+        basic_gamelog = basic_gamelog[basic_gamelog.Season == season]
+        for game, home, road in zip(basic_gamelog.Game, basic_gamelog.Home, basic_gamelog.Away):
+            for kind, parsedfile, write in (
+                    ('pbp', scrape_game.get_parsed_save_filename(season, game), write_game_pbp),
+                    ('toi', scrape_game.get_parsed_shifts_save_filename(season, game), write_game_toi)):
+                if int(game) not in written[kind] and os.path.exists(parsedfile):
+                    write(season, int(game), pd.read_hdf(parsedfile), home, road)
+        flush()
+        print('Done writing dataset for', season)
@@ -0,0 +1,224 @@
+"""
+Concurrent HTTP fetching for the NHL API: a token-bucket rate limiter shared by all threads, one keep-alive
+connection per host per thread, and retries with exponential backoff.
+"""
+
+import threading
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+class RateLimiter(object):
+    """
+    A thread-safe token bucket.
+
+    Tokens are added at rate per second, up to burst tokens. Each request takes one token, waiting if none are left.
+
+    Parameters
+    -----------
+    rate : float or None
+        Requests per second. None or 0 means unlimited.
+    burst : int
+        The most requests that can be made back-to-back after an idle period.
+    """
+
+    def __init__(self, rate, burst = 1):
+        import time
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits until a token is available and takes it.
+        """
+        import time
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class FetchError(Exception):
+    """
+    Raised when a url could not be read after all retries.
+    """
+
+    def __init__(self, url, status, reason):
+        super(FetchError, self).__init__('{0:s} returned {1:d} {2:s}'.format(url, status, reason))
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+class Fetcher(object):
+    """
+    Fetches urls from any number of threads, reusing connections and respecting a global rate limit.
+
+    Parameters
+    -----------
+    rate : float or None
+        Requests per second across all threads. None or 0 means unlimited.
+    retries : int
+        The number of times to retry a request after a connection error, 429, or 5xx response.
+    backoff : float
+        Seconds to wait before the first retry. The wait doubles with each further retry.
+    timeout : float
+        Socket timeout in seconds.
+    max_redirects : int
+        The most redirects to follow for one url. Only redirects to the same host are followed.
+    """
+
+    def __init__(self, rate = 1, retries = 3, backoff = 1, timeout = 30, max_redirects = 5):
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._local = threading.local()
+
+    def _get_connection(self, scheme, netloc):
+        """
+        Returns this thread's open connection to the given host, creating it if needed.
+        """
+        import http.client
+        if not hasattr(self._local, 'connections'):
+            self._local.connections = {}
+        key = (scheme, netloc)
+        if key not in self._local.connections:
+            if scheme == 'https':
+                self._local.connections[key] = http.client.HTTPSConnection(netloc, timeout = self.timeout)
+            else:
+                self._local.connections[key] = http.client.HTTPConnection(netloc, timeout = self.timeout)
+        return self._local.connections[key]
+
+    def _drop_connection(self, scheme, netloc):
+        """
+        Closes and forgets this thread's connection to the given host, e.g. after an error.
+        """
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def fetch(self, url):
+        """
+        Reads the given url.
+
+        Parameters
+        -----------
+        url : str
+            The url to read
+
+        Returns
+        --------
+        bytes
+            The response body
+
+        Raises
+        -------
+        FetchError
+            If the server returned an error status that should not be retried, or kept failing after all retries.
+        OSError
+            If the connection kept failing after all retries.
+        """
+        status, body, headers = self.fetch_conditional(url)
+        return body
+
+    def fetch_conditional(self, url, etag = None, last_modified = None):
+        """
+        Reads the given url, asking the server not to resend it if it has not changed.
+
+        Redirects (301, 302, 303, 307, and 308) are followed, up to max_redirects hops, as long as they stay on the
+        same host.
+
+        Parameters
+        -----------
+        url : str
+            The url to read
+        etag : str or None
+            The ETag header from the last time the url was read, sent as If-None-Match
+        last_modified : str or None
+            The Last-Modified header from the last time the url was read, sent as If-Modified-Since
+
+        Returns
+        --------
+        tuple
+            The status (200, or 304 if unchanged), the body (None if unchanged), and the response headers as a dict
+            with lowercase keys
+
+        Raises
+        -------
+        FetchError
+            If the server returned an error status that should not be retried, kept failing after all retries, or
+            redirected to another host or too many times.
+        OSError
+            If the connection kept failing after all retries.
+        """
+        import urllib.parse
+
+        headers = {'Connection': 'keep-alive'}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        if last_modified is not None:
+            headers['If-Modified-Since'] = last_modified
+
+        host = urllib.parse.urlsplit(url).hostname
+        for hop in range(self.max_redirects + 1):
+            status, reason, body, responseheaders = self._request(url, headers)
+            if status == 200:
+                return 200, body, responseheaders
+            if status == 304:
+                return 304, None, responseheaders
+            if status not in REDIRECT_STATUSES or 'location' not in responseheaders:
+                raise FetchError(url, status, reason)
+            target = urllib.parse.urljoin(url, responseheaders['location'])
+            if urllib.parse.urlsplit(target).hostname != host:
+                raise FetchError(url, status, 'redirect to another host: {0:s}'.format(target))
+            url = target
+        raise FetchError(url, status, 'more than {0:d} redirects'.format(self.max_redirects))
+
+    def _request(self, url, headers):
+        """
+        Makes one GET request, retrying after connection errors, 429, and 5xx responses.
+
+        Returns
+        --------
+        tuple
+            The status, reason, body, and response headers (a dict with lowercase keys) of the last response
+        """
+        import time
+        import http.client
+        import urllib.parse
+
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.limiter.acquire()
+            conn = self._get_connection(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path, headers = headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt == self.retries:
+                    raise
+                continue
+
+            if response.will_close:
+                self._drop_connection(parts.scheme, parts.netloc)
+            if response.status != 429 and response.status < 500:
+                break
+        return response.status, response.reason, body, {key.lower(): value for key, value in response.getheaders()}
@@ -1,6 +1,7 @@
 import dash_core_components as dcc
 import dash_html_components as html
 import dash
+import dashdata
 
 app = dash.Dash()
 
@@ -8,12 +9,17 @@ markdown_text = '''
 ### scrapenhl
 
 This is a python package to help you scrape, manipulate, and visualize hockey data. 
-Date last updated: _____
+Date last updated: {0:s}
 '''
 
-app.layout = html.Div([
-    dcc.Markdown(children=markdown_text)
-])
+### The layout is a function, so the date is read from the dashboard snapshot (see dashdata.py) per page load
+def serve_layout():
+    snapshot = dashdata.get_snapshot(build_if_missing=False)
+    return html.Div([
+        dcc.Markdown(children=markdown_text.format(snapshot.updated if snapshot is not None else 'never'))
+    ])
+
+app.layout = serve_layout
 
 ### TODO add links to other pages
 ### TODO add button to autoupdate()
@@ -0,0 +1,193 @@
+"""
+A process-wide cache of team logs (see scrape_season.get_team_pbplog and get_team_toilog), so dashboards and analysis
+loops that revisit the same team-season do not reread it every time.
+
+Entries are keyed on the log's path and modification time, so a log rewritten by update_teamlogs is reread on its next
+use. Memory use is capped at scrapenhl_globals.TEAMLOG_CACHE_BYTES; the least recently used logs are evicted first.
+If scrapenhl_globals.TEAMLOG_CACHE_SPILL is True, evicted logs are written as single feather files to
+SAVE_FOLDER/cache/teamlogs (itself capped at TEAMLOG_CACHE_SPILL_BYTES) and read back from there, which is much faster
+than reassembling a log from its per-game files. Spilled files are named by key, so other processes reuse them too.
+"""
+
+import scrapenhl_globals
+import os.path
+import threading
+
+class LRUCache(object):
+    """
+    A thread-safe cache of dataframes, evicting the least recently used entries once their total size passes max_bytes.
+
+    Parameters
+    -----------
+    max_bytes : int
+        The most memory, in bytes (as measured by DataFrame.memory_usage(deep = True)), that cached dataframes can use
+    spill_folder : str or None
+        If given, evicted dataframes are written here and read back on their next use instead of being reloaded
+    max_spill_bytes : int
+        The most disk space spilled files can use. The oldest are deleted first.
+    """
+
+    def __init__(self, max_bytes, spill_folder = None, max_spill_bytes = 2 ** 32):
+        import collections
+        self.max_bytes = max_bytes
+        self.spill_folder = spill_folder
+        self.max_spill_bytes = max_spill_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def _get_spill_filename(self, key):
+        """
+        Returns the file an entry is spilled to, named by a hash of its key.
+        """
+        import hashlib
+        return os.path.join(self.spill_folder, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.feather')
+
+    def get(self, key, loader):
+        """
+        Returns the cached dataframe for key, calling loader() to load it if it is not cached.
+
+        The result is a shallow copy of the cached dataframe, so adding or replacing its columns does not change the
+        cache (with pandas copy-on-write, neither does any other change).
+
+        Parameters
+        -----------
+        key : tuple
+            The entry's key. Entries whose key has the same first element (e.g. a path) are dropped when a new one is
+            loaded, since they are stale versions of it.
+        loader : function
+            Called with no arguments to load the dataframe on a miss
+
+        Returns
+        --------
+        pandas df
+            The dataframe
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0].copy(deep = False)
+
+        df = None
+        if self.spill_folder is not None and os.path.exists(self._get_spill_filename(key)):
+            import feather
+            try:
+                df = feather.read_dataframe(self._get_spill_filename(key))
+                self.spill_hits += 1
+            except Exception:
+                df = None
+        if df is None:
+            df = loader()
+            self.misses += 1
+        self.put(key, df)
+        return df.copy(deep = False)
+
+    def put(self, key, df):
+        """
+        Adds a dataframe to the cache, dropping stale entries with the same first key element and evicting the least
+        recently used entries if the cache is over max_bytes. Dataframes bigger than max_bytes are not cached.
+        """
+        size = int(df.memory_usage(index = True, deep = True).sum())
+        with self._lock:
+            for oldkey in [k for k in self._entries if k[0] == key[0] and k != key]:
+                self._drop(oldkey)
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (df, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldkey, (olddf, oldsize) = self._entries.popitem(last = False)
+                self.bytes -= oldsize
+                self.evictions += 1
+                self._spill(oldkey, olddf)
+
+    def _drop(self, key):
+        """
+        Removes an entry from memory without spilling it.
+        """
+        df, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def _spill(self, key, df):
+        """
+        Writes an evicted dataframe to the spill folder, then deletes the oldest spilled files if over
+        max_spill_bytes.
+        """
+        if self.spill_folder is None:
+            return
+        filename = self._get_spill_filename(key)
+        if not os.path.exists(filename):
+            try:
+                scrapenhl_globals.write_feather(df, filename)
+            except Exception as e:
+                print('Could not spill', key, 'to disk:', e)
+                return
+
+        files = [os.path.join(self.spill_folder, x) for x in os.listdir(self.spill_folder) if x[-8:] == '.feather']
+        files = sorted((os.stat(f).st_mtime, os.path.getsize(f), f) for f in files)
+        total = sum(size for mtime, size, f in files)
+        for mtime, size, f in files:
+            if total <= self.max_spill_bytes:
+                break
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Empties the in-memory cache. Spilled files are left for reuse.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        """
+        Returns the cache's counters.
+
+        Returns
+        --------
+        dict
+            Keys hits, misses (loads from the source), spill_hits (loads from the spill folder), evictions, entries,
+            bytes, and max_bytes
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'spill_hits': self.spill_hits,
+                    'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self.bytes,
+                    'max_bytes': self.max_bytes}
+
+_CACHE = None
+
+def get_teamlog_cache():
+    """
+    Returns the process-wide team log cache, creating it from the settings in scrapenhl_globals if needed (or if they
+    have changed).
+    """
+    global _CACHE
+    spill_folder = os.path.join(scrapenhl_globals.SAVE_FOLDER, 'cache', 'teamlogs') \
+        if scrapenhl_globals.TEAMLOG_CACHE_SPILL else None
+    if _CACHE is None or _CACHE.spill_folder != spill_folder:
+        _CACHE = LRUCache(scrapenhl_globals.TEAMLOG_CACHE_BYTES, spill_folder,
+                          scrapenhl_globals.TEAMLOG_CACHE_SPILL_BYTES)
+    _CACHE.max_bytes = scrapenhl_globals.TEAMLOG_CACHE_BYTES
+    _CACHE.max_spill_bytes = scrapenhl_globals.TEAMLOG_CACHE_SPILL_BYTES
+    return _CACHE
+
+def get_path_key(path):
+    """
+    Returns the cache key for a team log file or folder: its path and modification time, or None if it does not
+    exist. Team log partitions are written by replacing files (see scrapenhl_globals.write_feather), which updates
+    the folder's modification time.
+    """
+    if not os.path.exists(path):
+        return None
+    return (path, os.stat(path).st_mtime_ns)
@@ -0,0 +1,205 @@
+"""
+A per-season manifest of what has been built from each game, so updates only redo the work for new or changed games.
+
+For each game, the manifest records the sha256 of the raw pbp and shift pages, the raw hashes that were parsed and the
+sha256 of the parsed files, and, for each downstream stage (team logs, toi matrix, Corsi table), the parsed hashes it
+was last built from. A stage is out of date for a game when its recorded hashes differ from the current parsed ones.
+
+Hashes are cached with each file's size and modification time, so checking an unchanged season only stats files.
+"""
+
+import scrapenhl_globals
+import os.path
+
+STAGES = ('teamlogs', 'toimatrix', 'corsi')
+
+def get_manifest_filename(season):
+    """
+    Returns the file holding this season's manifest.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+
+    Returns
+    --------
+    str
+        SAVE_FOLDER/Season/manifest.json
+    """
+    return os.path.join(scrapenhl_globals.get_season_folder(season), 'manifest.json')
+
+def read_manifest(season):
+    """
+    Reads this season's manifest.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+
+    Returns
+    --------
+    dict
+        Game id (as str) to that game's entry. Empty if there is no manifest yet.
+    """
+    import json
+    filename = get_manifest_filename(season)
+    if not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, 'r') as reader:
+            return json.load(reader)
+    except ValueError:
+        return {}
+
+def write_manifest(season, manifest):
+    """
+    Writes this season's manifest, via a temporary file.
+    """
+    import os
+    import json
+    filename = get_manifest_filename(season)
+    with open(filename + '.tmp', 'w') as writer:
+        json.dump(manifest, writer, sort_keys = True)
+    os.replace(filename + '.tmp', filename)
+
+def _get_entry(manifest, game):
+    """
+    Returns the game's manifest entry, creating it if needed.
+    """
+    return manifest.setdefault(str(game), {'files': {}})
+
+def _hash_file(entry, filename, decompress = False, knownhash = None):
+    """
+    Returns the sha256 of a file (of its decompressed contents if decompress), or None if it does not exist.
+
+    The hash is cached in the entry with the file's size and modification time and only recomputed when they change.
+    knownhash, if given, is used instead of reading the file when the cache is stale.
+    """
+    import hashlib
+    import rawcodec
+    key = os.path.basename(filename)
+    if not os.path.exists(filename):
+        entry['files'].pop(key, None)
+        return None
+    stat = os.stat(filename)
+    fingerprint = [stat.st_size, stat.st_mtime_ns]
+    cached = entry['files'].get(key)
+    if cached is not None and cached[:2] == fingerprint:
+        return cached[2]
+    if knownhash is None:
+        with open(filename, 'rb') as reader:
+            contents = reader.read()
+        knownhash = hashlib.sha256(rawcodec.decompress(contents) if decompress else contents).hexdigest()
+    entry['files'][key] = fingerprint + [knownhash]
+    return knownhash
+
+def _hash_archived_page(entry, season, game, kind, location, knownhash = None):
+    """
+    Returns the sha256 of a page in the season archive (see rawarchive), like _hash_file. The archive is append-only,
+    so a page's offset and length change whenever it is rewritten, and are cached in place of size and mtime.
+    """
+    import hashlib
+    import rawarchive
+    import scrape_game
+    key = os.path.basename(scrape_game.get_raw_filename(season, game, kind))
+    codec, offset, length = location
+    fingerprint = [length, 'archive:{0:d}'.format(offset)]
+    cached = entry['files'].get(key)
+    if cached is not None and cached[:2] == fingerprint:
+        return cached[2]
+    if knownhash is None:
+        knownhash = hashlib.sha256(rawarchive.read_page(season, game, kind)).hexdigest()
+    entry['files'][key] = fingerprint + [knownhash]
+    return knownhash
+
+def get_raw_hashes(manifest, season, game):
+    """
+    Returns the sha256 of the game's raw pbp and shift pages, using the fetch metadata's hashes when available.
+
+    Parameters
+    -----------
+    manifest : dict
+        The season's manifest (see read_manifest). Cached hashes are updated in place.
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+
+    Returns
+    --------
+    dict
+        Keys pbp and shift, with None for missing pages
+    """
+    import scrape_game
+    import rawarchive
+    entry = _get_entry(manifest, game)
+    meta = scrape_game.read_fetch_meta(season, game)
+    hashes = {}
+    for kind in ('pbp', 'shift'):
+        filename = scrape_game.get_raw_filename(season, game, kind)
+        location = rawarchive.get_page_location(season, game, kind)
+        if location is not None and (scrapenhl_globals.USE_RAW_ARCHIVE or not os.path.exists(filename)):
+            hashes[kind] = _hash_archived_page(entry, season, game, kind, location, meta.get(kind, {}).get('sha256'))
+        else:
+            hashes[kind] = _hash_file(entry, filename, True, meta.get(kind, {}).get('sha256'))
+    return hashes
+
+def get_parsed_hashes(manifest, season, game):
+    """
+    Returns the sha256 of the game's parsed pbp and toi files.
+
+    Parameters
+    -----------
+    manifest : dict
+        The season's manifest (see read_manifest). Cached hashes are updated in place.
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+
+    Returns
+    --------
+    dict
+        Keys pbp and shift, with None for missing files
+    """
+    import scrape_game
+    entry = _get_entry(manifest, game)
+    return {kind: _hash_file(entry, filename)
+            for kind, filename in (('pbp', scrape_game.get_parsed_save_filename(season, game)),
+                                   ('shift', scrape_game.get_parsed_shifts_save_filename(season, game)))}
+
+def needs_parse(manifest, season, game):
+    """
+    Returns True if the game's raw pages exist and have not been parsed in their current form, or a parsed file is
+    missing.
+    """
+    raw = get_raw_hashes(manifest, season, game)
+    if raw['pbp'] is None and raw['shift'] is None:
+        return False
+    parsed = get_parsed_hashes(manifest, season, game)
+    if any(raw[kind] is not None and parsed[kind] is None for kind in raw):
+        return True
+    return _get_entry(manifest, game).get('parsed_from') != raw
+
+def mark_parsed(manifest, season, game):
+    """
+    Records that the game's current raw pages have been parsed.
+    """
+    _get_entry(manifest, game)['parsed_from'] = get_raw_hashes(manifest, season, game)
+
+def needs_stage(manifest, season, game, stage):
+    """
+    Returns True if the stage (one of STAGES) was not built from the game's current parsed files.
+    """
+    parsed = get_parsed_hashes(manifest, season, game)
+    if parsed['pbp'] is None and parsed['shift'] is None:
+        return False
+    return _get_entry(manifest, game).get(stage) != parsed
+
+def mark_stage(manifest, season, game, stage):
+    """
+    Records that the stage (one of STAGES) has been built from the game's current parsed files.
+    """
+    _get_entry(manifest, game)[stage] = get_parsed_hashes(manifest, season, game)
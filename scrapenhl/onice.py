@@ -0,0 +1,290 @@
+"""
+An interval index over raw shift starts and ends, for attaching the players on ice to events without expanding shifts
+into one row per second.
+"""
+
+import scrapenhl_globals
+import scrape_game
+import reference_store
+
+### Keys are game position * GAME_STRIDE + second, so intervals from different games never overlap
+GAME_STRIDE = 100000
+### Shifts are bucketed by length so that short shifts are searched in a short window and long ones (goalies) in a
+### long one
+LENGTH_BUCKETS = (128, 1024, GAME_STRIDE)
+ON_ICE_COLUMNS = ['H1', 'H2', 'H3', 'H4', 'H5', 'H6', 'HG', 'R1', 'R2', 'R3', 'R4', 'R5', 'R6', 'RG']
+
+class ShiftIntervalIndex(object):
+    """
+    Sorted arrays of shift intervals for many games, queried with np.searchsorted.
+
+    A player is on ice at second t if start <= t <= end, using the same start and end seconds as the toi table (see
+    scrape_game.read_shift_intervals_from_json).
+
+    Parameters
+    -----------
+    games : array of int
+        The game id of each shift
+    players : array of int
+        The player ID of each shift
+    home : array of bool
+        Whether each shift is by a home player
+    starts : array of int
+        The first second of each shift
+    ends : array of int
+        The last second of each shift
+    goalies : set of int, or None
+        Goalie player IDs. If None, taken from positions in the player ID table.
+    """
+
+    def __init__(self, games, players, home, starts, ends, goalies = None):
+        import numpy as np
+
+        if goalies is None:
+            goalies = get_goalie_ids()
+        games = np.asarray(games, dtype = np.int64)
+        self.games = np.unique(games)
+        gamepos = np.searchsorted(self.games, games)
+        starts = np.asarray(starts, dtype = np.int64)
+        ends = np.maximum(np.asarray(ends, dtype = np.int64), starts)
+        players = np.asarray(players, dtype = np.int64)
+        isgoalie = np.isin(players, np.array(sorted(goalies), dtype = np.int64))
+        lengths = ends - starts + 1
+
+        self.buckets = []
+        lower = 0
+        for upper in LENGTH_BUCKETS:
+            inbucket = (lengths > lower) & (lengths <= upper)
+            startkeys = gamepos[inbucket] * GAME_STRIDE + starts[inbucket]
+            order = np.argsort(startkeys, kind = 'stable')
+            self.buckets.append({'Window': upper,
+                                 'Start': startkeys[order],
+                                 'End': (gamepos[inbucket] * GAME_STRIDE + ends[inbucket])[order],
+                                 'Player': players[inbucket][order],
+                                 'Home': np.asarray(home, dtype = bool)[inbucket][order],
+                                 'Goalie': isgoalie[inbucket][order]})
+            lower = upper
+
+    @classmethod
+    def from_season(cls, season, games = None, goalies = None):
+        """
+        Builds the index from the raw shift files saved for a season.
+
+        Parameters
+        -----------
+        season : int
+            The season of the game. 2007-08 would be 2007.
+        games : iterable of int, or None
+            The game ids to include. If None, all games in the game log for this season.
+        goalies : set of int, or None
+            Goalie player IDs. If None, taken from positions in the player ID table.
+
+        Returns
+        --------
+        ShiftIntervalIndex
+            The index
+        """
+        import os.path
+        import json
+        import numpy as np
+
+        store = reference_store.get_reference_store()
+        if games is None:
+            games = [row['Game'] for row in store.get_season_games(season)]
+
+        pieces = []
+        for game in sorted(games):
+            thisgamedata = store.get_game(season, game)
+            if thisgamedata is None or not scrape_game.raw_page_exists(season, game, 'shift'):
+                continue
+            try:
+                data = scrape_game.decode_json(scrape_game.read_game_page(season, game, 'shift'), (('data',),))['data']
+            except (json.JSONDecodeError, KeyError):
+                continue
+            if len(data) == 0:
+                continue
+            ids, teams, starts, ends, durations = scrape_game.read_shift_intervals_from_json(data)
+            pieces.append((np.full(len(ids), game), ids, teams == thisgamedata['Home'], starts, ends))
+
+        if len(pieces) == 0:
+            return cls([], [], [], [], [], goalies = goalies if goalies is not None else set())
+        return cls(*[np.concatenate(x) for x in zip(*pieces)], goalies = goalies)
+
+    def on_ice(self, games, times, chunksize = 50000):
+        """
+        Returns the players on ice at each (game, second).
+
+        Parameters
+        -----------
+        games : array of int
+            The game id of each query
+        times : array of int
+            The second of each query, e.g. the Seconds column of the pbp
+        chunksize : int
+            Queries are answered this many at a time, to bound memory use
+
+        Returns
+        --------
+        np.array
+            int64 array of shape (len(times), 14), with columns as in ON_ICE_COLUMNS: up to six home skaters (sorted by
+            ID), the home goalie, then the same for the road team. 0 where there is no player.
+        """
+        import numpy as np
+
+        games = np.asarray(games, dtype = np.int64)
+        times = np.asarray(times, dtype = np.int64)
+        result = np.zeros((len(times), len(ON_ICE_COLUMNS)), dtype = np.int64)
+
+        gamepos = np.searchsorted(self.games, games)
+        known = (gamepos < len(self.games)) & (self.games[np.minimum(gamepos, len(self.games) - 1)] == games) \
+            if len(self.games) > 0 else np.zeros(len(games), dtype = bool)
+        keys = gamepos * GAME_STRIDE + times
+
+        for first in range(0, len(keys), chunksize):
+            chunk = np.arange(first, min(first + chunksize, len(keys)))
+            chunk = chunk[known[chunk]]
+            self._fill(keys[chunk], chunk, result)
+        return result
+
+    def _fill(self, keys, rows, result):
+        """
+        Finds the intervals containing each key and writes their players into result[rows].
+        """
+        import numpy as np
+
+        matchrows = []
+        matchplayers = []
+        matchhome = []
+        matchgoalie = []
+        for bucket in self.buckets:
+            ### Only shifts starting within the bucket's window before the key can contain it
+            lo = np.searchsorted(bucket['Start'], keys - bucket['Window'] + 1, side = 'left')
+            hi = np.searchsorted(bucket['Start'], keys, side = 'right')
+            counts = hi - lo
+            queries = np.repeat(np.arange(len(keys)), counts)
+            candidates = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + lo[queries]
+            inside = bucket['End'][candidates] >= keys[queries]
+            matchrows.append(rows[queries[inside]])
+            matchplayers.append(bucket['Player'][candidates[inside]])
+            matchhome.append(bucket['Home'][candidates[inside]])
+            matchgoalie.append(bucket['Goalie'][candidates[inside]])
+
+        matchrows, matchplayers, matchhome, matchgoalie = [np.concatenate(x) for x in
+                                                            (matchrows, matchplayers, matchhome, matchgoalie)]
+        if len(matchrows) == 0:
+            return
+
+        ### Sort by query, team, skaters before goalies, then player; drop duplicate entries for the same player
+        order = np.lexsort((matchplayers, matchgoalie, ~matchhome, matchrows))
+        matchrows, matchplayers, matchhome, matchgoalie = [x[order] for x in
+                                                            (matchrows, matchplayers, matchhome, matchgoalie)]
+        keep = np.r_[True, (matchrows[1:] != matchrows[:-1]) | (matchplayers[1:] != matchplayers[:-1])]
+        matchrows, matchplayers, matchhome, matchgoalie = [x[keep] for x in
+                                                            (matchrows, matchplayers, matchhome, matchgoalie)]
+
+        ### Position within each (query, team, goalie) group
+        idx = np.arange(len(matchrows))
+        newgroup = np.r_[True, (matchrows[1:] != matchrows[:-1]) | (matchhome[1:] != matchhome[:-1]) |
+                         (matchgoalie[1:] != matchgoalie[:-1])]
+        rank = idx - np.maximum.accumulate(np.where(newgroup, idx, 0))
+
+        column = np.where(matchhome, 0, 7) + np.where(matchgoalie, 6, rank)
+        fits = np.where(matchgoalie, rank == 0, rank < 6)
+        result[matchrows[fits], column[fits]] = matchplayers[fits]
+
+def get_goalie_ids(store = None):
+    """
+    Returns the IDs of all players listed as goalies in the player ID table.
+
+    Parameters
+    -----------
+    store : reference_store.ReferenceStore or None
+        The reference tables to read. If None, uses reference_store.get_reference_store()
+
+    Returns
+    --------
+    set of int
+        Goalie player IDs
+    """
+    if store is None:
+        store = reference_store.get_reference_store()
+    return store.get_goalie_ids()
+
+def get_on_ice_from_matrix(season, games, times, goalies = None):
+    """
+    Returns the players on ice at each (game, second) from the season's toi matrix (see toimatrix.py), in the layout
+    of ShiftIntervalIndex.on_ice.
+
+    The matrix keeps six players per team per second, so unlike the interval index this cannot show a seventh player
+    during a too-many-men overlap.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : array of int
+        The game id of each query
+    times : array of int
+        The second of each query, e.g. the Seconds column of the pbp
+    goalies : set of int, or None
+        Goalie player IDs. If None, taken from positions in the player ID table.
+
+    Returns
+    --------
+    np.array
+        int64 array of shape (len(times), 14), with columns as in ON_ICE_COLUMNS. 0 where there is no player.
+    """
+    import numpy as np
+    import toimatrix
+
+    if goalies is None:
+        goalies = get_goalie_ids()
+    goalies = np.array(sorted(goalies), dtype = np.int64)
+    empty = np.iinfo(np.int64).max
+    games = np.asarray(games, dtype = np.int64)
+    times = np.asarray(times, dtype = np.int64)
+    result = np.zeros((len(times), len(ON_ICE_COLUMNS)), dtype = np.int64)
+    for game in np.unique(games):
+        rows = np.nonzero(games == game)[0]
+        players = toimatrix.get_players_on_ice(season, int(game), times[rows]).astype(np.int64)
+        for start, first in ((0, 0), (6, 7)):
+            team = players[:, start:start + 6]
+            isgoalie = (team != 0) & np.isin(team, goalies)
+            ### Skaters sorted by ID, then empty slots; the goalie (the lowest ID, if two) gets its own column
+            skaters = np.sort(np.where(isgoalie | (team == 0), empty, team), axis = 1)
+            goalie = np.where(isgoalie, team, empty).min(axis = 1)
+            result[rows, first:first + 6] = np.where(skaters == empty, 0, skaters)
+            result[rows, first + 6] = np.where(goalie == empty, 0, goalie)
+    return result
+
+def attach_on_ice(events, season, index = None):
+    """
+    Adds the players on ice to a season's worth of events in one vectorized call.
+
+    Parameters
+    -----------
+    events : pandas df
+        Events with Game and Seconds columns, e.g. from scrape_season.get_team_pbplog
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    index : ShiftIntervalIndex or None
+        The index to query. If None, the players are read from the season's toi matrix if it is current for the games
+        in events (see toimatrix.is_current), and otherwise an index is built for those games.
+
+    Returns
+    --------
+    pandas df
+        events with the columns in ON_ICE_COLUMNS added (home skaters H1-H6, home goalie HG, road R1-R6 and RG), 0
+        where there is no player
+    """
+    import pandas as pd
+    import toimatrix
+    games = set(int(g) for g in events.Game.unique())
+    if index is None and len(games) > 0 and toimatrix.is_current(season, games):
+        onice = get_on_ice_from_matrix(season, events.Game.values, events.Seconds.values)
+    else:
+        if index is None:
+            index = ShiftIntervalIndex.from_season(season, games)
+        onice = index.on_ice(events.Game.values, events.Seconds.values)
+    return pd.concat([events.reset_index(drop = True),
+                      pd.DataFrame(onice, columns = ON_ICE_COLUMNS)], axis = 1)
@@ -1,10 +1,32 @@
 import scrapenhl_globals
 import scrape_season
 import scrape_game
+import strength
 
-def get_player_cf(player, seasons=None):
+def get_player_cf(player, seasons=None, strengths=None):
+    """
+    Returns a player's Corsi for, against, and TOI by season, from the per-player-game Corsi table (see corsi.py)
 
-    player_gamelog = scrapenhl_globals.get_player_gamelog()
+    Parameters
+    -----------
+    player : int or str
+        The player ID or name
+    seasons : int or iterable of ints
+        The seasons of the game. 2007-08 would be 2007. Defaults to the three seasons before MAX_SEASON.
+    strengths: str or iterable of str
+        The strengths to include, from the player's team's perspective, e.g. '5v5'. Defaults to all.
+
+    Returns
+    --------
+    pandas df
+        One row per season, with CF, CA, TOI (seconds), and CF% (0-100)
+
+    Raises
+    -------
+    ValueError
+        If player is a name that matches no player
+    """
+    import corsi
 
     #Turn seasons into a set of acceptable values
     if seasons is None:
@@ -15,11 +37,45 @@ def get_player_cf(player, seasons=None):
         seasons = set(seasons)
 
     #Turn player name into ID if needed
+    if isinstance(player, str) and not player.isdigit():
+        pid = scrapenhl_globals.player_name_to_id(player)
+        if pid is None:
+            raise ValueError('No player found named {0:s}'.format(player))
+        player = pid
+    player = int(player)
+
+    df = corsi.get_player_corsi(sorted(seasons))
+    df = df[df.Player == player]
+    df = strength.filter_strength(df, strengths)
+    df = df[['Season', 'CF', 'CA', 'TOI']].groupby('Season', as_index=False).sum()
+    df['CF%'] = 100 * df.CF / (df.CF + df.CA)
+    return df
+
+def get_pbp(seasons=None, teams=None, events=None, players=None, columns=None):
+    """
+    Returns league-wide PBP events from the Parquet dataset, reading only what the filters need
 
+    Parameters
+    -----------
+    seasons : int or iterable of ints
+        The seasons of the game. 2007-08 would be 2007.
+    teams: str or iterable of str
+        Only games involving these teams
+    events: str or iterable of str
+        The event types, e.g. ['Shot', 'Missed Shot', 'Blocked Shot', 'Goal']
+    players: int or iterable of int
+        Player IDs; only events where one of them is the actor or recipient
+    columns: list of str
+        The columns to read
+    """
+    import dataset
+    return dataset.read_pbp(seasons=seasons, teams=teams, events=events, players=players, columns=columns)
 
-def read_team_pbp(season, team, types=None, strengths=None):
+def read_team_pbp(season, team, types=None, strengths=None, actors=None, recipients=None, on_ice=None, columns=None,
+                  games=None, return_type='df'):
     """
-    Returns PBP events for all players in this season
+    Returns PBP events for all players in this season. Filters and columns are pushed down to the team log read (see
+    teamquery.py); use teamquery.team_pbp directly to build more involved queries.
 
     Parameters
     -----------
@@ -27,41 +83,33 @@ def read_team_pbp(season, team, types=None, strengths=None):
         The season of the game. 2007-08 would be 2007.
     team: str
         The team to consider.
-    strength: str
-        The strength to filter to
-    actors: str or iterable of str
-        The player names
-    recipients: str or iterable of str
-        The recipient names
-    on_ice: str or iterable of str
-        players on ice
+    types: str or iterable of str
+        The event types, e.g. ['Shot', 'Missed Shot', 'Blocked Shot', 'Goal']
+    strengths: str or iterable of str
+        The strengths to filter to, from this team's perspective, e.g. '5v5' or ['5v4', '5v3']
+    actors: str, int, or iterable of str or int
+        The player names or IDs
+    recipients: str, int, or iterable of str or int
+        The recipient names or IDs
+    on_ice: str, int, or iterable of str or int
+        Players (names or IDs); only events with at least one of them on ice
+    columns: list of str
+        The columns to return. Defaults to all.
+    games: int or iterable of int
+        The games to read. Defaults to all.
     return_type: str
-        The return type. Can return pandas dataframe rows with 'rows' or full dataframe with 'df'
+        'df' for a dataframe, 'arrow' for a pyarrow table, 'chunks' for an iterator of dataframes, or 'rows' for an
+        iterator of row namedtuples
     """
-    df = scrape_season.get_team_pbplog(season, team)
-
-    ### Filter strength
+    import teamquery
+    query = teamquery.team_pbp(season, team).games(games).events(types).strengths(strengths) \
+        .actors(actors).recipients(recipients).on_ice(on_ice).columns(columns)
+    return teamquery.run(query, return_type)
 
-    ### Filter actor
-
-    ### Filter recipient
-
-    ### Filter on_ice
-
-    ### Move this to the get_team_pbplog method
-
-    ### Return type
-    if return_type == 'rows':
-        return df.iterrows()
-    elif return_type == 'df':
-        return df
-    else:
-        print('Invalid return type specification for read_team_toi; use "rows" or "df"')
-        return df
-
-def read_team_toi(season, team, strengths=None, return_type='rows'):
+def read_team_toi(season, team, strengths=None, on_ice=None, columns=None, games=None, return_type='rows'):
     """
-    Returns TOI totals for all players in this season on this team
+    Returns the second-by-second TOI log for this team in this season. Filters and columns are pushed down to the team
+    log read (see teamquery.py).
 
     Parameters
     -----------
@@ -69,54 +117,120 @@ def read_team_toi(season, team, strengths=None, return_type='rows'):
         The season of the game. 2007-08 would be 2007.
     team: str
         The team to consider.
-    strength: str
-        The strength to filter to
+    strengths: str or iterable of str
+        The strengths to filter to, from this team's perspective, e.g. '5v5' or ['5v4', '5v3']
+    on_ice: str, int, or iterable of str or int
+        Players (names or IDs); only seconds with at least one of them on ice
+    columns: list of str
+        The columns to return. Defaults to all.
+    games: int or iterable of int
+        The games to read. Defaults to all.
     return_type: str
-        The return type. Can return pandas dataframe rows with 'rows' or full dataframe with 'df'
+        'rows' for an iterator of row namedtuples, 'df' for a dataframe, 'arrow' for a pyarrow table, or 'chunks' for
+        an iterator of dataframes
     """
-    df = scrape_season.get_team_toilog(season, team)
-
-    ### Filter strength
-
-    ### Wide to long on players
+    import teamquery
+    query = teamquery.team_toi(season, team).games(games).strengths(strengths).on_ice(on_ice).columns(columns)
+    return teamquery.run(query, return_type)
 
-    ### Join correct names
-
-    ### Return type
-    if return_type == 'rows':
-        return df.iterrows()
-    elif return_type == 'df':
-        return df
-    else:
-        print('Invalid return type specification for read_team_toi; use "rows" or "df"')
-        return df
-
-def get_toi():
+def get_toi(seasons=None, teams=None, strengths=None, workers=1, batch_size=65536):
     """
-    Returns TOI totals for all players in this season
+    Returns TOI totals for all players in these seasons, by season, team, and strength
+
+    Team toi logs are streamed (see teamquery.TeamLogQuery.iter_chunks) and each chunk is reduced to per-player
+    seconds before the next is read, so memory stays bounded by the chunk size rather than the size of a season.
 
     Parameters
     -----------
     seasons : iterable of ints
-        The seasons of the game. 2007-08 would be 2007. Can also just be an int
+        The seasons of the game. 2007-08 would be 2007. Can also just be an int. Defaults to the three seasons before
+        MAX_SEASON.
     teams: iterable of str
-        The teams to consider. Can also be a single str.
+        The teams to consider. Can also be a single str. Defaults to every team in the game log for each season.
+    strengths: str or iterable of str
+        The strengths to include, from the player's team's perspective, e.g. '5v5'. Defaults to all.
+    workers: int
+        The number of processes to read team logs in. Each process reduces whole team logs.
+    batch_size: int
+        The most toi log rows (seconds) to hold in memory at once per process
+
+    Returns
+    --------
+    pandas df
+        Columns Season, Team, Player, Strength, and TOI (seconds)
     """
-    import feather
     import pandas as pd
-    import os.path
+
+    if seasons is None:
+        seasons = [x for x in range(scrapenhl_globals.MAX_SEASON - 3, scrapenhl_globals.MAX_SEASON)]
+    if isinstance(seasons, int):
+        seasons = [seasons]
+    if isinstance(teams, str):
+        teams = [teams]
 
     basic_gamelog = scrapenhl_globals.get_quick_gamelog_file()
+    tasks = []
+    for season in sorted(seasons):
+        seasonlog = basic_gamelog[basic_gamelog.Season == season]
+        seasonteams = set(seasonlog.Home) | set(seasonlog.Away)
+        if teams is not None:
+            seasonteams &= set(teams)
+        tasks += [(season, team) for team in sorted(seasonteams)]
+
+    if workers > 1:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_get_team_toi, *zip(*tasks), [strengths] * len(tasks),
+                                        [batch_size] * len(tasks))) if len(tasks) > 0 else []
+    else:
+        results = [_get_team_toi(season, team, strengths, batch_size) for season, team in tasks]
 
-    alltoi = {}
+    columns = ['Season', 'Team', 'Player', 'Strength', 'TOI']
+    results = [df for df in results if len(df) > 0]
+    if len(results) == 0:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(results, ignore_index=True)[columns]
 
-    for season in seasons:
-        teams = {x for x in \
-                 basic_gamelog.query('Season == {0:d}'.format(season))['Home'].drop_duplicates()} | \
-                {x for x in \
-                 basic_gamelog.query('Season == {0:d}'.format(season))['Away'].drop_duplicates()}
+def _get_team_toi(season, team, strengths=None, batch_size=65536):
+    """
+    Reduces one team's toi log for one season to seconds per player and strength, one chunk at a time.
 
-        for team in teams:
-            df = scrape_season.get_team_toilog(season, team)
-            ### Melt this to be long on player IDs
-            ### Group by
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team: str
+        The team abbreviation
+    strengths: str or iterable of str
+        The strengths to include, from this team's perspective. Defaults to all.
+    batch_size: int
+        The most rows to read at once
+
+    Returns
+    --------
+    pandas df
+        Columns Season, Team, Player, Strength, and TOI (seconds), sorted by player and strength
+    """
+    import numpy as np
+    import pandas as pd
+    import teamquery
+
+    query = teamquery.team_toi(season, team).strengths(strengths)
+    playercols = query.get_player_columns('team')
+    totals = {}
+    if len(playercols) > 0:
+        for chunk in query.columns(playercols + ['Strength']).iter_chunks(batch_size):
+            ids = chunk[playercols].to_numpy(dtype=np.float64, na_value=np.nan)
+            codes, labels = pd.factorize(chunk.Strength.astype(str).values)
+            valid = ~np.isnan(ids) & (ids > 0)
+            rows = np.nonzero(valid)[0]
+            keys = ids[valid].astype(np.int64) * len(labels) + codes[rows]
+            keys, counts = np.unique(keys, return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                pid, code = divmod(key, len(labels))
+                totals[(pid, labels[code])] = totals.get((pid, labels[code]), 0) + count
+
+    keys = sorted(totals)
+    return pd.DataFrame({'Season': season, 'Team': team, 'Player': [k[0] for k in keys],
+                         'Strength': [k[1] for k in keys], 'TOI': [totals[k] for k in keys]},
+                        columns=['Season', 'Team', 'Player', 'Strength', 'TOI'])
@@ -0,0 +1,313 @@
+"""
+An in-memory index of player names and IDs built from the player ID file, for resolving names and labelling charts
+without re-reading the file for every lookup.
+
+The index is built the first time it is needed and rebuilt when the player ID file's modification time changes.
+"""
+
+import scrapenhl_globals
+import os.path
+
+### The lowest trigram similarity (0-1) a fuzzy match can have
+FUZZY_MIN_SCORE = 0.3
+
+class PlayerNameIndex(object):
+    """
+    Indexes the player ID table by ID, by exact name, and by name substring.
+
+    Parameters
+    -----------
+    df : pandas df
+        The player ID table, with columns ID, Name, Team, and Count (see scrapenhl_globals.get_player_id_file)
+    """
+
+    def __init__(self, df):
+        counts = {}
+        for pid, name, team, count in zip(df.ID, df.Name, df.Team, df.Count):
+            key = (str(name), int(float(pid)), str(team))
+            counts[key] = counts.get(key, 0) + int(count)
+
+        ### For each name, (ID, team, count) sorted by count, most common first
+        self.name_rows = {}
+        namecounts = {}
+        for (name, pid, team), count in counts.items():
+            self.name_rows.setdefault(name, []).append((pid, team, count))
+            namecounts[(pid, name)] = namecounts.get((pid, name), 0) + count
+        for rows in self.name_rows.values():
+            rows.sort(key = lambda row: -row[2])
+
+        ### Most common spelling for each ID
+        self.id_to_name = {}
+        best = {}
+        for (pid, name), count in namecounts.items():
+            if pid not in best or count > best[pid]:
+                best[pid] = count
+                self.id_to_name[pid] = name
+
+        ### Sorted names for prefix searches, and trigrams for substring searches
+        self.names = sorted(self.name_rows)
+        self.trigrams = {}
+        for i, name in enumerate(self.names):
+            for gram in {name[j:j + 3] for j in range(len(name) - 2)}:
+                self.trigrams.setdefault(gram, []).append(i)
+
+    def get_name(self, pid):
+        """
+        Returns the most common spelling of this player's name, or None if the ID is not known.
+        """
+        return self.id_to_name.get(int(float(pid)))
+
+    def names_starting_with(self, prefix):
+        """
+        Returns the known names starting with prefix (case sensitive), in alphabetical order.
+        """
+        import bisect
+        start = bisect.bisect_left(self.names, prefix)
+        end = start
+        while end < len(self.names) and self.names[end][:len(prefix)] == prefix:
+            end += 1
+        return self.names[start:end]
+
+    def names_containing(self, substring):
+        """
+        Returns the known names containing substring (case sensitive), in alphabetical order.
+        """
+        if len(substring) < 3:
+            return [name for name in self.names if substring in name]
+        candidates = None
+        for gram in {substring[j:j + 3] for j in range(len(substring) - 2)}:
+            positions = self.trigrams.get(gram, [])
+            candidates = set(positions) if candidates is None else candidates & set(positions)
+            if len(candidates) == 0:
+                return []
+        return [self.names[i] for i in sorted(candidates) if substring in self.names[i]]
+
+    def _match(self, names, team_helper):
+        """
+        Returns the (ID, team, count) rows for these names, most common first, and whether the choice is ambiguous.
+        Returns None if there are no rows, or if team_helper rules them all out.
+        """
+        rows = sorted((row for name in names for row in self.name_rows[name]), key = lambda row: -row[2])
+        if len(rows) == 0:
+            return None
+        if len({row[0] for row in rows}) == 1:
+            return rows, False
+        if team_helper is None:
+            return rows, True
+        rows = [row for row in rows if row[1] in team_helper]
+        if len(rows) == 0:
+            return None
+        return rows, len(rows) > 1
+
+    def find(self, pname, team_helper = None):
+        """
+        Finds the IDs matching a name: exact matches first, then names containing pname.
+
+        Parameters
+        -----------
+        pname : str
+            The player name. Case sensitive.
+        team_helper : iterable of str, or str, or None
+            Can be used to help break ties between players with the same name
+
+        Returns
+        --------
+        tuple
+            (ID, team, count) rows, most common first, and True if more than one ID matched. None if there were no
+            matches.
+        """
+        if isinstance(team_helper, str):
+            team_helper = {team_helper}
+        elif team_helper is not None:
+            team_helper = set(team_helper)
+
+        if pname in self.name_rows:
+            result = self._match([pname], team_helper)
+            if result is not None:
+                return result
+        return self._match(self.names_containing(pname), team_helper)
+
+    def _build_fuzzy_index(self):
+        """
+        Builds the trigram index over normalized spellings used by fuzzy_match. Done on the first fuzzy query.
+        """
+        import numpy as np
+        postings = {}
+        sizes = []
+        for i, name in enumerate(self.names):
+            grams = _get_trigrams(_normalize_name(name))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+            sizes.append(len(grams))
+        self.fuzzy_postings = {gram: np.array(positions, dtype = np.int32) for gram, positions in postings.items()}
+        self.fuzzy_sizes = np.array(sizes, dtype = np.float64)
+
+    def fuzzy_match(self, pname, team_helper = None, limit = 5, min_score = FUZZY_MIN_SCORE):
+        """
+        Returns the players whose names are most similar to pname.
+
+        Names are compared after lowercasing and removing accents and punctuation, by the Dice coefficient of their
+        character trigrams. Shared trigrams are counted from an inverted index rather than by comparing pname with
+        every name.
+
+        Parameters
+        -----------
+        pname : str
+            The player name, as spelled anywhere
+        team_helper : iterable of str, or str, or None
+            Among candidates with the same (rounded) score, players who played for these teams come first
+        limit : int
+            The most candidates to return
+        min_score : float
+            The lowest similarity (0-1) to return
+
+        Returns
+        --------
+        list of tuple
+            (ID, name, score) for each candidate, best first. The name is the matching spelling.
+        """
+        import numpy as np
+        if not hasattr(self, 'fuzzy_postings'):
+            self._build_fuzzy_index()
+        if isinstance(team_helper, str):
+            team_helper = {team_helper}
+        elif team_helper is not None:
+            team_helper = set(team_helper)
+
+        grams = _get_trigrams(_normalize_name(pname))
+        postings = [self.fuzzy_postings[gram] for gram in grams if gram in self.fuzzy_postings]
+        if len(postings) == 0:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength = len(self.names))
+        scores = 2 * shared / (len(grams) + self.fuzzy_sizes)
+        candidates = np.nonzero(scores >= min_score)[0]
+        ### Keep a few more spellings than needed, since one player can have several, plus anything tied with them
+        if len(candidates) > 4 * limit:
+            cutoff = np.partition(-scores[candidates], 4 * limit)[4 * limit]
+            candidates = candidates[np.round(scores[candidates], 2) >= round(-cutoff, 2)]
+
+        ### Best spelling per ID
+        best = {}
+        for i in candidates:
+            name = self.names[i]
+            score = float(scores[i])
+            for pid, team, count in self.name_rows[name]:
+                teammatch = team_helper is not None and team in team_helper
+                key = (round(score, 2), teammatch, count)
+                if pid not in best or key > best[pid][0]:
+                    best[pid] = (key, name, score)
+
+        ranked = sorted(best.items(), key = lambda item: item[1][0], reverse = True)[:limit]
+        return [(pid, name, score) for pid, (key, name, score) in ranked]
+
+    def get_id(self, pname, team_helper = None):
+        """
+        Returns the ID of the most common player matching this name (see find), or None.
+        """
+        result = self.find(pname, team_helper)
+        if result is None:
+            return None
+        return result[0][0][0]
+
+def _normalize_name(pname):
+    """
+    Lowercases a name and removes accents and punctuation, e.g. "P.K. Subban" to "pk subban".
+    """
+    import unicodedata
+    pname = unicodedata.normalize('NFKD', str(pname))
+    pname = ''.join(c for c in pname if not unicodedata.combining(c)).lower()
+    pname = ''.join(c if c.isalnum() else ' ' if c.isspace() or c == '-' else '' for c in pname)
+    return ' '.join(pname.split())
+
+def _get_trigrams(pname):
+    """
+    Returns the set of character trigrams in a normalized name, padded so word starts and ends count.
+    """
+    padded = '  ' + pname.replace(' ', '  ') + ' '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+_INDEX = None
+_INDEX_MTIME = None
+
+def get_player_name_index():
+    """
+    Returns the process-wide PlayerNameIndex, building it if needed or if the player ID file has changed.
+    """
+    global _INDEX, _INDEX_MTIME
+    filename = scrapenhl_globals.PLAYER_ID_FILE
+    mtime = os.path.getmtime(filename) if os.path.exists(filename) else None
+    if _INDEX is None or mtime != _INDEX_MTIME:
+        _INDEX = PlayerNameIndex(scrapenhl_globals.get_player_id_file())
+        _INDEX_MTIME = mtime
+    return _INDEX
+
+def player_ids_to_names(pids):
+    """
+    Returns the names for a list of player IDs in one call.
+
+    Parameters
+    -----------
+    pids : iterable of int or float
+        The player IDs
+
+    Returns
+    --------
+    list of str
+        The names, with None for unknown IDs
+    """
+    index = get_player_name_index()
+    return [index.get_name(pid) for pid in pids]
+
+def player_names_to_ids(pnames, team_helper = None):
+    """
+    Returns the IDs for a list of player names in one call. Ambiguous names resolve to the most common player.
+
+    Parameters
+    -----------
+    pnames : iterable of str
+        The player names. Case sensitive.
+    team_helper : iterable of str, or str, or None
+        Can be used to help break ties between players with the same name. Applies to every name.
+
+    Returns
+    --------
+    list of int
+        The IDs, with None for names that were not found
+    """
+    index = get_player_name_index()
+    return [index.get_id(pname, team_helper) for pname in pnames]
+
+def fuzzy_match_names(pnames, team_helper = None, limit = 1, min_score = FUZZY_MIN_SCORE):
+    """
+    Fuzzy matches many names at once, e.g. to reconcile a roster from another source. Each distinct name is matched
+    once.
+
+    Parameters
+    -----------
+    pnames : iterable of str
+        The player names, as spelled anywhere
+    team_helper : iterable of str, or str, or None
+        Used to break ties between similar names. Applies to every name.
+    limit : int
+        The most candidates to return per name
+    min_score : float
+        The lowest similarity (0-1) to return
+
+    Returns
+    --------
+    pandas df
+        One row per name and candidate, with Name, Rank (1 is best), ID, Match (the matched spelling), and Score.
+        Names with no candidates get one row with missing ID.
+    """
+    import pandas as pd
+    index = get_player_name_index()
+    matches = {}
+    rows = []
+    for pname in pnames:
+        if pname not in matches:
+            matches[pname] = index.fuzzy_match(pname, team_helper, limit, min_score)
+        if len(matches[pname]) == 0:
+            rows.append({'Name': pname, 'Rank': 1, 'ID': None, 'Match': None, 'Score': 0.0})
+        for rank, (pid, match, score) in enumerate(matches[pname]):
+            rows.append({'Name': pname, 'Rank': rank + 1, 'ID': pid, 'Match': match, 'Score': score})
+    return pd.DataFrame(rows, columns = ['Name', 'Rank', 'ID', 'Match', 'Score'])
@@ -0,0 +1,453 @@
+"""
+An optional packed store for raw pages: one append-only file per season instead of thousands of small .zlib files.
+
+Each season has two files in its season folder:
+
+- raw.pack: the compressed pages (exactly as they would be saved to a .zlib file; see rawcodec) back to back.
+- raw.idx: one fixed-size record per page written, also append-only: game id, kind (pbp or shift), codec, offset into
+  raw.pack, and length. If a page is written more than once, the last record wins; use compact() to reclaim the old
+  copies.
+
+The pack is read through mmap, so reading a page is a slice of the mapped file, and reading a season in game order is
+sequential I/O over one file. A page is appended to the pack before its index record, so an interrupted write leaves
+at worst some unreferenced bytes at the end of the pack. Writers lock raw.lock in the season folder, so several
+processes can append to one archive at once.
+
+Set scrapenhl_globals.USE_RAW_ARCHIVE to True to save new pages here; scrape_game reads pages from either place (see
+scrape_game.read_game_page). Use pack_season to move a season's existing .zlib files into its archive.
+"""
+
+import scrapenhl_globals
+import os.path
+import threading
+
+KINDS = ('pbp', 'shift')
+CODECS = ('zlib', 'zstd')
+INDEX_DTYPE = [('Game', '<i4'), ('Kind', 'u1'), ('Codec', 'u1'), ('Offset', '<i8'), ('Length', '<i8')]
+
+### Season folder -> open archive state (see _get_state)
+_ARCHIVES = {}
+_LOCK = threading.RLock()
+
+def get_pack_filename(season):
+    """
+    Returns the file holding the season's packed raw pages. See the module docstring.
+    """
+    return os.path.join(scrapenhl_globals.get_season_folder(season), 'raw.pack')
+
+def get_index_filename(season):
+    """
+    Returns the file holding the season's raw page index. See the module docstring.
+    """
+    return os.path.join(scrapenhl_globals.get_season_folder(season), 'raw.idx')
+
+def get_lock_filename(season):
+    """
+    Returns the file locked while the season's archive is written or its index is loaded. See _ArchiveLock.
+    """
+    return os.path.join(scrapenhl_globals.get_season_folder(season), 'raw.lock')
+
+class _ArchiveLock(object):
+    """
+    Holds a lock on the season's raw.lock: exclusive for writers, so appends from several processes do not interleave,
+    and shared for readers loading the index, so they never see a compaction half done. Where fcntl is not available
+    (Windows), nothing is locked.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    shared : bool
+        If True, takes a shared (read) lock instead of an exclusive one
+    """
+
+    def __init__(self, season, shared = False):
+        self.season = season
+        self.shared = shared
+        self._file = None
+
+    def __enter__(self):
+        if not os.path.exists(scrapenhl_globals.get_season_folder(self.season)):
+            return self
+        self._file = open(get_lock_filename(self.season), 'a')
+        try:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        return self
+
+    def __exit__(self, *args):
+        ### Closing the file releases the lock
+        if self._file is not None:
+            self._file.close()
+
+def read_index(season):
+    """
+    Returns every record in the season's raw page index, in the order written.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+
+    Returns
+    --------
+    np.array
+        Structured array with fields Game, Kind, Codec, Offset, and Length. Kind and Codec index into KINDS and CODECS.
+        Empty if nothing has been written.
+    """
+    import numpy as np
+    filename = get_index_filename(season)
+    if not os.path.exists(filename):
+        return np.zeros(0, dtype = INDEX_DTYPE)
+    with open(filename, 'rb') as reader:
+        data = reader.read()
+    itemsize = np.dtype(INDEX_DTYPE).itemsize
+    ### Drop a partial record left by an interrupted write
+    return np.frombuffer(data[:len(data) - len(data) % itemsize], dtype = INDEX_DTYPE)
+
+def _get_file_id(filename):
+    """
+    Returns (inode, size) for a file, or None if it does not exist. The inode changes when compact replaces the file.
+    """
+    if not os.path.exists(filename):
+        return None
+    stat = os.stat(filename)
+    return (stat.st_ino, stat.st_size)
+
+def _map_pack(season):
+    """
+    Returns the season's pack mapped read-only, or None if it is missing or empty.
+    """
+    import mmap
+    packfile = get_pack_filename(season)
+    if not os.path.exists(packfile) or os.path.getsize(packfile) == 0:
+        return None
+    with open(packfile, 'rb') as reader:
+        return mmap.mmap(reader.fileno(), 0, access = mmap.ACCESS_READ)
+
+def _load_state(season):
+    """
+    Reads the season's index and maps its pack. Call with the archive locked, so the two match.
+
+    The state is a dict with keys pages ((game, kind) -> (codec, offset, length)), index_id and pack_id (see
+    _get_file_id), and mmap.
+    """
+    indexid = _get_file_id(get_index_filename(season))
+    packid = _get_file_id(get_pack_filename(season))
+    pages = {}
+    for game, kind, codec, offset, length in read_index(season).tolist():
+        pages[(game, KINDS[kind])] = (CODECS[codec], offset, length)
+    return {'pages': pages, 'index_id': indexid, 'pack_id': packid, 'mmap': _map_pack(season)}
+
+def _recover(season):
+    """
+    Finishes or discards a compaction that was interrupted (see compact). Call with the archive locked exclusively.
+    """
+    import os
+    packtmp = get_pack_filename(season) + '.tmp'
+    indextmp = get_index_filename(season) + '.tmp'
+    if os.path.exists(indextmp) and not os.path.exists(packtmp):
+        ### The new pack was swapped in, and its index was complete before that, so swap the index in too
+        os.replace(indextmp, get_index_filename(season))
+    for filename in (packtmp, indextmp):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+def _get_state(season):
+    """
+    Returns the season's cached archive state (see _load_state), reloading it if the index has changed (e.g. because
+    another process appended to it or the archive was compacted), and remapping the pack if it has only grown.
+    """
+    key = scrapenhl_globals.get_season_folder(season)
+    with _LOCK:
+        state = _ARCHIVES.get(key)
+        indexid = _get_file_id(get_index_filename(season))
+        packid = _get_file_id(get_pack_filename(season))
+        if state is not None and state['index_id'] == indexid:
+            if state['pack_id'] == packid:
+                return state
+            if packid is not None and state['pack_id'] is not None and packid[0] == state['pack_id'][0]:
+                ### Pages were appended; they are written before their index records, so the index still matches
+                if state['mmap'] is not None:
+                    state['mmap'].close()
+                state['mmap'] = _map_pack(season)
+                state['pack_id'] = packid
+                return state
+
+        if os.path.exists(get_index_filename(season) + '.tmp'):
+            with _ArchiveLock(season):
+                _recover(season)
+        if indexid is None and packid is None:
+            ### No archive, so nothing to lock (and no lock file to create)
+            newstate = _load_state(season)
+        else:
+            with _ArchiveLock(season, shared = True):
+                newstate = _load_state(season)
+        if state is not None:
+            _close_state(state)
+        _ARCHIVES[key] = newstate
+        return newstate
+
+def _close_state(state):
+    """
+    Closes the state's mapped pack, if any.
+    """
+    if state['mmap'] is not None:
+        state['mmap'].close()
+        state['mmap'] = None
+
+def close(season = None):
+    """
+    Unmaps the season's archive (or every archive, if season is None), e.g. before moving or deleting its files.
+    """
+    with _LOCK:
+        keys = list(_ARCHIVES) if season is None else [scrapenhl_globals.get_season_folder(season)]
+        for key in keys:
+            state = _ARCHIVES.pop(key, None)
+            if state is not None:
+                _close_state(state)
+
+def has_page(season, game, kind):
+    """
+    Returns True if the season's archive holds this game's page.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+    """
+    return (int(game), kind) in _get_state(season)['pages']
+
+def get_page_location(season, game, kind):
+    """
+    Returns the codec, offset, and length of this game's page in the season's pack, or None if it is not archived.
+    """
+    return _get_state(season)['pages'].get((int(game), kind))
+
+def list_games(season):
+    """
+    Returns the game ids with a page of either kind in the season's archive, sorted.
+    """
+    return sorted({game for game, kind in _get_state(season)['pages']})
+
+def read_blob(season, game, kind):
+    """
+    Returns this game's page as saved, i.e. still compressed, or None if it is not in the season's archive.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+
+    Returns
+    --------
+    bytes or None
+        The compressed page
+    """
+    with _LOCK:
+        state = _get_state(season)
+        location = state['pages'].get((int(game), kind))
+        if location is None:
+            return None
+        codec, offset, length = location
+        return state['mmap'][offset:offset + length]
+
+def read_page(season, game, kind):
+    """
+    Returns this game's page, decompressed, or None if it is not in the season's archive.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+
+    Returns
+    --------
+    bytes or None
+        The page
+    """
+    import rawcodec
+    blob = read_blob(season, game, kind)
+    if blob is None:
+        return None
+    return rawcodec.decompress(blob)
+
+def write_blobs(season, blobs):
+    """
+    Appends compressed pages to the season's archive. The archive is locked while writing, so several processes can
+    append to it at once.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    blobs : iterable of (int, str, bytes)
+        Game id, kind ('pbp' or 'shift'), and the page compressed with rawcodec.compress
+    """
+    import os
+    import numpy as np
+    import rawcodec
+
+    if not os.path.exists(scrapenhl_globals.get_season_folder(season)):
+        scrapenhl_globals.create_season_folder(season)
+    key = scrapenhl_globals.get_season_folder(season)
+    with _LOCK, _ArchiveLock(season):
+        _recover(season)
+        before = _get_file_id(get_index_filename(season))
+        records = []
+        with open(get_pack_filename(season), 'ab') as writer:
+            offset = writer.seek(0, os.SEEK_END)
+            for game, kind, blob in blobs:
+                writer.write(blob)
+                records.append((int(game), KINDS.index(kind), CODECS.index(rawcodec.detect_codec(blob)), offset,
+                                len(blob)))
+                offset += len(blob)
+            writer.flush()
+            os.fsync(writer.fileno())
+        if len(records) == 0:
+            return
+        itemsize = np.dtype(INDEX_DTYPE).itemsize
+        index_size = before[1] - before[1] % itemsize if before is not None else 0
+        with open(get_index_filename(season), 'ab') as writer:
+            ### Overwrite any partial record left by an interrupted write
+            writer.truncate(index_size)
+            writer.write(np.array(records, dtype = INDEX_DTYPE).tobytes())
+
+        state = _ARCHIVES.get(key)
+        if state is not None and state['index_id'] == before:
+            ### Nothing else was written since the state was loaded, so it only needs these records
+            for game, kind, codec, offset, length in records:
+                state['pages'][(game, KINDS[kind])] = (CODECS[codec], offset, length)
+            state['index_id'] = _get_file_id(get_index_filename(season))
+        elif state is not None:
+            _close_state(_ARCHIVES.pop(key))
+
+def write_blob(season, game, kind, blob):
+    """
+    Appends one compressed page to the season's archive. See write_blobs.
+    """
+    write_blobs(season, [(game, kind, blob)])
+
+def compact(season):
+    """
+    Rewrites the season's archive in game order, without pages superseded by later writes.
+
+    The new pack and index are written to temporary files and then swapped in, pack first. If this is interrupted
+    after the pack is swapped, the next read or write swaps in the index too; before that, the old archive is kept.
+
+    Returns
+    --------
+    tuple of int
+        Pack size in bytes before and after
+    """
+    import os
+    import numpy as np
+    packfile = get_pack_filename(season)
+    indexfile = get_index_filename(season)
+    with _LOCK, _ArchiveLock(season):
+        _recover(season)
+        state = _load_state(season)
+        if state['index_id'] is None and state['pack_id'] is None:
+            return 0, 0
+        before = state['pack_id'][1] if state['pack_id'] is not None else 0
+        records = []
+        with open(packfile + '.tmp', 'wb') as writer:
+            offset = 0
+            for game, kind in sorted(state['pages']):
+                codec, oldoffset, length = state['pages'][(game, kind)]
+                writer.write(state['mmap'][oldoffset:oldoffset + length])
+                records.append((game, KINDS.index(kind), CODECS.index(codec), offset, length))
+                offset += length
+            writer.flush()
+            os.fsync(writer.fileno())
+        with open(indexfile + '.tmp', 'wb') as writer:
+            writer.write(np.array(records, dtype = INDEX_DTYPE).tobytes())
+            writer.flush()
+            os.fsync(writer.fileno())
+        _close_state(state)
+        close(season)
+        ### Index last: see _recover
+        os.replace(packfile + '.tmp', packfile)
+        os.replace(indexfile + '.tmp', indexfile)
+        return before, offset
+
+def pack_season(season, remove_files = True):
+    """
+    Moves a season's raw .zlib files into its archive, in game order. Pages are copied as saved, without recompressing
+    them; use rawcodec.migrate_season to change codecs.
+
+    Files are only removed after all of the season's pages have been written to the archive, so this can be interrupted
+    and rerun.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    remove_files : bool
+        If True, removes each .zlib file once it has been packed.
+
+    Returns
+    --------
+    int
+        The number of pages packed
+    """
+    import os
+    import scrape_game
+
+    filenames = []
+    for game in scrape_game.list_raw_files(season):
+        for kind in KINDS:
+            filename = scrape_game.get_raw_filename(season, game, kind)
+            if os.path.exists(filename):
+                filenames.append((game, kind, filename))
+
+    def blobs():
+        for game, kind, filename in filenames:
+            with open(filename, 'rb') as reader:
+                yield game, kind, reader.read()
+
+    write_blobs(season, blobs())
+    if remove_files:
+        for game, kind, filename in filenames:
+            os.remove(filename)
+    print('Packed', len(filenames), 'raw pages for', season)
+    return len(filenames)
+
+def unpack_season(season, remove_archive = True):
+    """
+    Writes the pages in a season's archive back out to .zlib files, e.g. to stop using the archive format.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    remove_archive : bool
+        If True, deletes the archive once every page has been written out.
+    """
+    import os
+    import scrape_game
+    pages = sorted(_get_state(season)['pages'])
+    for game, kind in pages:
+        filename = scrape_game.get_raw_filename(season, game, kind)
+        with open(filename + '.tmp', 'wb') as writer:
+            writer.write(read_blob(season, game, kind))
+        os.replace(filename + '.tmp', filename)
+    if remove_archive:
+        close(season)
+        for filename in (get_pack_filename(season), get_index_filename(season)):
+            if os.path.exists(filename):
+                os.remove(filename)
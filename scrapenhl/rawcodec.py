@@ -0,0 +1,275 @@
+"""
+Compression for raw pages from the NHL API.
+
+Pages are written with zstd when the zstandard package is installed, optionally with a dictionary trained on pages
+already scraped (NHL feeds are very similar from game to game, so a dictionary shrinks them a lot and speeds up
+compression). Otherwise, and for files written before zstd was supported, pages are zlib. The codec is detected from
+the first bytes of each file, so both kinds can be mixed in a season folder; file names keep their .zlib extension.
+
+Dictionaries are kept in SAVE_FOLDER/reference/raw dictionaries, named by their zstd dictionary ID, and a frame
+records the ID of the dictionary it was written with. dictionaries.json there says which dictionary to use for new
+pages of each kind ('pbp' or 'shift').
+"""
+
+import scrapenhl_globals
+import os.path
+import threading
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZSTD_LEVEL = 6
+ZLIB_LEVEL = 9
+DICTIONARY_SIZE = 112640
+
+_DICTIONARIES = {}
+_ACTIVE = None
+_LOCK = threading.Lock()
+_THREAD_STATE = threading.local()
+
+def get_codec():
+    """
+    Returns the codec used for new raw pages: scrapenhl_globals.RAW_CODEC if set, otherwise zstd if the zstandard
+    package can be imported, otherwise zlib.
+
+    Returns
+    --------
+    str
+        'zstd' or 'zlib'
+    """
+    if scrapenhl_globals.RAW_CODEC is not None:
+        return scrapenhl_globals.RAW_CODEC
+    try:
+        import zstandard
+        return 'zstd'
+    except ImportError:
+        return 'zlib'
+
+def detect_codec(blob):
+    """
+    Returns the codec a raw page was written with, from its first bytes.
+
+    Parameters
+    -----------
+    blob : bytes
+        The compressed page, as stored on disk
+
+    Returns
+    --------
+    str
+        'zstd' or 'zlib'
+    """
+    return 'zstd' if blob[:4] == ZSTD_MAGIC else 'zlib'
+
+def get_dictionary_folder():
+    """
+    Returns the folder holding zstd dictionaries for raw pages.
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'reference', 'raw dictionaries')
+
+def _get_dictionary(dict_id):
+    """
+    Returns the zstd dictionary with this ID, reading it from disk the first time.
+    """
+    import zstandard
+    if dict_id not in _DICTIONARIES:
+        filename = os.path.join(get_dictionary_folder(), '{0:d}.zdict'.format(dict_id))
+        with open(filename, 'rb') as reader:
+            _DICTIONARIES[dict_id] = zstandard.ZstdCompressionDict(reader.read())
+    return _DICTIONARIES[dict_id]
+
+def _get_active_dictionaries():
+    """
+    Returns the dict of page kind to the ID of the dictionary used for new pages of that kind.
+    """
+    import json
+    global _ACTIVE
+    if _ACTIVE is None:
+        filename = os.path.join(get_dictionary_folder(), 'dictionaries.json')
+        if os.path.exists(filename):
+            with open(filename, 'r') as reader:
+                _ACTIVE = {kind: int(dict_id) for kind, dict_id in json.load(reader).items()}
+        else:
+            _ACTIVE = {}
+    return _ACTIVE
+
+def _get_zstd_compressor(kind):
+    """
+    Returns this thread's zstd compressor for this page kind, using the kind's active dictionary if there is one.
+    """
+    import zstandard
+    local = _get_thread_state()
+    dict_id = _get_active_dictionaries().get(kind)
+    key = ('c', dict_id)
+    if key not in local:
+        if dict_id is None:
+            local[key] = zstandard.ZstdCompressor(level = ZSTD_LEVEL)
+        else:
+            local[key] = zstandard.ZstdCompressor(level = ZSTD_LEVEL, dict_data = _get_dictionary(dict_id))
+    return local[key]
+
+def _get_thread_state():
+    """
+    Returns a dict of this thread's zstd compressors and decompressors, which are not thread safe.
+    """
+    if not hasattr(_THREAD_STATE, 'state'):
+        _THREAD_STATE.state = {}
+    return _THREAD_STATE.state
+
+def compress(page, kind = None, codec = None):
+    """
+    Compresses a raw page for saving.
+
+    Parameters
+    -----------
+    page : bytes
+        The page
+    kind : str or None
+        'pbp' or 'shift', to pick a zstd dictionary. None compresses without one.
+    codec : str or None
+        'zstd' or 'zlib'. None uses get_codec().
+
+    Returns
+    --------
+    bytes
+        The compressed page
+    """
+    import zlib
+    if codec is None:
+        codec = get_codec()
+    if codec == 'zlib':
+        return zlib.compress(page, level = ZLIB_LEVEL)
+    return _get_zstd_compressor(kind).compress(page)
+
+def decompress(blob):
+    """
+    Decompresses a raw page written by compress, or a zlib page written before zstd was supported.
+
+    Parameters
+    -----------
+    blob : bytes
+        The compressed page
+
+    Returns
+    --------
+    bytes
+        The page
+    """
+    import zlib
+    if detect_codec(blob) == 'zlib':
+        return zlib.decompress(blob)
+
+    import zstandard
+    dict_id = zstandard.get_frame_parameters(blob).dict_id
+    local = _get_thread_state()
+    key = ('d', dict_id)
+    if key not in local:
+        if dict_id == 0:
+            local[key] = zstandard.ZstdDecompressor()
+        else:
+            local[key] = zstandard.ZstdDecompressor(dict_data = _get_dictionary(dict_id))
+    return local[key].decompress(blob)
+
+def train_dictionary(seasons, kind, size = DICTIONARY_SIZE, max_games = 2000):
+    """
+    Trains a zstd dictionary on raw pages already scraped and makes it the one used for new pages of this kind.
+
+    Parameters
+    -----------
+    seasons : int or iterable of int
+        The seasons to sample pages from. 2007-08 would be 2007.
+    kind : str
+        'pbp' or 'shift'
+    size : int
+        The dictionary size in bytes
+    max_games : int
+        The most pages to train on, spread evenly over the games found
+
+    Returns
+    --------
+    int
+        The new dictionary's ID
+    """
+    import json
+    import zstandard
+    import scrape_game
+    global _ACTIVE
+
+    if isinstance(seasons, int):
+        seasons = [seasons]
+    pages = []
+    for season in seasons:
+        for game in scrape_game.list_raw_games(season):
+            if scrape_game.raw_page_exists(season, game, kind):
+                pages.append((season, game))
+    step = max(1, len(pages) // max_games)
+    samples = [scrape_game.read_game_page(season, game, kind) for season, game in pages[::step]]
+    samples = [sample for sample in samples if len(sample) > 0]
+
+    dictionary = zstandard.train_dictionary(size, samples)
+    folder = get_dictionary_folder()
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(os.path.join(folder, '{0:d}.zdict'.format(dictionary.dict_id())), 'wb') as writer:
+        writer.write(dictionary.as_bytes())
+
+    with _LOCK:
+        active = dict(_get_active_dictionaries())
+        active[kind] = dictionary.dict_id()
+        with open(os.path.join(folder, 'dictionaries.json') + '.tmp', 'w') as writer:
+            json.dump(active, writer)
+        os.replace(os.path.join(folder, 'dictionaries.json') + '.tmp', os.path.join(folder, 'dictionaries.json'))
+        _ACTIVE = active
+        _THREAD_STATE.state = {}
+    return dictionary.dict_id()
+
+def migrate_season(season, codec = None):
+    """
+    Rewrites a season's raw pages with the given codec (and the current dictionaries), leaving their contents the
+    same. Each file is replaced atomically, so the migration can be interrupted and rerun. Pages in the season archive
+    (see rawarchive) are appended again; use rawarchive.compact afterwards to reclaim the old copies.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    codec : str or None
+        'zstd' or 'zlib'. None uses get_codec().
+
+    Returns
+    --------
+    tuple of int
+        Total bytes on disk before and after
+    """
+    import os
+    import scrape_game
+    import rawarchive
+
+    if codec is None:
+        codec = get_codec()
+    before = 0
+    after = 0
+    archived = []
+    for game in scrape_game.list_raw_files(season):
+        for kind in ('pbp', 'shift'):
+            filename = scrape_game.get_raw_filename(season, game, kind)
+            if not os.path.exists(filename):
+                continue
+            with open(filename, 'rb') as reader:
+                blob = reader.read()
+            newblob = compress(decompress(blob), kind, codec)
+            before += len(blob)
+            after += len(newblob)
+            with open(filename + '.tmp', 'wb') as writer:
+                writer.write(newblob)
+            os.replace(filename + '.tmp', filename)
+    for game in rawarchive.list_games(season):
+        for kind in ('pbp', 'shift'):
+            blob = rawarchive.read_blob(season, game, kind)
+            if blob is None:
+                continue
+            newblob = compress(decompress(blob), kind, codec)
+            before += len(blob)
+            after += len(newblob)
+            archived.append((game, kind, newblob))
+    rawarchive.write_blobs(season, archived)
+    print('Migrated', season, 'raw pages to', codec, ':', before, 'bytes to', after)
+    return before, after
@@ -0,0 +1,380 @@
+"""
+An in-memory copy of the player ID, team ID, and game log files, so parsing a season does not re-read and rewrite
+them for every game.
+"""
+
+import scrapenhl_globals
+import os.path
+
+class ReferenceStore(object):
+    """
+    Holds the player ID, team ID, and game log tables in indexed dicts.
+
+    Tables are read from disk the first time they are needed. Updates are applied in memory and written back with
+    flush(), which is called automatically every flush_every games, and when the interpreter exits (including after an
+    unhandled exception).
+
+    Several processes can update the same files (e.g. an update run alongside a dashboard rebuild). flush() holds a
+    lock file while it writes, and if another process has written the files since this store read them, it rereads
+    them and applies this store's updates on top, so neither process's additions are lost.
+
+    A store can also be spawned for a worker process (see spawn). The worker's store never touches disk; instead its
+    updates are returned with get_delta() and merged into the parent store with apply_delta().
+
+    Parameters
+    -----------
+    flush_every : int or None
+        The number of games (see game_done) after which pending updates are written to disk. None means only flush
+        when flush() is called or at exit.
+    flush_at_exit : bool
+        If True, pending updates are written when the interpreter exits.
+    """
+
+    def __init__(self, flush_every = 100, flush_at_exit = True):
+        self.flush_every = flush_every
+        self._loaded = False
+        self._pending_games = 0
+        self._dirty = set()
+        self._cleared = False
+        self._file_keys = None
+        ### Updates since the tables were read or last flushed, to reapply if another process wrote the files
+        self._added_teams = set()
+        self._added_players = {}
+        self._added_games = set()
+        self.teams = {}
+        self.players = {}
+        self.games = {}
+        if flush_at_exit:
+            import atexit
+            atexit.register(self.flush)
+
+    def _load(self):
+        """
+        Reads the three tables from disk if they have not been read yet.
+        """
+        if self._loaded:
+            return
+        team_ids = scrapenhl_globals.get_team_id_file()
+        self.teams = {int(tid): (abbrev, name) for tid, abbrev, name in
+                      zip(team_ids.ID, team_ids.Abbreviation, team_ids.Name)}
+
+        player_ids = scrapenhl_globals.get_player_id_file()
+        self.players = {}
+        for pid, name, team, pos, num, hand, count in zip(player_ids.ID, player_ids.Name, player_ids.Team,
+                                                          player_ids.Pos, player_ids['#'], player_ids.Hand,
+                                                          player_ids.Count):
+            key = (str(pid), name, team, pos, int(num), hand)
+            self.players[key] = self.players.get(key, 0) + int(count)
+
+        basic_gamelog = scrapenhl_globals.get_quick_gamelog_file()
+        self.games = {}
+        for row in basic_gamelog.to_dict('records'):
+            row['Season'] = int(row['Season'])
+            row['Game'] = int(row['Game'])
+            self.games[(row['Season'], row['Game'])] = row
+        self._file_keys = _get_file_keys()
+        self._loaded = True
+
+    def clear(self):
+        """
+        Empties all three tables, e.g. to rebuild them from scratch. The empty tables are written on the next flush.
+        """
+        self.teams = {}
+        self.players = {}
+        self.games = {}
+        self._loaded = True
+        self._cleared = True
+        self._dirty = {'teams', 'players', 'games'}
+
+    def has_team(self, tid):
+        """
+        Returns True if this team ID is in the team ID table.
+        """
+        self._load()
+        return int(tid) in self.teams
+
+    def get_team_abbreviation(self, tid):
+        """
+        Returns the abbreviation for this team ID.
+        """
+        self._load()
+        return self.teams[int(tid)][0]
+
+    def add_team(self, tid, abbreviation, name):
+        """
+        Adds a team to the team ID table.
+
+        Parameters
+        -----------
+        tid : int
+            The team ID
+        abbreviation : str
+            The team abbreviation, e.g. WSH
+        name : str
+            The team name, e.g. Washington Capitals
+        """
+        self._load()
+        self.teams[int(tid)] = (abbreviation, name)
+        self._added_teams.add(int(tid))
+        self._dirty.add('teams')
+
+    def add_players(self, rows):
+        """
+        Adds one appearance for each player to the player ID table.
+
+        Parameters
+        -----------
+        rows : iterable of tuple
+            Each tuple is (ID, Name, Team, Pos, #, Hand)
+        """
+        self._load()
+        for pid, name, team, pos, num, hand in rows:
+            self._add_player_count((str(pid), name, team, pos, int(num), hand), 1)
+        self._dirty.add('players')
+
+    def _add_player_count(self, key, count):
+        """
+        Adds appearances to one row of the player ID table.
+        """
+        self.players[key] = self.players.get(key, 0) + count
+        self._added_players[key] = self._added_players.get(key, 0) + count
+
+    def add_game(self, row):
+        """
+        Adds a game to the game log, replacing any previous entry for the same season and game.
+
+        Parameters
+        -----------
+        row : dict
+            Has keys Season, Game, Datetime, Venue, Home, HomeCoach, HomeScore, Away, AwayCoach, and AwayScore
+        """
+        self._load()
+        row = dict(row)
+        row['Season'] = int(row['Season'])
+        row['Game'] = int(row['Game'])
+        self.games[(row['Season'], row['Game'])] = row
+        self._added_games.add((row['Season'], row['Game']))
+        self._dirty.add('games')
+
+    def get_game(self, season, game):
+        """
+        Returns the game log entry for this game as a dict, or None if it is not in the game log.
+        """
+        self._load()
+        return self.games.get((int(season), int(game)))
+
+    def get_season_games(self, season):
+        """
+        Returns the game log entries for this season as dicts, in game order.
+        """
+        self._load()
+        return [row for (gseason, game), row in sorted(self.games.items()) if gseason == int(season)]
+
+    def get_team_ids(self, abbreviation):
+        """
+        Returns the team IDs with this abbreviation, e.g. WSH, in ID order.
+        """
+        self._load()
+        return sorted(tid for tid, (abbrev, name) in self.teams.items() if abbrev == abbreviation)
+
+    def get_goalie_ids(self):
+        """
+        Returns the IDs of players listed as goalies in the player ID table, as a set of int.
+        """
+        self._load()
+        return {int(key[0]) for key in self.players if key[3] == 'G'}
+
+    def game_done(self):
+        """
+        Marks the end of one game's updates, flushing to disk every flush_every games.
+        """
+        self._pending_games += 1
+        if self.flush_every is not None and self._pending_games >= self.flush_every:
+            self.flush()
+
+    def spawn(self, season = None, game = None):
+        """
+        Returns a store for parsing games in a worker process.
+
+        The new store starts with this store's teams, its goalies' player rows (strength.add_strength_to_toi needs every
+        goalie, even when a game's pbp is not reparsed), and, if season and game are given, that game's game log
+        entry. It never reads from or writes to disk, and get_delta returns only the updates made to it.
+
+        Parameters
+        -----------
+        season : int or None
+            The season of the game. 2007-08 would be 2007.
+        game : int or None
+            The game id
+
+        Returns
+        --------
+        ReferenceStore
+            The worker's store
+        """
+        self._load()
+        child = ReferenceStore(flush_every = None, flush_at_exit = False)
+        child._loaded = True
+        child.teams = dict(self.teams)
+        child.players = {key: count for key, count in self.players.items() if key[3] == 'G'}
+        if season is not None and (int(season), int(game)) in self.games:
+            child.games = {(int(season), int(game)): self.games[(int(season), int(game))]}
+        return child
+
+    def get_delta(self):
+        """
+        Returns the updates made to a spawned store, in a form that can be sent back from a worker process.
+
+        Returns
+        --------
+        dict
+            Has keys teams, players, and games, holding the added teams, player appearance counts, and game log entries
+        """
+        return {'teams': {tid: self.teams[tid] for tid in self._added_teams},
+                'players': dict(self._added_players),
+                'games': {key: self.games[key] for key in self._added_games}}
+
+    def apply_delta(self, delta):
+        """
+        Merges the updates from a spawned store (see get_delta) into this store.
+
+        Applying the deltas from each game in game order gives the same tables as parsing the games serially.
+
+        Parameters
+        -----------
+        delta : dict
+            The result of get_delta() on a spawned store
+        """
+        self._load()
+        for tid, (abbreviation, name) in delta['teams'].items():
+            self.add_team(tid, abbreviation, name)
+        for key, count in delta['players'].items():
+            self._add_player_count(key, count)
+        if len(delta['players']) > 0:
+            self._dirty.add('players')
+        for row in delta['games'].values():
+            self.add_game(row)
+
+    def get_team_id_df(self):
+        """
+        Returns the team ID table as a dataframe, in the format of scrapenhl_globals.get_team_id_file
+        """
+        import pandas as pd
+        self._load()
+        tids = sorted(self.teams)
+        return pd.DataFrame({'ID': tids,
+                             'Abbreviation': [self.teams[tid][0] for tid in tids],
+                             'Name': [self.teams[tid][1] for tid in tids]})
+
+    def get_player_id_df(self):
+        """
+        Returns the player ID table as a dataframe, in the format of scrapenhl_globals.get_player_id_file
+        """
+        import pandas as pd
+        self._load()
+        keys = list(self.players)
+        return pd.DataFrame({'ID': [k[0] for k in keys], 'Name': [k[1] for k in keys],
+                             'Team': [k[2] for k in keys], 'Pos': [k[3] for k in keys],
+                             '#': [k[4] for k in keys], 'Hand': [k[5] for k in keys],
+                             'Count': [self.players[k] for k in keys]},
+                            columns = ['ID', 'Name', 'Team', 'Pos', '#', 'Hand', 'Count'])
+
+    def get_quick_gamelog_df(self):
+        """
+        Returns the game log as a dataframe, in the format of scrapenhl_globals.get_quick_gamelog_file
+        """
+        import pandas as pd
+        self._load()
+        return pd.DataFrame(list(self.games.values()),
+                            columns = ['Season', 'Game', 'Datetime', 'Venue', 'Home', 'HomeCoach', 'HomeScore',
+                                       'Away', 'AwayCoach', 'AwayScore'])
+
+    def flush(self):
+        """
+        Writes any tables with pending updates to disk.
+
+        If another process has written the files since this store read them, they are reread first and this store's
+        updates since its last flush are applied on top. Tables emptied with clear() are written as they are.
+        """
+        if len(self._dirty) > 0:
+            with _ReferenceFileLock():
+                if not self._cleared and self._file_keys != _get_file_keys():
+                    self._reload()
+                if 'teams' in self._dirty:
+                    scrapenhl_globals.write_team_id_file(self.get_team_id_df())
+                if 'players' in self._dirty:
+                    scrapenhl_globals.write_player_id_file(self.get_player_id_df())
+                if 'games' in self._dirty:
+                    scrapenhl_globals.write_quick_gamelog_file(self.get_quick_gamelog_df())
+                self._file_keys = _get_file_keys()
+        self._dirty = set()
+        self._cleared = False
+        self._added_teams = set()
+        self._added_players = {}
+        self._added_games = set()
+        self._pending_games = 0
+
+    def _reload(self):
+        """
+        Rereads the tables from disk and reapplies the updates made since they were last read or flushed.
+        """
+        teams = {tid: self.teams[tid] for tid in self._added_teams}
+        players = self._added_players
+        games = {key: self.games[key] for key in self._added_games}
+        self._loaded = False
+        self._load()
+        self.teams.update(teams)
+        for key, count in players.items():
+            self.players[key] = self.players.get(key, 0) + count
+        self.games.update(games)
+        ### Every table is rewritten, since the others may have changed on disk as well as the dirty ones
+        self._dirty = {'teams', 'players', 'games'}
+
+def _get_file_keys():
+    """
+    Returns the modification time, size, and inode of each reference file (None if missing), to tell whether another
+    process has written them.
+    """
+    keys = []
+    for filename in (scrapenhl_globals.TEAM_ID_FILE, scrapenhl_globals.PLAYER_ID_FILE,
+                     scrapenhl_globals.BASIC_GAMELOG_FILE):
+        if os.path.exists(filename):
+            stat = os.stat(filename)
+            keys.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        else:
+            keys.append(None)
+    return tuple(keys)
+
+class _ReferenceFileLock(object):
+    """
+    Holds an exclusive lock on SAVE_FOLDER/reference/.lock, so only one process rewrites the reference files at a
+    time. Where fcntl is not available (Windows), nothing is locked.
+    """
+
+    def __enter__(self):
+        import os
+        folder = os.path.dirname(scrapenhl_globals.PLAYER_ID_FILE)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self._file = open(os.path.join(folder, '.lock'), 'a')
+        try:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        return self
+
+    def __exit__(self, *args):
+        ### Closing the file releases the lock
+        self._file.close()
+
+_STORE = None
+
+def get_reference_store():
+    """
+    Returns the process-wide ReferenceStore, creating it if needed.
+    """
+    global _STORE
+    if _STORE is None:
+        _STORE = ReferenceStore()
+    return _STORE
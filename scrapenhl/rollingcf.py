@@ -1,63 +1,82 @@
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-import scrapenhl_globals
+from dash.dependencies import Input, Output
+import dashdata
 
 app = dash.Dash()
 
-### Get data--dummy for now
+### Get data from the dashboard snapshot (see dashdata.py), loaded on the first request rather than at import
 
 ### Set options
 #### Player (str-->int ID--default Erik Karlsson)
-allplayers = scrapenhl_globals.get_preferred_player_names().sort_values(by='Name')
-player_select = dcc.Dropdown(
-        options=[{'label': pname, 'value': pid} for pname, pid in zip(allplayers.Name, allplayers.ID)],
-        value='8474578')
+def get_player_select(snapshot):
+    return dcc.Dropdown(id='player', options=snapshot.player_options, value=snapshot.default_player)
 
 #### Date range (default to last 3 years) (two dates) via https://plot.ly/python/range-slider/
 #### Team(s) (list of str--default all)
-allteams = scrapenhl_globals.get_team_id_file().sort_values(by='Name')
-team_select = dcc.Dropdown(
-    options=[{'label': tname, 'value': tid} for tname, tid in zip(allteams.Name, allteams.Abbreviation)],
-    value=allteams.Abbreviation.values, multi=True)
+def get_team_select(snapshot):
+    return dcc.Dropdown(id='teams', options=snapshot.team_options,
+                        value=[option['value'] for option in snapshot.team_options], multi=True)
 
 #### Roll length (int--default 25)
-window_slider = dcc.Slider(min=5, max=80,
+window_slider = dcc.Slider(id='window', min=5, max=80,
         marks={i: 'Label {}'.format(i) if i == 1 else str(i) for i in range(5, 81, 5)},
         value=25)
 
 #### Score adjust (bool--default False)
-scoreadjust_button = dcc.RadioItems(
+scoreadjust_button = dcc.RadioItems(id='scoreadjust',
         options=[
             {'label': 'None', 'value': 'None'}, {'label': '@IneffectiveMath', 'value': '@IneffectiveMath'}],
         value='None')
 
 #### Include playoffs (bool--default True)
-playoff_button = dcc.RadioItems(
+playoff_button = dcc.RadioItems(id='playoffs',
         options=[
             {'label': 'Yes', 'value': 'Yes'},
             {'label': 'No', 'value': 'No'}], value='Yes')
 
 #### Show missing games through gaps in graph (bool--default True)
-gpgaps_button = dcc.RadioItems(
+gpgaps_button = dcc.RadioItems(id='gpgaps',
         options=[
             {'label': 'Yes', 'value': 'Yes'},
             {'label': 'No', 'value': 'No'}], value='Yes')
 #### Show offseason via gap in graph (bool--default False)
 
-### Calculate, using external method (replace with dummy output)
+### Calculate from the snapshot's precomputed per-game series, so callbacks only redo the rolling sums
+@app.callback(Output('rollingcf', 'figure'),
+              [Input('player', 'value'), Input('teams', 'value'), Input('window', 'value'),
+               Input('scoreadjust', 'value'), Input('playoffs', 'value'), Input('gpgaps', 'value')])
+def update_rollingcf(player, teams, window, scoreadjust, playoffs, gpgaps):
+    if player is None:
+        return {'data': [], 'layout': {}}
+    snapshot = dashdata.get_snapshot()
+    if teams is not None and len(teams) == len(snapshot.team_options):
+        teams = None
+    df = snapshot.get_rolling_cf(int(player), window=window, teams=teams, playoffs=playoffs == 'Yes',
+                                 score_adjust=scoreadjust != 'None', gaps=gpgaps == 'Yes')
+    return {'data': [{'x': df['Datetime'], 'y': df['CF%'], 'mode': 'lines',
+                      'connectgaps': gpgaps != 'Yes', 'name': 'CF%'}],
+            'layout': {'yaxis': {'title': '{0:d}-game rolling CF%'.format(window)}}}
 
 ### Plot this output
+rollingcf_graph = dcc.Graph(id='rollingcf')
 
 ### Option to save
 
-app.layout = html.Div([html.Label('Player'), player_select,
-    html.Label('Team(s)'), team_select,
-    html.Label('Include playoffs?'), playoff_button,
-    html.Label('Score-adjustment'), scoreadjust_button,
-    html.Label('Window size'), window_slider,
-    html.Label('Show missed games?'), gpgaps_button],
-                      style={'columnCount': 2})
+### The layout is a function, so Dash builds it per page load from the current snapshot
+def serve_layout():
+    snapshot = dashdata.get_snapshot()
+    return html.Div([html.Div([html.Label('Player'), get_player_select(snapshot),
+        html.Label('Team(s)'), get_team_select(snapshot),
+        html.Label('Include playoffs?'), playoff_button,
+        html.Label('Score-adjustment'), scoreadjust_button,
+        html.Label('Window size'), window_slider,
+        html.Label('Show missed games?'), gpgaps_button],
+                          style={'columnCount': 2}),
+        rollingcf_graph])
+
+app.layout = serve_layout
 
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
@@ -1,5 +1,8 @@
 import scrapenhl_globals
+import reference_store
+import strength
 import os.path
+import threading
 
 def get_url(season, game):
     """
@@ -53,7 +56,7 @@ def get_json_save_filename(season, game):
     str
         file name, SAVE_FOLDER/Season/Game.zlib
     """
-    return os.path.join(scrapenhl_globals.SAVE_FOLDER, season, '{0:d}.zlib'.format(game))
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, str(season), '{0:d}.zlib'.format(game))
 
 def get_shift_save_filename(season, game):
     """
@@ -71,7 +74,7 @@ def get_shift_save_filename(season, game):
     str
         file name, SAVE_FOLDER/Season/Game_shifts.zlib
     """
-    return os.path.join(scrapenhl_globals.SAVE_FOLDER, season, '{0:d}_shifts.zlib'.format(game))
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, str(season), '{0:d}_shifts.zlib'.format(game))
 
 def get_parsed_save_filename(season, game):
     """
@@ -89,7 +92,7 @@ def get_parsed_save_filename(season, game):
     str
         file name, SAVE_FOLDER/Season/Game_parsed.zlib
     """
-    return os.path.join(scrapenhl_globals.SAVE_FOLDER, season, '{0:d}_parsed.hdf5'.format(game))
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, str(season), '{0:d}_parsed.hdf5'.format(game))
 
 def get_parsed_shifts_save_filename(season, game):
     """
@@ -107,11 +110,367 @@ def get_parsed_shifts_save_filename(season, game):
     str
         file name, SAVE_FOLDER/Season/Game_shifts_parsed.zlib
     """
-    return os.path.join(scrapenhl_globals.SAVE_FOLDER, season, '{0:d}_shifts_parsed.hdf5'.format(game))
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, str(season), '{0:d}_shifts_parsed.hdf5'.format(game))
 
-def scrape_game(season, game, force_overwrite = False):
+def get_fetch_meta_filename(season, game):
     """
-    Scrapes and saves game files in compressed (zlib) format
+    Returns the file holding fetch metadata for this game's raw pages (see read_fetch_meta).
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+
+    Returns
+    --------
+    str
+        file name, SAVE_FOLDER/Season/Game_meta.json
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, str(season), '{0:d}_meta.json'.format(game))
+
+def read_fetch_meta(season, game):
+    """
+    Reads the fetch metadata for this game's raw pages.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+
+    Returns
+    --------
+    dict
+        Keys are page kinds ('pbp' and 'shift'). Each value is a dict with url, etag, last_modified (None if the
+        server did not send them), sha256 (of the uncompressed page), fetched (UTC time of the last request), and,
+        once the page has been parsed, parsed_sha256 (sha256 of the page that was parsed). Empty if there is no
+        metadata, e.g. for games scraped before it was recorded.
+    """
+    import json
+    filename = get_fetch_meta_filename(season, game)
+    if not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, 'r') as reader:
+            return json.load(reader)
+    except ValueError:
+        return {}
+
+def _write_fetch_meta(season, game, meta):
+    """
+    Writes the fetch metadata for this game's raw pages, via a temporary file.
+    """
+    import json
+    filename = get_fetch_meta_filename(season, game)
+    with open(filename + '.tmp', 'w') as writer:
+        json.dump(meta, writer, indent = 1, sort_keys = True)
+    os.replace(filename + '.tmp', filename)
+
+def needs_reparse(meta, kind):
+    """
+    Returns True if this page's raw bytes have changed since it was last parsed.
+
+    Parameters
+    -----------
+    meta : dict
+        The result of read_fetch_meta
+    kind : str
+        'pbp' or 'shift'
+
+    Returns
+    --------
+    bool
+        False if there is no metadata for the page
+    """
+    entry = meta.get(kind)
+    return entry is not None and 'sha256' in entry and entry.get('parsed_sha256') != entry['sha256']
+
+JSON_BACKEND = None
+_SIMDJSON_PARSERS = threading.local()
+GAME_SUBTREES = (('gameData',), ('liveData', 'boxscore', 'teams'), ('liveData', 'plays', 'allPlays'))
+
+def get_json_backend():
+    """
+    Returns the name of the JSON library used to decode raw pages.
+
+    On first use this picks orjson if installed, then simdjson, then the standard library json module. Set
+    JSON_BACKEND to one of 'orjson', 'simdjson', or 'json' to override (see benchmarks.benchmark_json_decode).
+
+    Returns
+    --------
+    str
+        'orjson', 'simdjson', or 'json'
+    """
+    global JSON_BACKEND
+    if JSON_BACKEND is None:
+        JSON_BACKEND = 'json'
+        for name in ('orjson', 'simdjson'):
+            try:
+                __import__(name)
+                JSON_BACKEND = name
+                break
+            except ImportError:
+                pass
+    return JSON_BACKEND
+
+def _get_simdjson_parser():
+    """
+    Returns this thread's simdjson parser. Parsers cannot be shared between threads.
+    """
+    import simdjson
+    if not hasattr(_SIMDJSON_PARSERS, 'parser'):
+        _SIMDJSON_PARSERS.parser = simdjson.Parser()
+    return _SIMDJSON_PARSERS.parser
+
+def decode_json(page, subtrees = None):
+    """
+    Decodes a raw page into python objects with the fastest available JSON library (see get_json_backend).
+
+    Pages are decoded as latin-1 first, as they always have been, so names match those already in the reference
+    files.
+
+    Parameters
+    -----------
+    page : bytes
+        The raw (decompressed) page
+    subtrees : iterable of tuple of str, or None
+        If provided, only these subtrees are returned, e.g. (('liveData', 'plays', 'allPlays'),). The result is
+        still nested the same way, so it can be indexed like the full document. With simdjson, the rest of the
+        document is never converted to python objects. Missing subtrees are left out.
+
+    Returns
+    --------
+    dict
+        The decoded json
+
+    Raises
+    -------
+    json.JSONDecodeError
+        If the page is not valid json, whichever library is used
+    """
+    import json
+    backend = get_json_backend()
+    text = page.decode('latin-1')
+
+    if backend == 'simdjson':
+        try:
+            doc = _get_simdjson_parser().parse(text)
+        except Exception as e:
+            raise json.JSONDecodeError(str(e), text, 0)
+        try:
+            if subtrees is None:
+                return doc.as_dict()
+            result = {}
+            for path in subtrees:
+                try:
+                    value = doc.at_pointer('/' + '/'.join(path))
+                except KeyError:
+                    continue
+                if hasattr(value, 'as_dict'):
+                    value = value.as_dict()
+                elif hasattr(value, 'as_list'):
+                    value = value.as_list()
+                _set_subtree(result, path, value)
+            return result
+        finally:
+            del doc
+
+    if backend == 'orjson':
+        import orjson
+        data = orjson.loads(text)
+    else:
+        data = json.loads(text)
+    if subtrees is None:
+        return data
+
+    result = {}
+    for path in subtrees:
+        value = data
+        try:
+            for key in path:
+                value = value[key]
+        except (KeyError, TypeError):
+            continue
+        _set_subtree(result, path, value)
+    return result
+
+def _set_subtree(result, path, value):
+    """
+    Sets result[path[0]][path[1]]...[path[-1]] = value, creating intermediate dicts as needed.
+    """
+    for key in path[:-1]:
+        result = result.setdefault(key, {})
+    result[path[-1]] = value
+
+def read_raw_page(filename):
+    """
+    Reads a saved raw page from disk and decompresses it, whichever codec it was written with (see rawcodec).
+
+    Parameters
+    -----------
+    filename : str
+        The file, e.g. from get_json_save_filename or get_shift_save_filename
+
+    Returns
+    --------
+    bytes
+        The decompressed page
+    """
+    import rawcodec
+    with open(filename, 'rb') as reader:
+        return rawcodec.decompress(reader.read())
+
+def get_raw_filename(season, game, kind):
+    """
+    Returns the loose file for this game's raw page: get_json_save_filename for 'pbp', get_shift_save_filename for
+    'shift'.
+    """
+    if kind == 'pbp':
+        return get_json_save_filename(season, game)
+    return get_shift_save_filename(season, game)
+
+def _get_raw_sources(season, game, kind):
+    """
+    Returns the places a raw page is looked for, in order: the season archive first if
+    scrapenhl_globals.USE_RAW_ARCHIVE, otherwise the loose file first. Each is ('archive', None) or ('file', filename).
+    """
+    sources = [('archive', None), ('file', get_raw_filename(season, game, kind))]
+    if not scrapenhl_globals.USE_RAW_ARCHIVE:
+        sources.reverse()
+    return sources
+
+def raw_page_exists(season, game, kind):
+    """
+    Returns True if this game's raw page has been saved, either as a loose file or in the season archive (see
+    rawarchive).
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+    """
+    import rawarchive
+    return os.path.exists(get_raw_filename(season, game, kind)) or rawarchive.has_page(season, game, kind)
+
+def read_raw_blob(season, game, kind):
+    """
+    Returns this game's raw page as saved (still compressed), from a loose file or the season archive. See
+    _get_raw_sources for which wins if both exist.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+
+    Returns
+    --------
+    bytes or None
+        The compressed page, or None if it has not been saved
+    """
+    import rawarchive
+    for source, filename in _get_raw_sources(season, game, kind):
+        if source == 'archive':
+            blob = rawarchive.read_blob(season, game, kind)
+            if blob is not None:
+                return blob
+        elif os.path.exists(filename):
+            with open(filename, 'rb') as reader:
+                return reader.read()
+    return None
+
+def read_game_page(season, game, kind):
+    """
+    Returns this game's raw page, decompressed, from a loose file or the season archive.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+
+    Returns
+    --------
+    bytes or None
+        The page, or None if it has not been saved
+    """
+    import rawcodec
+    blob = read_raw_blob(season, game, kind)
+    if blob is None:
+        return None
+    return rawcodec.decompress(blob)
+
+def write_raw_blob(season, game, kind, blob):
+    """
+    Saves this game's compressed raw page: to the season archive if scrapenhl_globals.USE_RAW_ARCHIVE, otherwise to
+    its loose file (via a temporary file).
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+    blob : bytes
+        The page, compressed with rawcodec.compress
+    """
+    import os
+    if scrapenhl_globals.USE_RAW_ARCHIVE:
+        import rawarchive
+        rawarchive.write_blob(season, game, kind, blob)
+        ### Otherwise a stale loose file would still be found by tools that only look at files
+        if os.path.exists(get_raw_filename(season, game, kind)):
+            os.remove(get_raw_filename(season, game, kind))
+        return
+    filename = get_raw_filename(season, game, kind)
+    with open(filename + '.tmp', 'wb') as writer:
+        writer.write(blob)
+    os.replace(filename + '.tmp', filename)
+
+def list_raw_files(season):
+    """
+    Returns the game ids with a loose raw pbp or shift file in this season's folder, sorted.
+    """
+    folder = scrapenhl_globals.get_season_folder(season)
+    if not os.path.exists(folder):
+        return []
+    games = set()
+    for x in os.listdir(folder):
+        if x[-5:] == '.zlib':
+            name = x[:-5][:-7] if x[-12:-5] == '_shifts' else x[:-5]
+            if name.isdigit():
+                games.add(int(name))
+    return sorted(games)
+
+def list_raw_games(season):
+    """
+    Returns the game ids with a raw pbp or shift page saved for this season, as loose files or in the season archive,
+    sorted.
+    """
+    import rawarchive
+    return sorted(set(list_raw_files(season)) | set(rawarchive.list_games(season)))
+
+def scrape_game(season, game, force_overwrite = False, fetcher = None, revalidate = False):
+    """
+    Scrapes and saves game files in compressed (zstd or zlib) format
+
+    Each request's ETag, Last-Modified, content hash, and time are recorded in a metadata file next to the raw pages
+    (see read_fetch_meta).
 
     Parameters
     -----------
@@ -122,6 +481,13 @@ def scrape_game(season, game, force_overwrite = False):
         The preseason, all-star game, Olympics, and World Cup also have game IDs that can be provided.
     force_overwrite : bool
         If True, will overwrite previously raw html files. If False, will not scrape if files already found.
+    fetcher : fetcher.Fetcher or None
+        If provided, requests go through this fetcher (shared rate limit, connection reuse, retries). If None, each
+        url is read with a single urllib request.
+    revalidate : bool
+        If True, files already found are checked for corrections with a conditional request. Pages the server
+        reports as unchanged (304), or whose content hash is unchanged, are not rewritten; changed pages are saved
+        and will be reparsed by parse_game.
 
     Returns
     -------
@@ -129,53 +495,107 @@ def scrape_game(season, game, force_overwrite = False):
         A boolean indicating whether the NHL API was queried.
     """
     query = False
-
-    import os.path
-    url = get_url(season, game)
-    filename = get_json_save_filename(season, game)
-    if force_overwrite or not os.path.exists(filename):
-        import urllib.request
-        try:
+    meta = read_fetch_meta(season, game)
+    for url, kind in ((get_url(season, game), 'pbp'), (get_shift_url(season, game), 'shift')):
+        exists = raw_page_exists(season, game, kind)
+        if force_overwrite or not exists or revalidate:
             query = True
-            with urllib.request.urlopen(url) as reader:
-                page = reader.read()
-        except Exception as e:
-            if game < 30111:
-                print('Error reading pbp url for', season, game, e, e.args)
-                page = bytes('', encoding = 'latin-1')
-        if True:#game < 30111:
-            import zlib
-            page2 = zlib.compress(page, level=9)
-            w = open(filename, 'wb')
-            w.write(page2)
-            w.close()
-
-    url = get_shift_url(season, game)
-    filename = get_shift_save_filename(season, game)
-    if force_overwrite or not os.path.exists(filename):
-        import urllib.request
-        try:
-            query = True
-            with urllib.request.urlopen(url) as reader:
-                page = reader.read()
-        except Exception as e:
-            if game < 30111:
-                print('Error reading shift url for', season, game, e, e.args)
-                page = bytes('', encoding='latin-1')
-        if True:#game < 30111:
-            import zlib
-            page2 = zlib.compress(page, level=9)
-            w = open(filename, 'wb')
-            w.write(page2)
-            w.close()
-
+            previous = meta.get(kind, {}) if exists and not force_overwrite else None
+            entry = _scrape_page(url, season, game, kind, fetcher, previous)
+            if entry is not None:
+                meta[kind] = entry
+    if query and len(meta) > 0:
+        _write_fetch_meta(season, game, meta)
     return query
 
-def parse_game(season, game, force_overwrite = False):
+def _scrape_page(url, season, game, kind, fetcher = None, previous = None):
+    """
+    Reads the url and saves the page in compressed format (zstd or zlib; see rawcodec), with write_raw_blob.
+
+    If the url cannot be read, nothing is saved, so the page is requested again the next time the game is scraped.
+    When revalidating, the existing file is left alone.
+
+    Parameters
+    -----------
+    url : str
+        The url to read
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    kind : str
+        'pbp' or 'shift'
+    fetcher : fetcher.Fetcher or None
+        If provided, the url is read through this fetcher. Otherwise, urllib is used.
+    previous : dict or None
+        If revalidating an existing file, its metadata entry (see read_fetch_meta), which may be empty. The request is
+        made conditional on its etag and last_modified, and the file is only rewritten if the content changed.
+
+    Returns
+    --------
+    dict or None
+        The page's new metadata entry, or None if nothing was saved
+    """
+    import rawcodec
+    import hashlib
+    import datetime
+    etag = previous.get('etag') if previous is not None else None
+    last_modified = previous.get('last_modified') if previous is not None else None
+    try:
+        if fetcher is not None:
+            status, page, headers = fetcher.fetch_conditional(url, etag, last_modified)
+        else:
+            import urllib.request
+            import urllib.error
+            request = urllib.request.Request(url)
+            if etag is not None:
+                request.add_header('If-None-Match', etag)
+            if last_modified is not None:
+                request.add_header('If-Modified-Since', last_modified)
+            try:
+                with urllib.request.urlopen(request) as reader:
+                    status, page, headers = 200, reader.read(), {k.lower(): v for k, v in reader.getheaders()}
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                status, page, headers = 304, None, {k.lower(): v for k, v in e.headers.items()}
+    except Exception as e:
+        if previous is not None:
+            print('Error revalidating', kind, 'url for', season, game, e, e.args)
+        elif game < 30111:
+            ### Playoff games that have not been played yet are expected to fail
+            print('Error reading', kind, 'url for', season, game, e, e.args)
+        return None
+
+    entry = dict(previous) if previous is not None else {}
+    entry['url'] = url
+    entry['fetched'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    entry['etag'] = headers.get('etag', etag)
+    entry['last_modified'] = headers.get('last-modified', last_modified)
+    if status == 304:
+        return entry
+
+    digest = hashlib.sha256(page).hexdigest()
+    if previous is not None:
+        olddigest = previous.get('sha256')
+        if olddigest is None:
+            olddigest = hashlib.sha256(read_game_page(season, game, kind)).hexdigest()
+            ### The file was parsed (if at all) before hashes were recorded
+            entry['parsed_sha256'] = olddigest
+        if olddigest == digest:
+            entry['sha256'] = digest
+            return entry
+    entry['sha256'] = digest
+
+    write_raw_blob(season, game, kind, rawcodec.compress(page, kind))
+    return entry
+
+def parse_game(season, game, force_overwrite = False, store = None):
     """
     Reads this game's zlib file from disk and parses into a friendlier format, then saves again to disk in zlib.
 
-    This method also updates the global player id and game log files, and writes any updates to disk.
+    This method also updates the global player id, team id, and game log tables. Updates are held in the reference
+    store and written to disk in batches; call store.flush() to write them immediately.
 
     Parameters
     -----------
@@ -185,33 +605,34 @@ def parse_game(season, game, force_overwrite = False):
         The game id. This can range from 20001 to 21230 for regular season, and 30111 to 30417 for playoffs.
         The preseason, all-star game, Olympics, and World Cup also have game IDs that can be provided.
     force_overwrite : bool
-        If True, will overwrite previously raw html files. If False, will not scrape if files already found.
+        If True, will overwrite previously raw html files. If False, will not parse if files already found, unless
+        the raw page has changed since it was parsed (see scrape_game and read_fetch_meta).
+    store : reference_store.ReferenceStore or None
+        The reference tables to update. If None, uses reference_store.get_reference_store()
     """
     import os.path
-    import zlib
     import json
-    import pandas as pd
+    import onice
+    if store is None:
+        store = reference_store.get_reference_store()
+    meta = read_fetch_meta(season, game)
+    parsed = []
+    events = None
     filename = get_parsed_save_filename(season, game)
-    if ((force_overwrite or not os.path.exists(filename)) and os.path.exists(get_json_save_filename(season, game))):
-        r = open(get_json_save_filename(season, game), 'rb')
-        page = r.read()
-        r.close()
-
-        page = zlib.decompress(page)
+    if ((force_overwrite or not os.path.exists(filename) or needs_reparse(meta, 'pbp'))
+            and raw_page_exists(season, game, 'pbp')):
+        page = read_game_page(season, game, 'pbp')
         try:
-            data = json.loads(page.decode('latin-1'))
+            data = decode_json(page, GAME_SUBTREES)
 
             teamdata = data['liveData']['boxscore']['teams']
 
-            update_team_ids_from_json(teamdata)
-            update_player_ids_from_json(teamdata)
-            update_quick_gamelog_from_json(data)
+            update_team_ids_from_json(teamdata, store, data['gameData']['teams'])
+            update_player_ids_from_json(teamdata, store)
+            update_quick_gamelog_from_json(data, store)
 
             events = read_events_from_json(data['liveData']['plays']['allPlays'])
-
-            if events is not None:
-                events.to_hdf(filename, key='Game{0:d}0{1:d}'.format(season, game), mode='w',
-                              complevel=9, complib='zlib')
+            parsed.append('pbp')
 
             #pbp_compressed = zlib.compress(bytes(events, encoding = 'latin-1'), level=9)
             #w = open(filename, 'wb')
@@ -220,26 +641,24 @@ def parse_game(season, game, force_overwrite = False):
         except json.JSONDecodeError:
             pass
 
-    filename = get_parsed_shifts_save_filename(season, game)
-    basic_gamelog = scrapenhl_globals.get_quick_gamelog_file()
-    if ((force_overwrite or not os.path.exists(filename)) and os.path.exists(get_shift_save_filename(season, game))):
-        r = open(get_shift_save_filename(season, game), 'rb')
-        page = r.read()
-        r.close()
+    thisgamedata = store.get_game(season, game)
+    if thisgamedata is not None:
+        rname = thisgamedata['Away']
+        hname = thisgamedata['Home']
+    else:
+        hname = None
+        rname = None
 
-        page = zlib.decompress(page)
+    shifts = None
+    filename = get_parsed_shifts_save_filename(season, game)
+    if ((force_overwrite or not os.path.exists(filename) or needs_reparse(meta, 'shift'))
+            and raw_page_exists(season, game, 'shift')):
+        page = read_game_page(season, game, 'shift')
         try:
-            data = json.loads(page.decode('latin-1'))
-
-            try:
-                thisgamedata = basic_gamelog.query('Season == {0:d} & Game == {1:d}'.format(season, game))
-                rname = thisgamedata['Away'].iloc[0]
-                hname = thisgamedata['Home'].iloc[0]
-            except Exception as e:
-                hname = None
-                rname = None
+            data = decode_json(page, (('data',),))
 
             shifts = read_shifts_from_json(data['data'], hname, rname)
+            parsed.append('shift')
 
             if shifts is not None:
                 #shifts = ''
@@ -247,29 +666,67 @@ def parse_game(season, game, force_overwrite = False):
                 #w = open(filename, 'wb')
                 #w.write(shifts_compressed)
                 #w.close()
+                if hname is not None:
+                    shifts = strength.add_strength_to_toi(shifts, hname, rname, onice.get_goalie_ids(store))
                 shifts.to_hdf(filename, key = 'Game{0:d}0{1:d}'.format(season, game), mode = 'w',
                               complevel = 9, complib = 'zlib')
+                if scrapenhl_globals.WRITE_DATASET and hname is not None:
+                    import dataset
+                    dataset.write_game_toi(season, game, shifts, hname, rname)
         except json.JSONDecodeError:
             pass
 
+    ### The pbp is written after the toi so each event can be stamped with the strength at its second
+    if events is not None:
+        if shifts is None and os.path.exists(filename):
+            import pandas as pd
+            shifts = pd.read_hdf(filename)
+        events = strength.add_strength_to_pbp(events, shifts, hname, rname, onice.get_goalie_ids(store))
+        events.to_hdf(get_parsed_save_filename(season, game), key = 'Game{0:d}0{1:d}'.format(season, game),
+                      mode = 'w', format = 'table', complevel = 9, complib = 'zlib')
+        if scrapenhl_globals.WRITE_DATASET and hname is not None:
+            import dataset
+            dataset.write_game_pbp(season, game, events, hname, rname)
+
+    ### Record which raw pages have been parsed, so they are only reparsed if they change
+    if any(kind in meta and 'sha256' in meta[kind] for kind in parsed):
+        for kind in parsed:
+            if kind in meta and 'sha256' in meta[kind]:
+                meta[kind]['parsed_sha256'] = meta[kind]['sha256']
+        _write_fetch_meta(season, game, meta)
+
+    store.game_done()
+
 def read_shifts_from_json(data, homename = None, roadname = None):
+    """
+    Expands the shift chart json into a second-by-second table of the players on ice for each team.
+
+    Rather than stepping through the game one second at a time, this method sweeps over the shift intervals once:
+    every shift is expanded into its seconds with np.repeat, players are ranked within each second, and the result is
+    scattered directly into the wide table.
+
+    Parameters
+    -----------
+    data : list of dict
+        A json list that is the result of shift_page['data']
+    homename : str or None
+        The home team abbreviation. If None, the first team in the shift data is taken to be the home team.
+    roadname : str or None
+        The road team abbreviation. If None, the last team in the shift data that is not the home team is used.
 
+    Returns
+    --------
+    pandas df
+        Dataframe with a Time column (seconds elapsed in the game) and up to six player ID columns per team, named
+        e.g. WSH1 through WSH6. Returns None if there is no shift data.
+    """
     if len(data) == 0:
         return
-    ids = ['' for i in range(len(data))]
-    periods = [0 for i in range(len(data))]
-    starts = ['0:00' for i in range(len(data))]
-    ends = ['0:00' for i in range(len(data))]
-    teams = ['' for i in range(len(data))]
-    durations = [0 for i in range(len(data))]
-
-    for i, dct in enumerate(data):
-        ids[i] = dct['playerId']
-        periods[i] = dct['period']
-        starts[i] = dct['startTime']
-        ends[i] = dct['endTime']
-        durations[i] = dct['duration']
-        teams[i] = dct['teamAbbrev']
+
+    import numpy as np
+    import pandas as pd
+
+    ids, teams, starts, ends, durations = read_shift_intervals_from_json(data)
 
     ### Seems like home players come first
     if homename is None:
@@ -279,124 +736,199 @@ def read_shifts_from_json(data, homename = None, roadname = None):
                 roadname = teams[i]
                 break
 
-    startmin = [x[:x.index(':')] for x in starts]
-    startsec = [x[x.index(':') + 1:] for x in starts]
-    starttimes = [1200 * (p-1) + 60 * int(m) + int(s) for p, m, s in zip(periods, startmin, startsec)]
-    endmin = [x[:x.index(':')] for x in ends]
-    endsec = [x[x.index(':') + 1:] for x in ends]
-    ### There is an extra -1 in endtimes to avoid overlapping start/end
-    endtimes = [1200 * (p - 1) + 60 * int(m) + int(s) - 1 for p, m, s in zip(periods, endmin, endsec)]
+    maxtime = int(ends.max())
+
+    ### Expand every shift into one row per second. Shifts are counted at their start second even if they end before
+    ### they start, and seconds outside the game are dropped.
+    lengths = np.maximum(ends - starts + 1, 1)
+    rows = np.repeat(np.arange(len(ids)), lengths)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    times = starts[rows] + offsets
+    inside = (times >= 0) & (times <= maxtime)
+    rows = rows[inside]
+    times = times[inside]
+
+    toi = pd.DataFrame({'Time': np.arange(maxtime + 1, dtype = np.int64)})
+    for name in (homename, roadname):
+        if name is None:
+            continue
+        cols = _sweep_team_shifts(rows[teams[rows] == name], times[teams[rows] == name],
+                                  ids, durations, name, maxtime)
+        for col, vals in cols:
+            toi[col] = vals
+
+    return toi
+
+def read_shift_intervals_from_json(data):
+    """
+    Reads player IDs, teams, and start and end seconds out of the shift chart json.
 
-    durationtime = [e - s for s, e in zip(starttimes, endtimes)]
+    Start and end are measured in seconds elapsed in the game. The end has an extra -1 to avoid overlapping
+    start/end, and shifts that appear to end before they start are assumed to wrap into the next period.
 
-    import pandas as pd
-    df = pd.DataFrame({'PlayerID': ids, 'Period': periods, 'Start': starttimes, 'End': endtimes,
-                       'Team': teams, 'Duration': durationtime})
-    df.loc[df.End < df.Start, 'End'] = df.End + 1200
-    tempdf = df[['PlayerID', 'Start', 'End', 'Team', 'Duration']]
-    tempdf = tempdf.assign(Time = tempdf.Start)
-    #print(tempdf.head(20))
-
-    toi = pd.DataFrame({'Time': [i for i in range(0, max(df.End) + 1)]})
-
-    toidfs = []
-    while len(tempdf.index) > 0:
-        temptoi = toi.merge(tempdf, how = 'inner', on = 'Time')
-        toidfs.append(temptoi)
-
-        tempdf = tempdf.assign(Time = tempdf.Time + 1)
-        tempdf = tempdf.query('Time <= End')
-
-    tempdf = pd.concat(toidfs)
-    tempdf = tempdf.sort_values(by = 'Time')
-
-    ### Append team name to start of columns by team
-    hdf = tempdf.query('Team == "' + homename + '"')
-    hdf2 = hdf.groupby('Time').rank()
-    hdf2 = hdf2.rename(columns = {'PlayerID': 'rank'})
-    hdf2.loc[:, 'rank'] = hdf2['rank'].apply(lambda x: int(x))
-    hdf.loc[:, 'rank'] = homename + hdf2['rank'].astype('str')
-
-    rdf = tempdf.query('Team == "' + roadname + '"')
-    rdf2 = rdf.groupby('Time').rank()
-    rdf2 = rdf2.rename(columns={'PlayerID': 'rank'})
-    rdf2.loc[:, 'rank'] = rdf2['rank'].apply(lambda x: int(x))
-    rdf.loc[:, 'rank'] = roadname + rdf2['rank'].astype('str')
-
-    ### Occasionally bad entries make duplicates on time and rank. Take one with longer duration
-
-    tokeep = hdf.sort_values(by = 'Duration', ascending = False)
-    tokeep = tokeep.groupby(['Time', 'PlayerID']).first()
-    tokeep.reset_index(inplace = True)
-    hdf = hdf.merge(tokeep, how = 'inner', on = ['Time', 'PlayerID', 'Start', 'End', 'Team', 'rank'])
-
-    tokeep = rdf.sort_values(by='Duration', ascending=False)
-    tokeep = tokeep.groupby(['Time', 'PlayerID']).first()
-    tokeep.reset_index(inplace=True)
-    rdf = rdf.merge(tokeep, how='inner', on=['Time', 'PlayerID', 'Start', 'End', 'Team', 'rank'])
-
-    ### Remove values above 6--looking like there won't be many
-    ### TODO: keep goalie if one is a goalie!
-    hdf = hdf.pivot(index = 'Time', columns = 'rank', values = 'PlayerID').iloc[:, 0:6]
-    hdf.reset_index(inplace = True) #get time back as a column
-    rdf = rdf.pivot(index='Time', columns='rank', values='PlayerID').iloc[:, 0:6]
-    rdf.reset_index(inplace = True)
-
-    toi = toi.merge(hdf, how = 'left', on = 'Time').merge(rdf, how = 'left', on = 'Time')
-
-    return(toi)
-
-def update_team_ids_from_json(teamdata):
+    Parameters
+    -----------
+    data : list of dict
+        A json list that is the result of shift_page['data']
+
+    Returns
+    --------
+    tuple of np.array
+        Player IDs, team abbreviations, starts, ends, and durations (end minus start, before any wrapping)
+    """
+    import numpy as np
+
+    ids = np.array([dct['playerId'] for dct in data], dtype = np.int64)
+    teams = np.array([dct['teamAbbrev'] for dct in data], dtype = object)
+    periods = np.array([dct['period'] for dct in data], dtype = np.int64)
+
+    starts = 1200 * (periods - 1) + _clock_to_seconds([dct['startTime'] for dct in data])
+    ### There is an extra -1 in ends to avoid overlapping start/end
+    ends = 1200 * (periods - 1) + _clock_to_seconds([dct['endTime'] for dct in data]) - 1
+    durations = ends - starts
+    ends = np.where(ends < starts, ends + 1200, ends)
+
+    return ids, teams, starts, ends, durations
+
+def _clock_to_seconds(clocks):
+    """
+    Converts game clock strings like 12:34 into seconds elapsed in the period.
+
+    Parameters
+    -----------
+    clocks : iterable of str
+        Game clock strings in mm:ss format
+
+    Returns
+    --------
+    np.array of int64
+        Seconds elapsed in the period
+    """
+    import numpy as np
+    return np.array([60 * int(x[:x.index(':')]) + int(x[x.index(':') + 1:]) for x in clocks], dtype = np.int64)
+
+def _sweep_team_shifts(rows, times, ids, durations, teamname, maxtime):
+    """
+    Ranks one team's players within each second and lays them out as wide columns.
+
+    Within a second, players are ranked by ID (ties get their average rank, truncated), and the column label is the
+    team name plus that rank as an integer, e.g. WSH1, as in the toi files written by earlier versions. (The original
+    loop, kept in benchmarks.py, labels them WSH1.0 under pandas versions where its int conversion keeps the float
+    dtype.) Occasionally bad entries put a player on the ice twice in the same second; the entry from the longer shift
+    is kept. This includes exact duplicate entries, which made the original loop fail with "Index contains duplicate
+    entries". Only the first six labels (in sorted order) become columns.
+
+    Parameters
+    -----------
+    rows : np.array of int
+        For each second a player on this team was on ice, the index of the shift it came from
+    times : np.array of int
+        The seconds matching rows
+    ids : np.array of int
+        Player ID of every shift
+    durations : np.array of int
+        Duration of every shift
+    teamname : str
+        The team abbreviation, used to name columns
+    maxtime : int
+        The last second of the game
+
+    Returns
+    --------
+    list of (str, np.array)
+        Column names and values, with NaN (and float dtype) where nobody is on ice
+    """
+    import numpy as np
+
+    if len(rows) == 0:
+        return []
+
+    pids = ids[rows]
+    ### Sort by time, then player, then longest shift first
+    order = np.lexsort((rows, -durations[rows], pids, times))
+    times = times[order]
+    pids = pids[order]
+
+    ### Position of each entry within its second, and of the first and last entry for the same player in that second
+    idx = np.arange(len(times))
+    newtime = np.r_[True, times[1:] != times[:-1]]
+    newplayer = newtime | np.r_[True, pids[1:] != pids[:-1]]
+    timestart = np.maximum.accumulate(np.where(newtime, idx, 0))
+    playerstarts = idx[newplayer]
+    playerends = np.r_[playerstarts[1:], len(idx)] - 1
+    playergroup = np.cumsum(newplayer) - 1
+    ### Average rank, truncated
+    ranks = (playerstarts[playergroup] + playerends[playergroup] - 2 * timestart) // 2 + 1
+
+    ### Keep one entry per player per second
+    times = times[newplayer]
+    pids = pids[newplayer]
+    ranks = ranks[newplayer]
+
+    labels = sorted(set(ranks.tolist()), key = lambda x: str(x))
+    ### If any second with a player on ice is missing any rank, or any second has nobody on, the team's columns are
+    ### all floats
+    usefloat = len(times) != len(labels) * len(np.unique(times)) or len(np.unique(times)) != maxtime + 1
+
+    cols = []
+    for rank in labels[:6]:
+        vals = np.full(maxtime + 1, np.nan) if usefloat else np.zeros(maxtime + 1, dtype = np.int64)
+        vals[times[ranks == rank]] = pids[ranks == rank]
+        cols.append(('{0:s}{1:d}'.format(teamname, rank), vals))
+    return cols
+
+def update_team_ids_from_json(teamdata, store = None, teaminfo = None):
+    """
+    Adds the home and road teams in the current game's json[liveData][boxscore] to the team ids, if not already there.
+
+    Team abbreviations are taken from teaminfo if given, and otherwise looked up on the NHL API.
+
+    Parameters
+    -----------
+    teamdata : dict
+        A json dict that is the result of api_page['liveData']['boxscore']['teams']
+    store : reference_store.ReferenceStore or None
+        The reference tables to update. If None, uses reference_store.get_reference_store()
+    teaminfo : dict or None
+        A json dict that is the result of api_page['gameData']['teams'], which has team names and abbreviations
+    """
     import urllib.request
     import json
-    import pandas as pd
 
-    hid = teamdata['home']['team']['id']
-    team_ids = scrapenhl_globals.get_team_id_file()
-    if hid not in team_ids.ID.values:
-        url = 'https://statsapi.web.nhl.com{0:s}'.format(teamdata['home']['team']['link'])
-        with urllib.request.urlopen(url) as reader:
-            page = reader.read()
-        teaminfo = json.loads(page.decode('latin-1'))
-        hid = teaminfo['teams'][0]['id']
-        habbrev = teaminfo['teams'][0]['abbreviation']
-        hname = teaminfo['teams'][0]['name']
-
-        df = pd.DataFrame({'ID': [hid], 'Abbreviation': [habbrev], 'Name': [hname]})
-        team_ids = pd.concat([team_ids, df])
-        scrapenhl_globals.write_team_id_file(team_ids)
-
-    rid = teamdata['away']['team']['id']
-    if rid not in team_ids.ID.values:
-        url = 'https://statsapi.web.nhl.com{0:s}'.format(teamdata['away']['team']['link'])
-        with urllib.request.urlopen(url) as reader:
-            page = reader.read()
-        teaminfo = json.loads(page.decode('latin-1'))
-        rid = teaminfo['teams'][0]['id']
-        rabbrev = teaminfo['teams'][0]['abbreviation']
-        rname = teaminfo['teams'][0]['name']
-
-        df = pd.DataFrame({'ID': [rid], 'Abbreviation': [rabbrev], 'Name': [rname]})
-        team_ids = pd.concat([team_ids, df])
-        scrapenhl_globals.write_team_id_file(team_ids)
-
-def update_player_ids_from_json(teamdata):
-    """
-    Creates a data frame of player data from current game's json[liveData][boxscore] to update player ids.
-
-    This method reads player ids, names, handedness, team, position, and number, and full joins to player ids.
-    If there are any changes to player ids, the dataframe gets written to disk again.
+    if store is None:
+        store = reference_store.get_reference_store()
+
+    for side in ('home', 'away'):
+        if store.has_team(teamdata[side]['team']['id']):
+            continue
+        if teaminfo is not None and 'abbreviation' in teaminfo[side]:
+            store.add_team(teaminfo[side]['id'], teaminfo[side]['abbreviation'], teaminfo[side]['name'])
+        else:
+            url = 'https://statsapi.web.nhl.com{0:s}'.format(teamdata[side]['team']['link'])
+            with urllib.request.urlopen(url) as reader:
+                page = reader.read()
+            apiinfo = json.loads(page.decode('latin-1'))
+            store.add_team(apiinfo['teams'][0]['id'], apiinfo['teams'][0]['abbreviation'],
+                           apiinfo['teams'][0]['name'])
+
+def update_player_ids_from_json(teamdata, store = None):
+    """
+    Reads player data from current game's json[liveData][boxscore] to update player ids.
+
+    This method reads player ids, names, handedness, team, position, and number, and adds one appearance for each to
+    the player ids in the reference store.
 
     Parameters
     -----------
     teamdata : dict
         A json dict that is the result of api_page['liveData']['boxscore']['teams']
+    store : reference_store.ReferenceStore or None
+        The reference tables to update. If None, uses reference_store.get_reference_store()
     """
-    team_ids = scrapenhl_globals.get_team_id_file()
-    rteam = team_ids.query('ID == ' + str(teamdata['away']['team']['id']))
-    rabbrev = rteam['Abbreviation'].iloc[0]
-    hteam = team_ids.query('ID == ' + str(teamdata['home']['team']['id']))
-    habbrev = hteam['Abbreviation'].iloc[0]
+    if store is None:
+        store = reference_store.get_reference_store()
+    rabbrev = store.get_team_abbreviation(teamdata['away']['team']['id'])
+    habbrev = store.get_team_abbreviation(teamdata['home']['team']['id'])
 
     awayplayers = teamdata['away']['players']
     homeplayers = teamdata['home']['players']
@@ -457,35 +989,24 @@ def update_player_ids_from_json(teamdata):
         nums[i + len(awayplayers)] = num
         handedness[i + len(awayplayers)] = hand
 
-    import pandas as pd
-    gamedf = pd.DataFrame({'ID': ids,
-                           'Name': names,
-                           'Team': teams,
-                           'Pos': positions,
-                           '#': nums,
-                           'Hand': handedness})
-    gamedf['Count'] = 1
-
-    player_ids = scrapenhl_globals.get_player_id_file()
+    store.add_players(zip(ids, names, teams, positions, nums, handedness))
 
-    player_ids = pd.concat([player_ids, gamedf]) \
-        .groupby(['ID', 'Name', 'Team', 'Pos', '#', 'Hand']).sum().reset_index()
-
-    scrapenhl_globals.write_player_id_file(player_ids)
-
-def update_quick_gamelog_from_json(data):
+def update_quick_gamelog_from_json(data, store = None):
     """
-    Creates a data frame of basic game data from current game's json to update global BASIC_GAMELOG.
+    Reads basic game data from current game's json to update the game log.
 
-    This method reads the season, game, date and time, venue, and team names, coaches, anc scores, joining to
-    BASIC_GAMELOG.
-    If there are any changes to BASIC_GAMELOG, the dataframe gets written to disk again.
+    This method reads the season, game, date and time, venue, and team names, coaches, anc scores, and adds them to
+    the game log in the reference store.
 
     Parameters
     -----------
     data : dict
         The full json dict from the api_page
+    store : reference_store.ReferenceStore or None
+        The reference tables to update. If None, uses reference_store.get_reference_store()
     """
+    if store is None:
+        store = reference_store.get_reference_store()
     season = int(str(data['gameData']['game']['pk'])[:4])
     game = int(str(data['gameData']['game']['pk'])[4:])
     datetime = data['gameData']['datetime']['dateTime']
@@ -493,11 +1014,8 @@ def update_quick_gamelog_from_json(data):
         venue = data['gameData']['venue']['name']
     except KeyError:
         venue = 'N/A'
-    team_ids = scrapenhl_globals.get_team_id_file()
-    hname = team_ids.query('ID == ' + str(data['gameData']['teams']['home']['id']))
-    hname = hname['Abbreviation'].iloc[0]
-    rname = team_ids.query('ID == ' + str(data['gameData']['teams']['away']['id']))
-    rname = rname['Abbreviation'].iloc[0]
+    hname = store.get_team_abbreviation(data['gameData']['teams']['home']['id'])
+    rname = store.get_team_abbreviation(data['gameData']['teams']['away']['id'])
     try:
         hcoach = data['liveData']['boxscore']['teams']['home']['coaches'][0]['person']['fullName']
     except IndexError:
@@ -509,81 +1027,62 @@ def update_quick_gamelog_from_json(data):
     hscore = data['liveData']['boxscore']['teams']['home']['teamStats']['teamSkaterStats']['goals']
     rscore = data['liveData']['boxscore']['teams']['away']['teamStats']['teamSkaterStats']['goals']
 
-    import pandas as pd
-    gamedf = pd.DataFrame({'Season': [season], 'Game': [game], 'Datetime': [datetime], 'Venue': [venue],
-                           'Home': [hname], 'HomeCoach': [hcoach], 'HomeScore': [hscore],
-                           'Away': [rname], 'AwayCoach': [rcoach], 'AwayScore': [rscore]})
-    basic_gamelog = scrapenhl_globals.get_quick_gamelog_file()
-    basic_gamelog = pd.concat([basic_gamelog, gamedf]).drop_duplicates()
-    scrapenhl_globals.write_quick_gamelog_file(basic_gamelog)
+    store.add_game({'Season': season, 'Game': game, 'Datetime': datetime, 'Venue': venue,
+                    'Home': hname, 'HomeCoach': hcoach, 'HomeScore': hscore,
+                    'Away': rname, 'AwayCoach': rcoach, 'AwayScore': rscore})
 
 def read_events_from_json(pbp):
     """
-    Returns the NHL API url to scrape.
+    Reads the play by play events from the json into a dataframe with typed columns.
+
+    Each column is extracted in a single pass over the plays and written straight into a typed array, so there are no
+    object columns apart from the roles and notes.
 
     Parameters
     -----------
-    season : int
-        The season of the game. 2007-08 would be 2007.
-    game : int
-        The game id. This can range from 20001 to 21230 for regular season, and 30111 to 30417 for playoffs.
-        The preseason, all-star game, Olympics, and World Cup also have game IDs that can be provided.
+    pbp : list of dict
+        A json list that is the result of api_page['liveData']['plays']['allPlays']
+
     Returns
     --------
     pandas df
-        Dataframe of the game's play by play data
+        Dataframe of the game's play by play data. Columns are Index, Period (int32), Time (mm:ss str), Seconds
+        (int16, seconds elapsed in the game, matching the Time column of the TOI table), Event (categorical), Team,
+        Actor, and Recipient (int64 IDs, -1 if missing), ActorRole, RecipientRole, X and Y (float32, NaN if missing),
+        and Note.
     """
 
     import numpy as np
     import pandas as pd
 
-    index = [i for i in range(len(pbp))]
-    period = [-1 for i in range(len(pbp))]
-    time = ['0:00' for i in range(len(pbp))]
-    event = ['NA' for i in range(len(pbp))]
-
-    team = [-1 for i in range(len(pbp))]
-    p1 = [-1 for i in range(len(pbp))]
-    p1role = ['' for i in range(len(pbp))]
-    p2 = [-1 for i in range(len(pbp))]
-    p2role = ['' for i in range(len(pbp))]
-    xy = [(np.NaN, np.NaN) for i in range(len(pbp))]
-    note = ['' for i in range(len(pbp))]
-
-    for i in range(len(pbp)):
-        period[i] = int(pbp[i]['about']['period'])
-        time[i] = pbp[i]['about']['periodTime']
-        event[i] = pbp[i]['result']['event']
-
-        try:
-            xy[i] = (float(pbp[i]['coordinates']['x']), float(pbp[i]['coordinates']['y']))
-        except KeyError:
-            pass
-        try:
-            team[i] = pbp[i]['team']['id']
-        except KeyError:
-            pass
-        try:
-            p1[i] = pbp[i]['players'][0]['player']['id']
-            p1role[i] = pbp[i]['players'][0]['playerType']
-        except KeyError:
-            pass
-        try:
-            p2[i] = pbp[i]['players'][1]['player']['id']
-            p2role[i] = pbp[i]['players'][1]['playerType']
-        except KeyError:
-            pass
-        except IndexError: #e.g. on a give or take
-            pass
-
-        try:
-            note[i] = pbp[i]['result']['description']
-        except KeyError:
-            pass
-
-        #print(period[i], time[i], event[i], xy[i], team[i], p1[i], p1role[i], p2[i], p2role[i])
-
-    pbpdf = pd.DataFrame({'Index': index, 'Period': period, 'Time': time, 'Event': event,
-                          'Team': team, 'Actor': p1, 'ActorRole': p1role, 'Recipient': p2, 'RecipientRole': p2role,
-                          'XY': xy, 'Note': note})
+    n = len(pbp)
+    empty = {}
+
+    period = np.fromiter((play['about']['period'] for play in pbp), dtype = np.int32, count = n)
+    time = [play['about']['periodTime'] for play in pbp]
+    seconds = (1200 * (period.astype(np.int64) - 1) + _clock_to_seconds(time)).astype(np.int16)
+    event = pd.Categorical([play['result']['event'] for play in pbp])
+    note = [play['result'].get('description', '') for play in pbp]
+    team = np.fromiter((play.get('team', empty).get('id', -1) for play in pbp), dtype = np.int64, count = n)
+
+    ### Coordinates are only kept if both x and y are present
+    coords = [play.get('coordinates', empty) for play in pbp]
+    hascoords = [('x' in c and 'y' in c) for c in coords]
+    x = np.fromiter((c['x'] if h else np.nan for c, h in zip(coords, hascoords)), dtype = np.float32, count = n)
+    y = np.fromiter((c['y'] if h else np.nan for c, h in zip(coords, hascoords)), dtype = np.float32, count = n)
+
+    ### The second player is missing on e.g. a give or take
+    players = [play.get('players', ()) for play in pbp]
+    p1 = [p[0] if len(p) > 0 else empty for p in players]
+    p2 = [p[1] if len(p) > 1 else empty for p in players]
+    actor = np.fromiter((p['player']['id'] if p else -1 for p in p1), dtype = np.int64, count = n)
+    actorrole = [p.get('playerType', '') for p in p1]
+    recipient = np.fromiter((p['player']['id'] if p else -1 for p in p2), dtype = np.int64, count = n)
+    recipientrole = [p.get('playerType', '') for p in p2]
+
+    pbpdf = pd.DataFrame({'Index': np.arange(n), 'Period': period, 'Time': time, 'Seconds': seconds,
+                          'Event': event, 'Team': team, 'Actor': actor, 'ActorRole': actorrole,
+                          'Recipient': recipient, 'RecipientRole': recipientrole, 'X': x, 'Y': y, 'Note': note},
+                         columns = ['Index', 'Period', 'Time', 'Seconds', 'Event', 'Team', 'Actor', 'ActorRole',
+                                    'Recipient', 'RecipientRole', 'X', 'Y', 'Note'])
     return pbpdf
@@ -1,7 +1,13 @@
 import scrapenhl_globals
 import scrape_game
-
-def scrape_games(season, games, force_overwrite = False, pause = 1, marker = 10):
+import reference_store
+import toimatrix
+import strength
+import corsi
+import os.path
+
+def scrape_games(season, games, force_overwrite = False, pause = 1, marker = 10, workers = 1, rate = None,
+                 revalidate = False):
     """
     Scrapes the specified games.
 
@@ -18,6 +24,14 @@ def scrape_games(season, games, force_overwrite = False, pause = 1, marker = 10)
         The time to pause between requests to the NHL API. Defaults to 1 second
     marker : float or int
         The number of times to print progress. 10 will print every 10%; 20 every 5%.
+    workers : int
+        The number of games to scrape at once. With more than one worker, games are scraped from a thread pool sharing
+        one rate limit, instead of pausing between games.
+    rate : float or None
+        The maximum requests per second across all workers. Only used when workers > 1. Defaults to 1 / pause.
+    revalidate : bool
+        If True, games already scraped are checked for corrections with conditional requests (see
+        scrape_game.scrape_game). Changed pages are reparsed by parse_games.
     """
     import time
     import datetime
@@ -26,9 +40,28 @@ def scrape_games(season, games, force_overwrite = False, pause = 1, marker = 10)
     marker_i = [len(games)//marker * i for i in range(marker)]
     marker_i[-1] = len(games) - 1
     marker_i_set = set(marker_i)
+
+    if workers > 1:
+        import concurrent.futures
+        import fetcher
+        if rate is None:
+            rate = 1 / pause if pause else None
+        shared_fetcher = fetcher.Fetcher(rate = rate)
+        with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+            futures = {executor.submit(scrape_game.scrape_game, season, game, force_overwrite, shared_fetcher,
+                                       revalidate): game
+                       for game in games}
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                future.result()
+                if i in marker_i_set:
+                    print('Done through', season, futures[future], ' ~ ', round((marker_i.index(i)) * 100/marker),
+                          '% in', str(datetime.timedelta(seconds = time.time() - starttime)))
+        print('Done scraping games in', season)
+        return
+
     for i in range(len(games)):
         game = games[i]
-        newscrape = scrape_game.scrape_game(season, game, force_overwrite)
+        newscrape = scrape_game.scrape_game(season, game, force_overwrite, revalidate = revalidate)
         if newscrape: #only sleep if had to scrape a new game
             time.sleep(pause)
         if i in marker_i_set:
@@ -37,7 +70,8 @@ def scrape_games(season, games, force_overwrite = False, pause = 1, marker = 10)
     print('Done scraping games in', season)
 
 
-def scrape_season(season, startgame = None, endgame = None, force_overwrite = False, pause = 1):
+def scrape_season(season, startgame = None, endgame = None, force_overwrite = False, pause = 1, workers = 1,
+                  rate = None, revalidate = False):
     """
     Scrapes games for the specified season.
 
@@ -54,6 +88,12 @@ def scrape_season(season, startgame = None, endgame = None, force_overwrite = Fa
         If True, will overwrite previously raw html files. If False, will not scrape if files already found.
     pause : float or int
         The time to pause between requests to the NHL API. Defaults to 1 second
+    workers : int
+        The number of games to scrape at once. See scrape_games.
+    rate : float or None
+        The maximum requests per second across all workers. See scrape_games.
+    revalidate : bool
+        If True, games already scraped are checked for corrections. See scrape_games.
     """
     if season != 2012:
         games = [20000 + x for x in range(1, 1231)]
@@ -67,108 +107,203 @@ def scrape_season(season, startgame = None, endgame = None, force_overwrite = Fa
         games = [g for g in games if g >= startgame]
     if endgame is not None:
         games = [g for g in games if g <= endgame]
-    scrape_games(season, games, force_overwrite, pause, 10)
+    scrape_games(season, games, force_overwrite, pause, 10, workers, rate, revalidate)
 
 def get_team_pbplog_filename(season, team):
-    return '{0:s}Team logs/{2:s}{1:d}_pbp.feather'.format(scrapenhl_globals.SAVE_FOLDER, season, team)
+    """
+    Returns the single-file team pbp log used before team logs were partitioned by game. See get_team_pbplog_folder.
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'Team logs', '{1:s}{0:d}_pbp.feather'.format(season, team))
 
 def get_team_toilog_filename(season, team):
-    return '{0:s}Team logs/{2:s}{1:d}_toi.feather'.format(scrapenhl_globals.SAVE_FOLDER, season, team)
+    """
+    Returns the single-file team toi log used before team logs were partitioned by game. See get_team_toilog_folder.
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'Team logs', '{1:s}{0:d}_toi.feather'.format(season, team))
 
-def update_teamlogs(season, force_overwrite = False):
-    import os
+def get_team_pbplog_folder(season, team):
+    """
+    Returns the folder holding this team's pbp log for this season, with one feather file per game.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The team abbreviation
+
+    Returns
+    --------
+    str
+        SAVE_FOLDER/Team logs/[team][season]_pbp
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'Team logs', '{1:s}{0:d}_pbp'.format(season, team))
+
+def get_team_toilog_folder(season, team):
+    """
+    Returns the folder holding this team's toi log for this season, with one feather file per game.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The team abbreviation
+
+    Returns
+    --------
+    str
+        SAVE_FOLDER/Team logs/[team][season]_toi
+    """
+    return os.path.join(scrapenhl_globals.SAVE_FOLDER, 'Team logs', '{1:s}{0:d}_toi'.format(season, team))
+
+def _get_teamlog_games(folder):
+    """
+    Returns a dict of game id to file for the game partitions in this team log folder.
+    """
+    if not os.path.exists(folder):
+        return {}
+    return {int(x[:-8]): os.path.join(folder, x) for x in os.listdir(folder)
+            if x[-8:] == '.feather' and x[:-8].isdigit()}
+
+def _migrate_teamlog(filename, folder):
+    """
+    Splits a single-file team log into per-game partitions in folder, then removes the single file.
+    """
     import feather
-    import pandas as pd
-    import os.path
+    if not os.path.exists(filename):
+        return
+    df = feather.read_dataframe(filename)
+    for game, gamedf in df.groupby('Game'):
+        scrapenhl_globals.write_feather(gamedf.reset_index(drop = True),
+                                        os.path.join(folder, '{0:d}.feather'.format(int(game))))
+    os.remove(filename)
+
+def _write_teamlog_game(df, folder, game):
+    """
+    Writes one game's team log partition, storing object columns as str.
+    """
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            df[col] = df[col].astype(str)
+    scrapenhl_globals.write_feather(df, os.path.join(folder, '{0:d}.feather'.format(game)))
+
+def update_teamlogs(season, force_overwrite = False, games = None):
+    """
+    Adds newly parsed games to each team's pbp and toi logs for this season.
+
+    Team logs are stored as one feather file per game, so an update only writes the new games. Logs in the older
+    single-file format are split into per-game files the first time they are updated.
 
-    basic_gamelog = scrapenhl_globals.get_quick_gamelog_file()
+    Strength columns are flipped to the team's perspective (TeamSkaters, OppSkaters, TeamGoalie, OppGoalie, and
+    Strength as [team]v[opponent]; see strength.to_team_perspective).
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    force_overwrite : bool
+        If True, rewrites every game's partition. If False, only writes games not already in the logs.
+    games : iterable of int, or None
+        Games to rewrite even if they are already in the logs, e.g. because they were reparsed
+    """
+    import pandas as pd
 
-    teams = {x for x in \
-             basic_gamelog.query('Season == {0:d}'.format(season))['Home'].drop_duplicates()} | \
-            {x for x in \
-             basic_gamelog.query('Season == {0:d}'.format(season))['Away'].drop_duplicates()}
-    temp = basic_gamelog
-    ### List files in correct format
-    allfiles = os.listdir(scrapenhl_globals.get_season_folder(season))
+    games = set() if games is None else {int(g) for g in games}
+    basic_gamelog = reference_store.get_reference_store().get_quick_gamelog_df()
+    basic_gamelog = basic_gamelog[basic_gamelog.Season == season]
 
-    pbpfiles = {int(x[:5]): x for x in allfiles if x[-12:] == '_parsed.zlib'}
-    toifiles = {int(x[:5]): x for x in allfiles if x[-19:] == '_shifts_parsed.zlib'}
+    teams = set(basic_gamelog.Home) | set(basic_gamelog.Away)
 
     for team in teams:
-        teamgames = {int(g) for g in basic_gamelog.query('Season == {0:d} & (Home == "{1:s}" | Away == "{1:s}")'.format(
-            season, team))['Game'].values}
-        current_pbp = None
-        games_already_done = set()
-        if os.path.exists(get_team_pbplog_filename(season, team)):
-            current_pbp = feather.read_dataframe(get_team_pbplog_filename(season, team))
-            games_already_done = {x for x in current_pbp.Game}
-
-        dflist = []
-        if not force_overwrite and current_pbp is not None:
-            dflist.append(current_pbp)
-            teamgames = {int(g) for g in teamgames if g not in games_already_done}
-        ### TODO do I need to flip any columns?
-        #if force_overwrite:
-        for game in teamgames:
+        teamgames = {int(g) for g in basic_gamelog[(basic_gamelog.Home == team) |
+                                                   (basic_gamelog.Away == team)].Game.values}
+        homegames = {int(g) for g in basic_gamelog[basic_gamelog.Home == team].Game.values}
+
+        folder = get_team_pbplog_folder(season, team)
+        _migrate_teamlog(get_team_pbplog_filename(season, team), folder)
+        newgames = teamgames if force_overwrite else (teamgames - set(_get_teamlog_games(folder))) | \
+                                                     (teamgames & games)
+        for game in sorted(newgames):
             try:
                 df = pd.read_hdf(scrape_game.get_parsed_save_filename(season, game))
-                df = df.assign(Game = game)
-                if df is not None:
-                    dflist.append(df)
             except FileNotFoundError:
-                pass
-        if len(dflist) > 0:
-            new_pbp = pd.concat(dflist)
-            for col in new_pbp.columns:
-                if new_pbp[col].dtype == 'object':
-                    new_pbp[col] = new_pbp[col].astype(str)
-            feather.write_dataframe(new_pbp, get_team_pbplog_filename(season, team))
-
-        current_toi = None
-        games_already_done = set()
-        if os.path.exists(get_team_toilog_filename(season, team)):
-            current_toi = feather.read_dataframe(get_team_toilog_filename(season, team))
-            games_already_done = {x for x in current_toi.Game}
-        ### TODO issues here
-        dflist = []
-        if not force_overwrite:
-            dflist.append(current_toi)
-            teamgames = {g for g in teamgames if g not in games_already_done}
-
-        #if force_overwrite:
-        for game in teamgames:
+                continue
+            df = strength.to_team_perspective(df, game in homegames)
+            _write_teamlog_game(df.assign(Game = game), folder, game)
+
+        folder = get_team_toilog_folder(season, team)
+        _migrate_teamlog(get_team_toilog_filename(season, team), folder)
+        newgames = teamgames if force_overwrite else (teamgames - set(_get_teamlog_games(folder))) | \
+                                                     (teamgames & games)
+        for game in sorted(newgames):
             try:
                 df = pd.read_hdf(scrape_game.get_parsed_shifts_save_filename(season, game))
-                df = df.assign(Game = game)
-                cols_to_replace = {col for col in df.columns if str.isdigit(col[-1]) if col[:3] != team}
-                df.rename(columns = {col: 'Opp' + col[3:] for col in cols_to_replace}, inplace = True)
-                if df is not None:
-                    dflist.append(df)
             except FileNotFoundError:
-                pass
+                continue
+            df = strength.to_team_perspective(df.assign(Game = game), game in homegames)
+            cols_to_replace = {col for col in df.columns if str.isdigit(col[-1]) if col[:3] != team}
+            df.rename(columns = {col: 'Opp' + col[3:] for col in cols_to_replace}, inplace = True)
+            _write_teamlog_game(df, folder, game)
+
+def _read_teamlog(folder, filename):
+    """
+    Reads a team log through the team log cache (see logcache.py), concatenating its game partitions in game order,
+    or reading the single file if the log has not been partitioned yet.
+    """
+    import logcache
+    folderkey = logcache.get_path_key(folder)
+    key = (folder, folderkey, len(os.listdir(folder)) if folderkey is not None else 0,
+           logcache.get_path_key(filename))
+    return logcache.get_teamlog_cache().get(key, lambda: _load_teamlog(folder, filename))
 
-        import pandas as pd
-        dflist = [df for df in dflist if df is not None]
-        if len(dflist) > 0:
-            new_toi = pd.concat(dflist)
-            for col in new_toi.columns:
-                if new_toi[col].dtype == 'object':
-                    new_toi[col] = new_toi[col].astype(str)
-            feather.write_dataframe(new_toi, get_team_toilog_filename(season, team))
+def _load_teamlog(folder, filename):
+    """
+    Reads a team log from disk. See _read_teamlog.
+    """
+    import feather
+    import pandas as pd
+    games = _get_teamlog_games(folder)
+    if len(games) == 0:
+        return feather.read_dataframe(filename)
+    return pd.concat([feather.read_dataframe(games[game]) for game in sorted(games)], ignore_index = True)
 
 def get_team_toilog(season, team):
-    import feather
-    return feather.read_dataframe(get_team_toilog_filename(season, team))
+    """
+    Returns this team's toi log for this season as one dataframe.
+
+    The log is sliced from the season's toi matrix (see toimatrix.get_team_toilog) when the matrix has all of the
+    team's parsed games and none has been reparsed since it was written. Otherwise it is read from the team log files.
+    """
+    games = _get_parsed_team_games(season, team)
+    if len(games) > 0 and toimatrix.is_current(season, games):
+        import logcache
+        key = ((toimatrix.get_matrix_filename(season), team),
+               logcache.get_path_key(toimatrix.get_index_filename(season)))
+        return logcache.get_teamlog_cache().get(key, lambda: toimatrix.get_team_toilog(season, team))
+    return _read_teamlog(get_team_toilog_folder(season, team), get_team_toilog_filename(season, team))
+
+def _get_parsed_team_games(season, team):
+    """
+    Returns the team's games this season, from the game log, whose toi has been parsed.
+    """
+    basic_gamelog = reference_store.get_reference_store().get_quick_gamelog_df()
+    basic_gamelog = basic_gamelog[(basic_gamelog.Season == season) &
+                                  ((basic_gamelog.Home == team) | (basic_gamelog.Away == team))]
+    return [int(game) for game in basic_gamelog.Game
+            if os.path.exists(scrape_game.get_parsed_shifts_save_filename(season, game))]
 
 def get_team_pbplog(season, team):
-    import feather
-    return feather.read_dataframe(get_team_pbplog_filename(season, team))
+    """
+    Returns this team's pbp log for this season as one dataframe.
+    """
+    return _read_teamlog(get_team_pbplog_folder(season, team), get_team_pbplog_filename(season, team))
 
 def get_season_schedule_url(season):
     return 'https://statsapi.web.nhl.com/api/v1/schedule?startDate={0:d}-09-01&endDate={1:d}-06-25'.format(season,
                                                                                                            season + 1)
 
-def parse_games(season, games, force_overwrite = False, marker = 10):
+def parse_games(season, games, force_overwrite = False, marker = 10, workers = 1):
     """
     Parses the specified games.
 
@@ -183,6 +318,11 @@ def parse_games(season, games, force_overwrite = False, marker = 10):
         If True, will overwrite previously parsed files. If False, will not parise if files already found.
     marker : float or int
         The number of times to print progress. 10 will print every 10%; 20 every 5%.
+    workers : int
+        The number of processes to parse games in. With more than one, each game is parsed in a process pool against
+        its own reference store, and the player, team, and game log updates are merged here in game order, so the
+        result is the same as parsing serially. Games for the Parquet dataset (see dataset.py) are passed back and
+        written here too.
     """
     import time
     import datetime
@@ -193,15 +333,76 @@ def parse_games(season, games, force_overwrite = False, marker = 10):
     marker_i = [len(games) // marker * i for i in range(marker)]
     marker_i[-1] = len(games) - 1
     marker_i_set = set(marker_i)
+    store = reference_store.get_reference_store()
+
+    if workers > 1:
+        import concurrent.futures
+        deltas = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+            futures = {executor.submit(_parse_game_worker, season, game, force_overwrite,
+                                       store.spawn(season, game)): game for game in games}
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                deltas[futures[future]], pending = future.result()
+                if len(pending) > 0:
+                    import dataset
+                    dataset.add_pending(pending)
+                if i in marker_i_set:
+                    print('Done through', season, futures[future], ' ~ ', round((marker_i.index(i)) * 100 / marker),
+                          '% in', str(datetime.timedelta(seconds=time.time() - starttime)))
+        for game in games:
+            store.apply_delta(deltas[game])
+        store.flush()
+        _flush_dataset()
+        print('Done parsing games in', season)
+        return
+
     for i in range(len(games)):
         game = games[i]
-        scrape_game.parse_game(season, game, force_overwrite)
+        scrape_game.parse_game(season, game, force_overwrite, store)
         if i in marker_i_set:
             print('Done through', season, game, ' ~ ', round((marker_i.index(i)) * 100 / marker), '% in',
                   str(datetime.timedelta(seconds=time.time() - starttime)))
+    store.flush()
+    _flush_dataset()
     print('Done parsing games in', season)
 
-def autoupdate(season = scrapenhl_globals.MAX_SEASON):
+def _flush_dataset():
+    """
+    Writes games buffered for the Parquet dataset, if it is being written. See dataset.flush.
+    """
+    if scrapenhl_globals.WRITE_DATASET:
+        import dataset
+        dataset.flush()
+
+def _parse_game_worker(season, game, force_overwrite, store):
+    """
+    Parses one game in a worker process.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    force_overwrite : bool
+        If True, will overwrite previously parsed files.
+    store : reference_store.ReferenceStore
+        A store from ReferenceStore.spawn
+
+    Returns
+    --------
+    tuple
+        The store's updates, from ReferenceStore.get_delta, and the game's tables for the Parquet dataset, from
+        dataset.pop_pending (empty unless scrapenhl_globals.WRITE_DATASET is set)
+    """
+    scrape_game.parse_game(season, game, force_overwrite, store)
+    pending = {}
+    if scrapenhl_globals.WRITE_DATASET:
+        import dataset
+        pending = dataset.pop_pending()
+    return store.get_delta(), pending
+
+def autoupdate(season = None):
     """
     Scrapes unscraped games for the specified season.
 
@@ -211,8 +412,10 @@ def autoupdate(season = scrapenhl_globals.MAX_SEASON):
     Parameters
     -----------
     season : int
-        The season of the game. 2007-08 would be 2007.
+        The season of the game. 2007-08 would be 2007. None uses scrapenhl_globals.MAX_SEASON.
     """
+    if season is None:
+        season = scrapenhl_globals.MAX_SEASON
     import urllib.request
     url = get_season_schedule_url(season)
     with urllib.request.urlopen(url) as reader:
@@ -229,6 +432,75 @@ def autoupdate(season = scrapenhl_globals.MAX_SEASON):
 
     scrape_games(season, completed_games)
     parse_games(season, completed_games)
+    toimatrix.update_toi_matrix(season)
+    corsi.update_player_corsi(season)
+
+    import dashdata
+    dashdata.build_snapshot()
+
+def update(season = None, games = None, workers = 1, revalidate = False):
+    """
+    Brings everything for this season up to date, redoing only the work for new or changed games.
+
+    Games are scraped if missing (or revalidated), parsed if their raw pages changed since they were parsed, and
+    written to the team logs, toi matrix, and Corsi table if their parsed files changed since those were built. The
+    dashboard snapshot (see dashdata.py) is rebuilt if the Corsi table changed. What has been done for each game is
+    recorded in the season's manifest (see manifest.py), so running this twice in a row does nothing the second time.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007. None uses scrapenhl_globals.MAX_SEASON.
+    games : iterable of int, or None
+        The games to consider. If None, all completed games according to the NHL schedule.
+    workers : int
+        The number of games to scrape and parse at once. See scrape_games and parse_games.
+    revalidate : bool
+        If True, games already scraped are checked for corrections. See scrape_games.
+
+    Returns
+    --------
+    dict
+        Stage name ('parse' and each of manifest.STAGES) to the sorted list of games it was run for
+    """
+    import os
+    import manifest
+
+    if season is None:
+        season = scrapenhl_globals.MAX_SEASON
+    if games is None:
+        games = read_completed_games_from_url(season)
+    games = sorted(int(g) for g in games)
+    if not os.path.exists(scrapenhl_globals.get_season_folder(season)):
+        scrapenhl_globals.create_season_folder(season)
+
+    scrape_games(season, games, workers = workers, revalidate = revalidate)
+
+    done = {}
+    gamemanifest = manifest.read_manifest(season)
+    done['parse'] = [game for game in games if manifest.needs_parse(gamemanifest, season, game)]
+    if len(done['parse']) > 0:
+        parse_games(season, done['parse'], force_overwrite = True, workers = workers)
+        for game in done['parse']:
+            manifest.mark_parsed(gamemanifest, season, game)
+        manifest.write_manifest(season, gamemanifest)
+
+    for stage, run in (('teamlogs', update_teamlogs), ('toimatrix', toimatrix.update_toi_matrix),
+                       ('corsi', corsi.update_player_corsi)):
+        done[stage] = [game for game in games if manifest.needs_stage(gamemanifest, season, game, stage)]
+        if len(done[stage]) == 0:
+            continue
+        run(season, games = done[stage])
+        for game in done[stage]:
+            manifest.mark_stage(gamemanifest, season, game, stage)
+        manifest.write_manifest(season, gamemanifest)
+
+    import dashdata
+    if len(done['corsi']) > 0 or not os.path.exists(dashdata.get_options_filename()):
+        dashdata.build_snapshot()
+
+    print('Updated', season, {stage: len(stagegames) for stage, stagegames in done.items()})
+    return done
 
 def read_completed_games_from_url(season):
     import urllib.request
@@ -246,34 +518,56 @@ def read_completed_games_from_url(season):
                 completed_games.add(int(str(game['gamePk'])[-5:]))
     return completed_games
 
-def reparse_season(season = scrapenhl_globals.MAX_SEASON):
+def reparse_season(season = None, workers = 1):
     """
     Re-parses entire season.
     :param season: int
-        The season of the game. 2007-08 would be 2007.
+        The season of the game. 2007-08 would be 2007. None uses scrapenhl_globals.MAX_SEASON.
+    :param workers: int
+        The number of processes to parse games in. See parse_games.
     :return:
     """
+    if season is None:
+        season = scrapenhl_globals.MAX_SEASON
     completed_games = read_completed_games_from_url(season)
-    parse_games(season, completed_games, True)
+    parse_games(season, completed_games, True, workers = workers)
+
+
+def list_scraped_games(season):
+    """
+    Lists the games in this season with a raw game page saved on disk, as a file or in the season archive.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
 
+    Returns
+    --------
+    list of int
+        The game ids, sorted
+    """
+    return [game for game in scrape_game.list_raw_games(season) if scrape_game.raw_page_exists(season, game, 'pbp')]
 
-def rewrite_globals(start_from_scratch = True, seasons = None):
+def rewrite_globals(start_from_scratch = True, seasons = None, workers = 1):
     """
     Recreates global files: PLAYER_IDS, BASIC_GAMELOG, TEAM_IDS, CORRECTED_PLAYERNAMES
 
+    Games are listed from the raw files already on disk, and team names and abbreviations are read from the game
+    files, so this works offline. All updates are accumulated in the reference store and each file is written once,
+    at the end.
+
     Parameters
     -----------
     seasons : list of int or None
         The seasons of the games. 2007-08 would be 2007. Should only be provided when start_from_scratch is False.
     start_from_scratch: bool
-        If True, will search through all files; if False, will look only at missing games in BASIC_GAMELOG.
-        False not yet implemented.
+        If True, will search through all files; if False, will look only at games missing from BASIC_GAMELOG.
+    workers : int
+        The number of processes to read games in. Each reads a chunk of a season's games against its own reference
+        store, and the updates are merged here in game order, so the result is the same as with one worker.
     """
 
-    import os.path
-    import zlib
-    import json
-    import pandas as pd
     import time
     import datetime
 
@@ -282,59 +576,103 @@ def rewrite_globals(start_from_scratch = True, seasons = None):
     elif isinstance(seasons, int):
         seasons = [seasons]
 
+    store = reference_store.get_reference_store()
     if start_from_scratch:
-        import os
-        try:
-            os.remove(scrapenhl_globals.PLAYER_ID_FILE)
-        except FileNotFoundError:
-            pass
-        try:
-            os.remove(scrapenhl_globals.TEAM_ID_FILE)
-        except FileNotFoundError:
-            pass
-        try:
-            os.remove(scrapenhl_globals.BASIC_GAMELOG_FILE)
-        except FileNotFoundError:
-            pass
+        store.clear()
 
     for season in seasons:
 
         starttime = time.time()
 
-        games = read_completed_games_from_url(season)
+        games = list_scraped_games(season)
+        if not start_from_scratch:
+            games = [g for g in games if store.get_game(season, g) is None]
+
+        if workers > 1:
+            import concurrent.futures
+            chunks = [games[i::workers] for i in range(workers)]
+            chunks = [sorted(chunk) for chunk in chunks if len(chunk) > 0]
+            with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+                deltas = list(executor.map(_read_reference_data_worker, [season] * len(chunks), chunks,
+                                           [store.spawn() for chunk in chunks]))
+            ### Apply game by game, in order, so the tables come out as they would serially
+            for game in games:
+                for delta in deltas:
+                    if game in delta:
+                        store.apply_delta(delta[game])
+        else:
+            marker = 20
+            marker_i = [len(games) // marker * i for i in range(marker)]
+            if len(games) > 0:
+                marker_i[-1] = len(games) - 1
+            marker_i_set = set(marker_i)
+
+            for i in range(len(games)):
+                game = games[i]
+                _read_reference_data(season, game, store)
+                if i in marker_i_set:
+                    print('Done through', season, game, ' ~ ', round((marker_i.index(i)) * 100 / marker), '% in ',
+                          str(datetime.timedelta(seconds = time.time() - starttime)))
+
+        print('Done with', season, 'in', str(datetime.timedelta(seconds = time.time() - starttime)))
+
+    store.flush()
+
+def _read_reference_data(season, game, store):
+    """
+    Reads one saved game file and applies its team, player, and game log updates to the store.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    store : reference_store.ReferenceStore
+        The reference tables to update
+    """
+    import os.path
+    import json
+    if scrape_game.raw_page_exists(season, game, 'pbp'):
+        page = scrape_game.read_game_page(season, game, 'pbp')
+        try:
+            data = scrape_game.decode_json(page, scrape_game.GAME_SUBTREES[:2])
+
+            teamdata = data['liveData']['boxscore']['teams']
+
+            scrape_game.update_team_ids_from_json(teamdata, store, data['gameData']['teams'])
+            scrape_game.update_player_ids_from_json(teamdata, store)
+            scrape_game.update_quick_gamelog_from_json(data, store)
+        except json.JSONDecodeError:
+            pass
+
+def _read_reference_data_worker(season, games, store):
+    """
+    Reads a chunk of saved game files in a worker process.
 
-        marker = 20
-        games = sorted(list(games))
-        marker_i = [len(games) // marker * i for i in range(marker)]
-        marker_i[-1] = len(games) - 1
-        marker_i_set = set(marker_i)
-
-        for i in range(len(games)):
-            game = games[i]
-            #print(season, game)
-            filename = scrape_game.get_parsed_save_filename(season, game)
-            if os.path.exists(scrape_game.get_json_save_filename(season, game)):
-                r = open(scrape_game.get_json_save_filename(season, game), 'rb')
-                page = r.read()
-                r.close()
-
-                page = zlib.decompress(page)
-                try:
-                    data = json.loads(page.decode('latin-1'))
-
-                    teamdata = data['liveData']['boxscore']['teams']
-
-                    scrape_game.update_team_ids_from_json(teamdata)
-                    scrape_game.update_player_ids_from_json(teamdata)
-                    scrape_game.update_quick_gamelog_from_json(data)
-                except json.JSONDecodeError:
-                    pass
-
-            if i in marker_i_set:
-                print('Done through', season, game, ' ~ ', round((marker_i.index(i)) * 100 / marker), '% in ',
-                      str(datetime.timedelta(seconds = time.time() - starttime)))
-
-        print('Done with', season)
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : list of int
+        The game ids, in order
+    store : reference_store.ReferenceStore
+        A store from ReferenceStore.spawn
+
+    Returns
+    --------
+    dict
+        Game id to that game's updates (see ReferenceStore.get_delta)
+    """
+    deltas = {}
+    for game in games:
+        ### A fresh store per game keeps each game's delta separate, while new teams carry over
+        gamestore = store.spawn()
+        _read_reference_data(season, game, gamestore)
+        deltas[game] = gamestore.get_delta()
+        for tid, (abbreviation, name) in deltas[game]['teams'].items():
+            store.add_team(tid, abbreviation, name)
+    return deltas
 
 if __name__ == "__main__":
     for season in range(2015, 2017):
@@ -1,23 +1,109 @@
 """
 File and folder paths, and other variables needed by all modules in this package.
+
+SAVE_FOLDER, MAX_SEASON, and the reference file paths (PLAYER_ID_FILE, TEAM_ID_FILE, BASIC_GAMELOG_FILE, and
+PLAYER_NAMES_FILE) are resolved by a Config object the first time one of them is used (see get_config), so importing
+this module does no filesystem work and does not import pandas or feather. Assigning to them, e.g.
+scrapenhl_globals.SAVE_FOLDER = '...', still overrides them; the reference file paths follow SAVE_FOLDER unless they
+are assigned too.
 """
 
-import os
 import os.path
 
-SAVE_FOLDER = os.path.join(os.getcwd(), "data")
-PLAYER_ID_FILE = os.path.join(SAVE_FOLDER, 'reference', 'playerids.feather')
-TEAM_ID_FILE = os.path.join(SAVE_FOLDER, 'reference', 'teamids.feather')
-BASIC_GAMELOG_FILE = os.path.join(SAVE_FOLDER, 'reference', 'quickgamelog.feather')
-PLAYER_NAMES_FILE = os.path.join(SAVE_FOLDER, 'reference', 'playerids_names.feather')
-
-import datetime
-MAX_SEASON = datetime.datetime.now().year - 1
-if datetime.datetime.now().month >= 9:
-    MAX_SEASON += 1
-import feather
-import pandas as pd
-import os.path
+### If True, parsed games are also written to the partitioned Parquet dataset (see dataset.py)
+WRITE_DATASET = False
+### Codec for new raw pages: 'zstd', 'zlib', or None to use zstd if the zstandard package is installed (see rawcodec.py)
+RAW_CODEC = None
+### If True, new raw pages are appended to one packed archive per season instead of saved as .zlib files (see
+### rawarchive.py). Pages are read from either place regardless.
+USE_RAW_ARCHIVE = False
+### The most memory, in bytes, that cached team logs can use (see logcache.py)
+TEAMLOG_CACHE_BYTES = 512 * 2 ** 20
+### If True, team logs evicted from the cache are spilled to SAVE_FOLDER/cache/teamlogs, up to this many bytes
+TEAMLOG_CACHE_SPILL = False
+TEAMLOG_CACHE_SPILL_BYTES = 4 * 2 ** 30
+
+### Reference file names in SAVE_FOLDER/reference
+_REFERENCE_FILES = {'PLAYER_ID_FILE': 'playerids.feather', 'TEAM_ID_FILE': 'teamids.feather',
+                    'BASIC_GAMELOG_FILE': 'quickgamelog.feather', 'PLAYER_NAMES_FILE': 'playerids_names.feather'}
+
+class Config(object):
+    """
+    The package's settings that depend on the environment, resolved once.
+
+    Parameters
+    -----------
+    save_folder : str or None
+        The folder data is saved in. None uses the SCRAPENHL_SAVE_FOLDER environment variable if it is set, otherwise
+        data in the working directory.
+    max_season : int or None
+        The latest season. None uses the current season: this year from September on, otherwise last year.
+    """
+
+    def __init__(self, save_folder = None, max_season = None):
+        import os
+        import datetime
+        if save_folder is None:
+            save_folder = os.environ.get('SCRAPENHL_SAVE_FOLDER') or os.path.join(os.getcwd(), 'data')
+        if max_season is None:
+            now = datetime.datetime.now()
+            max_season = now.year if now.month >= 9 else now.year - 1
+        self.save_folder = save_folder
+        self.max_season = max_season
+
+_CONFIG = None
+
+def get_config():
+    """
+    Returns the package's Config, resolving it on first use.
+    """
+    global _CONFIG
+    if _CONFIG is None:
+        _CONFIG = Config()
+    return _CONFIG
+
+def configure(save_folder = None, max_season = None):
+    """
+    Replaces the package's Config, e.g. at the start of a script, and drops any values assigned directly to
+    SAVE_FOLDER, MAX_SEASON, or the reference file paths so they follow the new Config.
+
+    Parameters
+    -----------
+    save_folder : str or None
+        See Config
+    max_season : int or None
+        See Config
+
+    Returns
+    --------
+    Config
+        The new Config
+    """
+    global _CONFIG
+    _CONFIG = Config(save_folder, max_season)
+    for name in ['SAVE_FOLDER', 'MAX_SEASON'] + list(_REFERENCE_FILES):
+        globals().pop(name, None)
+    return _CONFIG
+
+def __getattr__(name):
+    """
+    Resolves SAVE_FOLDER, MAX_SEASON, and the reference file paths from the Config when they have not been assigned.
+    """
+    if name == 'SAVE_FOLDER':
+        return get_config().save_folder
+    if name == 'MAX_SEASON':
+        return get_config().max_season
+    if name in _REFERENCE_FILES:
+        return os.path.join(_get('SAVE_FOLDER'), 'reference', _REFERENCE_FILES[name])
+    raise AttributeError('module {0:s} has no attribute {1:s}'.format(__name__, name))
+
+def _get(name):
+    """
+    Returns the current value of a setting from inside this module, where module __getattr__ does not apply.
+    """
+    if name in globals():
+        return globals()[name]
+    return __getattr__(name)
 
 def create_season_folder(season):
     """
@@ -29,7 +115,7 @@ def create_season_folder(season):
         The season of the game. 2007-08 would be 2007.
     """
     import os
-    folder = os.path.join(SAVE_FOLDER, str(season))
+    folder = os.path.join(_get('SAVE_FOLDER'), str(season))
     os.mkdir(folder)
 
 def get_season_folder(season):
@@ -46,7 +132,29 @@ def get_season_folder(season):
     str
         The folder path
     """
-    return os.path.join(SAVE_FOLDER, str(season))
+    return os.path.join(_get('SAVE_FOLDER'), str(season))
+
+def write_feather(df, filename):
+    """
+    Writes the dataframe to filename in feather format.
+
+    The file is written to a temporary file next to filename first and then moved into place, so an interrupted
+    write never leaves a truncated file behind.
+
+    Parameters
+    -----------
+    df : pandas df
+        The dataframe to write
+    filename : str
+        The destination file
+    """
+    import feather
+    folder = os.path.dirname(filename)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    tempfile = filename + '.tmp'
+    feather.write_dataframe(df, tempfile)
+    os.replace(tempfile, filename)
 
 def get_player_id_file():
     """
@@ -62,13 +170,15 @@ def get_player_id_file():
     Pandas df
         The player id dataframe
     """
-    if not os.path.exists(PLAYER_ID_FILE):
+    import feather
+    import pandas as pd
+    if not os.path.exists(_get('PLAYER_ID_FILE')):
         print('Creating blank player ID file for future use')
         df = pd.DataFrame({'ID': [], 'Name': [], 'Team': [], 'Pos': [], '#': [], 'Hand': [], 'Count': []})
         #write_player_id_file()
         return df
     else:
-        return feather.read_dataframe(PLAYER_ID_FILE)
+        return feather.read_dataframe(_get('PLAYER_ID_FILE'))
 
 def write_player_id_file(df):
     """
@@ -85,7 +195,7 @@ def write_player_id_file(df):
     df['Team'] = df['Team'].astype(str)
     df['Hand'] = df['Hand'].astype(str)
     df['Count'] = df['Count'].astype(int)
-    feather.write_dataframe(df, PLAYER_ID_FILE)
+    write_feather(df, _get('PLAYER_ID_FILE'))
 
 def get_team_id_file():
     """
@@ -100,13 +210,15 @@ def get_team_id_file():
     Pandas df
         The team id dataframe
     """
-    if not os.path.exists(TEAM_ID_FILE):
+    import feather
+    import pandas as pd
+    if not os.path.exists(_get('TEAM_ID_FILE')):
         print('Creating blank team ID file for future use')
         TEAM_IDS = pd.DataFrame({'ID': [], 'Name': [], 'Abbreviation': []})
         # write_player_id_file()
         return TEAM_IDS
     else:
-        return feather.read_dataframe(TEAM_ID_FILE)
+        return feather.read_dataframe(_get('TEAM_ID_FILE'))
 
 def write_team_id_file(df):
     """
@@ -115,7 +227,7 @@ def write_team_id_file(df):
     This file maps team IDs to names and abbreviations.
     """
     df.sort_values(by="ID", inplace=True)
-    feather.write_dataframe(df, TEAM_ID_FILE)
+    write_feather(df, _get('TEAM_ID_FILE'))
 
 def get_quick_gamelog_file():
     """
@@ -129,14 +241,16 @@ def get_quick_gamelog_file():
     Pandas df
         The game log dataframe
     """
-    if not os.path.exists(BASIC_GAMELOG_FILE):
+    import feather
+    import pandas as pd
+    if not os.path.exists(_get('BASIC_GAMELOG_FILE')):
         print('Creating blank game log file for future use')
         df = pd.DataFrame({'Season': [], 'Game': [], 'Datetime': [], 'Venue': [],
                            'Home': [], 'HomeCoach': [], 'HomeScore': [],
                            'Away': [], 'AwayCoach': [], 'AwayScore': []})
         return df
     else:
-        return feather.read_dataframe(BASIC_GAMELOG_FILE)
+        return feather.read_dataframe(_get('BASIC_GAMELOG_FILE'))
 
 def write_quick_gamelog_file(df):
     """
@@ -144,25 +258,28 @@ def write_quick_gamelog_file(df):
     """
     df.sort_values(by = ['Season', 'Game'], inplace = True)
     df = df.drop_duplicates()
-    feather.write_dataframe(df, BASIC_GAMELOG_FILE)
+    write_feather(df, _get('BASIC_GAMELOG_FILE'))
 
 def write_preferred_player_names_file():
     """
     Uses player_ids file, assigns most common spelling of name to each ID
     """
+    import feather
     df = get_player_id_file()
     highn = df[['ID', 'Name', 'Count']].groupby(['ID', 'Name']).sum() \
         .reset_index() \
         .sort_values(by='Count', ascending=False) \
-        .groupby('ID').iloc[0].reset_index()
-    feather.write_dataframe(highn, PLAYER_NAMES_FILE)
+        .drop_duplicates('ID') \
+        .reset_index(drop=True)
+    feather.write_dataframe(highn, _get('PLAYER_NAMES_FILE'))
 
 def get_preferred_player_names():
+    import feather
     try:
-        return feather.read_dataframe(PLAYER_NAMES_FILE)
+        return feather.read_dataframe(_get('PLAYER_NAMES_FILE'))
     except Exception as e:
         write_preferred_player_names_file()
-        return feather.read_dataframe(PLAYER_NAMES_FILE)
+        return feather.read_dataframe(_get('PLAYER_NAMES_FILE'))
 
 def player_id_to_name(pid):
     """
@@ -178,9 +295,8 @@ def player_id_to_name(pid):
     pname: str
         The player name
     """
-    df = get_preferred_player_names()
-    df = df.query('ID == {0:.1f}'.format(float(pid)))
-    return df.Name.iloc[0]
+    import playernames
+    return playernames.get_player_name_index().get_name(pid)
 
 def player_name_to_id(pname, team_helper=None):
     """
@@ -189,6 +305,9 @@ def player_name_to_id(pname, team_helper=None):
     This method first looks for exact matches. If none are found, it looks for names containing given name.
     If there are still no matches, it prints a warning and takes the closest fuzzy match.
 
+    Lookups use an index that is built once and rebuilt when the player ID file changes; see playernames.py. To
+    resolve many names at once, use playernames.player_names_to_ids.
+
     Parameters
     -----------
     pname : str
@@ -201,58 +320,21 @@ def player_name_to_id(pname, team_helper=None):
     id: int
         The ID number of the player
     """
-    df = get_player_id_file()
-    df = df[['Name', 'ID', 'Team', 'Count']].groupby(['Name', 'ID', 'Team']).sum() \
-        .reset_index().sort_values('Count', ascending=False)
-
-    if team_helper is not None:
-        if isinstance(team_helper, str):
-            team_helper = {team_helper}
-
-    ### Exact match
-    exact = df[df.Name == pname]
-    if len(exact.ID.unique()) == 1:
-        return exact.ID.iloc[0]
-    elif len(exact.ID.unique()) > 1:
-        if team_helper is None:
+    import playernames
+    result = playernames.get_player_name_index().find(pname, team_helper)
+    if result is not None:
+        rows, ambiguous = result
+        if ambiguous:
+            import pandas as pd
             print('Found multiple matches for', pname)
-            print(exact)
-            print('Selecting', exact.iloc[0, :])
-            return exact.ID.iloc[0]
-        else:
-            exact_team = exact[exact.Team.isin(team_helper)]
-            if len(exact_team) == 1:
-                return exact_team.ID.iloc[0]
-            elif len(exact_team) > 1:
-                print('Found multiple matches for', pname)
-                print(exact_team)
-                print('Selecting', exact_team.iloc[0,:])
-                return exact_team.ID.iloc[0]
-
-    ### Contains match
-    contains = df[df.Name.str.contains(pname)]
-    if len(contains.ID.unique()) == 1:
-        return contains.ID.iloc[0]
-    elif len(contains.ID.unique()) > 1:
-        if team_helper is None:
-            print('Found multiple matches for', pname)
-            print(contains)
-            print('Selecting', contains.iloc[0, :])
-            return contains.ID.iloc[0]
-        else:
-            contains_team = contains[contains.Team.isin(team_helper)]
-            if len(contains_team) == 1:
-                return contains_team.ID.iloc[0]
-            elif len(contains_team) > 1:
-                print('Found multiple matches for', pname)
-                print(contains_team)
-                print('Selecting', contains_team.iloc[0,:])
-                return contains_team['ID'].iloc[0]
+            print(pd.DataFrame(rows, columns=['ID', 'Team', 'Count']))
+            print('Selecting', rows[0])
+        return rows[0][0]
 
     ### Fuzzy match
-    ### TODO using fuzzywuzzy
-    print('Match not found. Fuzzy matching to be implemented later')
-    return None
-
-
-
+    candidates = playernames.get_player_name_index().fuzzy_match(pname, team_helper)
+    if len(candidates) == 0:
+        print('Match not found for', pname)
+        return None
+    print('No exact match for', pname, '- using closest fuzzy match:', candidates[0][1])
+    return candidates[0][0]
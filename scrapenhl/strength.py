@@ -0,0 +1,172 @@
+"""
+Skater counts, goalie flags, and strength codes (e.g. 5v5, 5v4, 4v5) for each second of the toi table and each pbp
+event, computed at parse time with numpy over the whole game.
+
+In the game files, everything is from the home team's perspective: HomeSkaters, RoadSkaters, HomeGoalie, RoadGoalie,
+and Strength = [home skaters]v[road skaters]. An empty net shows up as a False goalie flag (and usually an extra
+skater). Team logs flip these to the team's perspective (see to_team_perspective).
+"""
+
+STRENGTH_COLUMNS = ['HomeSkaters', 'RoadSkaters', 'HomeGoalie', 'RoadGoalie', 'Strength']
+TEAM_STRENGTH_COLUMNS = ['TeamSkaters', 'OppSkaters', 'TeamGoalie', 'OppGoalie', 'Strength']
+
+def _get_player_columns(toi, team):
+    """
+    Returns the player ID columns for this team in a toi table, e.g. WSH1-WSH6.
+    """
+    return [col for col in toi.columns if col[:len(team)] == team and col[len(team):].isdigit()]
+
+def _count_players(toi, team, goalies):
+    """
+    Returns the number of skaters on ice and whether a goalie is on ice for each second, for one team.
+    """
+    import numpy as np
+    cols = _get_player_columns(toi, team)
+    if len(cols) == 0:
+        return np.zeros(len(toi), dtype = np.int8), np.zeros(len(toi), dtype = bool)
+    players = toi[cols].values.astype(np.float64)
+    onice = ~np.isnan(players)
+    isgoalie = onice & np.isin(np.nan_to_num(players, nan = 0).astype(np.int64),
+                               np.array(sorted(goalies), dtype = np.int64))
+    skaters = (onice & ~isgoalie).sum(axis = 1).astype(np.int8)
+    return skaters, isgoalie.any(axis = 1)
+
+def get_strength_codes(skaters, oppskaters):
+    """
+    Returns strength codes like 5v4 from two arrays of skater counts.
+
+    Parameters
+    -----------
+    skaters : array of int
+        Skater counts for the first team
+    oppskaters : array of int
+        Skater counts for the second team
+
+    Returns
+    --------
+    np.array of str
+        [skaters]v[oppskaters], or an empty string where either count is negative (unknown)
+    """
+    import numpy as np
+    skaters = np.asarray(skaters, dtype = np.int64)
+    oppskaters = np.asarray(oppskaters, dtype = np.int64)
+    codes = np.char.add(np.char.add(skaters.astype(str), 'v'), oppskaters.astype(str)).astype(object)
+    codes[(skaters < 0) | (oppskaters < 0)] = ''
+    return codes
+
+def add_strength_to_toi(toi, homename, roadname, goalies):
+    """
+    Adds skater counts, goalie flags, and a strength code to each second of a game's toi table.
+
+    Parameters
+    -----------
+    toi : pandas df
+        The result of scrape_game.read_shifts_from_json
+    homename : str
+        The home team abbreviation
+    roadname : str
+        The road team abbreviation
+    goalies : set of int
+        Goalie player IDs, e.g. from onice.get_goalie_ids
+
+    Returns
+    --------
+    pandas df
+        toi with the columns in STRENGTH_COLUMNS added
+    """
+    homeskaters, homegoalie = _count_players(toi, homename, goalies)
+    roadskaters, roadgoalie = _count_players(toi, roadname, goalies)
+    return toi.assign(HomeSkaters = homeskaters, RoadSkaters = roadskaters, HomeGoalie = homegoalie,
+                      RoadGoalie = roadgoalie, Strength = get_strength_codes(homeskaters, roadskaters))
+
+def add_strength_to_pbp(events, toi, homename = None, roadname = None, goalies = None):
+    """
+    Adds the state of the game at each event's second to a game's pbp, by indexing into the toi table.
+
+    Parameters
+    -----------
+    events : pandas df
+        The result of scrape_game.read_events_from_json
+    toi : pandas df or None
+        The game's toi table, with or without strength columns. If None, or if an event is past the end of the toi,
+        the skater counts are -1, the goalie flags False, and the strength code empty.
+    homename : str or None
+        The home team abbreviation. Only needed if toi does not have strength columns yet.
+    roadname : str or None
+        The road team abbreviation. Only needed if toi does not have strength columns yet.
+    goalies : set of int, or None
+        Goalie player IDs. Only needed if toi does not have strength columns yet.
+
+    Returns
+    --------
+    pandas df
+        events with the columns in STRENGTH_COLUMNS added
+    """
+    import numpy as np
+    n = len(events)
+    homeskaters = np.full(n, -1, dtype = np.int8)
+    roadskaters = np.full(n, -1, dtype = np.int8)
+    homegoalie = np.zeros(n, dtype = bool)
+    roadgoalie = np.zeros(n, dtype = bool)
+
+    if toi is not None and 'Strength' not in toi.columns and homename is not None:
+        toi = add_strength_to_toi(toi, homename, roadname, goalies)
+    if toi is not None and 'Strength' in toi.columns and len(toi) > 0:
+        ### Toi rows are one per second from 0, so the event's second is its row
+        times = events.Seconds.values.astype(np.int64)
+        valid = (times >= 0) & (times < len(toi))
+        homeskaters[valid] = toi.HomeSkaters.values[times[valid]]
+        roadskaters[valid] = toi.RoadSkaters.values[times[valid]]
+        homegoalie[valid] = toi.HomeGoalie.values[times[valid]]
+        roadgoalie[valid] = toi.RoadGoalie.values[times[valid]]
+
+    return events.assign(HomeSkaters = homeskaters, RoadSkaters = roadskaters, HomeGoalie = homegoalie,
+                         RoadGoalie = roadgoalie, Strength = get_strength_codes(homeskaters, roadskaters))
+
+def to_team_perspective(df, home):
+    """
+    Replaces the home/road strength columns with team/opponent ones, for a team log.
+
+    Parameters
+    -----------
+    df : pandas df
+        A game's pbp or toi with the columns in STRENGTH_COLUMNS
+    home : bool
+        True if the team is the home team in this game
+
+    Returns
+    --------
+    pandas df
+        df with the columns in TEAM_STRENGTH_COLUMNS instead, and Strength as [team]v[opponent] (categorical). df is
+        returned unchanged if it has no strength columns, e.g. if it was parsed before they were added.
+    """
+    if 'Strength' not in df.columns:
+        return df
+    team, opp = ('Home', 'Road') if home else ('Road', 'Home')
+    df = df.assign(TeamSkaters = df[team + 'Skaters'], OppSkaters = df[opp + 'Skaters'],
+                   TeamGoalie = df[team + 'Goalie'], OppGoalie = df[opp + 'Goalie'])
+    df = df.assign(Strength = get_strength_codes(df.TeamSkaters.values, df.OppSkaters.values))
+    df['Strength'] = df.Strength.astype('category')
+    return df.drop(columns = STRENGTH_COLUMNS[:4])
+
+def filter_strength(df, strengths):
+    """
+    Keeps only rows at the given strengths.
+
+    Parameters
+    -----------
+    df : pandas df
+        A pbp or toi table with a Strength column
+    strengths : str or iterable of str, or None
+        Strength codes like '5v5' or ['5v4', '4v5']. None keeps everything.
+
+    Returns
+    --------
+    pandas df
+        The matching rows
+    """
+    if strengths is None:
+        return df
+    if isinstance(strengths, str):
+        strengths = [strengths]
+    return df[df.Strength.isin(list(strengths))]
@@ -0,0 +1,431 @@
+"""
+A lazy query builder for team pbp and toi logs (see scrape_season.update_teamlogs).
+
+Filters and column selections are collected without reading anything, then pushed down to a pyarrow scan of the team
+log's per-game feather files when the query is run: game filters skip whole files, only the selected columns (plus
+those the filters need) are read, and row filters are evaluated on Arrow data instead of pandas rows. Older feather V1
+files are read into memory whole and filtered the same way. For example, one player's 5v5 shot attempts in a season:
+
+    teamquery.team_pbp(2016, 'WSH').strengths('5v5').events(corsi.CORSI_EVENTS).actors(8471214).to_df()
+
+Each filter returns a new query, so a partly-built query can be reused. Results come back as a pandas dataframe
+(to_df), a pyarrow table (to_arrow), or an iterator of dataframes (iter_chunks) to keep memory bounded.
+"""
+
+import os.path
+
+GAME_STRIDE = 100000
+
+def _tolist(x):
+    """
+    Turns None, a single value, or an iterable into None or a list.
+    """
+    if x is None:
+        return None
+    if isinstance(x, (str, int, float)):
+        return [x]
+    return list(x)
+
+def _to_player_ids(players):
+    """
+    Turns player IDs and/or names into a list of int IDs. Names that cannot be found are printed and skipped.
+    """
+    import playernames
+    ids = []
+    for player in _tolist(players):
+        if isinstance(player, str) and not player.isdigit():
+            pid = playernames.player_names_to_ids([player])[0]
+            if pid is None:
+                print('Could not find player', player)
+                continue
+            ids.append(int(pid))
+        else:
+            ids.append(int(player))
+    return ids
+
+def _is_arrow_file(filename):
+    """
+    Returns True if the file is an Arrow IPC file (feather V2), False if it is a feather V1 file.
+    """
+    with open(filename, 'rb') as reader:
+        return reader.read(6) == b'ARROW1'
+
+def _conform(table, schema):
+    """
+    Returns the table with the schema's columns in order: columns it lacks are null, and the rest are cast.
+    """
+    import pyarrow as pa
+    arrays = [table.column(field.name).cast(field.type) if field.name in table.column_names
+              else pa.nulls(table.num_rows, field.type) for field in schema]
+    return pa.Table.from_arrays(arrays, schema = schema)
+
+class TeamLogQuery(object):
+    """
+    A query over one team's pbp or toi log for one season. Build one with team_pbp or team_toi.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The team abbreviation
+    kind : str
+        'pbp' or 'toi'
+    """
+
+    def __init__(self, season, team, kind):
+        self.season = season
+        self.team = team
+        self.kind = kind
+        self._games = None
+        self._filters = []
+        self._on_ice = []
+        self._columns = None
+
+    def _copy(self):
+        """
+        Returns a copy of this query to add to.
+        """
+        import copy
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        query._on_ice = list(self._on_ice)
+        return query
+
+    def _add_filter(self, column, values):
+        """
+        Returns a copy of this query that only keeps rows where column is one of values. None values add no filter.
+        """
+        query = self._copy()
+        values = _tolist(values)
+        if values is not None:
+            query._filters.append((column, values))
+        return query
+
+    def games(self, games):
+        """
+        Only read these games (ids). Other games' files are not opened. Calling this again narrows to both lists.
+        """
+        query = self._copy()
+        games = _tolist(games)
+        if games is not None:
+            games = {int(g) for g in games}
+            query._games = games if self._games is None else self._games & games
+        return query
+
+    def strengths(self, strengths):
+        """
+        Only keep rows at these strengths, from this team's perspective, e.g. '5v5' or ['5v4', '5v3'].
+        """
+        return self._add_filter('Strength', strengths)
+
+    def events(self, events):
+        """
+        Only keep these event types, e.g. ['Shot', 'Missed Shot', 'Blocked Shot', 'Goal']. pbp only.
+        """
+        self._check_kind('pbp', 'events')
+        return self._add_filter('Event', events)
+
+    def actors(self, players):
+        """
+        Only keep events where the actor is one of these players (IDs or names). pbp only.
+        """
+        self._check_kind('pbp', 'actors')
+        return self._add_filter('Actor', None if players is None else _to_player_ids(players))
+
+    def recipients(self, players):
+        """
+        Only keep events where the recipient is one of these players (IDs or names). pbp only.
+        """
+        self._check_kind('pbp', 'recipients')
+        return self._add_filter('Recipient', None if players is None else _to_player_ids(players))
+
+    def on_ice(self, players):
+        """
+        Only keep rows where at least one of these players (IDs or names, for either team) is on the ice. Chain calls
+        to require several players, e.g. .on_ice(a).on_ice(b) for seconds with both a and b on.
+
+        For pbp, a player is on ice for an event if they are in the toi log at the event's second.
+        """
+        query = self._copy()
+        if players is not None:
+            query._on_ice.append(_to_player_ids(players))
+        return query
+
+    def columns(self, columns):
+        """
+        Only read these columns. Filters can still use other columns.
+        """
+        query = self._copy()
+        query._columns = _tolist(columns)
+        return query
+
+    def _check_kind(self, kind, method):
+        """
+        Raises ValueError if this query is not over a log of this kind.
+        """
+        if self.kind != kind:
+            raise ValueError('{0:s} can only be used on {1:s} logs'.format(method, kind))
+
+    def get_files(self):
+        """
+        Returns the team log files the query reads: one per game (after game filters), or the single file of a log
+        that has not been partitioned by game yet.
+        """
+        return self._get_files()[0]
+
+    def _get_files(self):
+        """
+        Returns the files the query reads, and True if they are a single unpartitioned log (so game filters have to be
+        applied to rows rather than by skipping files).
+        """
+        import scrape_season
+        if self.kind == 'pbp':
+            folder = scrape_season.get_team_pbplog_folder(self.season, self.team)
+            filename = scrape_season.get_team_pbplog_filename(self.season, self.team)
+        else:
+            folder = scrape_season.get_team_toilog_folder(self.season, self.team)
+            filename = scrape_season.get_team_toilog_filename(self.season, self.team)
+        games = scrape_season._get_teamlog_games(folder)
+        if len(games) == 0:
+            return ([filename] if os.path.exists(filename) else []), True
+        return [games[game] for game in sorted(games) if self._games is None or game in self._games], False
+
+    def _get_dataset(self, files):
+        """
+        Returns a pyarrow dataset over the files, with their schemas unified (toi logs have a varying number of player
+        columns from game to game).
+
+        Feather V2 files are Arrow IPC files and are scanned from disk. Older feather V1 files (e.g. logs written
+        before the package moved to pyarrow) cannot be scanned that way, so they are read whole into memory and
+        conformed to the unified schema.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.feather
+
+        arrowfiles = [f for f in files if _is_arrow_file(f)]
+        tables = [pyarrow.feather.read_table(f) for f in files if not _is_arrow_file(f)]
+        schemas = [pa.ipc.open_file(f).schema for f in arrowfiles] + [table.schema for table in tables]
+        try:
+            schema = pa.unify_schemas(schemas, promote_options = 'permissive')
+        except TypeError:
+            schema = pa.unify_schemas(schemas)
+        datasets = []
+        if len(arrowfiles) > 0:
+            datasets.append(ds.dataset(arrowfiles, format = 'feather', schema = schema))
+        if len(tables) > 0:
+            datasets.append(ds.InMemoryDataset([_conform(table, schema) for table in tables], schema = schema))
+        if len(datasets) == 1:
+            return datasets[0]
+        return ds.dataset(datasets, schema = schema)
+
+    def get_schema(self):
+        """
+        Returns the unified pyarrow schema of the files the query reads, or None if there are none.
+        """
+        files = self.get_files()
+        if len(files) == 0:
+            return None
+        return self._get_dataset(files).schema
+
+    def get_player_columns(self, side = 'both'):
+        """
+        Returns the toi log's player ID columns across the games the query reads.
+
+        Parameters
+        -----------
+        side : str
+            'team' for this team's columns (e.g. WSH1...), 'opp' for the opponent's (Opp1...), or 'both'
+
+        Returns
+        --------
+        list of str
+            The column names
+        """
+        schema = self.get_schema()
+        if schema is None:
+            return []
+        columns = self._get_player_columns(schema)
+        if side == 'team':
+            return [col for col in columns if col[:len(self.team)] == self.team]
+        if side == 'opp':
+            return [col for col in columns if col[:3] == 'Opp']
+        return columns
+
+    def _get_player_columns(self, schema):
+        """
+        Returns the toi log's player ID columns, e.g. WSH1... and Opp1...
+        """
+        return [name for name in schema.names for prefix in (self.team, 'Opp')
+                if name[:len(prefix)] == prefix and name[len(prefix):].isdigit()]
+
+    def _get_filter(self, dataset, unpartitioned = False):
+        """
+        Returns the pyarrow filter expression for this query, or None. For pbp, on-ice filters are applied separately
+        (see _get_on_ice_keys).
+        """
+        import pyarrow.dataset as ds
+        ### A column none of the files have (e.g. Strength in logs written before it was added) matches nothing
+        conditions = [ds.field(column).isin(values) if column in dataset.schema.names else ds.scalar(False)
+                      for column, values in self._filters]
+        if self._games is not None and unpartitioned:
+            conditions.append(ds.field('Game').isin(sorted(self._games)))
+        if self.kind == 'toi':
+            playercols = self._get_player_columns(dataset.schema)
+            for players in self._on_ice:
+                players = [float(p) for p in players]
+                condition = None
+                for col in playercols:
+                    condition = ds.field(col).isin(players) if condition is None else \
+                        condition | ds.field(col).isin(players)
+                conditions.append(ds.scalar(False) if condition is None else condition)
+        result = None
+        for condition in conditions:
+            result = condition if result is None else result & condition
+        return result
+
+    def _get_on_ice_keys(self):
+        """
+        For a pbp query with on-ice filters, returns the sorted Game * GAME_STRIDE + second keys at which the required
+        players are on ice, from the toi log. Returns None if there are no on-ice filters.
+        """
+        import numpy as np
+        if self.kind != 'pbp' or len(self._on_ice) == 0:
+            return None
+        toi = TeamLogQuery(self.season, self.team, 'toi')
+        toi._games = self._games
+        toi._on_ice = self._on_ice
+        table = toi.columns(['Game', 'Time']).to_arrow()
+        return np.unique(table.column('Game').to_numpy().astype(np.int64) * GAME_STRIDE +
+                         table.column('Time').to_numpy().astype(np.int64))
+
+    def _scan(self, batch_size = None):
+        """
+        Yields the query's results as pyarrow record batches (one batch if batch_size is None).
+        """
+        import numpy as np
+        import pyarrow as pa
+
+        files, unpartitioned = self._get_files()
+        if len(files) == 0:
+            return
+        dataset = self._get_dataset(files)
+        keys = self._get_on_ice_keys()
+        columns = self._columns
+        if keys is not None and columns is not None:
+            columns = columns + [col for col in ('Game', 'Seconds') if col not in columns]
+        condition = self._get_filter(dataset, unpartitioned)
+
+        if batch_size is None:
+            batches = dataset.to_table(columns = columns, filter = condition).to_batches()
+            batches = [pa.concat_batches(batches)] if len(batches) > 0 else []
+        else:
+            batches = dataset.to_batches(columns = columns, filter = condition, batch_size = batch_size)
+        for batch in batches:
+            if keys is not None:
+                eventkeys = batch.column('Game').to_numpy().astype(np.int64) * GAME_STRIDE + \
+                            batch.column('Seconds').to_numpy().astype(np.int64)
+                batch = batch.filter(pa.array(np.isin(eventkeys, keys)))
+                if self._columns is not None:
+                    batch = batch.select(self._columns)
+            if batch.num_rows > 0:
+                yield batch
+
+    def to_arrow(self):
+        """
+        Runs the query and returns a pyarrow table, or None if the team has no log for this season.
+        """
+        import pyarrow as pa
+        batches = list(self._scan())
+        if len(batches) == 0:
+            files = self.get_files()
+            if len(files) == 0:
+                return None
+            schema = self._get_dataset(files).schema
+            if self._columns is not None:
+                schema = pa.schema([schema.field(col) for col in self._columns])
+            return schema.empty_table()
+        return pa.Table.from_batches(batches)
+
+    def to_df(self):
+        """
+        Runs the query and returns a pandas dataframe, or None if the team has no log for this season.
+        """
+        table = self.to_arrow()
+        if table is None:
+            return None
+        return table.to_pandas()
+
+    def iter_chunks(self, batch_size = 65536):
+        """
+        Runs the query and yields the results as pandas dataframes of at most batch_size rows, so only one chunk is in
+        memory at a time.
+        """
+        for batch in self._scan(batch_size):
+            yield batch.to_pandas()
+
+def team_pbp(season, team):
+    """
+    Returns a query over this team's pbp log for this season. See TeamLogQuery.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The team abbreviation
+
+    Returns
+    --------
+    TeamLogQuery
+        The query, with no filters yet
+    """
+    return TeamLogQuery(season, team, 'pbp')
+
+def team_toi(season, team):
+    """
+    Returns a query over this team's toi log for this season. See TeamLogQuery.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The team abbreviation
+
+    Returns
+    --------
+    TeamLogQuery
+        The query, with no filters yet
+    """
+    return TeamLogQuery(season, team, 'toi')
+
+def run(query, return_type = 'df', batch_size = 65536):
+    """
+    Runs the query and returns the results in the given format.
+
+    Parameters
+    -----------
+    query : TeamLogQuery
+        The query to run
+    return_type : str
+        'df' for a pandas dataframe, 'arrow' for a pyarrow table, 'chunks' for an iterator of dataframes, or 'rows'
+        for an iterator of row namedtuples (read chunk by chunk with itertuples)
+    batch_size : int
+        The most rows per chunk for 'chunks' and 'rows'
+
+    Returns
+    --------
+    pandas df, pyarrow table, or iterator
+        The results
+    """
+    if return_type == 'arrow':
+        return query.to_arrow()
+    if return_type == 'chunks':
+        return query.iter_chunks(batch_size)
+    if return_type == 'rows':
+        return (row for chunk in query.iter_chunks(batch_size) for row in chunk.itertuples(index = False))
+    if return_type != 'df':
+        print('Invalid return type specification; use "df", "arrow", "chunks", or "rows"')
+    return query.to_df()
@@ -0,0 +1,319 @@
+"""
+A memory-mapped, uncompressed store for the second-by-second toi tables from scrape_game.read_shifts_from_json.
+
+Each season has two files in its season folder:
+
+- toi_matrix.int32: the rows of every game back to back, as a flat int32 array with 13 columns per row: Time, then
+  six home player IDs, then six road player IDs. 0 means no player.
+- toi_index.npy: a structured array with one entry per game: game id, row offset, row count, and home and road
+  abbreviations.
+
+Both are opened with np.memmap / np.load(mmap_mode='r'), so reading a game or a time range within it is a slice of
+the mapped file: no decompression and no copy.
+"""
+
+import scrapenhl_globals
+import os.path
+
+NUM_COLUMNS = 13
+INDEX_DTYPE = [('Game', 'i4'), ('Offset', 'i8'), ('Rows', 'i4'), ('Home', 'U3'), ('Away', 'U3')]
+
+def get_matrix_filename(season):
+    """
+    Returns the file holding the season's toi rows. See the module docstring.
+    """
+    return os.path.join(scrapenhl_globals.get_season_folder(season), 'toi_matrix.int32')
+
+def get_index_filename(season):
+    """
+    Returns the file holding the season's game index. See the module docstring.
+    """
+    return os.path.join(scrapenhl_globals.get_season_folder(season), 'toi_index.npy')
+
+def read_index(season):
+    """
+    Returns the season's game index, memory-mapped.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+
+    Returns
+    --------
+    np.array
+        Structured array with fields Game, Offset, Rows, Home, and Away. Empty if nothing has been written.
+    """
+    import numpy as np
+    if not os.path.exists(get_index_filename(season)):
+        return np.zeros(0, dtype = INDEX_DTYPE)
+    return np.load(get_index_filename(season), mmap_mode = 'r')
+
+def read_matrix(season):
+    """
+    Returns all of the season's toi rows, memory-mapped, with shape (rows, 13).
+    """
+    import numpy as np
+    filename = get_matrix_filename(season)
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return np.zeros((0, NUM_COLUMNS), dtype = np.int32)
+    return np.memmap(filename, dtype = np.int32, mode = 'r').reshape(-1, NUM_COLUMNS)
+
+def _find_game(index, game):
+    """
+    Returns the position of the game in the index, or None. Later entries win if a game was written twice.
+    """
+    import numpy as np
+    matches = np.nonzero(index['Game'] == game)[0]
+    if len(matches) == 0:
+        return None
+    return matches[-1]
+
+def to_matrix(df, home, road):
+    """
+    Converts a toi dataframe from scrape_game.read_shifts_from_json into the 13-column int32 layout.
+
+    Parameters
+    -----------
+    df : pandas df
+        Toi table with a Time column and player ID columns named by team, e.g. WSH1
+    home : str
+        The home team abbreviation
+    road : str
+        The road team abbreviation
+
+    Returns
+    --------
+    np.array
+        int32 array of shape (len(df), 13)
+    """
+    import numpy as np
+    matrix = np.zeros((len(df), NUM_COLUMNS), dtype = np.int32)
+    matrix[:, 0] = df.Time.values
+    for start, team in ((1, home), (7, road)):
+        cols = [col for col in df.columns if col[:len(team)] == team and col[len(team):].isdigit()][:6]
+        for i, col in enumerate(cols):
+            matrix[:, start + i] = np.nan_to_num(df[col].values.astype(np.float64), nan = 0).astype(np.int32)
+    return matrix
+
+def write_games(season, games):
+    """
+    Appends games to the season's toi matrix and rewrites the (small) index.
+
+    Games already in the matrix are appended again and the index points to the new rows; use compact() to reclaim the
+    old ones.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : iterable of (int, np.array, str, str)
+        Game id, matrix from to_matrix, home abbreviation, and road abbreviation
+    """
+    import os
+    import numpy as np
+
+    index = [tuple(entry) for entry in read_index(season)]
+    offset = len(read_matrix(season))
+    with open(get_matrix_filename(season), 'ab') as writer:
+        for game, matrix, home, road in games:
+            writer.write(np.ascontiguousarray(matrix, dtype = np.int32).tobytes())
+            index = [entry for entry in index if entry[0] != game]
+            index.append((game, offset, len(matrix), home, road))
+            offset += len(matrix)
+
+    index = np.array(index, dtype = INDEX_DTYPE)
+    index.sort(order = 'Game')
+    tempfile = get_index_filename(season) + '.tmp.npy'
+    np.save(tempfile, index)
+    os.replace(tempfile, get_index_filename(season))
+
+def update_toi_matrix(season, force_overwrite = False, games = None):
+    """
+    Adds parsed games (from their HDF5 toi files) that are not yet in the season's toi matrix.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    force_overwrite : bool
+        If True, re-adds every parsed game.
+    games : iterable of int, or None
+        Games to re-add even if they are already in the matrix, e.g. because they were reparsed
+    """
+    import pandas as pd
+    import scrape_game
+    import reference_store
+
+    done = set() if force_overwrite else {int(g) for g in read_index(season)['Game']}
+    if games is not None:
+        done -= {int(g) for g in games}
+    basic_gamelog = reference_store.get_reference_store().get_quick_gamelog_df()
+    basic_gamelog = basic_gamelog[basic_gamelog.Season == season]
+
+    newgames = []
+    for game, home, road in zip(basic_gamelog.Game, basic_gamelog.Home, basic_gamelog.Away):
+        if int(game) in done or not os.path.exists(scrape_game.get_parsed_shifts_save_filename(season, game)):
+            continue
+        df = pd.read_hdf(scrape_game.get_parsed_shifts_save_filename(season, game))
+        newgames.append((int(game), to_matrix(df, home, road), home, road))
+    if len(newgames) > 0:
+        write_games(season, newgames)
+
+def compact(season):
+    """
+    Rewrites the season's toi matrix without rows left behind by games that were written more than once.
+    """
+    import os
+    import numpy as np
+    index = read_index(season)
+    matrix = read_matrix(season)
+    games = [(int(entry['Game']), np.array(matrix[entry['Offset']:entry['Offset'] + entry['Rows']]),
+              str(entry['Home']), str(entry['Away'])) for entry in index]
+    del matrix
+    os.remove(get_matrix_filename(season))
+    os.remove(get_index_filename(season))
+    write_games(season, games)
+
+def read_game(season, game, start = None, end = None):
+    """
+    Returns the toi rows for one game, optionally limited to a time range, as a view of the mapped file.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    start : int or None
+        The first second to return. Rows are one per second from 0, so this is also a row offset.
+    end : int or None
+        The last second to return (inclusive)
+
+    Returns
+    --------
+    np.array
+        int32 array of shape (seconds, 13), or None if the game is not in the matrix
+    """
+    index = read_index(season)
+    i = _find_game(index, game)
+    if i is None:
+        return None
+    rows = read_matrix(season)[index['Offset'][i]:index['Offset'][i] + index['Rows'][i]]
+    return rows[start:None if end is None else end + 1]
+
+def get_players_on_ice(season, game, times):
+    """
+    Returns the home and road player IDs on ice at each of the given seconds.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    game : int
+        The game id
+    times : array of int
+        Seconds elapsed in the game, e.g. the Seconds column of the pbp
+
+    Returns
+    --------
+    np.array
+        int32 array of shape (len(times), 12): six home IDs then six road IDs, 0 where there is no player. Times past
+        the end of the game get all zeros.
+    """
+    import numpy as np
+    rows = read_game(season, game)
+    result = np.zeros((len(times), NUM_COLUMNS - 1), dtype = np.int32)
+    if rows is None:
+        return result
+    times = np.asarray(times)
+    valid = (times >= 0) & (times < len(rows))
+    result[valid] = rows[times[valid], 1:]
+    return result
+
+def is_current(season, games):
+    """
+    Returns True if every game is in the season's toi matrix and none of them has been parsed again since the matrix
+    was last written.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    games : iterable of int
+        The game ids
+
+    Returns
+    --------
+    bool
+    """
+    import scrape_game
+    index = read_index(season)
+    if len(index) == 0 or not {int(g) for g in games} <= {int(g) for g in index['Game']}:
+        return False
+    written = os.stat(get_index_filename(season)).st_mtime_ns
+    for game in games:
+        filename = scrape_game.get_parsed_shifts_save_filename(season, game)
+        if os.path.exists(filename) and os.stat(filename).st_mtime_ns > written:
+            return False
+    return True
+
+def get_team_toilog(season, team, goalies = None):
+    """
+    Returns this team's toi log for this season from the toi matrix, in the layout of scrape_season.get_team_toilog:
+    Time, [team]1-[team]6, Opp1-Opp6, Game, and the strength columns in strength.TEAM_STRENGTH_COLUMNS, with NaN
+    where there is no player.
+
+    Parameters
+    -----------
+    season : int
+        The season of the game. 2007-08 would be 2007.
+    team : str
+        The team abbreviation
+    goalies : set of int, or None
+        Goalie player IDs, for the strength columns. If None, taken from positions in the player ID table.
+
+    Returns
+    --------
+    pandas df
+        The team's toi log
+    """
+    import numpy as np
+    import pandas as pd
+    import strength
+
+    index = read_index(season)
+    matrix = read_matrix(season)
+    pieces = []
+    for entry in index:
+        if entry['Home'] == team:
+            teamcols, oppcols = slice(1, 7), slice(7, 13)
+        elif entry['Away'] == team:
+            teamcols, oppcols = slice(7, 13), slice(1, 7)
+        else:
+            continue
+        rows = matrix[entry['Offset']:entry['Offset'] + entry['Rows']]
+        pieces.append((int(entry['Game']), rows[:, 0], rows[:, teamcols], rows[:, oppcols]))
+
+    columns = ['Time'] + ['{0:s}{1:d}'.format(team, i) for i in range(1, 7)] + \
+              ['Opp{0:d}'.format(i) for i in range(1, 7)] + ['Game'] + strength.TEAM_STRENGTH_COLUMNS
+    if len(pieces) == 0:
+        return pd.DataFrame(columns = columns)
+
+    if goalies is None:
+        import onice
+        goalies = onice.get_goalie_ids()
+    goalies = np.array(sorted(goalies), dtype = np.int32)
+    players = np.vstack([np.hstack([t, o]) for g, time, t, o in pieces])
+    isgoalie = np.isin(players, goalies) & (players != 0)
+    isskater = (players != 0) & ~isgoalie
+
+    df = pd.DataFrame(np.where(players == 0, np.nan, players.astype(np.float64)), columns = columns[1:13])
+    df.insert(0, 'Time', np.concatenate([time for g, time, t, o in pieces]).astype(np.int64))
+    df['Game'] = np.concatenate([np.full(len(time), g, dtype = np.int64) for g, time, t, o in pieces])
+    df['TeamSkaters'] = isskater[:, :6].sum(axis = 1).astype(np.int8)
+    df['OppSkaters'] = isskater[:, 6:].sum(axis = 1).astype(np.int8)
+    df['TeamGoalie'] = isgoalie[:, :6].any(axis = 1)
+    df['OppGoalie'] = isgoalie[:, 6:].any(axis = 1)
+    df['Strength'] = pd.Categorical(strength.get_strength_codes(df.TeamSkaters.values, df.OppSkaters.values))
+    return df
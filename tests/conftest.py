@@ -0,0 +1,105 @@
+"""
+Shared fixtures. The package's modules import each other by bare name (e.g. import scrapenhl_globals), so the
+scrapenhl folder is put on the path here.
+"""
+
+import os
+import sys
+import json
+
+import pytest
+
+PACKAGE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scrapenhl')
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+sys.path.insert(0, PACKAGE_FOLDER)
+
+def read_data_json(filename):
+    """
+    Returns the contents of a json file in tests/data.
+    """
+    with open(os.path.join(DATA_FOLDER, filename), 'r') as reader:
+        return json.load(reader)
+
+def _reset_caches():
+    """
+    Drops every process-wide cache, so each test starts from its own save folder.
+    """
+    import reference_store
+    import logcache
+    import playernames
+    import dashdata
+    import rawarchive
+    import chartmethods
+    import dataset
+    import rawcodec
+
+    reference_store._STORE = None
+    logcache._CACHE = None
+    playernames._INDEX = None
+    playernames._INDEX_MTIME = None
+    dashdata._SNAPSHOT = None
+    dashdata._SNAPSHOT_MTIME = None
+    rawarchive.close()
+    dataset.pop_pending()
+    rawcodec._ACTIVE = None
+    rawcodec._DICTIONARIES.clear()
+    rawcodec._THREAD_STATE.state = {}
+    for name in dir(chartmethods):
+        if hasattr(getattr(chartmethods, name), 'cache_clear'):
+            getattr(chartmethods, name).cache_clear()
+
+@pytest.fixture
+def save_folder(tmp_path):
+    """
+    Points SAVE_FOLDER at an empty temporary folder for the length of the test.
+    """
+    import scrapenhl_globals
+    import reference_store
+
+    folder = str(tmp_path / 'data')
+    os.makedirs(os.path.join(folder, 'reference'))
+    previous = scrapenhl_globals.get_config()
+    scrapenhl_globals.configure(save_folder = folder, max_season = 2016)
+    _reset_caches()
+    yield folder
+    ### Write out anything the test left pending while SAVE_FOLDER still points at its folder
+    if reference_store._STORE is not None:
+        reference_store._STORE.flush()
+    _reset_caches()
+    scrapenhl_globals.configure(save_folder = previous.save_folder, max_season = previous.max_season)
+
+@pytest.fixture(scope = 'session')
+def _built_season(tmp_path_factory):
+    """
+    Runs scrape_season.update once over the synthetic games in feeds.write_season, and returns the folder.
+    """
+    import scrapenhl_globals
+    import reference_store
+    import scrape_season
+    import feeds
+
+    folder = str(tmp_path_factory.mktemp('season') / 'data')
+    os.makedirs(os.path.join(folder, 'reference'))
+    previous = scrapenhl_globals.get_config()
+    scrapenhl_globals.configure(save_folder = folder, max_season = 2016)
+    _reset_caches()
+    try:
+        games = feeds.write_season(2016)
+        scrape_season.update(2016, games = games)
+        reference_store.get_reference_store().flush()
+    finally:
+        _reset_caches()
+        scrapenhl_globals.configure(save_folder = previous.save_folder, max_season = previous.max_season)
+    return folder, games
+
+@pytest.fixture
+def updated_season(save_folder, _built_season):
+    """
+    Fills SAVE_FOLDER with six WSH-BOS games from 2016 (see feeds.write_season) that have been scraped, parsed, and
+    built into team logs, the toi matrix, the Corsi table, and the dashboard snapshot. Returns the game ids.
+    """
+    import shutil
+    folder, games = _built_season
+    shutil.copytree(folder, save_folder, dirs_exist_ok = True)
+    _reset_caches()
+    return games
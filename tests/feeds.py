@@ -0,0 +1,121 @@
+"""
+Raw NHL API pages (game feed and shift chart) for synthetic games, so the scrape -> parse -> update pipeline can be
+tested offline. Each team's goalie is its base ID and its skaters are base + 1 to base + 18.
+"""
+
+import json
+import random
+
+### Team ID, abbreviation, name, and base player ID
+WSH = (15, 'WSH', 'Washington Capitals', 8471000)
+BOS = (6, 'BOS', 'Boston Bruins', 8475000)
+
+EVENTS = ['Faceoff', 'Shot', 'Missed Shot', 'Blocked Shot', 'Goal', 'Hit', 'Giveaway', 'Takeaway', 'Stoppage']
+
+def _clock(seconds):
+    return '{0:02d}:{1:02d}'.format(*divmod(seconds, 60))
+
+def get_roster(team):
+    """
+    Returns the boxscore players dict for a team: a goalie and 18 skaters.
+    """
+    positions = ['G'] + ['C', 'L', 'R', 'D', 'D'] * 3 + ['C', 'L', 'R']
+    return {'ID{0:d}'.format(team[3] + i): {'person': {'fullName': '{0:s} Player {1:d}'.format(team[1], i),
+                                                       'shootsCatches': 'L'},
+                                            'jerseyNumber': str(i + 1), 'position': {'code': positions[i]}}
+            for i in range(19)}
+
+def get_game_feed(season, game, home = WSH, road = BOS, seed = 0, events = 240):
+    """
+    Returns a game feed with random events spread over three periods.
+    """
+    rng = random.Random(seed)
+    plays = []
+    for i in range(events):
+        seconds = i * 3600 // events
+        period, clock = seconds // 1200 + 1, seconds % 1200
+        event = rng.choice(EVENTS)
+        play = {'about': {'period': period, 'periodTime': _clock(clock)},
+                'result': {'event': event, 'description': '{0:s} {1:d}'.format(event, i)}}
+        if event != 'Stoppage':
+            team, opp = (home, road) if rng.random() < 0.5 else (road, home)
+            play['team'] = {'id': team[0]}
+            play['players'] = [{'player': {'id': team[3] + rng.randrange(1, 19)}, 'playerType': 'Shooter'},
+                               {'player': {'id': opp[3]}, 'playerType': 'Goalie'}][:rng.choice([1, 2])]
+            play['coordinates'] = {'x': rng.randrange(-99, 99), 'y': rng.randrange(-42, 42)}
+        else:
+            play['coordinates'] = {}
+        plays.append(play)
+
+    def boxscore(team, goals):
+        return {'team': {'id': team[0], 'name': team[2], 'link': '/api/v1/teams/{0:d}'.format(team[0])},
+                'players': get_roster(team), 'coaches': [{'person': {'fullName': '{0:s} Coach'.format(team[1])}}],
+                'teamStats': {'teamSkaterStats': {'goals': goals}}}
+
+    return {'gameData': {'game': {'pk': int('{0:d}0{1:d}'.format(season, game))},
+                         'datetime': {'dateTime': '{0:d}-10-{1:02d}T23:00:00Z'.format(season, game % 28 + 1)},
+                         'venue': {'name': '{0:s} Arena'.format(home[1])},
+                         'teams': {'home': {'id': home[0], 'abbreviation': home[1], 'name': home[2]},
+                                   'away': {'id': road[0], 'abbreviation': road[1], 'name': road[2]}}},
+            'liveData': {'plays': {'allPlays': plays},
+                         'boxscore': {'teams': {'home': boxscore(home, 3), 'away': boxscore(road, 2)}}}}
+
+def get_shift_feed(segments, home = WSH, road = BOS):
+    """
+    Returns a shift chart with one shift per player per segment.
+
+    Parameters
+    -----------
+    segments : list of tuple
+        (period, start second in the period, end second in the period, home player IDs, road player IDs)
+    """
+    data = []
+    for team, side in ((home, 3), (road, 4)):
+        for segment in segments:
+            period, start, end = segment[:3]
+            for pid in segment[side]:
+                data.append({'playerId': pid, 'teamAbbrev': team[1], 'period': period, 'startTime': _clock(start),
+                             'endTime': _clock(end), 'duration': _clock(end - start)})
+    return {'data': data}
+
+def get_line_segments(home = WSH, road = BOS, seed = 0):
+    """
+    Returns segments (see get_shift_feed) for three periods of 5v5 with both goalies in, changing lines at random.
+    """
+    rng = random.Random(seed)
+    segments = []
+    for period in (1, 2, 3):
+        start, line = 0, 0
+        while start < 1200:
+            end = min(1200, start + rng.randrange(30, 90))
+            segments.append((period, start, end,
+                             [home[3]] + [home[3] + 1 + 5 * line + k for k in range(5)],
+                             [road[3]] + [road[3] + 1 + 5 * ((line + 1) % 3) + k for k in range(5)]))
+            start, line = end, (line + 1) % 3
+    return segments
+
+def write_game(season, game, home = WSH, road = BOS, seed = 0, segments = None):
+    """
+    Saves a synthetic game's raw pages for the season in SAVE_FOLDER, as scrape_game would.
+    """
+    import os
+    import rawcodec
+    import scrape_game
+    import scrapenhl_globals
+    if not os.path.exists(scrapenhl_globals.get_season_folder(season)):
+        scrapenhl_globals.create_season_folder(season)
+    if segments is None:
+        segments = get_line_segments(home, road, seed)
+    pages = {'pbp': get_game_feed(season, game, home, road, seed), 'shift': get_shift_feed(segments, home, road)}
+    for kind, page in pages.items():
+        scrape_game.write_raw_blob(season, game, kind, rawcodec.compress(json.dumps(page).encode('utf-8'), kind))
+
+def write_season(season = 2016, games = range(20001, 20007)):
+    """
+    Saves raw pages for a few WSH-BOS games, alternating home and road. Returns the game ids.
+    """
+    games = list(games)
+    for i, game in enumerate(games):
+        home, road = (WSH, BOS) if i % 2 == 0 else (BOS, WSH)
+        write_game(season, game, home, road, seed = i)
+    return games
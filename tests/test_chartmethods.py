@@ -0,0 +1,88 @@
+"""
+Tests for the rolling CF% engine in chartmethods.py, on the synthetic season from feeds.write_season.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import chartmethods
+import corsi
+import feeds
+import scrape_game
+
+PLAYER = feeds.WSH[3] + 1
+
+def _naive_rolling(cf, ca, window):
+    result = np.full(len(cf), np.nan)
+    for i in range(window - 1, len(cf)):
+        f, a = sum(cf[i - window + 1:i + 1]), sum(ca[i - window + 1:i + 1])
+        if f + a > 0:
+            result[i] = 100 * f / (f + a)
+    return result
+
+@pytest.mark.parametrize('window', [1, 2, 5, 10])
+def test_rolling_cf_pct_matches_naive(window):
+    rng = np.random.RandomState(window)
+    cf, ca = rng.randint(0, 4, 10).astype(float), rng.randint(0, 4, 10).astype(float)
+    cf[3] = ca[3] = 0
+    np.testing.assert_allclose(chartmethods.rolling_cf_pct(cf, ca, window), _naive_rolling(cf, ca, window))
+
+def test_rolling_cf_pct_window_longer_than_series():
+    assert np.isnan(chartmethods.rolling_cf_pct([1, 2], [2, 1], 3)).all()
+    assert len(chartmethods.rolling_cf_pct([], [], 1)) == 0
+
+def test_series_matches_corsi_table(updated_season):
+    table = corsi.get_player_corsi(2016)
+    table = table[(table.Player == PLAYER) & (table.Strength == '5v5')]
+    expected = table.groupby('Game')[['CF', 'CA']].sum()
+
+    series = chartmethods.get_player_game_series(PLAYER)
+    assert series.Game.tolist() == updated_season
+    assert series.Played.all()
+    np.testing.assert_array_equal(series.CF.values, expected.CF.values)
+    np.testing.assert_array_equal(series.CA.values, expected.CA.values)
+    assert len(chartmethods.get_player_game_series(PLAYER, teams = ['BOS'])) == 0
+
+def test_score_adjustment_evens_league_cf_and_ca(updated_season):
+    table = corsi.get_player_corsi(2016)
+    table = table[table.Strength == '5v5']
+    weights = chartmethods.get_score_adjustment_weights()
+    cf = sum(weights[s][0] * table[table.ScoreState == s].CF.sum() for s in weights)
+    ca = sum(weights[s][1] * table[table.ScoreState == s].CA.sum() for s in weights)
+    assert cf == pytest.approx(ca)
+
+    adjusted = chartmethods.get_player_game_series(PLAYER, score_adjust = True)
+    raw = chartmethods.get_player_game_series(PLAYER)
+    assert not np.allclose(adjusted.CF.values, raw.CF.values)
+
+def test_window_change_does_not_reread_tables(updated_season, monkeypatch):
+    first = chartmethods.get_rolling_cf(PLAYER, window = 2)
+    reads = []
+    monkeypatch.setattr(corsi, 'get_player_corsi', lambda *args: reads.append(args))
+    second = chartmethods.get_rolling_cf(PLAYER, window = 3)
+    assert reads == []
+
+    series = chartmethods.get_player_game_series(PLAYER)
+    np.testing.assert_allclose(first['CF%'].values, _naive_rolling(series.CF.values, series.CA.values, 2))
+    np.testing.assert_allclose(second['CF%'].values, _naive_rolling(series.CF.values, series.CA.values, 3))
+
+def test_missed_games_are_gaps_and_update_invalidates(updated_season):
+    before = chartmethods.get_rolling_cf(PLAYER, window = 2)
+    assert before['CF%'].notnull().sum() == len(updated_season) - 1
+
+    ### Game 20003 drops out of the Corsi table but stays in the game log, so the player missed it
+    os.remove(scrape_game.get_parsed_shifts_save_filename(2016, 20003))
+    corsi.update_player_corsi(2016, games = [20003])
+
+    series = chartmethods.get_player_game_series(PLAYER)
+    assert series.Game.tolist() == updated_season
+    assert series.Played.tolist() == [game != 20003 for game in updated_season]
+
+    withgaps = chartmethods.get_rolling_cf(PLAYER, window = 2)
+    assert withgaps.Game.tolist() == updated_season
+    assert np.isnan(withgaps['CF%'].values[2])
+    played = series[series.Played]
+    np.testing.assert_allclose(chartmethods.get_rolling_cf(PLAYER, window = 2, gaps = False)['CF%'].values,
+                               _naive_rolling(played.CF.values, played.CA.values, 2))
@@ -0,0 +1,99 @@
+"""
+Tests for corsi.py and pbpmethods.get_player_cf, on the synthetic season from feeds.write_season.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import corsi
+import pbpmethods
+import reference_store
+import scrape_game
+
+def _expected(games):
+    store = reference_store.get_reference_store()
+    df = pd.concat([corsi._read_game_corsi(2016, game, store.get_game(2016, game)['Home'],
+                                           store.get_game(2016, game)['Away'], store) for game in games],
+                   ignore_index = True)
+    return _sort(df.astype(corsi.CORSI_DTYPES))
+
+def _sort(df):
+    return df.sort_values(['Game', 'Player', 'Strength', 'ScoreState']).reset_index(drop = True)
+
+def _parts():
+    return sorted(os.listdir(corsi.get_player_corsi_folder(2016)))
+
+def test_table_matches_games(updated_season):
+    table = corsi.get_player_corsi(2016)
+    pd.testing.assert_frame_equal(_sort(table), _expected(updated_season))
+    assert table.TOI.sum() == 2 * 6 * 3600 * len(updated_season)
+
+def test_update_writes_only_recomputed_games(updated_season):
+    before = corsi.get_player_corsi(2016)
+    first = os.path.join(corsi.get_player_corsi_folder(2016), _parts()[0])
+    mtime = os.stat(first).st_mtime_ns
+
+    corsi.update_player_corsi(2016, games = [20002])
+    assert len(_parts()) == 2
+    assert os.stat(first).st_mtime_ns == mtime
+    newpart = pd.read_feather(os.path.join(corsi.get_player_corsi_folder(2016), _parts()[-1]))
+    assert newpart.Game.unique().tolist() == [20002]
+    pd.testing.assert_frame_equal(corsi.get_player_corsi(2016), before)
+
+    ### Nothing new, so nothing is written
+    corsi.update_player_corsi(2016)
+    assert len(_parts()) == 2
+
+def test_update_merges_parts(updated_season, monkeypatch):
+    before = corsi.get_player_corsi(2016)
+    monkeypatch.setattr(corsi, 'MAX_PARTS', 2)
+    corsi.update_player_corsi(2016, games = [20002])
+    corsi.update_player_corsi(2016, games = [20003])
+    assert len(_parts()) == 1
+    pd.testing.assert_frame_equal(corsi.get_player_corsi(2016), before)
+
+def test_update_drops_games_that_are_gone(updated_season):
+    os.remove(scrape_game.get_parsed_shifts_save_filename(2016, 20004))
+    corsi.update_player_corsi(2016, games = [20004])
+    assert len(_parts()) == 1
+    pd.testing.assert_frame_equal(_sort(corsi.get_player_corsi(2016)),
+                                  _expected([g for g in updated_season if g != 20004]))
+
+def test_single_file_table_becomes_first_part(updated_season):
+    import shutil
+    before = corsi.get_player_corsi(2016)
+    shutil.rmtree(corsi.get_player_corsi_folder(2016))
+    before.to_feather(corsi.get_player_corsi_filename(2016))
+    pd.testing.assert_frame_equal(corsi.get_player_corsi(2016), before)
+
+    corsi.update_player_corsi(2016, games = [20001])
+    assert not os.path.exists(corsi.get_player_corsi_filename(2016))
+    assert _parts() == ['part-00000.feather', 'part-00001.feather']
+    pd.testing.assert_frame_equal(corsi.get_player_corsi(2016), before)
+
+def test_versions_change_on_update(updated_season):
+    versions = corsi.get_player_corsi_versions()
+    assert [season for season, version in versions] == [2016]
+    corsi.update_player_corsi(2016, games = [20001])
+    assert corsi.get_player_corsi_versions() != versions
+
+def test_get_player_cf(updated_season):
+    player = 8471001
+    table = corsi.get_player_corsi(2016)
+    rows = table[table.Player == player]
+    df = pbpmethods.get_player_cf(player, 2016)
+    assert df[['CF', 'CA', 'TOI']].values.tolist() == [[rows.CF.sum(), rows.CA.sum(), rows.TOI.sum()]]
+    assert df['CF%'].iloc[0] == pytest.approx(100 * rows.CF.sum() / (rows.CF.sum() + rows.CA.sum()))
+
+    pd.testing.assert_frame_equal(pbpmethods.get_player_cf('WSH Player 1', 2016), df)
+    pd.testing.assert_frame_equal(pbpmethods.get_player_cf(str(player), 2016), df)
+    fivev5 = pbpmethods.get_player_cf(player, 2016, strengths = '5v5')
+    assert fivev5.TOI.iloc[0] == rows[rows.Strength == '5v5'].TOI.sum()
+
+def test_get_player_cf_unknown_name(updated_season, monkeypatch):
+    import scrapenhl_globals
+    monkeypatch.setattr(scrapenhl_globals, 'player_name_to_id', lambda name, team_helper = None: None)
+    with pytest.raises(ValueError, match = 'Nobody Here'):
+        pbpmethods.get_player_cf('Nobody Here', 2016)
@@ -0,0 +1,61 @@
+"""
+Tests for dashdata.py, on the synthetic season from feeds.write_season.
+"""
+
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+import chartmethods
+import corsi
+import dashdata
+import feeds
+import scrape_game
+
+PLAYERS = [feeds.WSH[3] + 1, feeds.WSH[3] + 16, feeds.BOS[3] + 4, feeds.BOS[3]]
+
+def _assert_matches_chartmethods(snapshot, player, window, teams, playoffs, score_adjust, gaps):
+    expected = chartmethods.get_rolling_cf(player, window, teams, playoffs, score_adjust, ('5v5',), gaps)
+    result = snapshot.get_rolling_cf(player, window, teams, playoffs, score_adjust, gaps)
+    for column in ('Season', 'Game', 'Team'):
+        assert result[column].tolist() == expected[column].tolist()
+    np.testing.assert_allclose(result['CF%'], expected['CF%'].values)
+
+@pytest.mark.parametrize('player', PLAYERS)
+def test_snapshot_matches_chartmethods(updated_season, player):
+    snapshot = dashdata.get_snapshot()
+    for window, teams, playoffs, score_adjust, gaps in itertools.product([1, 3], [None, ['WSH'], ['BOS']],
+                                                                         [True, False], [False, True], [True, False]):
+        _assert_matches_chartmethods(snapshot, player, window, teams, playoffs, score_adjust, gaps)
+
+def test_snapshot_options(updated_season):
+    snapshot = dashdata.get_snapshot()
+    assert {option['value'] for option in snapshot.team_options} == {'WSH', 'BOS'}
+    players = {option['value']: option['label'] for option in snapshot.player_options}
+    assert players[str(feeds.WSH[3] + 1)] == 'WSH Player 1'
+    assert len(players) == 38
+    assert snapshot.get_rolling_cf(1)['Game'].tolist() == []
+
+def test_snapshot_is_built_when_missing_and_reloaded_when_rebuilt(updated_season):
+    import shutil
+    shutil.rmtree(dashdata.get_snapshot_folder())
+    assert dashdata.get_snapshot(build_if_missing = False) is None
+    first = dashdata.get_snapshot()
+    assert dashdata.get_snapshot() is first
+
+    ### Game 20003 drops out of the Corsi table, so it becomes a missed game once the snapshot is rebuilt
+    os.remove(scrape_game.get_parsed_shifts_save_filename(2016, 20003))
+    corsi.update_player_corsi(2016, games = [20003])
+    assert dashdata.get_snapshot() is first
+    dashdata.build_snapshot()
+    ### Make sure the modification time moves even on file systems with coarse timestamps
+    mtime = os.path.getmtime(dashdata.get_options_filename())
+    os.utime(dashdata.get_options_filename(), (mtime + 10, mtime + 10))
+    second = dashdata.get_snapshot()
+    assert second is not first
+    result = second.get_rolling_cf(PLAYERS[0], window = 1, gaps = True)
+    assert result['Game'].tolist() == updated_season
+    assert np.isnan(result['CF%'][2])
+    _assert_matches_chartmethods(second, PLAYERS[0], 2, None, True, False, False)
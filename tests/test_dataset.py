@@ -0,0 +1,128 @@
+"""
+Tests for dataset.py, on the synthetic season from feeds.write_season.
+"""
+
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+import dataset
+import scrape_game
+import scrapenhl_globals
+
+def _read_parsed(games, kind = 'pbp'):
+    filename = scrape_game.get_parsed_save_filename if kind == 'pbp' else scrape_game.get_parsed_shifts_save_filename
+    return pd.concat([pd.read_hdf(filename(2016, game)).assign(game = game) for game in games], ignore_index = True)
+
+def _files(kind):
+    return sorted(glob.glob(os.path.join(dataset.get_dataset_folder(kind), 'season=2016', '*', 'part-0.parquet')))
+
+def _sort(df):
+    return df.sort_values(['game', 'Index'] if 'Index' in df.columns else ['game', 'Time']).reset_index(drop = True)
+
+def test_build_dataset_writes_one_file_per_home_team(updated_season):
+    import pyarrow.parquet as pq
+    dataset.build_dataset(2016)
+    for kind in ('pbp', 'toi'):
+        assert [os.path.basename(os.path.dirname(f)) for f in _files(kind)] == ['team=BOS', 'team=WSH']
+        for filename in _files(kind):
+            ### One row group per home game, in game order
+            games = pq.read_table(filename, columns = ['game']).column('game').to_pylist()
+            assert pq.ParquetFile(filename).num_row_groups == len(set(games)) == 3
+            assert games == sorted(games)
+        assert dataset.get_partition_games(kind, 2016) == set(updated_season)
+
+    pbp = dataset.read_pbp(games = 20003)
+    parsed = _read_parsed([20003])
+    assert (pbp.season == 2016).all() and (pbp.team == 'WSH').all()
+    assert pbp.Index.tolist() == parsed.Index.tolist()
+    assert pbp.Actor.tolist() == parsed.Actor.tolist()
+    assert pbp.Strength.tolist() == parsed.Strength.tolist()
+
+def test_filters_match_pandas(updated_season):
+    dataset.build_dataset(2016)
+    parsed = _read_parsed(updated_season)
+    parsed['Event'] = parsed.Event.astype(str)
+    player = 8471005
+
+    pbp = dataset.read_pbp(seasons = 2016, teams = 'WSH', events = ['Shot', 'Goal'], players = player,
+                           columns = ['game', 'Index', 'Event', 'Actor', 'Recipient'])
+    expected = parsed[parsed.Event.isin(['Shot', 'Goal']) & ((parsed.Actor == player) | (parsed.Recipient == player))]
+    assert len(expected) > 0
+    assert _sort(pbp)[['game', 'Index']].values.tolist() == _sort(expected)[['game', 'Index']].values.tolist()
+
+    toi = dataset.read_toi(players = player, games = [20001, 20002], columns = ['game', 'Time'])
+    shifts = _read_parsed([20001, 20002], 'toi')
+    expected = shifts[(shifts.drop(columns = ['Time', 'game']) == player).any(axis = 1)]
+    assert len(expected) > 0
+    assert _sort(toi).values.tolist() == _sort(expected[['game', 'Time']]).values.tolist()
+
+    assert dataset.read_pbp(teams = 'NYR') is not None and len(dataset.read_pbp(teams = 'NYR')) == 0
+    assert len(dataset.read_toi(seasons = 2015)) == 0
+
+def test_schema_does_not_depend_on_first_game(save_folder):
+    import pyarrow as pa
+    events = pd.DataFrame({'Index': [0, 1], 'Period': [1, 1], 'Time': ['00:00', '00:10'], 'Seconds': [0, 10],
+                           'Event': ['Faceoff', 'Shot'], 'Team': [15, 15], 'Actor': [8471001, 8471002],
+                           'ActorRole': ['Winner', 'Shooter'], 'Recipient': [8475001, 8475000],
+                           'RecipientRole': ['Loser', 'Goalie'], 'X': [0.0, 60.0], 'Y': [0.0, 5.0],
+                           'Note': ['Faceoff', 'Shot']})
+    ### The first game has no coordinates, notes, or strength at all, so pandas would infer null columns
+    empty = events.assign(X = None, Y = None, Note = None, RecipientRole = None)
+    dataset.write_game_pbp(2016, 20001, empty, 'WSH', 'BOS')
+    dataset.flush()
+    dataset.write_game_pbp(2016, 20002, events.assign(Strength = '5v5'), 'WSH', 'BOS')
+
+    table = dataset.read_pbp(return_type = 'arrow')
+    assert table.schema == dataset.get_schema('pbp', partitions = True)
+    assert table.schema.field('X').type == pa.float32()
+    assert table.schema.field('Note').type == pa.string()
+    pbp = table.to_pandas()
+    assert pbp[pbp.game == 20001].X.isna().all()
+    assert pbp[pbp.game == 20002].X.tolist() == [0.0, 60.0]
+    assert pbp[pbp.game == 20002].Strength.tolist() == ['5v5', '5v5']
+
+def test_rewriting_a_game_replaces_it(save_folder):
+    events = pd.DataFrame({'Index': [0, 1], 'Event': ['Faceoff', 'Shot'], 'Actor': [8471001, 8471002]})
+    dataset.write_game_pbp(2016, 20001, events, 'WSH', 'BOS')
+    dataset.write_game_pbp(2016, 20002, events, 'WSH', 'BOS')
+    dataset.flush()
+    dataset.write_game_pbp(2016, 20001, events.iloc[:1], 'WSH', 'BOS')
+    dataset.flush()
+    pbp = dataset.read_pbp()
+    assert pbp.groupby('game').size().to_dict() == {20001: 1, 20002: 2}
+    assert len(_files('pbp')) == 1
+
+def test_games_in_old_layout_are_moved(save_folder):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    events = pd.DataFrame({'Index': [0, 1], 'Event': ['Faceoff', 'Shot'], 'Actor': [8471001, 8471002],
+                           'Home': 'WSH', 'Away': 'BOS'})
+    for game in (20001, 20002):
+        folder = os.path.join(dataset.get_dataset_folder('pbp'), 'season=2016', 'game={0:d}'.format(game))
+        os.makedirs(folder)
+        pq.write_table(pa.Table.from_pandas(events, preserve_index = False), os.path.join(folder, 'part-0.parquet'))
+
+    ### A newer copy of 20002 replaces the old one
+    dataset.write_game_pbp(2016, 20002, events.iloc[:1], 'WSH', 'BOS')
+    dataset.flush()
+    assert _files('pbp') == [dataset.get_partition_filename('pbp', 2016, 'WSH')]
+    assert dataset.read_pbp().groupby('game').size().to_dict() == {20001: 2, 20002: 1}
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parse_games_writes_dataset(updated_season, monkeypatch, workers):
+    import scrape_season
+    monkeypatch.setattr(scrapenhl_globals, 'WRITE_DATASET', True)
+    scrape_season.parse_games(2016, updated_season, force_overwrite = True, workers = workers)
+    assert len(dataset._PENDING) == 0
+    assert len(_files('pbp')) == len(_files('toi')) == 2
+
+    pbp = dataset.read_pbp()
+    parsed = _read_parsed(updated_season)
+    assert _sort(pbp).Actor.tolist() == _sort(parsed).Actor.tolist()
+    toi = dataset.read_toi()
+    assert len(toi) == len(_read_parsed(updated_season, 'toi'))
+    assert set(toi.groupby('game').Home.first().items()) == \
+        {(game, 'WSH' if i % 2 == 0 else 'BOS') for i, game in enumerate(updated_season)}
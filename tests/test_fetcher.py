@@ -0,0 +1,245 @@
+"""
+Tests for fetcher.py and scrape_game's use of it, against a local stand-in for the NHL API.
+"""
+
+import http.server
+import threading
+import time
+
+import pytest
+
+import fetcher
+import scrape_game
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the routes in the server's routes dict. Each route is a list of responses (status, headers, body); the
+    last one repeats.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address, dict(self.headers)))
+            responses = server.routes.get(self.path, [(404, {}, b'not found')])
+            count = server.counts.get(self.path, 0)
+            server.counts[self.path] = count + 1
+        status, headers, body = responses[min(count, len(responses) - 1)]
+        if status == 200 and 'ETag' in headers and self.headers.get('If-None-Match') == headers['ETag']:
+            status, body = 304, b''
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    """
+    A keep-alive HTTP server on localhost. Set its routes, then read server.requests to see what was asked for.
+    """
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.lock = threading.Lock()
+    httpd.routes = {}
+    httpd.requests = []
+    httpd.counts = {}
+    httpd.url = 'http://127.0.0.1:{0:d}'.format(httpd.server_address[1])
+    thread = threading.Thread(target = httpd.serve_forever, args = (0.05,), daemon = True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def _fetcher(**kwargs):
+    return fetcher.Fetcher(**dict({'rate': None, 'retries': 3, 'backoff': 0.01, 'timeout': 5}, **kwargs))
+
+def test_fetch_reuses_connection(server):
+    server.routes.update({'/a': [(200, {}, b'a')], '/b': [(200, {}, b'b')]})
+    f = _fetcher()
+    assert [f.fetch(server.url + path) for path in ('/a', '/b', '/a', '/b')] == [b'a', b'b', b'a', b'b']
+    assert len(server.requests) == 4
+    assert len({client for path, client, headers in server.requests}) == 1
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_fetch_retries_rate_limited_and_server_errors(server, status):
+    server.routes['/flaky'] = [(status, {}, b''), (status, {}, b''), (200, {}, b'ok')]
+    assert _fetcher().fetch(server.url + '/flaky') == b'ok'
+    assert server.counts['/flaky'] == 3
+
+def test_fetch_gives_up_after_retries(server):
+    server.routes['/down'] = [(503, {}, b'')]
+    with pytest.raises(fetcher.FetchError) as e:
+        _fetcher(retries = 2).fetch(server.url + '/down')
+    assert e.value.status == 503
+    assert server.counts['/down'] == 3
+
+def test_fetch_does_not_retry_client_errors(server):
+    with pytest.raises(fetcher.FetchError) as e:
+        _fetcher().fetch(server.url + '/missing')
+    assert e.value.status == 404
+    assert server.counts['/missing'] == 1
+
+@pytest.mark.parametrize('status', [301, 302, 303, 307, 308])
+def test_fetch_follows_same_host_redirects(server, status):
+    server.routes.update({'/old': [(status, {'Location': '/middle'}, b'')],
+                          '/middle': [(status, {'Location': server.url + '/new'}, b'')],
+                          '/new': [(200, {}, b'moved')]})
+    assert _fetcher().fetch(server.url + '/old') == b'moved'
+    assert [path for path, client, headers in server.requests] == ['/old', '/middle', '/new']
+
+def test_fetch_does_not_follow_redirects_to_other_hosts(server):
+    server.routes['/away'] = [(302, {'Location': 'http://example.invalid/feed'}, b'')]
+    with pytest.raises(fetcher.FetchError) as e:
+        _fetcher().fetch(server.url + '/away')
+    assert e.value.status == 302
+    assert 'example.invalid' in e.value.reason
+
+def test_fetch_stops_redirect_loops(server):
+    server.routes.update({'/ping': [(302, {'Location': '/pong'}, b'')], '/pong': [(302, {'Location': '/ping'}, b'')]})
+    with pytest.raises(fetcher.FetchError):
+        _fetcher(max_redirects = 4).fetch(server.url + '/ping')
+    assert len(server.requests) == 5
+
+def test_fetch_conditional(server):
+    server.routes['/page'] = [(200, {'ETag': '"v1"', 'Last-Modified': 'Sat, 01 Oct 2016 00:00:00 GMT'}, b'page')]
+    f = _fetcher()
+    status, body, headers = f.fetch_conditional(server.url + '/page')
+    assert (status, body, headers['etag']) == (200, b'page', '"v1"')
+    status, body, headers = f.fetch_conditional(server.url + '/page', headers['etag'], headers['last-modified'])
+    assert (status, body) == (304, None)
+    assert server.requests[-1][2]['If-None-Match'] == '"v1"'
+    assert server.requests[-1][2]['If-Modified-Since'] == 'Sat, 01 Oct 2016 00:00:00 GMT'
+
+def test_rate_limiter_paces_requests():
+    limiter = fetcher.RateLimiter(20, burst = 2)
+    starttime = time.monotonic()
+    for i in range(8):
+        limiter.acquire()
+    ### Two tokens are available up front, then one every 1/20 s
+    assert time.monotonic() - starttime >= 6 / 20 - 0.01
+
+def test_rate_limit_is_shared_between_threads(server):
+    server.routes['/a'] = [(200, {}, b'a')]
+    f = _fetcher(rate = 20)
+    starttime = time.monotonic()
+    threads = [threading.Thread(target = lambda: [f.fetch(server.url + '/a') for i in range(3)]) for j in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(server.requests) == 9
+    assert time.monotonic() - starttime >= 8 / 20 - 0.01
+
+def test_failed_fetch_saves_nothing_and_is_retried(save_folder, server):
+    import os
+    import scrapenhl_globals
+    scrapenhl_globals.create_season_folder(2016)
+    f = _fetcher(retries = 0)
+    server.routes['/feed'] = [(503, {}, b''), (200, {}, b'{"data": []}')]
+
+    assert scrape_game._scrape_page(server.url + '/feed', 2016, 20001, 'shift', f) is None
+    assert not scrape_game.raw_page_exists(2016, 20001, 'shift')
+    assert not os.path.exists(scrape_game.get_shift_save_filename(2016, 20001))
+
+    entry = scrape_game._scrape_page(server.url + '/feed', 2016, 20001, 'shift', f)
+    assert entry is not None
+    assert scrape_game.read_game_page(2016, 20001, 'shift') == b'{"data": []}'
+
+def test_scrape_games_with_workers(save_folder, server, monkeypatch):
+    import scrapenhl_globals
+    import scrape_season
+    scrapenhl_globals.create_season_folder(2016)
+    games = list(range(20001, 20009))
+    for game in games:
+        server.routes['/pbp/{0:d}'.format(game)] = [(200, {}, '{{"game": {0:d}}}'.format(game).encode())]
+        server.routes['/shifts/{0:d}'.format(game)] = [(503, {}, b''), (200, {}, b'{"data": []}')]
+    monkeypatch.setattr(scrape_game, 'get_url', lambda season, game: server.url + '/pbp/{0:d}'.format(game))
+    monkeypatch.setattr(scrape_game, 'get_shift_url', lambda season, game: server.url + '/shifts/{0:d}'.format(game))
+
+    scrape_season.scrape_games(2016, games, pause = 0, workers = 3)
+    for game in games:
+        assert scrape_game.read_game_page(2016, game, 'pbp') == '{{"game": {0:d}}}'.format(game).encode()
+        assert scrape_game.read_game_page(2016, game, 'shift') == b'{"data": []}'
+    ### One attempt per pbp page, two per shift page, over at most one connection per worker
+    assert len(server.requests) == 3 * len(games)
+    assert len({client for path, client, headers in server.requests}) <= 3
+
+def _serve_game(server, monkeypatch, pbp, shift, etag):
+    import json
+    server.routes['/pbp'] = [(200, {'ETag': '"pbp{0:s}"'.format(etag)}, json.dumps(pbp).encode())]
+    server.routes['/shifts'] = [(200, {'ETag': '"shift{0:s}"'.format(etag)}, json.dumps(shift).encode())]
+    monkeypatch.setattr(scrape_game, 'get_url', lambda season, game: server.url + '/pbp')
+    monkeypatch.setattr(scrape_game, 'get_shift_url', lambda season, game: server.url + '/shifts')
+
+def _mtimes(season, game):
+    import os
+    return [os.stat(filename).st_mtime_ns for filename in
+            (scrape_game.get_raw_filename(season, game, 'pbp'), scrape_game.get_raw_filename(season, game, 'shift'),
+             scrape_game.get_parsed_save_filename(season, game),
+             scrape_game.get_parsed_shifts_save_filename(season, game))]
+
+@pytest.mark.parametrize('use_fetcher', [True, False])
+def test_revalidate_rewrites_and_reparses_only_changed_pages(save_folder, server, monkeypatch, use_fetcher):
+    import time
+    import pandas as pd
+    import feeds
+    import scrapenhl_globals
+    scrapenhl_globals.create_season_folder(2016)
+    f = _fetcher() if use_fetcher else None
+    pbp, shift = feeds.get_game_feed(2016, 20001), feeds.get_shift_feed(feeds.get_line_segments())
+    _serve_game(server, monkeypatch, pbp, shift, 'v1')
+
+    assert scrape_game.scrape_game(2016, 20001, fetcher = f)
+    scrape_game.parse_game(2016, 20001)
+    meta = scrape_game.read_fetch_meta(2016, 20001)
+    assert meta['pbp']['etag'] == '"pbpv1"'
+    assert meta['pbp']['parsed_sha256'] == meta['pbp']['sha256']
+    assert not scrape_game.needs_reparse(meta, 'pbp') and not scrape_game.needs_reparse(meta, 'shift')
+
+    ### Without revalidate, nothing is requested; with it, the server answers 304 and nothing changes
+    before = _mtimes(2016, 20001)
+    assert not scrape_game.scrape_game(2016, 20001, fetcher = f)
+    assert len(server.requests) == 2
+    time.sleep(0.01)
+    assert scrape_game.scrape_game(2016, 20001, fetcher = f, revalidate = True)
+    assert [headers.get('If-None-Match') for path, client, headers in server.requests[2:]] == ['"pbpv1"', '"shiftv1"']
+    scrape_game.parse_game(2016, 20001)
+    assert _mtimes(2016, 20001) == before
+
+    ### A new ETag with the same content is not rewritten either
+    _serve_game(server, monkeypatch, pbp, shift, 'v2')
+    scrape_game.scrape_game(2016, 20001, fetcher = f, revalidate = True)
+    scrape_game.parse_game(2016, 20001)
+    assert _mtimes(2016, 20001) == before
+    assert scrape_game.read_fetch_meta(2016, 20001)['shift']['etag'] == '"shiftv2"'
+
+    ### A corrected pbp is saved and reparsed; the unchanged shifts are not
+    pbp['liveData']['plays']['allPlays'] = pbp['liveData']['plays']['allPlays'][:-10]
+    _serve_game(server, monkeypatch, pbp, shift, 'v3')
+    scrape_game.scrape_game(2016, 20001, fetcher = f, revalidate = True)
+    meta = scrape_game.read_fetch_meta(2016, 20001)
+    assert scrape_game.needs_reparse(meta, 'pbp') and not scrape_game.needs_reparse(meta, 'shift')
+    scrape_game.parse_game(2016, 20001)
+    after = _mtimes(2016, 20001)
+    assert [a != b for a, b in zip(after, before)] == [True, False, True, False]
+    assert len(pd.read_hdf(scrape_game.get_parsed_save_filename(2016, 20001))) == 230
+
+def test_failed_revalidation_keeps_file(save_folder, server, monkeypatch):
+    import feeds
+    import scrapenhl_globals
+    scrapenhl_globals.create_season_folder(2016)
+    _serve_game(server, monkeypatch, feeds.get_game_feed(2016, 20001), {'data': []}, 'v1')
+    scrape_game.scrape_game(2016, 20001, fetcher = _fetcher())
+    page = scrape_game.read_game_page(2016, 20001, 'pbp')
+    meta = scrape_game.read_fetch_meta(2016, 20001)
+
+    server.routes['/pbp'] = [(503, {}, b'')]
+    scrape_game.scrape_game(2016, 20001, fetcher = _fetcher(retries = 0), revalidate = True)
+    assert scrape_game.read_game_page(2016, 20001, 'pbp') == page
+    assert scrape_game.read_fetch_meta(2016, 20001)['pbp']['sha256'] == meta['pbp']['sha256']
@@ -0,0 +1,74 @@
+"""
+Tests that importing the package's modules is cheap: no pandas, numpy, feather, or pyarrow at module level, and no
+reading or writing of files. Each module is imported in a fresh interpreter.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import PACKAGE_FOLDER
+
+### Dash apps, which import dash at module level by design
+DASH_APPS = ('home', 'rollingcf')
+HEAVY_MODULES = ('pandas', 'numpy', 'feather', 'pyarrow')
+MODULES = sorted(filename[:-3] for filename in os.listdir(PACKAGE_FOLDER)
+                 if filename[-3:] == '.py' and filename != '__init__.py' and filename[:-3] not in DASH_APPS)
+
+CODE = '''
+import sys, json
+import {0:s}
+print(json.dumps([name for name in {1!r} if name in sys.modules]))
+'''
+
+def _import_in_fresh_interpreter(module, cwd, env):
+    output = subprocess.check_output([sys.executable, '-c', CODE.format(module, HEAVY_MODULES)], cwd = cwd, env = env)
+    return json.loads(output.decode('utf-8').strip().split('\n')[-1])
+
+@pytest.fixture
+def empty_save_folder(tmp_path):
+    """
+    An environment whose save folder does not exist, so any file written at import time would create it.
+    """
+    folder = str(tmp_path / 'data')
+    env = dict(os.environ, SCRAPENHL_SAVE_FOLDER = folder)
+    env['PYTHONPATH'] = os.pathsep.join([PACKAGE_FOLDER, os.path.dirname(PACKAGE_FOLDER)] +
+                                        ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    return folder, env
+
+@pytest.mark.parametrize('module', MODULES)
+def test_module_import_is_light(module, empty_save_folder, tmp_path):
+    folder, env = empty_save_folder
+    assert _import_in_fresh_interpreter(module, str(tmp_path), env) == []
+    assert not os.path.exists(folder)
+    assert os.listdir(str(tmp_path)) == []
+
+def test_package_import_is_light(empty_save_folder, tmp_path):
+    folder, env = empty_save_folder
+    assert _import_in_fresh_interpreter('scrapenhl', str(tmp_path), env) == []
+    assert not os.path.exists(folder)
+
+def test_settings_are_resolved_on_first_use(empty_save_folder, tmp_path):
+    folder, env = empty_save_folder
+    code = 'import sys, scrapenhl_globals\n' \
+           'print(scrapenhl_globals.SAVE_FOLDER)\n' \
+           'print(scrapenhl_globals.PLAYER_ID_FILE)\n' \
+           'print("pandas" in sys.modules)'
+    output = subprocess.check_output([sys.executable, '-c', code], cwd = str(tmp_path), env = env)
+    assert output.decode('utf-8').split() == [folder, os.path.join(folder, 'reference', 'playerids.feather'),
+                                              'False']
+
+def test_ambiguous_player_name(save_folder, capsys):
+    import reference_store
+    import scrapenhl_globals
+    store = reference_store.get_reference_store()
+    store.add_players([('8471214', 'Same Name', 'WSH', 'C', 8, 'L'), ('8471214', 'Same Name', 'WSH', 'C', 8, 'L'),
+                       ('8474590', 'Same Name', 'BOS', 'D', 74, 'R')])
+    store.flush()
+
+    assert str(scrapenhl_globals.player_name_to_id('Same Name')) == '8471214'
+    assert 'Found multiple matches for Same Name' in capsys.readouterr().out
+    assert str(scrapenhl_globals.player_name_to_id('Same Name', 'BOS')) == '8474590'
@@ -0,0 +1,107 @@
+"""
+Tests for logcache.py and the team log reads in scrape_season that go through it.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import logcache
+import scrape_season
+import scrapenhl_globals
+
+def _df(value, rows = 1000):
+    return pd.DataFrame({'A': np.full(rows, value, dtype = np.int64), 'B': np.arange(rows, dtype = np.float64)})
+
+def _size(df):
+    return int(df.memory_usage(index = True, deep = True).sum())
+
+def _key(i):
+    ### Keys are (path, version); entries with the same path are versions of one log
+    return ('log{0:d}'.format(i), 1)
+
+def _loader(df, calls):
+    def load():
+        calls.append(1)
+        return df
+    return load
+
+def test_evicts_least_recently_used():
+    cache = logcache.LRUCache(2 * _size(_df(0)))
+    calls = []
+    for i in range(3):
+        cache.get(_key(i), _loader(_df(i), calls))
+    assert cache.get_stats()['entries'] == 2
+    assert cache.get_stats()['evictions'] == 1
+    ### Log 0 was evicted; getting it again evicts log 1, the least recently used
+    cache.get(_key(2), _loader(_df(2), calls))
+    cache.get(_key(0), _loader(_df(0), calls))
+    assert len(calls) == 4
+    assert set(cache._entries) == {_key(0), _key(2)}
+    assert cache.bytes == 2 * _size(_df(0))
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 4, 2)
+
+def test_oversized_and_stale_entries_are_not_kept():
+    cache = logcache.LRUCache(_size(_df(0)))
+    cache.put(('big', 1), _df(0, rows = 2000))
+    assert cache.get_stats()['entries'] == 0
+    cache.put(('log', 1), _df(1, rows = 100))
+    cache.put(('log', 2), _df(2, rows = 100))
+    assert list(cache._entries) == [('log', 2)]
+    assert cache.bytes == _size(_df(2, rows = 100))
+
+def test_results_are_copies():
+    cache = logcache.LRUCache(2 ** 20)
+    df = cache.get(('log', 1), lambda: _df(1))
+    df['C'] = 1
+    df['A'] = 5
+    cached = cache.get(('log', 1), lambda: None)
+    assert cached.columns.tolist() == ['A', 'B']
+    assert (cached.A == 1).all()
+
+def test_spill_to_disk(tmp_path):
+    folder = str(tmp_path / 'spill')
+    os.makedirs(folder)
+    cache = logcache.LRUCache(_size(_df(0)), folder, max_spill_bytes = 10 ** 9)
+    calls = []
+    cache.get(_key(0), _loader(_df(0), calls))
+    cache.get(_key(1), _loader(_df(1), calls))
+    assert len(os.listdir(folder)) == 1
+    pd.testing.assert_frame_equal(cache.get(_key(0), _loader(_df(0), calls)), _df(0))
+    assert len(calls) == 2
+    assert cache.get_stats()['spill_hits'] == 1
+
+    ### Another cache (e.g. in another process) reuses the spilled files
+    other = logcache.LRUCache(10 ** 9, folder)
+    pd.testing.assert_frame_equal(other.get(_key(1), _loader(_df(1), calls)), _df(1))
+    assert len(calls) == 2
+
+    ### The spill folder is capped too, oldest files first
+    spillsize = os.path.getsize(os.path.join(folder, os.listdir(folder)[0]))
+    cache.max_spill_bytes = 2 * spillsize
+    for i in range(2, 6):
+        cache.get(_key(i), _loader(_df(i), calls))
+    assert len(os.listdir(folder)) <= 2
+    assert os.path.exists(cache._get_spill_filename(_key(4)))
+
+def test_team_logs_are_cached_until_rewritten(updated_season, monkeypatch):
+    monkeypatch.setattr(scrapenhl_globals, 'TEAMLOG_CACHE_SPILL', True)
+    first = scrape_season.get_team_pbplog(2016, 'WSH')
+    second = scrape_season.get_team_pbplog(2016, 'WSH')
+    stats = logcache.get_teamlog_cache().get_stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+    pd.testing.assert_frame_equal(first, second)
+
+    ### A game's partition is rewritten (and one removed), so the log is reread
+    scrape_season.update_teamlogs(2016, games = [20002])
+    os.remove(os.path.join(scrape_season.get_team_pbplog_folder(2016, 'WSH'),
+                           sorted(os.listdir(scrape_season.get_team_pbplog_folder(2016, 'WSH')))[-1]))
+    third = scrape_season.get_team_pbplog(2016, 'WSH')
+    assert logcache.get_teamlog_cache().get_stats()['misses'] == 2
+    assert logcache.get_teamlog_cache().get_stats()['entries'] == 1
+    pd.testing.assert_frame_equal(third, scrape_season._load_teamlog(
+        scrape_season.get_team_pbplog_folder(2016, 'WSH'), scrape_season.get_team_pbplog_filename(2016, 'WSH')))
+    assert len(third) < len(first)
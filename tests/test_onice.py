@@ -0,0 +1,83 @@
+"""
+Tests for the shift interval index in onice.py.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import read_data_json
+
+import onice
+import scrape_game
+
+EDGE_CASES = read_data_json('shifts_edge_cases.json')
+
+def _index_and_intervals(cases):
+    """
+    Builds an index over several games' shift charts, one game per case. Returns the index, the raw intervals as a
+    dataframe, and the goalie IDs.
+    """
+    pieces = []
+    goalies = set()
+    for game, case in enumerate(cases, 20001):
+        data = EDGE_CASES[case]['data']
+        ids, teams, starts, ends, durations = scrape_game.read_shift_intervals_from_json(data)
+        pieces.append(pd.DataFrame({'Game': game, 'Player': ids, 'Home': teams == EDGE_CASES[case]['home'],
+                                    'Start': starts, 'End': np.maximum(ends, starts)}))
+        ### Goalies play the longest shifts in these charts
+        for home in (True, False):
+            team = pieces[-1][pieces[-1].Home == home]
+            goalies.add(int(team.Player[(team.End - team.Start).idxmax()]))
+    intervals = pd.concat(pieces, ignore_index = True)
+    index = onice.ShiftIntervalIndex(intervals.Game, intervals.Player, intervals.Home, intervals.Start,
+                                     intervals.End, goalies = goalies)
+    return index, intervals, goalies
+
+def _brute_force(intervals, goalies, game, second):
+    """
+    Returns the expected on_ice row for one query, by scanning every shift.
+    """
+    on = intervals[(intervals.Game == game) & (intervals.Start <= second) & (intervals.End >= second)]
+    row = []
+    for home in (True, False):
+        players = sorted(set(on[on.Home == home].Player))
+        skaters = [p for p in players if p not in goalies][:6]
+        goalie = [p for p in players if p in goalies][:1]
+        row += skaters + [0] * (6 - len(skaters)) + (goalie or [0])
+    return row
+
+@pytest.mark.parametrize('chunksize', [50000, 7])
+def test_on_ice_matches_brute_force(chunksize):
+    cases = ['period_crossing', 'overlapping', 'too_many_men', 'duplicate']
+    index, intervals, goalies = _index_and_intervals(cases)
+    games = np.repeat(np.arange(20001, 20001 + len(cases)), 3700)
+    seconds = np.tile(np.arange(-10, 3690), len(cases))
+    result = index.on_ice(games, seconds, chunksize = chunksize)
+    assert result.shape == (len(seconds), len(onice.ON_ICE_COLUMNS))
+    for i in range(0, len(seconds), 11):
+        assert result[i].tolist() == _brute_force(intervals, goalies, games[i], seconds[i]), (games[i], seconds[i])
+
+def test_too_many_men_shows_every_player():
+    index, intervals, goalies = _index_and_intervals(['too_many_men'])
+    result = index.on_ice(np.full(3600, 20001), np.arange(3600))
+    ### The toi table only has six columns per team, but the index keeps six skaters plus the goalie
+    assert ((result[:, :6] != 0).sum(axis = 1) + (result[:, 6] != 0)).max() == 7
+
+def test_unknown_games_and_empty_index():
+    index, intervals, goalies = _index_and_intervals(['overlapping'])
+    assert (index.on_ice([29999, 20001], [100, -5]) == 0).all()
+    empty = onice.ShiftIntervalIndex([], [], [], [], [], goalies = set())
+    assert (empty.on_ice([20001], [100]) == 0).all()
+
+def test_index_from_season_matches_toi(updated_season):
+    index = onice.ShiftIntervalIndex.from_season(2016)
+    assert index.games.tolist() == updated_season
+    for game in updated_season[:2]:
+        toi = pd.read_hdf(scrape_game.get_parsed_shifts_save_filename(2016, game))
+        result = index.on_ice(np.full(len(toi), game), toi.Time.values)
+        home, road = ('WSH', 'BOS') if game % 2 == 1 else ('BOS', 'WSH')
+        for side, team in ((slice(0, 7), home), (slice(7, 14), road)):
+            cols = [col for col in toi.columns if col[:3] == team and col[3:].isdigit()]
+            expected = [set(int(x) for x in row if x == x) for row in toi[cols].values]
+            assert [set(int(x) for x in row if x != 0) for row in result[:, side]] == expected
@@ -0,0 +1,44 @@
+"""
+Tests for pbpmethods.get_toi, on the synthetic season from feeds.write_season.
+"""
+
+import pandas as pd
+import pytest
+
+import feeds
+import pbpmethods
+import scrape_season
+
+def _brute_force(team):
+    df = scrape_season._load_teamlog(scrape_season.get_team_toilog_folder(2016, team),
+                                     scrape_season.get_team_toilog_filename(2016, team))
+    playercols = [col for col in df.columns if col[:3] == team and col[3:].isdigit()]
+    totals = {}
+    for strength, ids in zip(df.Strength.astype(str), df[playercols].values.tolist()):
+        for pid in ids:
+            if pd.notnull(pid) and pid > 0:
+                totals[(int(pid), strength)] = totals.get((int(pid), strength), 0) + 1
+    return totals
+
+def _totals(df, team):
+    df = df[df.Team == team]
+    return {(int(pid), strength): int(toi) for pid, strength, toi in zip(df.Player, df.Strength, df.TOI)}
+
+@pytest.mark.parametrize('batch_size, workers', [(65536, 1), (500, 1), (1000, 2)])
+def test_toi_matches_brute_force(updated_season, batch_size, workers):
+    df = pbpmethods.get_toi(2016, batch_size = batch_size, workers = workers)
+    assert df.columns.tolist() == ['Season', 'Team', 'Player', 'Strength', 'TOI']
+    assert sorted(df.Team.unique()) == ['BOS', 'WSH']
+    for team in ('WSH', 'BOS'):
+        assert _totals(df, team) == _brute_force(team)
+    ### The goalies played every second of every game
+    goalies = df[df.Player.isin([feeds.WSH[3], feeds.BOS[3]])].groupby('Player').TOI.sum()
+    assert goalies.tolist() == [3600 * len(updated_season)] * 2
+
+def test_toi_filters(updated_season):
+    df = pbpmethods.get_toi([2016], teams = 'WSH', strengths = ['5v5'])
+    assert df.Team.unique().tolist() == ['WSH']
+    assert df.Strength.unique().tolist() == ['5v5']
+    assert _totals(df, 'WSH') == {key: toi for key, toi in _brute_force('WSH').items() if key[1] == '5v5'}
+    assert len(pbpmethods.get_toi(2016, teams = 'NYR')) == 0
+    assert len(pbpmethods.get_toi(2015)) == 0
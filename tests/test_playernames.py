@@ -0,0 +1,113 @@
+"""
+Tests for playernames.py and the name lookups in scrapenhl_globals that use it.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import playernames
+import scrapenhl_globals
+
+def _write_players(rows):
+    """
+    Writes a player ID file with the given (ID, name, team, count) rows.
+    """
+    df = pd.DataFrame(rows, columns = ['ID', 'Name', 'Team', 'Count'])
+    df = df.assign(ID = df.ID.astype(str), Pos = 'C', **{'#': 8}, Hand = 'L')
+    scrapenhl_globals.write_player_id_file(df)
+
+PLAYERS = [(8471214, 'Alex Ovechkin', 'WSH', 80), (8471214, 'Alexander Ovechkin', 'WSH', 2),
+           (8474590, 'John Carlson', 'WSH', 80), (8474589, 'John Carlson', 'BOS', 5),
+           (8470638, 'Patrice Bergeron', 'BOS', 80), (8474056, 'P.K. Subban', 'MTL', 80),
+           (8470612, 'Ryan Getzlaf', 'ANA', 80), (8471685, 'Anze Kopitar', 'LAK', 80),
+           (8477934, 'Leon Draisaitl', 'EDM', 80)]
+
+@pytest.fixture
+def players(save_folder):
+    _write_players(PLAYERS)
+    return PLAYERS
+
+def test_ids_to_names_uses_most_common_spelling(players):
+    assert playernames.player_ids_to_names([8471214, 8474590.0, 1]) == ['Alex Ovechkin', 'John Carlson', None]
+    assert scrapenhl_globals.player_id_to_name(8470638) == 'Patrice Bergeron'
+
+def test_names_to_ids_exact_contains_and_team_helper(players):
+    assert playernames.player_names_to_ids(['Patrice Bergeron', 'Kopitar', 'Nobody']) == [8470638, 8471685, None]
+    ### Exact matches win over names containing the query
+    assert playernames.player_names_to_ids(['Alex Ovechkin']) == [8471214]
+    assert playernames.player_names_to_ids(['John Carlson']) == [8474590]
+    assert playernames.player_names_to_ids(['John Carlson'], team_helper = 'BOS') == [8474589]
+    assert scrapenhl_globals.player_name_to_id('John Carlson', team_helper = ['BOS']) == 8474589
+
+def test_prefix_and_substring_searches(players):
+    index = playernames.get_player_name_index()
+    assert index.names_starting_with('Alex') == ['Alex Ovechkin', 'Alexander Ovechkin']
+    assert index.names_containing('Ovechkin') == ['Alex Ovechkin', 'Alexander Ovechkin']
+    assert index.names_containing('an') == sorted(name for pid, name, team, count in PLAYERS[1:] if 'an' in name)
+    assert index.names_containing('zzz') == []
+
+def test_index_is_reused_until_file_changes(players):
+    index = playernames.get_player_name_index()
+    assert playernames.get_player_name_index() is index
+
+    _write_players(PLAYERS + [(8478402, 'Connor McDavid', 'EDM', 80)])
+    ### Make sure the modification time moves even on file systems with coarse timestamps
+    mtime = os.path.getmtime(scrapenhl_globals.PLAYER_ID_FILE)
+    os.utime(scrapenhl_globals.PLAYER_ID_FILE, (mtime + 10, mtime + 10))
+    assert playernames.get_player_name_index() is not index
+    assert playernames.player_names_to_ids(['Connor McDavid']) == [8478402]
+
+def test_empty_player_file(save_folder):
+    assert playernames.player_ids_to_names([8471214]) == [None]
+    assert playernames.player_names_to_ids(['Alex Ovechkin']) == [None]
+
+def _brute_force_scores(pname):
+    grams = playernames._get_trigrams(playernames._normalize_name(pname))
+    index = playernames.get_player_name_index()
+    scores = {}
+    for name in index.names:
+        other = playernames._get_trigrams(playernames._normalize_name(name))
+        score = 2 * len(grams & other) / (len(grams) + len(other))
+        for pid, team, count in index.name_rows[name]:
+            scores[pid] = max(scores.get(pid, 0), score)
+    return scores
+
+def test_normalize_name():
+    assert playernames._normalize_name('P.K. Subban') == 'pk subban'
+    assert playernames._normalize_name('  Anže  Kopitar ') == 'anze kopitar'
+    assert playernames._normalize_name("Ryan O'Reilly-Smith") == 'ryan oreilly smith'
+
+@pytest.mark.parametrize('pname, pid', [('Ovechkin', 8471214), ('alex ovechkn', 8471214), ('PK Subban', 8474056),
+                                        ('Anže Kopitar', 8471685), ('Leon Draisatl', 8477934),
+                                        ('getzlaf ryan', 8470612)])
+def test_fuzzy_match_finds_misspellings(players, pname, pid):
+    matches = playernames.get_player_name_index().fuzzy_match(pname, limit = 3)
+    assert matches[0][0] == pid
+    scores = _brute_force_scores(pname)
+    for matchid, name, score in matches:
+        assert score == pytest.approx(scores[matchid])
+    assert [score for matchid, name, score in matches] == sorted(scores.values(), reverse = True)[:len(matches)]
+
+def test_fuzzy_match_team_helper_and_min_score(players):
+    index = playernames.get_player_name_index()
+    assert index.fuzzy_match('Jon Carlson')[0][0] == 8474590
+    assert index.fuzzy_match('Jon Carlson', team_helper = 'BOS')[0][0] == 8474589
+    assert index.fuzzy_match('Qwxz Jkvb') == []
+    assert all(score >= 0.6 for pid, name, score in index.fuzzy_match('Bergeron', min_score = 0.6))
+
+def test_exact_lookup_falls_back_to_fuzzy_match(players, capsys):
+    assert scrapenhl_globals.player_name_to_id('Patrice Bergeon') == 8470638
+    assert 'closest fuzzy match: Patrice Bergeron' in capsys.readouterr().out
+    assert scrapenhl_globals.player_name_to_id('Qwxz Jkvb') is None
+
+def test_fuzzy_match_names_in_bulk(players):
+    df = playernames.fuzzy_match_names(['Jon Carlsen', 'Qwxz Jkvb', 'Jon Carlsen'], limit = 2)
+    assert df.columns.tolist() == ['Name', 'Rank', 'ID', 'Match', 'Score']
+    carlson = df[df.Name == 'Jon Carlsen']
+    assert carlson.Rank.tolist() == [1, 2, 1, 2]
+    assert carlson.ID.tolist() == [8474590, 8474589] * 2
+    assert (carlson.Match == 'John Carlson').all()
+    missing = df[df.Name == 'Qwxz Jkvb']
+    assert len(missing) == 1 and pd.isnull(missing.ID.iloc[0])
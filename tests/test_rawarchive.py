@@ -0,0 +1,152 @@
+"""
+Tests for rawarchive.py, and reading and writing raw pages through the season archive.
+"""
+
+import os
+
+import pytest
+
+import feeds
+import rawarchive
+import scrape_game
+import scrape_season
+import scrapenhl_globals
+
+def _read_pages(games):
+    return {(game, kind): scrape_game.read_game_page(2016, game, kind) for game in games for kind in rawarchive.KINDS}
+
+def test_write_and_read_pages(save_folder, monkeypatch):
+    monkeypatch.setattr(scrapenhl_globals, 'USE_RAW_ARCHIVE', True)
+    games = feeds.write_season(2016)
+    assert scrape_game.list_raw_files(2016) == []
+    assert rawarchive.list_games(2016) == games
+    assert scrape_game.list_raw_games(2016) == games
+    assert scrape_season.list_scraped_games(2016) == games
+    assert scrape_game.raw_page_exists(2016, 20003, 'shift')
+    assert not scrape_game.raw_page_exists(2016, 20007, 'pbp')
+    assert scrape_game.read_game_page(2016, 20007, 'pbp') is None
+    assert b'liveData' in scrape_game.read_game_page(2016, 20003, 'pbp')
+
+    ### A page written again supersedes the first copy, until compacted away
+    pages = _read_pages(games)
+    feeds.write_game(2016, 20003, seed = 99)
+    assert scrape_game.read_game_page(2016, 20003, 'pbp') != pages[(20003, 'pbp')]
+    pages = _read_pages(games)
+    assert len(rawarchive.read_index(2016)) == 2 * len(games) + 2
+    before, after = rawarchive.compact(2016)
+    assert after < before
+    assert len(rawarchive.read_index(2016)) == 2 * len(games)
+    assert _read_pages(games) == pages
+
+def test_pack_and_unpack_season(save_folder):
+    games = feeds.write_season(2016)
+    pages = _read_pages(games)
+    assert rawarchive.pack_season(2016) == 2 * len(games)
+    assert scrape_game.list_raw_files(2016) == []
+    assert _read_pages(games) == pages
+
+    rawarchive.unpack_season(2016)
+    assert not os.path.exists(rawarchive.get_pack_filename(2016))
+    assert scrape_game.list_raw_files(2016) == games
+    assert rawarchive.list_games(2016) == []
+    assert _read_pages(games) == pages
+
+def test_index_survives_interrupted_write_and_other_writers(save_folder):
+    games = feeds.write_season(2016, range(20001, 20003))
+    rawarchive.pack_season(2016)
+    pages = _read_pages(games)
+    ### A partial record at the end of the index is ignored, then overwritten by the next write
+    with open(rawarchive.get_index_filename(2016), 'ab') as writer:
+        writer.write(b'\x01\x02\x03')
+    rawarchive.close()
+    assert _read_pages(games) == pages
+    rawarchive.write_blob(2016, 20003, 'pbp', scrape_game.read_raw_blob(2016, 20001, 'pbp'))
+    assert len(rawarchive.read_index(2016)) == 5
+    assert scrape_game.read_game_page(2016, 20003, 'pbp') == pages[(20001, 'pbp')]
+
+    ### Appends by someone else (here, a second state) are picked up when the files change size
+    state = rawarchive._ARCHIVES.pop(scrapenhl_globals.get_season_folder(2016))
+    rawarchive.write_blob(2016, 20004, 'shift', scrape_game.read_raw_blob(2016, 20002, 'shift'))
+    rawarchive._ARCHIVES[scrapenhl_globals.get_season_folder(2016)] = state
+    assert rawarchive.has_page(2016, 20004, 'shift')
+    assert scrape_game.read_game_page(2016, 20004, 'shift') == pages[(20002, 'shift')]
+
+def test_packed_season_updates_like_files(updated_season):
+    import corsi
+    table = corsi.get_player_corsi(2016)
+    rawarchive.pack_season(2016)
+    done = scrape_season.update(2016, games = updated_season)
+    assert done == {'parse': [], 'teamlogs': [], 'toimatrix': [], 'corsi': []}
+    scrape_season.parse_games(2016, updated_season, force_overwrite = True)
+    corsi.update_player_corsi(2016, force_overwrite = True)
+    assert corsi.get_player_corsi(2016).equals(table)
+
+@pytest.mark.parametrize('interrupted_at', [1, 2])
+def test_interrupted_compaction_keeps_every_page(save_folder, monkeypatch, interrupted_at):
+    games = feeds.write_season(2016, range(20001, 20004))
+    rawarchive.pack_season(2016)
+    feeds.write_game(2016, 20002, seed = 99)
+    rawarchive.write_blob(2016, 20002, 'pbp', scrape_game.read_raw_blob(2016, 20002, 'pbp'))
+    os.remove(scrape_game.get_raw_filename(2016, 20002, 'pbp'))
+    os.remove(scrape_game.get_raw_filename(2016, 20002, 'shift'))
+    pages = _read_pages(games)
+
+    ### Stop before the pack is swapped in (1), or between swapping the pack and the index (2)
+    replace = os.replace
+    calls = []
+    def interrupted_replace(source, target):
+        calls.append(source)
+        if len(calls) == interrupted_at:
+            raise KeyboardInterrupt
+        replace(source, target)
+    monkeypatch.setattr(os, 'replace', interrupted_replace)
+    with pytest.raises(KeyboardInterrupt):
+        rawarchive.compact(2016)
+    monkeypatch.setattr(os, 'replace', replace)
+
+    rawarchive.close()
+    assert _read_pages(games) == pages
+    assert len(rawarchive.read_index(2016)) == 2 * len(games) + (1 if interrupted_at == 1 else 0)
+    assert not any(filename.endswith('.tmp') for filename in os.listdir(scrapenhl_globals.get_season_folder(2016)))
+    rawarchive.compact(2016)
+    assert _read_pages(games) == pages
+
+def _append_pages(folder, first, count, blob):
+    scrapenhl_globals.configure(save_folder = folder)
+    ### Load the index first, so this process's cached state goes stale as the others append
+    rawarchive.has_page(2016, first, 'pbp')
+    for game in range(first, first + count):
+        rawarchive.write_blob(2016, game, 'pbp', blob)
+
+def test_appends_from_several_processes(save_folder):
+    import multiprocessing
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('needs fork')
+    games = feeds.write_season(2016, range(20001, 20002))
+    rawarchive.pack_season(2016)
+    blob = scrape_game.read_raw_blob(2016, 20001, 'pbp')
+    rawarchive.close()
+
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target = _append_pages, args = (save_folder, 21000 + 100 * i, 25, blob))
+                 for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    expected = scrape_game.read_game_page(2016, 20001, 'pbp')
+    written = [game for i in range(4) for game in range(21000 + 100 * i, 21025 + 100 * i)]
+    assert len(rawarchive.read_index(2016)) == 2 + len(written)
+    assert all(rawarchive.read_page(2016, game, 'pbp') == expected for game in written)
+
+def test_scraped_games_need_a_pbp_page(save_folder):
+    games = feeds.write_season(2016, range(20001, 20004))
+    rawarchive.pack_season(2016)
+    feeds.write_game(2016, 20004)
+    os.remove(scrape_game.get_raw_filename(2016, 20004, 'pbp'))
+    rawarchive.write_blob(2016, 20005, 'shift', scrape_game.read_raw_blob(2016, 20001, 'shift'))
+    assert scrape_game.list_raw_games(2016) == games + [20004, 20005]
+    assert scrape_season.list_scraped_games(2016) == games
+    assert scrape_season.list_scraped_games(2015) == []
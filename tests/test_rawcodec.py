@@ -0,0 +1,75 @@
+"""
+Tests for rawcodec.py, and reading raw pages written with either codec.
+"""
+
+import json
+import zlib
+
+import pytest
+
+import feeds
+import rawcodec
+import scrape_game
+import scrapenhl_globals
+
+zstandard = pytest.importorskip('zstandard')
+
+def _pages():
+    return {'pbp': json.dumps(feeds.get_game_feed(2016, 20001)).encode(),
+            'shift': json.dumps(feeds.get_shift_feed(feeds.get_line_segments())).encode()}
+
+@pytest.mark.parametrize('codec', ['zstd', 'zlib'])
+def test_round_trip(codec):
+    for kind, page in _pages().items():
+        blob = rawcodec.compress(page, kind, codec)
+        assert rawcodec.detect_codec(blob) == codec
+        assert rawcodec.decompress(blob) == page
+        assert len(blob) < len(page)
+
+def test_default_codec(monkeypatch):
+    assert rawcodec.get_codec() == 'zstd'
+    monkeypatch.setattr(scrapenhl_globals, 'RAW_CODEC', 'zlib')
+    assert rawcodec.get_codec() == 'zlib'
+    assert rawcodec.detect_codec(rawcodec.compress(b'{}')) == 'zlib'
+
+def test_zlib_pages_written_before_zstd_still_read(save_folder):
+    scrapenhl_globals.create_season_folder(2016)
+    page = _pages()['pbp']
+    with open(scrape_game.get_json_save_filename(2016, 20001), 'wb') as writer:
+        writer.write(zlib.compress(page, level = 9))
+    assert scrape_game.read_game_page(2016, 20001, 'pbp') == page
+
+def test_dictionaries(save_folder):
+    games = feeds.write_season(2016, range(20001, 20041))
+    plain = {game: rawcodec.compress(scrape_game.read_game_page(2016, game, 'pbp'), 'pbp') for game in games}
+
+    first = rawcodec.train_dictionary(2016, 'pbp', size = 8192)
+    page = scrape_game.read_game_page(2016, 20001, 'pbp')
+    blob = rawcodec.compress(page, 'pbp')
+    assert zstandard.get_frame_parameters(blob).dict_id == first
+    assert len(blob) < len(plain[20001])
+    ### Shift pages have no dictionary yet
+    assert zstandard.get_frame_parameters(rawcodec.compress(b'{"data": []}', 'shift')).dict_id == 0
+
+    ### Frames written with an older dictionary, or none, still read after a new one is trained
+    second = rawcodec.train_dictionary(2016, 'pbp', size = 4096)
+    assert second != first
+    rawcodec._DICTIONARIES.clear()
+    rawcodec._THREAD_STATE.state = {}
+    assert rawcodec.decompress(blob) == page
+    assert rawcodec.decompress(plain[20001]) == page
+    assert zstandard.get_frame_parameters(rawcodec.compress(page, 'pbp')).dict_id == second
+
+def test_migrate_season_keeps_contents_and_does_not_reparse(updated_season, monkeypatch):
+    import scrape_season
+    pages = {game: (scrape_game.read_game_page(2016, game, 'pbp'), scrape_game.read_game_page(2016, game, 'shift'))
+             for game in updated_season}
+    before, after = rawcodec.migrate_season(2016, 'zlib')
+    assert before < after
+    for game in updated_season:
+        for kind in ('pbp', 'shift'):
+            with open(scrape_game.get_raw_filename(2016, game, kind), 'rb') as reader:
+                assert rawcodec.detect_codec(reader.read()) == 'zlib'
+        assert (scrape_game.read_game_page(2016, game, 'pbp'), scrape_game.read_game_page(2016, game, 'shift')) == \
+            pages[game]
+    assert scrape_season.update(2016, games = updated_season)['parse'] == []
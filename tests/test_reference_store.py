@@ -0,0 +1,144 @@
+"""
+Tests for reference_store.py.
+"""
+
+import multiprocessing
+
+import pytest
+
+import reference_store
+import scrapenhl_globals
+
+def _player(pid, name = None, team = 'WSH', pos = 'C'):
+    return (str(pid), name or 'Player {0:d}'.format(pid), team, pos, 8, 'L')
+
+def _game(game, home = 'WSH', away = 'BOS'):
+    return {'Season': 2016, 'Game': game, 'Datetime': '2016-10-12T23:00:00Z', 'Venue': 'Capital One Arena',
+            'Home': home, 'HomeCoach': 'Coach H', 'HomeScore': 3, 'Away': away, 'AwayCoach': 'Coach A',
+            'AwayScore': 2}
+
+def _read_store():
+    return reference_store.ReferenceStore(flush_every = None, flush_at_exit = False)
+
+def _reread():
+    """
+    Returns a new store with the tables on disk loaded.
+    """
+    store = _read_store()
+    store._load()
+    return store
+
+def test_store_round_trip(save_folder):
+    store = _read_store()
+    store.add_team(15, 'WSH', 'Washington Capitals')
+    store.add_players([_player(8471214), _player(8471214), _player(8474590)])
+    store.add_game(_game(20001))
+    store.flush()
+
+    reread = _reread()
+    assert reread.get_team_abbreviation(15) == 'WSH'
+    assert reread.players == {_player(8471214): 2, _player(8474590): 1}
+    assert reread.get_game(2016, 20001)['Home'] == 'WSH'
+    assert len(scrapenhl_globals.get_player_id_file()) == 2
+
+def test_store_flushes_every_n_games(save_folder):
+    import os
+    store = reference_store.ReferenceStore(flush_every = 2, flush_at_exit = False)
+    store.add_team(15, 'WSH', 'Washington Capitals')
+    store.game_done()
+    assert not os.path.exists(scrapenhl_globals.TEAM_ID_FILE)
+    store.game_done()
+    assert os.path.exists(scrapenhl_globals.TEAM_ID_FILE)
+
+def test_concurrent_stores_do_not_lose_updates(save_folder):
+    first = _read_store()
+    second = _read_store()
+    first.add_team(15, 'WSH', 'Washington Capitals')
+    first.add_players([_player(8471214)])
+    second.add_team(6, 'BOS', 'Boston Bruins')
+    second.add_players([_player(8471214), _player(8470638, team = 'BOS')])
+    second.add_game(_game(20001))
+
+    first.flush()
+    second.flush()
+    first.add_players([_player(8474590)])
+    first.flush()
+
+    reread = _reread()
+    assert reread.teams == {15: ('WSH', 'Washington Capitals'), 6: ('BOS', 'Boston Bruins')}
+    assert reread.players == {_player(8471214): 2, _player(8470638, team = 'BOS'): 1, _player(8474590): 1}
+    assert reread.get_game(2016, 20001) is not None
+    ### The second store's tables now include the first store's additions too
+    assert second.players == {_player(8471214): 2, _player(8470638, team = 'BOS'): 1}
+
+def test_clear_replaces_files(save_folder):
+    store = _read_store()
+    store.add_players([_player(8471214)])
+    store.flush()
+    other = _read_store()
+    other.add_players([_player(8474590)])
+    other.flush()
+
+    store.clear()
+    store.add_players([_player(8470638)])
+    store.flush()
+    assert _reread().players == {_player(8470638): 1}
+
+def _add_players_in_process(folder, first, count):
+    scrapenhl_globals.configure(save_folder = folder)
+    store = _read_store()
+    for pid in range(first, first + count):
+        store.add_players([_player(pid), _player(8471214)])
+        store.flush()
+
+def test_stores_in_several_processes_do_not_lose_updates(save_folder):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('needs fork')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target = _add_players_in_process, args = (save_folder, 8480000 + 100 * i, 10))
+                 for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    players = _reread().players
+    assert players[_player(8471214)] == 40
+    assert len(players) == 41
+
+def test_spawned_store_delta_matches_serial(save_folder):
+    serial = _read_store()
+    serial.add_team(15, 'WSH', 'Washington Capitals')
+    serial.add_players([_player(8471000, pos = 'G')])
+    serial.flush()
+
+    parent = _read_store()
+    child = parent.spawn()
+    child.add_team(6, 'BOS', 'Boston Bruins')
+    child.add_players([_player(8471214), _player(8471000, pos = 'G')])
+    child.add_game(_game(20001))
+    parent.apply_delta(child.get_delta())
+
+    serial.add_team(6, 'BOS', 'Boston Bruins')
+    serial.add_players([_player(8471214), _player(8471000, pos = 'G')])
+    serial.add_game(_game(20001))
+    assert parent.teams == serial.teams
+    assert parent.players == serial.players
+    assert parent.games == serial.games
+
+def test_accessors_load_the_tables(save_folder):
+    store = _read_store()
+    store.add_team(15, 'WSH', 'Washington Capitals')
+    store.add_team(6, 'BOS', 'Boston Bruins')
+    store.add_players([_player(8471000, pos = 'G'), _player(8471214), _player(8475000, team = 'BOS', pos = 'G')])
+    store.add_game(_game(20002, home = 'BOS', away = 'WSH'))
+    store.add_game(_game(20001))
+    store.add_game(dict(_game(20001), Season = 2015))
+    store.flush()
+
+    assert [row['Game'] for row in _read_store().get_season_games(2016)] == [20001, 20002]
+    assert _read_store().get_season_games(2014) == []
+    assert _read_store().get_goalie_ids() == {8471000, 8475000}
+    assert _read_store().get_team_ids('BOS') == [6]
+    assert _read_store().get_team_ids('NYR') == []
@@ -0,0 +1,161 @@
+"""
+Tests for parsing raw pages in scrape_game.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import read_data_json
+
+import benchmarks
+import scrape_game
+
+EDGE_CASES = read_data_json('shifts_edge_cases.json')
+
+def _players_on_ice(toi, team):
+    """
+    Returns the set of players on ice for one team in each second of a toi table.
+    """
+    cols = [col for col in toi.columns if col[:len(team)] == team]
+    return [{int(x) for x in row if not np.isnan(x)} for row in toi[cols].values.astype(float)]
+
+def test_shift_sweep_matches_loop_on_game():
+    ### Shift chart for 2015-16 game 20547 (WPG vs DET), rebuilt from the parsed table in scrapenhl/scrape/2015
+    data = read_data_json('shifts_2015_20547.json')['data']
+    expected = benchmarks._read_shifts_with_loop(data, 'WPG', 'DET')
+    result = scrape_game.read_shifts_from_json(data, 'WPG', 'DET')
+    pd.testing.assert_frame_equal(result, expected)
+    assert list(result.columns) == ['Time'] + ['WPG{0:d}'.format(i) for i in range(1, 7)] + \
+                                   ['DET{0:d}'.format(i) for i in range(1, 7)]
+
+def test_shift_sweep_finds_home_and_road_teams():
+    data = read_data_json('shifts_2015_20547.json')['data']
+    pd.testing.assert_frame_equal(scrape_game.read_shifts_from_json(data),
+                                  scrape_game.read_shifts_from_json(data, 'WPG', 'DET'))
+
+@pytest.mark.parametrize('case', ['period_crossing', 'overlapping', 'too_many_men'])
+def test_shift_sweep_matches_loop_on_edge_cases(case):
+    data = EDGE_CASES[case]['data']
+    expected = benchmarks._read_shifts_with_loop(data, 'WSH', 'PIT')
+    pd.testing.assert_frame_equal(scrape_game.read_shifts_from_json(data, 'WSH', 'PIT'), expected)
+
+def test_shift_crossing_period_end_continues_into_next_period():
+    toi = scrape_game.read_shifts_from_json(EDGE_CASES['period_crossing']['data'], 'WSH', 'PIT')
+    wsh = _players_on_ice(toi, 'WSH')
+    pit = _players_on_ice(toi, 'PIT')
+    ### 19:30 of the first period to 00:00 of the second, which is stored as an end clock of 00:00
+    assert all(8471020 in wsh[t] for t in range(1170, 1200))
+    assert 8471020 not in wsh[1200]
+    ### 19:50 of the second period to 00:20 of the third
+    assert all(8475020 in pit[t] for t in range(2390, 2420))
+    assert 8475020 not in pit[2420]
+
+def test_shift_sweep_keeps_one_entry_for_duplicate_shifts():
+    data = EDGE_CASES['duplicate']['data']
+    ### The original loop cannot reshape a table with the same player twice in a second
+    with pytest.raises(ValueError):
+        benchmarks._read_shifts_from_json_loop(data, 'WSH', 'PIT')
+
+    result = scrape_game.read_shifts_from_json(data, 'WSH', 'PIT')
+    deduplicated = scrape_game.read_shifts_from_json(data[:41] + data[42:], 'WSH', 'PIT')
+    assert data[40] == data[41]
+    assert len(result) == len(deduplicated)
+    for team in ('WSH', 'PIT'):
+        assert _players_on_ice(result, team) == _players_on_ice(deduplicated, team)
+
+def test_shift_sweep_returns_none_without_shifts():
+    assert scrape_game.read_shifts_from_json([]) is None
+
+def _get_plays():
+    """
+    Returns the plays of a synthetic game, with the shapes the extractor has to handle: no team, one player, no
+    coordinates, and only one coordinate.
+    """
+    import feeds
+    plays = feeds.get_game_feed(2016, 20001, events = 60)['liveData']['plays']['allPlays']
+    plays[1].pop('team', None)
+    plays[1].pop('players', None)
+    plays[2]['players'] = plays[2].get('players', [])[:1] or [{'player': {'id': 8471001}, 'playerType': 'Hitter'}]
+    plays[3]['coordinates'] = {}
+    plays[4]['coordinates'] = {'x': 10}
+    plays[5]['about']['period'] = 4
+    plays[5]['about']['periodTime'] = '03:07'
+    return plays
+
+def test_read_events_matches_list_extractor():
+    plays = _get_plays()
+    events = scrape_game.read_events_from_json(plays)
+    expected = benchmarks._read_events_from_json_lists(plays)
+
+    for col in ('Index', 'Period', 'Time', 'Team', 'Actor', 'ActorRole', 'Recipient', 'RecipientRole', 'Note'):
+        assert events[col].tolist() == expected[col].tolist(), col
+    assert events.Event.astype(str).tolist() == expected.Event.tolist()
+    x, y = zip(*expected.XY)
+    np.testing.assert_array_equal(events.X.values, np.array(x, dtype = np.float32))
+    np.testing.assert_array_equal(events.Y.values, np.array(y, dtype = np.float32))
+
+def test_read_events_types():
+    events = scrape_game.read_events_from_json(_get_plays())
+    assert events.Period.dtype == np.int32 and events.Seconds.dtype == np.int16
+    assert isinstance(events.Event.dtype, pd.CategoricalDtype)
+    assert events.Team.dtype == events.Actor.dtype == events.Recipient.dtype == np.int64
+    assert events.X.dtype == events.Y.dtype == np.float32
+
+    assert (events.Team[1], events.Actor[1], events.Recipient[1], events.ActorRole[1]) == (-1, -1, -1, '')
+    assert events.Recipient[2] == -1 and events.Actor[2] > 0
+    assert np.isnan(events.X[3]) and np.isnan(events.X[4]) and np.isnan(events.Y[4])
+    ### Seconds is on the toi table's axis: 1200 per period
+    assert events.Seconds[5] == 3 * 1200 + 187
+    periods, clocks = events.Period.values, events.Time.str.split(':')
+    assert events.Seconds.tolist() == [1200 * (p - 1) + 60 * int(m) + int(s) for p, (m, s) in zip(periods, clocks)]
+
+def test_read_events_without_plays():
+    events = scrape_game.read_events_from_json([])
+    assert len(events) == 0
+    assert list(events.columns) == ['Index', 'Period', 'Time', 'Seconds', 'Event', 'Team', 'Actor', 'ActorRole',
+                                    'Recipient', 'RecipientRole', 'X', 'Y', 'Note']
+
+def _json_backends():
+    import importlib.util
+    return ['json'] + [name for name in ('orjson', 'simdjson') if importlib.util.find_spec(name) is not None]
+
+@pytest.fixture(params = _json_backends())
+def json_backend(request, monkeypatch):
+    monkeypatch.setattr(scrape_game, 'JSON_BACKEND', request.param)
+    return request.param
+
+def test_decode_json_full_page(json_backend):
+    import json
+    import feeds
+    page = feeds.get_game_feed(2016, 20001, events = 30)
+    text = json.dumps(page)
+    assert scrape_game.decode_json(text.encode('latin-1')) == json.loads(text)
+
+def test_decode_json_subtrees(json_backend):
+    import json
+    import feeds
+    page = feeds.get_game_feed(2016, 20001, events = 30)
+    data = scrape_game.decode_json(json.dumps(page).encode('latin-1'),
+                                   scrape_game.GAME_SUBTREES[1:] + (('liveData', 'missing'),))
+    assert set(data) == {'liveData'}
+    assert set(data['liveData']) == {'boxscore', 'plays'}
+    assert data['liveData']['boxscore'] == {'teams': page['liveData']['boxscore']['teams']}
+    assert data['liveData']['plays']['allPlays'] == page['liveData']['plays']['allPlays']
+
+def test_decode_json_reads_pages_as_latin1(json_backend):
+    ### Names in the reference files were decoded from UTF-8 bytes as latin-1, and have to keep matching
+    page = '{"name": "René Bourque"}'.encode('utf-8')
+    assert scrape_game.decode_json(page) == {'name': 'RenÃ© Bourque'}
+
+def test_decode_json_errors(json_backend):
+    import json
+    with pytest.raises(json.JSONDecodeError):
+        scrape_game.decode_json(b'{"data": [1, 2')
+    with pytest.raises(json.JSONDecodeError):
+        scrape_game.decode_json(b'<html>Service Unavailable</html>', (('data',),))
+
+def test_shift_benchmark_reports_identical_games(updated_season):
+    results = benchmarks.benchmark_read_shifts(2016, updated_season)
+    assert results.Game.tolist() == updated_season
+    assert results.Identical.all()
@@ -0,0 +1,214 @@
+"""
+Tests for parsing and updating seasons in scrape_season.
+"""
+
+import os
+
+import pandas as pd
+
+import feeds
+import reference_store
+import scrape_game
+import scrape_season
+
+def _read_parsed(season, games):
+    """
+    Returns each game's parsed pbp and toi tables.
+    """
+    return {game: (pd.read_hdf(scrape_game.get_parsed_save_filename(season, game)),
+                   pd.read_hdf(scrape_game.get_parsed_shifts_save_filename(season, game))) for game in games}
+
+def _assert_parsed_equal(first, second):
+    assert sorted(first) == sorted(second)
+    for game in first:
+        pd.testing.assert_frame_equal(first[game][0], second[game][0])
+        pd.testing.assert_frame_equal(first[game][1], second[game][1])
+
+def _sort(df):
+    return df.sort_values(list(df.columns)).reset_index(drop = True)
+
+def test_parallel_parse_matches_serial(save_folder):
+    games = feeds.write_season(2016)
+    scrape_season.parse_games(2016, games)
+    serial = _read_parsed(2016, games)
+    serialstore = reference_store.get_reference_store()
+    tables = (serialstore.get_team_id_df(), serialstore.get_player_id_df(), serialstore.get_quick_gamelog_df())
+
+    reference_store._STORE = None
+    scrape_season.parse_games(2016, games, force_overwrite = True, workers = 3)
+    _assert_parsed_equal(_read_parsed(2016, games), serial)
+    parallelstore = reference_store.get_reference_store()
+    pd.testing.assert_frame_equal(parallelstore.get_team_id_df(), tables[0])
+    ### Every game was parsed twice, so every player has twice the appearances
+    players = tables[1].assign(Count = tables[1].Count * 2)
+    pd.testing.assert_frame_equal(_sort(parallelstore.get_player_id_df()), _sort(players))
+    pd.testing.assert_frame_equal(parallelstore.get_quick_gamelog_df(), tables[2])
+
+def test_parallel_shift_reparse_matches_serial(save_folder):
+    games = feeds.write_season(2016)
+    scrape_season.parse_games(2016, games)
+    serial = _read_parsed(2016, games)
+    assert all(toi.HomeGoalie.all() and toi.RoadGoalie.all() for pbp, toi in serial.values())
+
+    ### Only the toi is reparsed, so goalies have to come from the player table rather than the game's boxscore
+    for game in games:
+        os.remove(scrape_game.get_parsed_shifts_save_filename(2016, game))
+    reference_store._STORE = None
+    scrape_season.parse_games(2016, games, workers = 3)
+    _assert_parsed_equal(_read_parsed(2016, games), serial)
+
+def _reference_tables():
+    store = reference_store.get_reference_store()
+    return (store.get_team_id_df(), _sort(store.get_player_id_df()), store.get_quick_gamelog_df())
+
+def _assert_tables_equal(first, second):
+    for a, b in zip(first, second):
+        pd.testing.assert_frame_equal(a, b)
+
+def _no_network(*args, **kwargs):
+    raise AssertionError('tried to use the network')
+
+def test_rewrite_globals_matches_parse(save_folder, monkeypatch):
+    import urllib.request
+    import scrapenhl_globals
+    games = feeds.write_season(2016)
+    scrape_season.parse_games(2016, games)
+    expected = _reference_tables()
+
+    monkeypatch.setattr(urllib.request, 'urlopen', _no_network)
+    written = []
+    write_feather = scrapenhl_globals.write_feather
+    monkeypatch.setattr(scrapenhl_globals, 'write_feather',
+                        lambda df, filename: written.append(os.path.basename(filename)) or write_feather(df, filename))
+    reference_store._STORE = None
+    scrape_season.rewrite_globals(start_from_scratch = True, seasons = [2016])
+    reference_store._STORE = None
+    _assert_tables_equal(_reference_tables(), expected)
+    ### Each reference file is written once, at the end
+    assert sorted(written) == sorted(set(written))
+    assert 'playerids.feather' in written
+
+def test_rewrite_globals_with_workers_matches_one_worker(save_folder):
+    games = feeds.write_season(2016)
+    scrape_season.rewrite_globals(start_from_scratch = True, seasons = [2016])
+    reference_store._STORE = None
+    expected = _reference_tables()
+
+    reference_store._STORE = None
+    scrape_season.rewrite_globals(start_from_scratch = True, seasons = [2016], workers = 3)
+    reference_store._STORE = None
+    _assert_tables_equal(_reference_tables(), expected)
+
+def test_rewrite_globals_only_adds_missing_games(save_folder):
+    games = feeds.write_season(2016, range(20001, 20005))
+    scrape_season.rewrite_globals(start_from_scratch = True, seasons = [2016])
+    reference_store._STORE = None
+    feeds.write_game(2016, 20005, feeds.WSH, feeds.BOS, seed = 4)
+
+    scrape_season.rewrite_globals(start_from_scratch = False, seasons = [2016])
+    reference_store._STORE = None
+    added = _reference_tables()
+
+    scrape_season.rewrite_globals(start_from_scratch = True, seasons = [2016])
+    reference_store._STORE = None
+    _assert_tables_equal(added, _reference_tables())
+    assert sorted(added[2].Game) == games + [20005]
+
+def _record_teamlog_writes(monkeypatch):
+    written = []
+    write = scrape_season._write_teamlog_game
+    def record(df, folder, game):
+        written.append((os.path.basename(folder), game))
+        write(df, folder, game)
+    monkeypatch.setattr(scrape_season, '_write_teamlog_game', record)
+    return written
+
+def test_team_logs_have_one_file_per_game(updated_season):
+    for team in ('WSH', 'BOS'):
+        for folder in (scrape_season.get_team_pbplog_folder(2016, team),
+                       scrape_season.get_team_toilog_folder(2016, team)):
+            assert sorted(scrape_season._get_teamlog_games(folder)) == updated_season
+        pbp = scrape_season.get_team_pbplog(2016, team)
+        assert pbp.Game.unique().tolist() == updated_season
+        parsed = _read_parsed(2016, [20002])[20002][0]
+        game = pbp[pbp.Game == 20002]
+        assert game.Index.tolist() == parsed.Index.tolist()
+        ### BOS is home in 20002, so its log keeps the home team's strength and WSH's is flipped
+        assert game.TeamSkaters.tolist() == (parsed.HomeSkaters if team == 'BOS' else parsed.RoadSkaters).tolist()
+
+def test_team_log_update_only_writes_new_or_given_games(updated_season, monkeypatch):
+    written = _record_teamlog_writes(monkeypatch)
+    scrape_season.update_teamlogs(2016)
+    assert written == []
+
+    scrape_season.update_teamlogs(2016, games = [20002])
+    assert sorted(written) == [('BOS2016_pbp', 20002), ('BOS2016_toi', 20002), ('WSH2016_pbp', 20002),
+                               ('WSH2016_toi', 20002)]
+
+    del written[:]
+    os.remove(os.path.join(scrape_season.get_team_toilog_folder(2016, 'WSH'), '20004.feather'))
+    scrape_season.update_teamlogs(2016)
+    assert written == [('WSH2016_toi', 20004)]
+
+def test_single_file_team_log_is_split_into_games(updated_season):
+    import shutil
+    import scrapenhl_globals
+    folder = scrape_season.get_team_pbplog_folder(2016, 'WSH')
+    expected = scrape_season.get_team_pbplog(2016, 'WSH')
+    scrapenhl_globals.write_feather(expected, scrape_season.get_team_pbplog_filename(2016, 'WSH'))
+    shutil.rmtree(folder)
+    os.makedirs(folder)
+    pd.testing.assert_frame_equal(scrape_season.get_team_pbplog(2016, 'WSH'), expected)
+
+    scrape_season.update_teamlogs(2016)
+    assert not os.path.exists(scrape_season.get_team_pbplog_filename(2016, 'WSH'))
+    assert sorted(scrape_season._get_teamlog_games(folder)) == updated_season
+    pd.testing.assert_frame_equal(scrape_season.get_team_pbplog(2016, 'WSH'), expected)
+
+def _stage_outputs():
+    """
+    Returns the modification times of the parsed files and everything built from them.
+    """
+    import scrapenhl_globals
+    files = []
+    for folder in (scrapenhl_globals.get_season_folder(2016), os.path.join(scrapenhl_globals.SAVE_FOLDER, 'reference')):
+        for root, dirs, filenames in os.walk(folder):
+            files += [os.path.join(root, filename) for filename in filenames
+                      if filename != 'manifest.json' and not filename.endswith('_meta.json')]
+    return {filename: os.stat(filename).st_mtime_ns for filename in files}
+
+def test_second_update_does_nothing(updated_season, monkeypatch):
+    monkeypatch.setattr(scrape_game, '_scrape_page', _no_network)
+    before = _stage_outputs()
+    done = scrape_season.update(2016, games = updated_season)
+    assert done == {'parse': [], 'teamlogs': [], 'toimatrix': [], 'corsi': []}
+    assert _stage_outputs() == before
+
+def test_update_redoes_only_new_and_changed_games(updated_season, monkeypatch):
+    import corsi
+    import manifest
+    monkeypatch.setattr(scrape_game, '_scrape_page', _no_network)
+    feeds.write_game(2016, 20003, seed = 99)
+    feeds.write_game(2016, 20007, seed = 7)
+    games = updated_season + [20007]
+    done = scrape_season.update(2016, games = games)
+    assert done == {stage: [20003, 20007] for stage in ('parse', 'teamlogs', 'toimatrix', 'corsi')}
+
+    ### The rebuilt tables match building every game from scratch
+    updated = corsi.get_player_corsi(2016)
+    assert sorted(updated.Game.unique()) == games
+    corsi.update_player_corsi(2016, force_overwrite = True)
+    pd.testing.assert_frame_equal(_sort(corsi.get_player_corsi(2016)), _sort(updated))
+
+    gamemanifest = manifest.read_manifest(2016)
+    assert not any(manifest.needs_parse(gamemanifest, 2016, game) for game in games)
+    assert scrape_season.update(2016, games = games)['parse'] == []
+
+def test_update_reruns_stages_when_a_parsed_file_changes(updated_season, monkeypatch):
+    monkeypatch.setattr(scrape_game, '_scrape_page', _no_network)
+    scrape_game.parse_game(2016, 20002, force_overwrite = True)
+    os.remove(scrape_game.get_parsed_save_filename(2016, 20005))
+    done = scrape_season.update(2016, games = updated_season)
+    ### 20005 is reparsed because a parsed file is missing; 20002's raw pages did not change, but its parsed files did
+    assert done['parse'] == [20005]
+    assert done == dict(done, teamlogs = [20002, 20005], toimatrix = [20002, 20005], corsi = [20002, 20005])
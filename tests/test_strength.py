@@ -0,0 +1,81 @@
+"""
+Tests for strength.py, on a synthetic game with known numbers of players on ice.
+"""
+
+import pandas as pd
+import pytest
+
+import feeds
+import scrape_game
+import scrape_season
+import strength
+
+WSH, BOS = feeds.WSH, feeds.BOS
+
+def _skaters(team, n, first = 1):
+    return [team[3] + first + i for i in range(n)]
+
+### (period, start, end, home IDs, road IDs, expected HomeSkaters, RoadSkaters, HomeGoalie, RoadGoalie, Strength)
+SEGMENTS = [(1, 0, 300, [WSH[3]] + _skaters(WSH, 5), [BOS[3]] + _skaters(BOS, 5), 5, 5, True, True, '5v5'),
+            (1, 300, 420, [WSH[3]] + _skaters(WSH, 5, 6), [BOS[3]] + _skaters(BOS, 4, 6), 5, 4, True, True, '5v4'),
+            (1, 420, 600, [WSH[3]] + _skaters(WSH, 4, 11), [BOS[3]] + _skaters(BOS, 4, 11), 4, 4, True, True,
+             '4v4'),
+            (1, 600, 1200, [WSH[3]] + _skaters(WSH, 5), [BOS[3]] + _skaters(BOS, 5), 5, 5, True, True, '5v5'),
+            (2, 0, 1200, [WSH[3]] + _skaters(WSH, 5, 6), [BOS[3]] + _skaters(BOS, 5, 6), 5, 5, True, True, '5v5'),
+            (3, 0, 1100, [WSH[3]] + _skaters(WSH, 5), [BOS[3]] + _skaters(BOS, 5), 5, 5, True, True, '5v5'),
+            ### The home goalie is pulled for an extra skater
+            (3, 1100, 1200, _skaters(WSH, 6, 11), [BOS[3]] + _skaters(BOS, 5, 11), 6, 5, False, True, '6v5')]
+
+def _expected_seconds():
+    """
+    Returns (second of the game, expected strength columns) for the middle of each segment, away from line changes.
+    """
+    for period, start, end, home, road, *expected in SEGMENTS:
+        for second in range(start + 2, end - 2):
+            yield (period - 1) * 1200 + second, expected
+
+@pytest.fixture
+def strength_game(save_folder):
+    feeds.write_game(2016, 20001, WSH, BOS, segments = [segment[:5] for segment in SEGMENTS])
+    scrape_season.parse_games(2016, [20001])
+    return 20001
+
+def test_toi_strength(strength_game):
+    toi = pd.read_hdf(scrape_game.get_parsed_shifts_save_filename(2016, strength_game))
+    assert len(toi) >= 3600
+    for second, expected in _expected_seconds():
+        assert toi.loc[second, strength.STRENGTH_COLUMNS].tolist() == expected, second
+    assert set(toi.Strength) >= {'5v5', '5v4', '4v4', '6v5'}
+
+def test_pbp_strength_is_strength_at_event_second(strength_game):
+    events = pd.read_hdf(scrape_game.get_parsed_save_filename(2016, strength_game))
+    expected = dict(_expected_seconds())
+    checked = 0
+    for row in events.itertuples():
+        if row.Seconds in expected:
+            assert [row.HomeSkaters, row.RoadSkaters, row.HomeGoalie, row.RoadGoalie, row.Strength] == \
+                expected[row.Seconds]
+            checked += 1
+    assert checked > 200
+
+def test_team_logs_flip_strength_for_road_team(strength_game):
+    scrape_season.update_teamlogs(2016)
+    for team, flip in (('WSH', False), ('BOS', True)):
+        toi = scrape_season._load_teamlog(scrape_season.get_team_toilog_folder(2016, team),
+                                          scrape_season.get_team_toilog_filename(2016, team))
+        for second, (home, road, homegoalie, roadgoalie, code) in _expected_seconds():
+            if flip:
+                home, road, homegoalie, roadgoalie = road, home, roadgoalie, homegoalie
+                code = '{0:d}v{1:d}'.format(home, road)
+            assert toi.loc[second, strength.TEAM_STRENGTH_COLUMNS].tolist() == [home, road, homegoalie, roadgoalie,
+                                                                                code], (team, second)
+    assert strength.filter_strength(toi, '5v6').Time.min() == 3 * 1200 - 100
+
+def test_strength_is_unknown_past_end_of_toi():
+    events = pd.DataFrame({'Seconds': [10, 5000]})
+    toi = pd.DataFrame({'Time': range(20), 'WSH1': 8471000.0, 'WSH2': 8471001.0, 'BOS1': 8475000.0,
+                        'BOS2': float('nan')})
+    events = strength.add_strength_to_pbp(events, toi, 'WSH', 'BOS', {8471000, 8475000})
+    assert events.Strength.tolist() == ['1v0', '']
+    assert events.HomeSkaters.tolist() == [1, -1]
+    assert events.RoadGoalie.tolist() == [True, False]
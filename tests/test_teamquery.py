@@ -0,0 +1,126 @@
+"""
+Tests for teamquery.py, against the team logs of the synthetic season and feather V1 logs.
+"""
+
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather
+import pytest
+
+import corsi
+import scrape_season
+import teamquery
+
+from conftest import PACKAGE_FOLDER
+
+def _pbplog(team = 'WSH'):
+    return scrape_season._load_teamlog(scrape_season.get_team_pbplog_folder(2016, team),
+                                       scrape_season.get_team_pbplog_filename(2016, team))
+
+def _toilog(team = 'WSH'):
+    return scrape_season._load_teamlog(scrape_season.get_team_toilog_folder(2016, team),
+                                       scrape_season.get_team_toilog_filename(2016, team))
+
+def _keys(df, columns):
+    return sorted(map(tuple, df[columns].values.tolist()))
+
+def test_pbp_filters_match_pandas(updated_season):
+    player = 8471003
+    df = teamquery.team_pbp(2016, 'WSH').strengths('5v5').events(corsi.CORSI_EVENTS).actors(player).to_df()
+    log = _pbplog()
+    expected = log[(log.Strength == '5v5') & log.Event.isin(corsi.CORSI_EVENTS) & (log.Actor == player)]
+    assert len(expected) > 0
+    assert _keys(df, ['Game', 'Index']) == _keys(expected, ['Game', 'Index'])
+
+def test_games_and_columns(updated_season):
+    query = teamquery.team_pbp(2016, 'WSH').games([20001, 20002, 29999]).games([20002, 20003])
+    assert [os.path.basename(f) for f in query.get_files()] == ['20002.feather']
+    df = query.columns(['Game', 'Index']).to_df()
+    assert list(df.columns) == ['Game', 'Index']
+    assert set(df.Game) == {20002}
+
+def test_toi_on_ice(updated_season):
+    first, second = 8471001, 8475006
+    df = teamquery.team_toi(2016, 'WSH').on_ice(first).on_ice(second).columns(['Game', 'Time']).to_df()
+    log = _toilog()
+    players = log[teamquery.team_toi(2016, 'WSH').get_player_columns()]
+    expected = log[(players == first).any(axis = 1) & (players == second).any(axis = 1)]
+    assert len(expected) > 0
+    assert _keys(df, ['Game', 'Time']) == _keys(expected, ['Game', 'Time'])
+
+def test_pbp_on_ice_uses_toi_seconds(updated_season):
+    player = 8471001
+    df = teamquery.team_pbp(2016, 'WSH').on_ice(player).columns(['Game', 'Index', 'Seconds']).to_df()
+    toi = _toilog()
+    players = toi[teamquery.team_toi(2016, 'WSH').get_player_columns()]
+    onice = set(zip(toi.Game[(players == player).any(axis = 1)], toi.Time[(players == player).any(axis = 1)]))
+    log = _pbplog()
+    expected = log[[(g, s) in onice for g, s in zip(log.Game, log.Seconds)]]
+    assert 0 < len(expected) < len(log)
+    assert list(df.columns) == ['Game', 'Index', 'Seconds']
+    assert _keys(df, ['Game', 'Index']) == _keys(expected, ['Game', 'Index'])
+
+def test_chunks_and_rows(updated_season):
+    query = teamquery.team_toi(2016, 'BOS').strengths('5v5')
+    chunks = list(teamquery.run(query, 'chunks', batch_size = 1000))
+    assert max(len(chunk) for chunk in chunks) <= 1000
+    assert sum(len(chunk) for chunk in chunks) == len(query.to_df()) == len(_toilog('BOS'))
+    assert sum(1 for row in teamquery.run(query.games(20001), 'rows')) == 3600
+
+def test_empty_results(updated_season):
+    df = teamquery.team_pbp(2016, 'WSH').actors(1).columns(['Game', 'Actor']).to_df()
+    assert len(df) == 0 and list(df.columns) == ['Game', 'Actor']
+    assert teamquery.team_pbp(2016, 'NYR').to_df() is None
+    with pytest.raises(ValueError):
+        teamquery.team_toi(2016, 'WSH').events('Shot')
+
+def test_feather_v1_log(save_folder):
+    ### A single-file log in the original format, as in scrape/Team logs
+    df = pd.DataFrame({'Game': [20001, 20001, 20002, 20003], 'Index': [0, 1, 0, 0],
+                       'Event': ['Shot', 'Hit', 'Goal', 'Shot'], 'Actor': [8471214, 8471214, 8474590, 8471214]})
+    filename = scrape_season.get_team_pbplog_filename(2015, 'WSH')
+    os.makedirs(os.path.dirname(filename))
+    pyarrow.feather.write_feather(df, filename, version = 1)
+    assert not teamquery._is_arrow_file(filename)
+
+    query = teamquery.team_pbp(2015, 'WSH')
+    assert query.get_files() == [filename]
+    assert query.get_schema().field('Actor').type == pa.int64()
+    result = query.games([20001, 20003]).events('Shot').actors(8471214).to_df()
+    assert result[['Game', 'Index']].values.tolist() == [[20001, 0], [20003, 0]]
+    assert len(list(query.iter_chunks(batch_size = 2))) == 2
+
+def test_feather_v1_and_v2_partitions(updated_season):
+    ### One game's partition rewritten as V1 without its strength columns, next to V2 partitions
+    folder = scrape_season.get_team_pbplog_folder(2016, 'WSH')
+    filename = os.path.join(folder, '20001.feather')
+    log = pyarrow.feather.read_table(filename).to_pandas()
+    expected = len(log[log.Event.isin(['Shot', 'Goal'])])
+    pyarrow.feather.write_feather(log.drop(columns = ['Strength', 'TeamSkaters']), filename, version = 1)
+
+    query = teamquery.team_pbp(2016, 'WSH')
+    assert query.get_schema().field('Strength') is not None
+    df = query.events(['Shot', 'Goal']).to_df()
+    assert len(df[df.Game == 20001]) == expected
+    assert df[df.Game == 20001].Strength.isna().all()
+    assert df[df.Game != 20001].Strength.notna().all()
+    assert len(query.strengths('5v5').games(20001).to_df()) == 0
+
+def test_legacy_toi_log(save_folder):
+    legacy = os.path.join(PACKAGE_FOLDER, 'scrape', 'Team logs', 'BUF2016_toi.feather')
+    if not os.path.exists(legacy):
+        pytest.skip('no legacy team logs')
+    os.makedirs(os.path.join(save_folder, 'Team logs'))
+    shutil.copy(legacy, scrape_season.get_team_toilog_filename(2016, 'BUF'))
+    log = pyarrow.feather.read_table(legacy).to_pandas()
+    player = int(log.BUF1.dropna().iloc[0])
+
+    query = teamquery.team_toi(2016, 'BUF')
+    players = log[query.get_player_columns()]
+    expected = log[(players == player).any(axis = 1)]
+    df = query.on_ice(player).to_df()
+    assert len(df) == len(expected) > 0
+    assert df.Time.tolist() == expected.Time.tolist()
@@ -0,0 +1,80 @@
+"""
+Tests for toimatrix.py, and for the team toi logs and on-ice lookups that read from it.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import onice
+import scrape_game
+import scrape_season
+import toimatrix
+
+def _players(df, prefix):
+    cols = [col for col in df.columns if col[:len(prefix)] == prefix and col[len(prefix):].isdigit()]
+    return [frozenset(int(x) for x in row if x == x) for row in df[cols].values]
+
+def _events(games):
+    return pd.concat([pd.read_hdf(scrape_game.get_parsed_save_filename(2016, game)).assign(Game = game)
+                      for game in games], ignore_index = True)
+
+def test_matrix_round_trip(updated_season):
+    for game in updated_season:
+        toi = pd.read_hdf(scrape_game.get_parsed_shifts_save_filename(2016, game))
+        home, road = ('WSH', 'BOS') if game % 2 == 1 else ('BOS', 'WSH')
+        rows = toimatrix.read_game(2016, game)
+        assert np.array_equal(rows, toimatrix.to_matrix(toi, home, road))
+        assert np.array_equal(toimatrix.read_game(2016, game, 100, 199), rows[100:200])
+    assert toimatrix.read_game(2016, 29999) is None
+
+def test_team_toilog_is_read_from_matrix(updated_season, monkeypatch):
+    expected = scrape_season._load_teamlog(scrape_season.get_team_toilog_folder(2016, 'WSH'),
+                                           scrape_season.get_team_toilog_filename(2016, 'WSH'))
+    ### The team log files are not read when the matrix is current
+    monkeypatch.setattr(scrape_season, '_read_teamlog', lambda folder, filename: pytest.fail('read team log files'))
+    df = scrape_season.get_team_toilog(2016, 'WSH')
+
+    assert df.Game.tolist() == expected.Game.tolist()
+    assert df.Time.tolist() == expected.Time.tolist()
+    assert _players(df, 'WSH') == _players(expected, 'WSH')
+    assert _players(df, 'Opp') == _players(expected, 'Opp')
+    for col in ('TeamSkaters', 'OppSkaters', 'TeamGoalie', 'OppGoalie'):
+        assert df[col].tolist() == expected[col].tolist()
+    assert df.Strength.astype(str).tolist() == expected.Strength.astype(str).tolist()
+
+def test_team_toilog_falls_back_when_matrix_is_stale(updated_season, monkeypatch):
+    assert toimatrix.is_current(2016, updated_season)
+    ### A game reparsed after the matrix was written
+    filename = scrape_game.get_parsed_shifts_save_filename(2016, updated_season[0])
+    later = os.stat(toimatrix.get_index_filename(2016)).st_mtime_ns + 10 ** 9
+    os.utime(filename, ns = (later, later))
+    assert not toimatrix.is_current(2016, updated_season)
+    monkeypatch.setattr(toimatrix, 'get_team_toilog', lambda *args: pytest.fail('read the matrix'))
+    assert len(scrape_season.get_team_toilog(2016, 'WSH')) > 0
+
+def test_team_toilog_falls_back_when_matrix_is_missing(updated_season):
+    expected = scrape_season.get_team_toilog(2016, 'BOS')
+    os.remove(toimatrix.get_index_filename(2016))
+    os.remove(toimatrix.get_matrix_filename(2016))
+    assert not toimatrix.is_current(2016, updated_season)
+    df = scrape_season.get_team_toilog(2016, 'BOS')
+    assert df.Time.tolist() == expected.Time.tolist()
+    assert _players(df, 'BOS') == _players(expected, 'BOS')
+
+def test_attach_on_ice_from_matrix_matches_interval_index(updated_season, monkeypatch):
+    events = _events(updated_season)
+    expected = onice.attach_on_ice(events, 2016, onice.ShiftIntervalIndex.from_season(2016, updated_season))
+    monkeypatch.setattr(onice.ShiftIntervalIndex, 'from_season', lambda *args: pytest.fail('built an index'))
+    df = onice.attach_on_ice(events, 2016)
+    assert np.array_equal(df[onice.ON_ICE_COLUMNS].values, expected[onice.ON_ICE_COLUMNS].values)
+    assert (df.HG != 0).all() and (df.H5 != 0).all()
+
+def test_attach_on_ice_builds_index_when_matrix_is_stale(updated_season):
+    events = _events(updated_season[:2])
+    expected = onice.attach_on_ice(events, 2016)
+    os.remove(toimatrix.get_index_filename(2016))
+    df = onice.attach_on_ice(events, 2016)
+    assert np.array_equal(df[onice.ON_ICE_COLUMNS].values, expected[onice.ON_ICE_COLUMNS].values)